@@ -3,9 +3,10 @@ from CommonServerPython import *
 from CommonServerUserPython import *
 
 ''' IMPORTS '''
+import codecs
 import csv
-import gzip
 import urllib3
+import zlib
 from dateutil.parser import parse
 from typing import Optional, Pattern, Dict, Any, Tuple, Union, List
 
@@ -13,6 +14,9 @@ from typing import Optional, Pattern, Dict, Any, Tuple, Union, List
 urllib3.disable_warnings()
 
 # Globals
+CHUNK_SIZE = 64 * 1024
+INDICATORS_BATCH_SIZE = 2000
+FEED_VALIDATORS_KEY = 'feed_validators'
 
 
 class Client(BaseClient):
@@ -20,7 +24,9 @@ class Client(BaseClient):
                  insecure: bool = False, credentials: dict = None, ignore_regex: str = None, encoding: str = 'latin-1',
                  delimiter: str = ',', doublequote: bool = True, escapechar: str = '',
                  quotechar: str = '"', skipinitialspace: bool = False, polling_timeout: int = 20, proxy: bool = False,
-                 feedTags: Optional[str] = None, tlp_color: Optional[str] = None, value_field: str = 'value', **kwargs):
+                 feedTags: Optional[str] = None, tlp_color: Optional[str] = None, value_field: str = 'value',
+                 max_concurrent_downloads: int = 5, skip_unmodified_feeds: bool = False, delta_mode: bool = False,
+                 **kwargs):
         """
         :param url: URL of the feed.
         :param feed_url_to_config: for each URL, a configuration of the feed that contains
@@ -62,6 +68,14 @@ class Client(BaseClient):
         :param polling_timeout: timeout of the polling request in seconds. Default: 20
         :param proxy: Sets whether use proxy when sending requests
         :param tlp_color: Traffic Light Protocol color.
+        :param max_concurrent_downloads: The maximal number of feed URLs to download at once. Default: 5
+        :param skip_unmodified_feeds: if *true* the ETag, Last-Modified and content digest of each URL are kept in the
+            integration context, and URLs which were not modified since the last fetch are not parsed again. A URL
+            is still parsed once in the period of `get_feed_full_sync_seconds`, so its indicators are not expired.
+            Ignored with the sudden death expiration policy. Default: *false*
+        :param delta_mode: if *true* only new and changed indicators are sent by a fetch, and indicators which
+            disappeared from the feed are sent with an expiration. See `FeedIndicatorsDelta`.
+            Ignored with the sudden death expiration policy. Default: *false*
         """
         self.tags: List[str] = argToList(feedTags)
         self.tlp_color = tlp_color
@@ -94,6 +108,15 @@ class Client(BaseClient):
         if ignore_regex is not None:
             self.ignore_regex = re.compile(ignore_regex)
         self.feed_url_to_config: Optional[Dict[str, dict]] = feed_url_to_config
+        self.max_concurrent_downloads = max_concurrent_downloads
+        # with the sudden death expiration policy, indicators which are not sent in a fetch are expired
+        self.skip_unmodified_feeds = skip_unmodified_feeds and kwargs.get('feedExpirationPolicy') != 'suddenDeath'
+        # an unmodified URL is still parsed once in this period, so its indicators are not expired
+        self.full_sync_seconds = get_feed_full_sync_seconds(kwargs.get('feedExpirationPolicy'),
+                                                            kwargs.get('feedExpirationInterval'))
+        self.delta_mode = delta_mode and kwargs.get('feedExpirationPolicy') != 'suddenDeath'
+        self.feed_validators: Dict[str, dict] = {}
+        self.unmodified_feeds: List[str] = []
         self.fieldnames = argToList(fieldnames)
         self.dialect: Dict[str, Any] = {
             'delimiter': delimiter,
@@ -113,42 +136,65 @@ class Client(BaseClient):
         return r.prepare()
 
     def build_iterator(self, **kwargs):
-        results = []
+        return list(self.iter_feeds(**kwargs))
+
+    def iter_feeds(self, skip_unmodified: bool = False, **kwargs):
+        """Downloads the feed URLs concurrently over a single pooled session, and yields a CSV reader of each URL as
+        soon as its response arrives, so it can be parsed while the other URLs are still downloading.
+
+        Args:
+            skip_unmodified: Whether to skip URLs which were not modified since the validators were last saved.
+
+        Returns:
+            Generator. {url: csv reader} dicts, in the order the responses arrived.
+        """
         urls = self._base_url
         if not isinstance(urls, list):
             urls = [urls]
-        for url in urls:
-            _session = requests.Session()
-
-            prepreq = self._build_request(url)
-
-            # this is to honour the proxy environment variables
-            kwargs.update(_session.merge_environment_settings(
-                prepreq.url,
-                {}, None, None, None  # defaults
-            ))
-            kwargs['stream'] = True
-            kwargs['verify'] = self._verify
-            kwargs['timeout'] = self.polling_timeout
-
-            if self.headers:
-                if 'headers' in kwargs:
-                    kwargs['headers'].update(self.headers)
-                else:
-                    kwargs['headers'] = self.headers
 
-            try:
-                r = _session.send(prepreq, **kwargs)
-            except requests.ConnectionError:
-                raise requests.ConnectionError('Failed to establish a new connection.'
-                                               ' Please make sure your URL is valid.')
+        saved_validators = get_integration_context().get(FEED_VALIDATORS_KEY, {}) if skip_unmodified else {}
+
+        def send_request(session, url):
+            # runs on a worker thread, the result is logged and saved by the consuming thread
+            validators = saved_validators.get(url, {})
+            fetch_time = time.time()
+            if fetch_time - validators.get('parse_time', 0) >= self.full_sync_seconds:
+                # the URL is parsed even if it was not modified, and its validators are replaced
+                validators = {}
+            r = self._send_request(session, url, headers=conditional_request_headers(kwargs.get('headers'), validators),
+                                   **{k: v for k, v in kwargs.items() if k != 'headers'})
+            if r.status_code == 304:
+                return None, validators, f'{url} was not modified since the last fetch'
+            if skip_unmodified and r.ok:
+                r, digest = spool_response(r)
+                new_validators = {
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                    'digest': digest,
+                    'parse_time': fetch_time
+                }
+                if digest == validators.get('digest'):
+                    new_validators['parse_time'] = validators['parse_time']
+                    r.close()
+                    return None, new_validators, f'The content of {url} was not modified since the last fetch'
+                return r, new_validators, None
+            return r, None, None
+
+        for url, (r, validators, unmodified_message) in iter_feeds(urls, send_request,
+                                                                   max_workers=self.max_concurrent_downloads):
+            if validators:
+                self.feed_validators[url] = validators
+            if unmodified_message:
+                demisto.debug(unmodified_message)
+                self.unmodified_feeds.append(url)
+                continue
             try:
                 r.raise_for_status()
             except Exception:
                 return_error('Exception in request: {} {}'.format(r.status_code, r.content))
                 raise
 
-            response = self.get_feed_content_divided_to_lines(url, r)
+            response = self.iter_feed_lines(url, r)
             if self.feed_url_to_config:
                 fieldnames = self.feed_url_to_config.get(url, {}).get('fieldnames', [])
             else:
@@ -165,9 +211,37 @@ class Client(BaseClient):
                 **self.dialect
             )
 
-            results.append({url: csvreader})
+            yield {url: csvreader}
+
+    def _send_request(self, session, url, headers=None, **kwargs):
+        prepreq = self._build_request(url)
+        # headers are a part of the prepared request, session.send does not accept them
+        prepreq.headers.update(dict(headers or {}, **self.headers))
 
-        return results
+        # this is to honour the proxy environment variables
+        kwargs.update(session.merge_environment_settings(
+            prepreq.url,
+            {}, None, None, None  # defaults
+        ))
+        kwargs['stream'] = True
+        kwargs['verify'] = self._verify
+        kwargs['timeout'] = self.polling_timeout
+
+        try:
+            return session.send(prepreq, **kwargs)
+        except requests.ConnectionError:
+            raise requests.ConnectionError('Failed to establish a new connection.'
+                                           ' Please make sure your URL is valid.')
+
+    def save_feed_validators(self):
+        """Saves the validators of the URLs fetched by `iter_feeds` to the integration context.
+        Should be called only after the indicators of the URLs were created.
+        """
+        if self.feed_validators:
+            integration_context = get_integration_context()
+            integration_context[FEED_VALIDATORS_KEY] = dict(integration_context.get(FEED_VALIDATORS_KEY, {}),
+                                                            **self.feed_validators)
+            set_integration_context(integration_context)
 
     def get_feed_content_divided_to_lines(self, url, raw_response):
         """Fetch feed data and divides its content to lines
@@ -179,12 +253,50 @@ class Client(BaseClient):
         Returns:
             List. List of lines from the feed content.
         """
-        if self.feed_url_to_config and self.feed_url_to_config.get(url).get('is_zipped_file'):  # type: ignore
-            response_content = gzip.decompress(raw_response.content)
-        else:
-            response_content = raw_response.content
+        return list(self.iter_feed_lines(url, raw_response))
+
+    def iter_feed_lines(self, url, raw_response):
+        """Reads the feed content in chunks and lazily yields its lines, so the feed is never held in memory.
+
+        Args:
+            url: Current feed's url.
+            raw_response: The raw (streamed) response from the feed's url.
+
+        Returns:
+            Generator. The lines of the feed content, split the same as `get_feed_content_divided_to_lines`.
+        """
+        chunks = raw_response.iter_content(chunk_size=CHUNK_SIZE)
+        if self.feed_url_to_config and self.feed_url_to_config.get(url, {}).get('is_zipped_file'):
+            chunks = gunzip_chunks(chunks)
+
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        remainder = ''
+        for chunk in chunks:
+            lines = (remainder + decoder.decode(chunk)).split('\n')
+            remainder = lines.pop()
+            yield from lines
+        yield remainder + decoder.decode(b'', final=True)
+
+
+def gunzip_chunks(chunks):
+    """Decompresses a stream of gzip compressed chunks.
 
-        return response_content.decode(self.encoding).split('\n')
+    Args:
+        chunks: Iterable of compressed bytes.
+
+    Returns:
+        Generator. The decompressed bytes.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk)
+            chunk = decompressor.unused_data
+            if chunk:
+                # the file holds several concatenated gzip members, the leftover starts the next one
+                yield decompressor.flush()
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    yield decompressor.flush()
 
 
 def determine_indicator_type(indicator_type, default_indicator_type, auto_detect, value):
@@ -254,8 +366,25 @@ def create_fields_mapping(raw_json: Dict[str, Any], mapping: Dict[str, Union[Tup
 
 
 def fetch_indicators_command(client: Client, default_indicator_type: str, auto_detect: bool, limit: int = 0, **kwargs):
-    iterator = client.build_iterator(**kwargs)
-    indicators = []
+    return list(fetch_indicators_generator(client, default_indicator_type, auto_detect, limit, **kwargs))
+
+
+def fetch_indicators_generator(client: Client, default_indicator_type: str, auto_detect: bool, limit: int = 0,
+                               skip_unmodified: bool = False, **kwargs):
+    """Lazily parses the feeds and yields indicators one by one, as the feed content is being downloaded.
+
+    Args:
+        client: Client object with request.
+        default_indicator_type: Indicator type which was inserted as a param of the integration by user.
+        auto_detect: True whether auto detection of the indicator type is wanted.
+        limit: Maximum number of indicators to yield, 0 means no limit.
+        skip_unmodified: Whether to skip feeds which were not modified since the last fetch.
+
+    Returns:
+        Generator. The indicators parsed from the feeds.
+    """
+    iterator = client.iter_feeds(skip_unmodified=skip_unmodified, **kwargs)
+    indicators_count = 0
     config = client.feed_url_to_config or {}
     for url_to_reader in iterator:
         for url, reader in url_to_reader.items():
@@ -282,12 +411,11 @@ def fetch_indicators_command(client: Client, default_indicator_type: str, auto_d
                     if client.tlp_color:
                         indicator['fields']['trafficlightprotocol'] = client.tlp_color
 
-                    indicators.append(indicator)
+                    yield indicator
+                    indicators_count += 1
                     # exit the loop if we have more indicators than the limit
-                    if limit and len(indicators) >= limit:
-                        return indicators
-
-    return indicators
+                    if limit and indicators_count >= limit:
+                        return
 
 
 def get_indicators_command(client, args: dict, tags: Optional[List[str]] = None):
@@ -322,15 +450,31 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(
+            delta = FeedIndicatorsDelta(
+                expiration_policy=params.get('feedExpirationPolicy'),
+                expiration_interval=params.get('feedExpirationInterval'),
+            ) if client.delta_mode else None
+            indicators = fetch_indicators_generator(
                 client,
                 params.get('indicator_type'),
                 params.get('auto_detect_type'),
                 params.get('limit'),
+                # all the indicators are sent in a full sync of the delta, so no URL is skipped
+                skip_unmodified=client.skip_unmodified_feeds and not (delta and delta.is_full_sync),
             )
-            # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
+            if delta:
+                indicators = delta.filter(indicators)
+            # we submit the indicators in batches as they are parsed, so only one batch is held in memory
+            for b in batch(indicators, batch_size=INDICATORS_BATCH_SIZE):
                 demisto.createIndicators(b)  # type: ignore
+            if delta:
+                # indicators of skipped URLs or beyond the limit were not seen, but did not disappear from the feed
+                partial_fetch = bool(client.unmodified_feeds or params.get('limit'))
+                if not partial_fetch:
+                    for b in batch(delta.expired_indicators(), batch_size=INDICATORS_BATCH_SIZE):
+                        demisto.createIndicators(b)  # type: ignore
+                delta.save(keep_unseen=partial_fetch)
+            client.save_feed_validators()
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
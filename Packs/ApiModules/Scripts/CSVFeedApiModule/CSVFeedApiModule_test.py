@@ -230,3 +230,252 @@ class TestTagsParam:
             )
             _, _, indicators = get_indicators_command(client, args)
             assert [] == indicators[0]['fields']['tags']
+
+
+def test_get_feed_content_multi_member_gzip():
+    """
+    Given:
+    - A gzip feed made of several concatenated gzip members, streamed in small chunks
+
+    When:
+    - Reading the feed lines
+
+    Then:
+    - Validating all members are decompressed and split to lines
+    """
+    import gzip
+    content = gzip.compress(b'1.1.1.1\n2.2.2.2\n') + gzip.compress(b'3.3.3.3\n')
+    chunks = [content[i:i + 7] for i in range(0, len(content), 7)]
+    assert b''.join(gunzip_chunks(chunks)) == b'1.1.1.1\n2.2.2.2\n3.3.3.3\n'
+
+
+def test_fetch_indicators_is_streamed_in_batches(mocker):
+    """
+    Given:
+    - A large CSV feed of 50,000 rows
+
+    When:
+    - Running fetch-indicators through feed_main
+
+    Then:
+    - Validating the indicators are sent to createIndicators in batches while the feed is parsed
+    - Validating the first batch is sent before the response body is read to its end, i.e. the feed is read lazily
+    """
+    import io
+    url = 'https://ipstack.com'
+    rows = 50000
+    feed = ''.join('1.1.{}.{},comment {}\n'.format(i // 256 % 256, i % 256, i) for i in range(rows)).encode('utf8')
+    feed_url_to_config = {
+        url: {
+            'fieldnames': ['value', 'comment'],
+            'indicator_type': 'IP',
+            'mapping': {'description': 'comment'}
+        }
+    }
+    body = io.BytesIO(feed)
+    batch_sizes = []
+    body_positions = []
+
+    def create_indicators(indicators_batch):
+        batch_sizes.append(len(indicators_batch))
+        # the response closes the body once it is read to its end
+        body_positions.append(len(feed) if body.closed else body.tell())
+
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators', side_effect=create_indicators)
+
+    with requests_mock.Mocker() as m:
+        m.get(url, body=body)
+        feed_main('CSV Feed', params={'url': url, 'feed_url_to_config': feed_url_to_config})
+
+    assert sum(batch_sizes) == rows
+    assert max(batch_sizes) == INDICATORS_BATCH_SIZE
+    assert len(batch_sizes) == -(-rows // INDICATORS_BATCH_SIZE)
+    # the body was read only up to a little more than the first batch when the first batch was sent
+    assert body_positions[0] < len(feed) // 4
+    assert body_positions == sorted(body_positions)
+
+
+def test_fetch_indicators_memory_is_bounded(mocker):
+    """
+    Given:
+    - A large CSV feed of 200,000 rows, whose indicators take hundreds of megabytes when held at once
+
+    When:
+    - Running fetch-indicators through feed_main
+
+    Then:
+    - Validating the peak memory of the fetch is bounded by the batch size, and not by the size of the feed
+    """
+    import io
+    import tracemalloc
+    url = 'https://ipstack.com'
+    rows = 200000
+    feed = ''.join('1.1.{}.{},comment {}\n'.format(i // 256 % 256, i % 256, i) for i in range(rows)).encode('utf8')
+    feed_url_to_config = {
+        url: {
+            'fieldnames': ['value', 'comment'],
+            'indicator_type': 'IP',
+            'mapping': {'description': 'comment'}
+        }
+    }
+    indicators_count = []
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    # not a MagicMock, which would keep a reference to every batch in its call list
+    mocker.patch.object(demisto, 'createIndicators', new=lambda b: indicators_count.append(len(b)))
+
+    with requests_mock.Mocker() as m:
+        m.get(url, body=io.BytesIO(feed))
+        tracemalloc.start()
+        try:
+            feed_main('CSV Feed', params={'url': url, 'feed_url_to_config': feed_url_to_config})
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert sum(indicators_count) == rows
+    # a batch of indicators takes a few megabytes, all of the indicators take more than a hundred
+    assert peak < 16 * 1024 * 1024
+
+
+def test_fetch_skips_feed_not_modified(mocker):
+    """
+    Given:
+    - A feed which returns an ETag header, answers 304 to a conditional request and then returns the same content
+      with a new ETag
+
+    When:
+    - Running fetch-indicators three times with skip_unmodified_feeds
+
+    Then:
+    - Validating the second fetch sends the conditional request header and does not create indicators
+    - Validating the third fetch does not create indicators either, as the content digest did not change
+    """
+    url = 'https://ipstack.com'
+    params = {
+        'url': url,
+        'feed_url_to_config': {url: {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'skip_unmodified_feeds': True
+    }
+    mocker.patch.object(demisto, 'integrationContext', {})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    with open('test_data/ip_ranges.txt') as ip_ranges_txt:
+        ip_ranges = ip_ranges_txt.read().encode('utf8')
+
+    with requests_mock.Mocker() as m:
+        m.get(url, [
+            {'content': ip_ranges, 'headers': {'ETag': '"v1"'}},
+            {'status_code': 304},
+            {'content': ip_ranges, 'headers': {'ETag': '"v2"'}},
+        ])
+        feed_main('CSV Feed', params=params)
+        assert demisto.createIndicators.call_count == 1
+        assert demisto.getIntegrationContext()['feed_validators'][url]['etag'] == '"v1"'
+
+        feed_main('CSV Feed', params=params)
+        assert m.last_request.headers['If-None-Match'] == '"v1"'
+        assert demisto.createIndicators.call_count == 1
+
+        feed_main('CSV Feed', params=params)
+        assert demisto.createIndicators.call_count == 1
+        assert demisto.getIntegrationContext()['feed_validators'][url]['etag'] == '"v2"'
+
+
+def test_fetch_parses_unmodified_feed_once_in_expiration_interval(mocker):
+    """
+    Given:
+    - A feed which always answers 304 to a conditional request, with the interval expiration policy of 2 minutes
+
+    When:
+    - Running fetch-indicators with skip_unmodified_feeds, before and after half of the expiration interval passed
+      since the feed was last parsed
+
+    Then:
+    - Validating the fetch before the period skips the feed
+    - Validating the fetch after the period sends no conditional request header and creates the indicators again,
+      so they are not expired
+    """
+    url = 'https://ipstack.com'
+    params = {
+        'url': url,
+        'feed_url_to_config': {url: {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'skip_unmodified_feeds': True,
+        'feedExpirationPolicy': 'interval',
+        'feedExpirationInterval': '2'
+    }
+    mocker.patch.object(demisto, 'integrationContext', {})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    with open('test_data/ip_ranges.txt') as ip_ranges_txt:
+        ip_ranges = ip_ranges_txt.read().encode('utf8')
+
+    with requests_mock.Mocker() as m:
+        m.get(url, [
+            {'content': ip_ranges, 'headers': {'ETag': '"v1"'}},
+            {'status_code': 304},
+            {'content': ip_ranges, 'headers': {'ETag': '"v1"'}},
+        ])
+        feed_main('CSV Feed', params=params)
+        feed_main('CSV Feed', params=params)
+        assert demisto.createIndicators.call_count == 1
+
+        demisto.getIntegrationContext()['feed_validators'][url]['parse_time'] -= 60
+        feed_main('CSV Feed', params=params)
+        assert 'If-None-Match' not in m.last_request.headers
+        assert demisto.createIndicators.call_count == 2
+
+
+def test_api_key_header_is_sent():
+    """
+    Given:
+    - Credentials of an API key header
+
+    When:
+    - Fetching the feed
+
+    Then:
+    - Validating the API key header is sent with the request
+    """
+    with requests_mock.Mocker() as m:
+        m.get('https://ipstack.com', content=b'1.1.1.1\n')
+        client = Client(url='https://ipstack.com', credentials={'identifier': '_header:X-Api-Key', 'password': 'key'})
+        client.build_iterator()
+        assert m.last_request.headers['X-Api-Key'] == 'key'
+
+
+def test_fetch_sends_only_delta(mocker):
+    """
+    Given:
+    - A feed which adds an indicator and drops another one between fetches
+
+    When:
+    - Running fetch-indicators twice with delta_mode
+
+    Then:
+    - Validating the second fetch creates only the added indicator
+    - Validating the dropped indicator is sent with an expiration
+    """
+    url = 'https://ipstack.com'
+    params = {
+        'url': url,
+        'feed_url_to_config': {url: {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'delta_mode': True
+    }
+    mocker.patch.object(demisto, 'integrationContext', {})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+
+    with requests_mock.Mocker() as m:
+        m.get(url, [
+            {'content': b'1.1.1.1\n2.2.2.2\n'},
+            {'content': b'1.1.1.1\n3.3.3.3\n'},
+        ])
+        feed_main('CSV Feed', params=params)
+        assert [i['value'] for i in demisto.createIndicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2']
+
+        feed_main('CSV Feed', params=params)
+        created, expired = [c[0][0] for c in demisto.createIndicators.call_args_list[1:]]
+        assert [i['value'] for i in created] == ['3.3.3.3']
+        assert [i['value'] for i in expired] == ['2.2.2.2']
+        assert expired[0]['expiration']
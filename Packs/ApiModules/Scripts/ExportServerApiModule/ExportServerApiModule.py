@@ -0,0 +1,274 @@
+import demistomock as demisto
+
+''' IMPORTS '''
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+import gevent
+from flask import Response
+from gevent.event import Event
+from gevent.lock import RLock
+
+''' CONSTANTS '''
+
+# the number of distinct requests (query, format, limit, offset, etc.) whose rendered response is kept
+MAX_RENDERED_RESPONSES = 64
+GZIP_COMPRESS_LEVEL = 6
+
+''' HELPER FUNCTIONS '''
+
+
+def accepts_gzip(headers) -> bool:
+    """Checks whether the client of a request accepts a gzip encoded response
+
+    Args:
+        headers: the request headers.
+
+    Returns:
+        bool. True if the Accept-Encoding header allows gzip.
+    """
+    for coding in headers.get('Accept-Encoding', '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '').lower() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+''' MAIN CLASSES '''
+
+
+class RenderedResponse:
+    """A response body which is encoded, compressed and hashed once, and then served to every client which
+    requests it. The body and its gzip encoding are different representations, so each of them has its own ETag.
+
+    Args:
+        body: the response body.
+        mimetype: the mimetype of the response.
+        last_run: the time (in epoch milliseconds) of the cache refresh the body was rendered from.
+    """
+
+    def __init__(self, body: str, mimetype: str, last_run: Optional[int] = None):
+        self.body = body.encode('utf-8')
+        self.gzipped_body = gzip.compress(self.body, compresslevel=GZIP_COMPRESS_LEVEL)
+        digest = hashlib.sha1(self.body).hexdigest()
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.mimetype = mimetype
+        self.last_run = last_run
+
+    @staticmethod
+    def is_not_modified(headers, etag: str) -> bool:
+        """Checks whether the client of a request already has a representation of the body
+
+        Args:
+            headers: the request headers.
+            etag: the ETag of the representation which would be served.
+
+        Returns:
+            bool. True if the If-None-Match header matches the ETag.
+        """
+        if_none_match = headers.get('If-None-Match', '')
+        if not if_none_match:
+            return False
+        etags = {etag.strip() for etag in if_none_match.split(',')}
+        # a weak validator is enough for a GET request
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+    def to_response(self, headers) -> Response:
+        """Creates the response to a request
+
+        Args:
+            headers: the request headers.
+
+        Returns:
+            Response. a 304 response if the client has the body, and otherwise the (gzip encoded if accepted) body.
+        """
+        gzipped = accepts_gzip(headers)
+        etag = self.gzip_etag if gzipped else self.etag
+        response_headers = {'ETag': etag, 'Vary': 'Accept-Encoding'}
+        if self.is_not_modified(headers, etag):
+            return Response(status=304, headers=response_headers)
+
+        if gzipped:
+            response_headers['Content-Encoding'] = 'gzip'
+            return Response(self.gzipped_body, status=200, mimetype=self.mimetype, headers=response_headers)
+
+        return Response(self.body, status=200, mimetype=self.mimetype, headers=response_headers)
+
+
+class RenderedResponseCache:
+    """Keeps the rendered response of each distinct request of a long running export server, so the response is
+    rendered only when the cache it was rendered from is refreshed. The least recently requested responses are
+    dropped when more than max_entries distinct requests are kept.
+
+    A state can also be kept for each request between its renders (e.g. the IP collapser of its IoCs), so it is never
+    shared by different requests.
+
+    Args:
+        max_entries: the maximal number of kept responses.
+    """
+
+    def __init__(self, max_entries: int = MAX_RENDERED_RESPONSES):
+        self.max_entries = max_entries
+        self._responses: OrderedDict = OrderedDict()
+        self._states: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(request_args: Any) -> str:
+        return json.dumps(vars(request_args), sort_keys=True, default=str)
+
+    def get(self, request_args: Any, last_run: Optional[int] = None,
+            refreshed_after: Optional[int] = None) -> Optional[RenderedResponse]:
+        """Gets the rendered response of a request, if it is up to date
+
+        Args:
+            request_args: the arguments of the request (e.g. a RequestArguments instance).
+            last_run: the time of the last cache refresh, which the response must have been rendered from.
+            refreshed_after: a time, which the response must have been rendered from a cache refresh after.
+
+        Returns:
+            RenderedResponse. the rendered response, or None if it should be rendered again.
+        """
+        key = self._key(request_args)
+        with self._lock:
+            if key not in self._responses:
+                return None
+            _, rendered = self._responses[key]
+            if last_run is not None and rendered.last_run != last_run:
+                return None
+            if refreshed_after is not None and (rendered.last_run or 0) <= refreshed_after:
+                return None
+            self._responses.move_to_end(key)
+            return rendered
+
+    def put(self, request_args: Any, body: str, mimetype: str, last_run: Optional[int] = None) -> RenderedResponse:
+        """Renders the response of a request, and keeps it
+
+        Args:
+            request_args: the arguments of the request (e.g. a RequestArguments instance).
+            body: the response body.
+            mimetype: the mimetype of the response.
+            last_run: the time of the cache refresh the body was created from.
+
+        Returns:
+            RenderedResponse. the rendered response.
+        """
+        rendered = RenderedResponse(body, mimetype, last_run)
+        key = self._key(request_args)
+        with self._lock:
+            self._responses[key] = (request_args, rendered)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries:
+                dropped_key, _ = self._responses.popitem(last=False)
+                self._states.pop(dropped_key, None)
+        return rendered
+
+    def get_state(self, request_args: Any, create_state: Callable[[], Any]) -> Tuple[Any, threading.Lock]:
+        """Gets the state kept for a request between its renders, with the lock which guards it. The state is dropped
+        with the response of the request, and the states of the least recently rendered requests are dropped when more
+        than max_entries are kept.
+
+        Args:
+            request_args: the arguments of the request (e.g. a RequestArguments instance).
+            create_state: creates the state of a request which has none.
+
+        Returns:
+            tuple. the state, and its lock.
+        """
+        key = self._key(request_args)
+        with self._lock:
+            if key not in self._states:
+                self._states[key] = (create_state(), threading.Lock())
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+            return self._states[key]
+
+    def requests(self) -> List[Any]:
+        """Gets the arguments of the requests whose responses are kept
+
+        Returns:
+            list. the request arguments, from the least to the most recently requested.
+        """
+        with self._lock:
+            return [request_args for request_args, _ in self._responses.values()]
+
+    def clear(self):
+        """Drops all the rendered responses and the states of their requests"""
+        with self._lock:
+            self._responses.clear()
+            self._states.clear()
+
+
+class CacheRefresher:
+    """Refreshes the cache of a long running export server in a background greenlet, so requests are answered at once
+    with the last refreshed values (stale-while-revalidate) instead of waiting for a refresh of the whole query.
+
+    The refreshes run on the gevent hub of the server, like the requests, as the demisto functions must not be called
+    from several threads. The refresh function should yield to the hub (e.g. gevent.sleep(0)) between long steps, so
+    requests are answered during a refresh.
+
+    Refreshes are single-flight: the refresh function is never run twice at once. The lock must not be held by
+    requests, which would wait for a whole refresh instead of being answered with the last refreshed values.
+
+    Args:
+        refresh: the function which refreshes the cache.
+        interval: the number of seconds between the start of a refresh and the start of the next one.
+    """
+
+    def __init__(self, refresh: Callable[[], Any], interval: float):
+        self._refresh = refresh
+        self.interval = interval
+        self.lock = RLock()
+        self.last_refresh: Optional[float] = None
+        self.last_refresh_duration: Optional[float] = None
+        self._stopped = Event()
+        self._greenlet: Optional[gevent.Greenlet] = None
+
+    def refresh(self, wait: bool = True) -> bool:
+        """Refreshes the cache
+
+        Args:
+            wait: whether to wait for a refresh which is already running, and then refresh, or to skip the refresh.
+
+        Returns:
+            bool. True if the cache was refreshed.
+        """
+        if not self.lock.acquire(blocking=wait):
+            return False
+        try:
+            start = time.monotonic()
+            self._refresh()
+            self.last_refresh = time.time()
+            self.last_refresh_duration = time.monotonic() - start
+            demisto.debug(f'Refreshed the cache in {self.last_refresh_duration:.2f} seconds')
+            return True
+        finally:
+            self.lock.release()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            start = time.monotonic()
+            try:
+                self.refresh()
+            except Exception as e:
+                demisto.error(f'Failed refreshing the cache in the background: {e}')
+            self._stopped.wait(max(self.interval - (time.monotonic() - start), 0))
+
+    def start(self):
+        """Starts refreshing the cache in a background greenlet, beginning with an immediate refresh"""
+        if self._greenlet and not self._greenlet.dead:
+            return
+        self._stopped.clear()
+        self._greenlet = gevent.spawn(self._run)
+
+    def stop(self):
+        """Stops refreshing the cache. A running refresh completes."""
+        self._stopped.set()
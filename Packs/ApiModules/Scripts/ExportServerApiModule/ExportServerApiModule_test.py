@@ -0,0 +1,290 @@
+import gzip
+
+import pytest
+
+import demistomock as demisto
+from ExportServerApiModule import *
+
+
+class RequestArguments:
+    def __init__(self, query, limit=10000):
+        self.query = query
+        self.limit = limit
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip, deflate', True),
+    ('deflate, gzip;q=0.5', True),
+    ('*', True),
+    ('gzip;q=0', False),
+    ('deflate', False),
+    ('', False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert accepts_gzip({'Accept-Encoding': accept_encoding}) == expected
+
+
+def test_rendered_response():
+    """
+    Given
+    - A rendered response.
+
+    When
+    - Responding to a client which does not accept gzip, to a client which does, and to a client which already has it.
+
+    Then
+    - Ensure the body is returned as is, gzip encoded, and not returned (304) respectively, always with the ETag of
+      the returned encoding.
+    - Ensure the gzip encoded body has another ETag than the body, so it does not match the ETag of the body.
+    """
+    rendered = RenderedResponse('1.1.1.1\n2.2.2.2', 'text/plain')
+
+    response = rendered.to_response({})
+    assert response.status_code == 200
+    assert response.data == b'1.1.1.1\n2.2.2.2'
+    assert response.headers['ETag'] == rendered.etag
+    assert 'Content-Encoding' not in response.headers
+
+    response = rendered.to_response({'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == rendered.gzip_etag != rendered.etag
+    assert gzip.decompress(response.data) == b'1.1.1.1\n2.2.2.2'
+
+    for if_none_match in (rendered.gzip_etag, f'"other", W/{rendered.gzip_etag}'):
+        response = rendered.to_response({'If-None-Match': if_none_match, 'Accept-Encoding': 'gzip'})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == rendered.gzip_etag
+
+    response = rendered.to_response({'If-None-Match': rendered.etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == rendered.etag
+
+    assert rendered.to_response({'If-None-Match': rendered.etag, 'Accept-Encoding': 'gzip'}).status_code == 200
+    assert rendered.to_response({'If-None-Match': rendered.gzip_etag}).status_code == 200
+    assert rendered.to_response({'If-None-Match': '"other"'}).status_code == 200
+    assert RenderedResponse('1.1.1.1\n2.2.2.2', 'text/plain').etag == rendered.etag
+    assert RenderedResponse('1.1.1.1', 'text/plain').etag != rendered.etag
+
+
+def test_rendered_responses_under_concurrent_clients(mocker):
+    """
+    Given
+    - A gevent WSGI server which serves a rendered response from a cache, as the export servers do.
+
+    When
+    - Many clients request it at once, some of them with gzip, and some of them with the ETag they already have.
+
+    Then
+    - Ensure every client gets the body in its encoding with the ETag of the encoding, or a 304 for a matching ETag.
+    - Ensure the response is rendered once for all of the clients.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import gevent
+    import requests
+    from flask import Flask, request
+    from gevent.pywsgi import WSGIServer
+
+    body = '\n'.join(f'1.1.{i // 256}.{i % 256}' for i in range(10000))
+    cache = RenderedResponseCache()
+    renders = []
+    app = Flask(__name__)
+
+    @app.route('/', methods=['GET'])
+    def route_values():
+        request_args = RequestArguments(request.args.get('q', ''))
+        rendered_response = cache.get(request_args)
+        if not rendered_response:
+            renders.append(request_args.query)
+            rendered_response = cache.put(request_args, body, 'text/plain')
+        return rendered_response.to_response(request.headers)
+
+    server = WSGIServer(('127.0.0.1', 0), app, log=None)
+    server.start()
+    url = f'http://127.0.0.1:{server.server_port}/?q=type:IP'
+    rendered = RenderedResponse(body, 'text/plain')
+
+    def get(i):
+        gzipped = i % 2 == 0
+        headers = {'Accept-Encoding': 'gzip' if gzipped else 'identity'}
+        if i % 3 == 0:
+            headers['If-None-Match'] = rendered.gzip_etag if gzipped else rendered.etag
+        with requests.Session() as session:
+            res = session.get(url, headers=headers, timeout=30)
+        return gzipped, headers, res
+
+    clients = 100
+    try:
+        # the server runs on the gevent hub of this thread, so it waits for the clients without blocking the hub
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            futures = [executor.submit(get, i) for i in range(clients)]
+            while not all(future.done() for future in futures):
+                gevent.sleep(0.01)
+        results = [future.result() for future in futures]
+    finally:
+        server.stop()
+
+    for gzipped, headers, res in results:
+        assert res.headers['ETag'] == (rendered.gzip_etag if gzipped else rendered.etag)
+        if 'If-None-Match' in headers:
+            assert res.status_code == 304
+        else:
+            assert res.status_code == 200
+            assert res.headers.get('Content-Encoding') == ('gzip' if gzipped else None)
+            assert res.text == body
+    assert len(results) == clients
+    assert renders == ['type:IP']
+
+
+def test_rendered_response_cache():
+    """
+    Given
+    - A cache of rendered responses.
+
+    When
+    - Getting the response of a request after a cache refresh, and of more requests than the cache keeps.
+
+    Then
+    - Ensure a response is returned only if it was rendered from the required refresh, and that the least recently
+      requested responses are dropped.
+    """
+    cache = RenderedResponseCache(max_entries=2)
+    assert cache.get(RequestArguments('type:IP')) is None
+
+    rendered = cache.put(RequestArguments('type:IP'), '1.1.1.1', 'text/plain', last_run=1000)
+    assert cache.get(RequestArguments('type:IP')) is rendered
+    assert cache.get(RequestArguments('type:IP'), last_run=1000) is rendered
+    assert cache.get(RequestArguments('type:IP'), last_run=2000) is None
+    assert cache.get(RequestArguments('type:IP'), refreshed_after=500) is rendered
+    assert cache.get(RequestArguments('type:IP'), refreshed_after=1000) is None
+    assert cache.get(RequestArguments('type:IP', limit=10)) is None
+
+    cache.put(RequestArguments('type:URL'), 'a.com', 'text/plain')
+    cache.get(RequestArguments('type:IP'))
+    cache.put(RequestArguments('type:Domain'), 'b.com', 'text/plain')
+    assert cache.get(RequestArguments('type:IP')) is rendered
+    assert cache.get(RequestArguments('type:URL')) is None
+
+    cache.clear()
+    assert cache.get(RequestArguments('type:IP')) is None
+
+
+def test_rendered_response_cache_requests():
+    """
+    Given
+    - A cache of rendered responses of several requests.
+
+    When
+    - Getting the requests whose responses are kept.
+
+    Then
+    - Ensure the request arguments are returned from the least to the most recently requested.
+    """
+    cache = RenderedResponseCache()
+    ip_request, url_request = RequestArguments('type:IP'), RequestArguments('type:URL')
+    cache.put(ip_request, '1.1.1.1', 'text/plain')
+    cache.put(url_request, 'a.com', 'text/plain')
+    cache.get(ip_request)
+    assert cache.requests() == [url_request, ip_request]
+
+
+def test_rendered_response_cache_state():
+    """
+    Given
+    - A cache of rendered responses.
+
+    When
+    - Getting the state of several requests, and rendering more requests than the cache keeps.
+
+    Then
+    - Ensure each request gets its own state, the same one on each call, and it is dropped with its response.
+    """
+    cache = RenderedResponseCache(max_entries=2)
+    ip_state, ip_lock = cache.get_state(RequestArguments('type:IP'), list)
+    url_state, url_lock = cache.get_state(RequestArguments('type:URL'), list)
+    assert ip_state is not url_state
+    assert ip_lock is not url_lock
+    assert cache.get_state(RequestArguments('type:IP'), list) == (ip_state, ip_lock)
+
+    cache.put(RequestArguments('type:IP'), '1.1.1.1', 'text/plain')
+    cache.put(RequestArguments('type:URL'), 'a.com', 'text/plain')
+    cache.put(RequestArguments('type:Domain'), 'b.com', 'text/plain')
+    assert cache.get_state(RequestArguments('type:IP'), list)[0] is not ip_state
+    assert cache.get_state(RequestArguments('type:URL'), list)[0] is url_state
+
+
+def test_cache_refresher_single_flight(mocker):
+    """
+    Given
+    - A cache refresher whose refresh takes a while.
+
+    When
+    - Refreshing the cache from several greenlets at once, while the background refresh runs.
+
+    Then
+    - Ensure the refreshes never run at the same time, and a refresh which does not wait is skipped.
+    """
+    import gevent
+
+    mocker.patch.object(demisto, 'debug')
+    running = []
+    overlaps = []
+
+    def refresh():
+        if running:
+            overlaps.append(True)
+        running.append(True)
+        gevent.sleep(0.05)
+        running.pop()
+
+    refresher = CacheRefresher(refresh, interval=60)
+    refresher.start()
+    gevent.sleep(0.01)
+    assert refresher.refresh(wait=False) is False
+
+    gevent.joinall([gevent.spawn(refresher.refresh) for _ in range(3)], raise_error=True)
+    refresher.stop()
+
+    assert not overlaps
+    assert refresher.last_refresh is not None
+    assert refresher.last_refresh_duration >= 0.05
+
+
+def test_cache_refresher_interval(mocker):
+    """
+    Given
+    - A cache refresher whose refresh fails once.
+
+    When
+    - Running it in the background.
+
+    Then
+    - Ensure the cache is refreshed on the interval, and the failure is logged without stopping the refreshes.
+    - Ensure the refreshes run on the gevent hub of the calling thread, and not on another thread.
+    """
+    import threading
+    import time
+
+    import gevent
+
+    mocker.patch.object(demisto, 'debug')
+    error = mocker.patch.object(demisto, 'error')
+    calls = []
+    threads = set()
+
+    def refresh():
+        calls.append(time.monotonic())
+        threads.add(threading.get_ident())
+        if len(calls) == 1:
+            raise ValueError('boom')
+
+    refresher = CacheRefresher(refresh, interval=0.05)
+    refresher.start()
+    gevent.sleep(0.18)
+    refresher.stop()
+
+    assert 3 <= len(calls) <= 5
+    assert threads == {threading.get_ident()}
+    assert 'boom' in error.call_args[0][0]
@@ -7,7 +7,7 @@ import urllib3
 import requests
 import traceback
 from dateutil.parser import parse
-from typing import Optional, Pattern, List
+from typing import Optional, Pattern, List, Tuple, Dict, Any
 
 # disable insecure warnings
 urllib3.disable_warnings()
@@ -15,13 +15,166 @@ urllib3.disable_warnings()
 ''' GLOBALS '''
 TAGS = 'feedTags'
 TLP_COLOR = 'trafficlightprotocol'
+# field regexes with named groups, backreferences or global inline flags can't be embedded in a combined regex
+UNCOMBINABLE_REGEX = re.compile(r'\(\?P|\\[1-9]|\(\?[aiLmsux]+\)')
+TRANSFORM_GROUP_REFERENCE = re.compile(r'\\\\|\\g<(\d+)>|\\([1-9]\d?)(?!\d)')
+FEED_VALIDATORS_KEY = 'feed_validators'
+
+
+class ExtractionPlan:
+    def __init__(self, feed_config: dict, default_indicator_type: str = '', feed_name: str = 'http'):
+        """Compiled extraction rules of a single feed URL.
+        The plan is built once per URL and then applied to each line of the feed, instead of re-compiling the
+        regexes of the feed configuration on every line.
+        Where all the regexes and transforms allow it, they are combined into a single regex of lookaheads, so each
+        line is scanned by one regex rather than by one regex per field.
+        :param feed_config: The configuration of the URL, see ``Client.feed_url_to_config``.
+        :param default_indicator_type: The indicator type to use if the configuration does not have one.
+        :param feed_name: The name of the feed.
+        """
+        self.indicator_type = feed_config.get('indicator_type', default_indicator_type)
+        self.indicator: Optional[Tuple[Pattern, Any]] = None
+        if 'indicator' in feed_config:
+            indicator = feed_config['indicator']
+            regex = re.compile(indicator['regex'])
+            self.indicator = (regex, compile_transform(indicator.get('transform', r'\g<0>'), regex.groups))
+
+        self.fields: List[Tuple[str, Pattern, Any]] = []
+        for field in feed_config.get('fields', []):
+            for f, fattrs in field.items():
+                if 'regex' not in fattrs:
+                    raise ValueError(f'{feed_name} - {f} field does not have a regex')
+                regex = re.compile(fattrs['regex'])
+                self.fields.append((f, regex, compile_transform(fattrs.get('transform', r'\g<0>'), regex.groups)))
+
+        self.combined_regex: Optional[Pattern] = None
+        self.combined_indicator: Optional[Tuple[int, list]] = None
+        self.combined_fields: List[Tuple[str, int, list]] = []
+        if self.fields:
+            self._combine()
+
+    def _combine(self):
+        """Builds a single regex extracting the indicator and all of the fields, if all the rules allow it."""
+        rules = ([self.indicator] if self.indicator else []) + [(regex, transform) for _, regex, transform in self.fields]
+        default_flags = re.compile('').flags
+        for regex, transform in rules:
+            if regex.flags != default_flags or UNCOMBINABLE_REGEX.search(regex.pattern) or \
+                    not isinstance(transform, list):
+                return
+
+        lookaheads = []
+        combined_rules = []
+        group = 0
+        for regex, transform in rules:
+            # every rule is wrapped by a group of its own, followed by the rule's own groups
+            offset = group + 1
+            group = offset + regex.groups
+            if regex.pattern.startswith('^') and '|' not in regex.pattern:
+                # anchored rules can only match at the start of the line, so there is no need to scan for them
+                lookaheads.append(r'(?=({})?)'.format(regex.pattern))
+            else:
+                lookaheads.append(r'(?=(?:[\s\S]*?({}))?)'.format(regex.pattern))
+            combined_rules.append((offset, [part + offset if isinstance(part, int) else part for part in transform]))
+        try:
+            combined_regex = re.compile('^' + ''.join(lookaheads))
+        except re.error:
+            return
+
+        self.combined_regex = combined_regex
+        if self.indicator:
+            self.combined_indicator = combined_rules.pop(0)
+        self.combined_fields = [(f, offset, transform) for (f, _, _), (offset, transform)
+                                in zip(self.fields, combined_rules)]
+
+    def extract(self, line: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Extracts the indicator value and the fields from a stripped, non empty line.
+        :param line: The line to extract from.
+        :return: The extracted indicator value (None if the indicator regex does not match) and the extracted fields.
+        """
+        if self.combined_regex:
+            return self._extract_combined(line)
+
+        value = line.split()[0]
+        if self.indicator:
+            indicator_regex, indicator_transform = self.indicator
+            m = indicator_regex.search(line)
+            if m is None:
+                return None, {}
+            value = expand_transform(m, indicator_transform)
+
+        attributes = {}
+        for f, regex, transform in self.fields:
+            m = regex.search(line)
+            if m is not None:
+                attributes[f] = to_int_if_possible(expand_transform(m, transform))
+        return value, attributes
+
+    def _extract_combined(self, line: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        # the lookaheads are optional, so the combined regex always matches
+        m = self.combined_regex.match(line)  # type: ignore[union-attr]
+        value = line.split()[0]
+        if self.combined_indicator:
+            indicator_group, indicator_transform = self.combined_indicator
+            if m.group(indicator_group) is None:  # type: ignore[union-attr]
+                return None, {}
+            value = expand_transform(m, indicator_transform)
+
+        attributes = {}
+        for f, field_group, transform in self.combined_fields:
+            if m.group(field_group) is not None:  # type: ignore[union-attr]
+                attributes[f] = to_int_if_possible(expand_transform(m, transform))
+        return value, attributes
+
+
+def compile_transform(transform: str, groups: int):
+    """Splits a transform template to its literal parts and group numbers, so it is not parsed again for every match.
+    :param transform: The transform template, e.g. r'\1-\2'.
+    :param groups: The number of groups of the regex the transform is applied on.
+    :return: A list of literal strings and group numbers, or the template itself if it has other escapes.
+    """
+    parts: List[Any] = []
+    position = 0
+    for m in TRANSFORM_GROUP_REFERENCE.finditer(transform):
+        literal = transform[position:m.start()]
+        if '\\' in literal:
+            return transform
+        reference = m.group(1) or m.group(2)
+        if reference is None:
+            # an escaped backslash
+            parts.append(literal + '\\')
+        elif int(reference) > groups:
+            # keep the original template, so that re reports the invalid group reference
+            return transform
+        else:
+            parts.extend([literal, int(reference)])
+        position = m.end()
+    literal = transform[position:]
+    if '\\' in literal:
+        return transform
+    parts.append(literal)
+    return [part for part in parts if part != '']
+
+
+def expand_transform(m, transform) -> str:
+    if isinstance(transform, str):
+        return m.expand(transform)
+    return ''.join(part if isinstance(part, str) else m.group(part) or '' for part in transform)
+
+
+def to_int_if_possible(value: str):
+    try:
+        return int(value)
+    except Exception:
+        return value
 
 
 class Client(BaseClient):
     def __init__(self, url: str, feed_name: str = 'http', insecure: bool = False, credentials: dict = None,
                  ignore_regex: str = None, encoding: str = None, indicator_type: str = '',
                  indicator: str = '', fields: str = '{}', feed_url_to_config: dict = None, polling_timeout: int = 20,
-                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None, **kwargs):
+                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None,
+                 max_concurrent_downloads: int = 5, skip_unmodified_feeds: bool = False,
+                 delta_mode: bool = False, **kwargs):
         """Implements class for miners of plain text feeds over HTTP.
         **Config parameters**
         :param: url: URL of the feed.
@@ -61,6 +214,14 @@ class Client(BaseClient):
             }]
         }
         :param: proxy: Use proxy in requests.
+        :param: max_concurrent_downloads: The maximal number of URLs to download at once. Default: 5
+        :param: skip_unmodified_feeds: boolean, if *true* the ETag, Last-Modified and content digest of each URL are
+            kept in the integration context, and URLs which were not modified since the last fetch are not parsed
+            again. A URL is still parsed once in the period of `get_feed_full_sync_seconds`, so its indicators are
+            not expired. Ignored with the sudden death expiration policy. Default: *false*
+        :param: delta_mode: boolean, if *true* only new and changed indicators are sent by a fetch, and indicators
+            which disappeared from the feed are sent with an expiration. See `FeedIndicatorsDelta`.
+            Ignored with the sudden death expiration policy. Default: *false*
         **Extraction dictionary**
             Extraction dictionaries contain the following keys:
             :regex: Python regular expression for searching the text.
@@ -137,6 +298,27 @@ class Client(BaseClient):
         if custom_fields_mapping is None:
             custom_fields_mapping = {}
         self.custom_fields_mapping = custom_fields_mapping
+        self.max_concurrent_downloads = max_concurrent_downloads
+        # with the sudden death expiration policy, indicators which are not sent in a fetch are expired
+        self.skip_unmodified_feeds = skip_unmodified_feeds and kwargs.get('feedExpirationPolicy') != 'suddenDeath'
+        # an unmodified URL is still parsed once in this period, so its indicators are not expired
+        self.full_sync_seconds = get_feed_full_sync_seconds(kwargs.get('feedExpirationPolicy'),
+                                                            kwargs.get('feedExpirationInterval'))
+        self.delta_mode = delta_mode and kwargs.get('feedExpirationPolicy') != 'suddenDeath'
+        self.feed_validators: Dict[str, dict] = {}
+        self.unmodified_feeds: List[str] = []
+        self.extraction_plans: Dict[str, ExtractionPlan] = {}
+
+    def get_extraction_plan(self, url: str) -> ExtractionPlan:
+        """
+        Get the compiled extraction plan of the given URL, it is built on the first call and cached for later lines.
+        :param url: The feed URL.
+        :return: The extraction plan.
+        """
+        if url not in self.extraction_plans:
+            self.extraction_plans[url] = ExtractionPlan(self.feed_url_to_config.get(url, {}), self.indicator_type,
+                                                        self.feed_name)
+        return self.extraction_plans[url]
 
     def get_feed_config(self, fields_json: str = '', indicator_json: str = ''):
         """
@@ -195,6 +377,16 @@ class Client(BaseClient):
         :param kwargs: Arguments to send to the HTTP API endpoint
         :return: List of indicators
         """
+        return list(self.iter_feeds(**kwargs))
+
+    def iter_feeds(self, skip_unmodified: bool = False, **kwargs):
+        """
+        Send the HTTP requests of all the URLs (services) concurrently over a single pooled session, and yield the
+        lines of each URL after filtering by Regex, as soon as its response arrives.
+        :param skip_unmodified: Whether to skip URLs which were not modified since the validators were last saved.
+        :param kwargs: Arguments to send to the HTTP API endpoint
+        :return: Generator of {url: lines} dicts, in the order the responses arrived
+        """
         kwargs['stream'] = True
         kwargs['verify'] = self._verify
         kwargs['timeout'] = self.polling_timeout
@@ -204,30 +396,59 @@ class Client(BaseClient):
 
         if self.username is not None and self.password is not None:
             kwargs['auth'] = (self.username, self.password)
+
+        urls = self._base_url
+        if not isinstance(urls, list):
+            urls = [urls]
+
+        for url in urls:
+            self.get_extraction_plan(url)
+        saved_validators = get_integration_context().get(FEED_VALIDATORS_KEY, {}) if skip_unmodified else {}
+
+        def send_request(session, url):
+            # runs on a worker thread, the result is logged and saved by the consuming thread
+            validators = saved_validators.get(url, {})
+            fetch_time = time.time()
+            if fetch_time - validators.get('parse_time', 0) >= self.full_sync_seconds:
+                # the URL is parsed even if it was not modified, and its validators are replaced
+                validators = {}
+            r = session.get(
+                url,
+                **dict(kwargs, headers=conditional_request_headers(kwargs.get('headers'), validators))
+            )
+            if r.status_code == 304:
+                return None, validators, f'{url} was not modified since the last fetch'
+            if skip_unmodified and r.ok:
+                r, digest = spool_response(r)
+                new_validators = {
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                    'digest': digest,
+                    'parse_time': fetch_time
+                }
+                if digest == validators.get('digest'):
+                    new_validators['parse_time'] = validators['parse_time']
+                    r.close()
+                    return None, new_validators, f'the content of {url} was not modified since the last fetch'
+                return r, new_validators, None
+            return r, None, None
+
         try:
-            urls = self._base_url
-            url_to_response_list: List[dict] = []
-            if not isinstance(urls, list):
-                urls = [urls]
-            for url in urls:
-                r = requests.get(
-                    url,
-                    **kwargs
-                )
+            for url, (r, validators, unmodified_message) in iter_feeds(urls, send_request,
+                                                                       max_workers=self.max_concurrent_downloads):
+                if validators:
+                    self.feed_validators[url] = validators
+                if unmodified_message:
+                    demisto.debug(f'{self.feed_name} - {unmodified_message}')
+                    self.unmodified_feeds.append(url)
+                    continue
                 try:
                     r.raise_for_status()
                 except Exception:
                     LOG(f'{self.feed_name!r} - exception in request:'
                         f' {r.status_code!r} {r.content!r}')
                     raise
-                url_to_response_list.append({url: r})
-        except requests.ConnectionError:
-            raise requests.ConnectionError('Failed to establish a new connection. Please make sure your URL is valid.')
-
-        results = []
-        for url_to_response in url_to_response_list:
-            for url, lines in url_to_response.items():
-                result = lines.iter_lines()
+                result = r.iter_lines()
                 if self.encoding is not None:
                     result = map(
                         lambda x: x.decode(self.encoding).encode('utf_8'),
@@ -243,8 +464,20 @@ class Client(BaseClient):
                         lambda x: self.ignore_regex.match(x) is None,  # type: ignore[union-attr]
                         result
                     )
-                results.append({url: result})
-        return results
+                yield {url: result}
+        except requests.ConnectionError:
+            raise requests.ConnectionError('Failed to establish a new connection. Please make sure your URL is valid.')
+
+    def save_feed_validators(self):
+        """
+        Save the validators of the URLs fetched by ``iter_feeds`` to the integration context.
+        Should be called only after the indicators of the URLs were created.
+        """
+        if self.feed_validators:
+            integration_context = get_integration_context()
+            integration_context[FEED_VALIDATORS_KEY] = dict(integration_context.get(FEED_VALIDATORS_KEY, {}),
+                                                            **self.feed_validators)
+            set_integration_context(integration_context)
 
     def custom_fields_creator(self, attributes: dict):
         created_custom_fields = {}
@@ -275,57 +508,14 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
     """
     attributes = None
     value: str = ''
-    indicator = None
-    fields_to_extract = []
-    feed_config = client.feed_url_to_config.get(url, {})
-    if feed_config:
-        if 'indicator' in feed_config:
-            indicator = feed_config['indicator']
-            if 'regex' in indicator:
-                indicator['regex'] = re.compile(indicator['regex'])
-            if 'transform' not in indicator:
-                indicator['transform'] = r'\g<0>'
-
-    if 'fields' in feed_config:
-        fields = feed_config['fields']
-        for field in fields:
-            for f, fattrs in field.items():
-                field = {f: {}}
-                if 'regex' in fattrs:
-                    field[f]['regex'] = re.compile(fattrs['regex'])
-                if 'transform' not in fattrs:
-                    field[f]['transform'] = r'\g<0>'
-                else:
-                    field[f]['transform'] = fattrs['transform']
-                fields_to_extract.append(field)
-
     line = line.strip()
     if line:
-        extracted_indicator = line.split()[0]
-        if indicator:
-            extracted_indicator = indicator['regex'].search(line)
-            if extracted_indicator is None:
-                return attributes, value
-            if 'transform' in indicator:
-                extracted_indicator = extracted_indicator.expand(indicator['transform'])
-        attributes = {}
-        for field in fields_to_extract:
-            for f, fattrs in field.items():
-                m = fattrs['regex'].search(line)
-
-                if m is None:
-                    continue
-
-                attributes[f] = m.expand(fattrs['transform'])
-
-                try:
-                    i = int(attributes[f])
-                except Exception:
-                    pass
-                else:
-                    attributes[f] = i
+        plan = client.get_extraction_plan(url)
+        extracted_indicator, attributes = plan.extract(line)
+        if extracted_indicator is None:
+            return None, value
         attributes['value'] = value = extracted_indicator
-        attributes['type'] = feed_config.get('indicator_type', client.indicator_type)
+        attributes['type'] = plan.indicator_type
         attributes['tags'] = feed_tags
 
         if tlp_color:
@@ -334,8 +524,8 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
     return attributes, value
 
 
-def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, **kwargs):
-    iterators = client.build_iterator(**kwargs)
+def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, skip_unmodified=False, **kwargs):
+    iterators = client.iter_feeds(skip_unmodified=skip_unmodified, **kwargs)
     indicators = []
     for iterator in iterators:
         for url, lines in iterator.items():
@@ -430,11 +620,27 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
+            delta = FeedIndicatorsDelta(
+                expiration_policy=params.get('feedExpirationPolicy'),
+                expiration_interval=params.get('feedExpirationInterval'),
+            ) if client.delta_mode else None
+            # all the indicators are sent in a full sync of the delta, so no URL is skipped
             indicators = fetch_indicators_command(client, feed_tags, tlp_color, params.get('indicator_type'),
-                                                  params.get('auto_detect_type'))
+                                                  params.get('auto_detect_type'),
+                                                  skip_unmodified=client.skip_unmodified_feeds and not (
+                                                      delta and delta.is_full_sync))
+            if delta:
+                indicators = delta.filter(indicators)
             # we submit the indicators in batches
             for b in batch(indicators, batch_size=2000):
                 demisto.createIndicators(b)
+            if delta:
+                # indicators of skipped URLs were not seen, but did not disappear from the feed
+                if not client.unmodified_feeds:
+                    for b in batch(delta.expired_indicators(), batch_size=2000):
+                        demisto.createIndicators(b)
+                delta.save(keep_unseen=bool(client.unmodified_feeds))
+            client.save_feed_validators()
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
@@ -1,7 +1,46 @@
-from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main
+from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main, \
+    ExtractionPlan, compile_transform, expand_transform
+import re
+import time
+import pytest
 import requests_mock
 import demistomock as demisto
 
+ASN_FEED_CONFIG = {
+    'indicator_type': 'ASN',
+    'indicator': {
+        'regex': '^AS[0-9]+'
+    },
+    'fields': [
+        {
+            'asndrop_country': {
+                'regex': r'^.*;\W([a-zA-Z]+)\W+',
+                'transform': r'\1'
+            }
+        },
+        {
+            'asndrop_org': {
+                'regex': r'^.*\|\W+(.*)',
+                'transform': r'\1'
+            }
+        }
+    ]
+}
+
+DSHIELD_FEED_CONFIG = {
+    'indicator_type': 'CIDR',
+    'indicator': {
+        'regex': r'^([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})\t([0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3})',
+        'transform': r'\1-\2'
+    },
+    'fields': [
+        {'dshield_nattacks': {'regex': r'^.*\t.*\t[0-9]+\t([0-9]+)', 'transform': r'\1'}},
+        {'dshield_name': {'regex': r'^.*\t.*\t[0-9]+\t[0-9]+\t([^\t]+)', 'transform': r'\1'}},
+        {'dshield_country': {'regex': r'^.*\t.*\t[0-9]+\t[0-9]+\t[^\t]+\t([A-Z]+)', 'transform': r'\1'}},
+        {'dshield_email': {'regex': r'\t(\S+@\S+)$'}}
+    ]
+}
+
 
 def test_get_indicators():
     with open('test_data/asn_ranges.txt') as asn_ranges_txt:
@@ -292,3 +331,317 @@ def test_feed_main_test_module(mocker, requests_mock):
     assert demisto.results.call_count == 1
     results = demisto.results.call_args[0][0]
     assert results['HumanReadable'] == 'ok'
+
+
+@pytest.mark.parametrize('transform, groups, expected', [
+    (r'\g<0>', 0, [0]),
+    (r'\1', 1, [1]),
+    (r'\1-\2', 2, [1, '-', 2]),
+    (r'AS\g<1>', 1, ['AS', 1]),
+    (r'\\\1', 1, ['\\', 1]),
+    (r'\1\t\2', 2, r'\1\t\2'),
+    (r'\2', 1, r'\2'),
+    (r'\g<name>', 1, r'\g<name>'),
+    (r'\123', 1, r'\123'),
+])
+def test_compile_transform(transform, groups, expected):
+    """
+    Given
+    - A transform template of a regex with the given number of groups.
+
+    When
+    - Compiling the transform of an extraction plan.
+
+    Then
+    - Ensure templates with group references only are split to their parts, and all other templates are kept as is.
+    - Ensure the compiled transform expands the same as the original template.
+    """
+    assert compile_transform(transform, groups) == expected
+    m = re.search('(a)(b)?' if groups == 2 else '(a)', 'xab')
+    if isinstance(expected, list):
+        assert expand_transform(m, expected) == m.expand(transform)
+
+
+def dshield_lines():
+    lines = [
+        '1.2.3.0\t1.2.3.255\t24\t{}\tSome Org Name\tUS\tabuse@example.com'.format(i) for i in range(50)
+    ]
+    lines += ['1.2.3.0\t1.2.3.255\t24\t7\tNo Country\t\tabuse@example.com', 'not an indicator\tline']
+    return lines
+
+
+def asn_lines():
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        return [line.strip() for line in asn_ranges_txt if line.strip()]
+
+
+def legacy_extract(feed_config, line):
+    """The per field extraction which was done for each line before extraction plans were introduced."""
+    indicator = feed_config['indicator']
+    m = re.compile(indicator['regex']).search(line)
+    if m is None:
+        return None, {}
+    value = m.expand(indicator.get('transform', r'\g<0>'))
+    attributes = {}
+    for field in feed_config['fields']:
+        for f, fattrs in field.items():
+            m = re.compile(fattrs['regex']).search(line)
+            if m is not None:
+                attributes[f] = m.expand(fattrs.get('transform', r'\g<0>'))
+                try:
+                    attributes[f] = int(attributes[f])
+                except Exception:
+                    pass
+    return value, attributes
+
+
+@pytest.mark.parametrize('feed_config, lines', [
+    (ASN_FEED_CONFIG, asn_lines()),
+    (DSHIELD_FEED_CONFIG, dshield_lines()),
+])
+def test_extraction_plan_combined_regex(feed_config, lines):
+    """
+    Given
+    - A feed configuration with an indicator regex and several field regexes.
+
+    When
+    - Building an extraction plan and applying it on the lines of the feed.
+
+    Then
+    - Ensure the regexes are combined to a single regex.
+    - Ensure the extracted indicators and fields are the same as extracting with a regex per field.
+    """
+    plan = ExtractionPlan(feed_config)
+    assert plan.combined_regex
+    for line in lines:
+        assert plan.extract(line) == legacy_extract(feed_config, line)
+
+
+def test_extraction_plan_uncombinable_regex():
+    """
+    Given
+    - A feed configuration with a field regex that has a named group.
+
+    When
+    - Building an extraction plan and applying it on the lines of the feed.
+
+    Then
+    - Ensure the plan falls back to a regex per field.
+    - Ensure the extracted indicators and fields are the same as extracting with a regex per field.
+    """
+    feed_config = {
+        'indicator': {'regex': '^AS[0-9]+'},
+        'fields': [{'asndrop_country': {'regex': r'^.*;\W(?P<country>[a-zA-Z]+)\W+', 'transform': r'\g<country>'}}]
+    }
+    plan = ExtractionPlan(feed_config)
+    assert plan.combined_regex is None
+    for line in asn_lines():
+        assert plan.extract(line) == legacy_extract(feed_config, line)
+
+
+def test_extraction_plan_benchmark():
+    """
+    Given
+    - A recorded large feed (the Spamhaus ASN-DROP list, repeated to 18,000 lines).
+
+    When
+    - Extracting the indicators with an extraction plan built once, and with the setup being done on every line.
+
+    Then
+    - Ensure reusing the plan parses more lines per second.
+    """
+    lines = asn_lines() * 40
+
+    start = time.perf_counter()
+    for line in lines:
+        ExtractionPlan(ASN_FEED_CONFIG).extract(line)
+    per_line_setup_rate = len(lines) / (time.perf_counter() - start)
+
+    plan = ExtractionPlan(ASN_FEED_CONFIG)
+    start = time.perf_counter()
+    for line in lines:
+        plan.extract(line)
+    plan_rate = len(lines) / (time.perf_counter() - start)
+
+    assert plan_rate > per_line_setup_rate
+
+
+def test_get_indicators_from_several_urls(requests_mock):
+    """
+    Given
+    - Two feed URLs, each with its own configuration.
+
+    When
+    - Fetching indicators, the URLs are downloaded concurrently.
+
+    Then
+    - Ensure the indicators of both URLs are returned, each parsed by the configuration of its URL.
+    """
+    from HTTPFeedApiModule import fetch_indicators_command
+    feed_url_to_config = {
+        'https://www.spamhaus.org/drop/asndrop.txt': ASN_FEED_CONFIG,
+        'https://www.example.com/ips.txt': {'indicator_type': 'IP'}
+    }
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        requests_mock.get('https://www.spamhaus.org/drop/asndrop.txt', content=asn_ranges_txt.read().encode('utf8'))
+    requests_mock.get('https://www.example.com/ips.txt', content=b'1.1.1.1\n2.2.2.2\n')
+    client = Client(url=list(feed_url_to_config), feed_url_to_config=feed_url_to_config, ignore_regex='^;.*')
+
+    indicators = fetch_indicators_command(client, [], None, None, False)
+
+    assert len([indicator for indicator in indicators if indicator['type'] == 'ASN']) == 466
+    assert [indicator['value'] for indicator in indicators if indicator['type'] == 'IP'] == ['1.1.1.1', '2.2.2.2']
+
+
+SPAMHAUS_URL = 'https://www.spamhaus.org/drop/asndrop.txt'
+
+
+def run_fetch(mocker, **params):
+    mocker.patch.object(demisto, 'params', return_value=dict({
+        'url': SPAMHAUS_URL,
+        'ignore_regex': '^;.*',
+        'feed_url_to_config': {SPAMHAUS_URL: ASN_FEED_CONFIG},
+        'skip_unmodified_feeds': True
+    }, **params))
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    feed_main('great_feed_name')
+    return sum(len(call[0][0]) for call in demisto.createIndicators.call_args_list)
+
+
+def test_fetch_skips_feed_not_modified(mocker, requests_mock):
+    """
+    Given
+    - A feed which returns an ETag and Last-Modified headers, and answers 304 to a conditional request.
+
+    When
+    - Fetching indicators twice with skip_unmodified_feeds.
+
+    Then
+    - Ensure the validators are saved to the integration context after the first fetch.
+    - Ensure the second fetch sends the conditional request headers and does not create indicators.
+    """
+    mocker.patch.object(demisto, 'integrationContext', {})
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        asn_ranges = asn_ranges_txt.read().encode('utf8')
+    requests_mock.get(SPAMHAUS_URL, [
+        {'content': asn_ranges, 'headers': {'ETag': '"v1"', 'Last-Modified': 'Tue, 24 Dec 2019 09:11:22 GMT'}},
+        {'status_code': 304}
+    ])
+
+    assert run_fetch(mocker) == 466
+    validators = demisto.getIntegrationContext()['feed_validators'][SPAMHAUS_URL]
+    assert validators['etag'] == '"v1"'
+    assert validators['last_modified'] == 'Tue, 24 Dec 2019 09:11:22 GMT'
+
+    assert run_fetch(mocker) == 0
+    assert requests_mock.last_request.headers['If-None-Match'] == '"v1"'
+    assert requests_mock.last_request.headers['If-Modified-Since'] == 'Tue, 24 Dec 2019 09:11:22 GMT'
+    assert demisto.getIntegrationContext()['feed_validators'][SPAMHAUS_URL] == validators
+
+
+def test_fetch_skips_feed_with_same_content(mocker, requests_mock):
+    """
+    Given
+    - A feed without validator headers, which returns the same content, and then a modified content.
+
+    When
+    - Fetching indicators three times with skip_unmodified_feeds.
+
+    Then
+    - Ensure the second fetch does not create indicators, as the content digest did not change.
+    - Ensure the third fetch creates the indicators of the modified content.
+    """
+    mocker.patch.object(demisto, 'integrationContext', {})
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        asn_ranges = asn_ranges_txt.read().encode('utf8')
+    requests_mock.get(SPAMHAUS_URL, [
+        {'content': asn_ranges},
+        {'content': asn_ranges},
+        {'content': asn_ranges + b'\nAS1 ; US | SOME ORG\n'}
+    ])
+
+    assert run_fetch(mocker) == 466
+    assert run_fetch(mocker) == 0
+    assert run_fetch(mocker) == 467
+
+
+def test_fetch_does_not_skip_with_sudden_death_expiration(mocker, requests_mock):
+    """
+    Given
+    - A feed which returns the same content, configured with the sudden death expiration policy.
+
+    When
+    - Fetching indicators twice with skip_unmodified_feeds.
+
+    Then
+    - Ensure the indicators are created on both fetches, so they are not expired.
+    """
+    mocker.patch.object(demisto, 'integrationContext', {})
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        requests_mock.get(SPAMHAUS_URL, content=asn_ranges_txt.read().encode('utf8'), headers={'ETag': '"v1"'})
+
+    assert run_fetch(mocker, feedExpirationPolicy='suddenDeath') == 466
+    assert run_fetch(mocker, feedExpirationPolicy='suddenDeath') == 466
+    assert 'If-None-Match' not in requests_mock.last_request.headers
+
+
+def test_fetch_parses_unmodified_feed_once_a_day(mocker, requests_mock):
+    """
+    Given
+    - A feed which answers 304 to a conditional request, configured with the indicator type expiration policy.
+
+    When
+    - Fetching indicators with skip_unmodified_feeds, before and after a day passed since the feed was last parsed.
+
+    Then
+    - Ensure the fetch before a day passed does not create indicators.
+    - Ensure the fetch after a day passed sends no conditional request header and creates the indicators again, so
+      they are not expired.
+    """
+    mocker.patch.object(demisto, 'integrationContext', {})
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        asn_ranges = asn_ranges_txt.read().encode('utf8')
+    requests_mock.get(SPAMHAUS_URL, [
+        {'content': asn_ranges, 'headers': {'ETag': '"v1"'}},
+        {'status_code': 304},
+        {'content': asn_ranges, 'headers': {'ETag': '"v1"'}}
+    ])
+
+    assert run_fetch(mocker, feedExpirationPolicy='indicatorType') == 466
+    assert run_fetch(mocker, feedExpirationPolicy='indicatorType') == 0
+
+    demisto.getIntegrationContext()['feed_validators'][SPAMHAUS_URL]['parse_time'] -= 24 * 3600
+    assert run_fetch(mocker, feedExpirationPolicy='indicatorType') == 466
+    assert 'If-None-Match' not in requests_mock.last_request.headers
+
+
+def test_fetch_sends_only_delta(mocker, requests_mock):
+    """
+    Given
+    - A feed which is not modified, and then has an indicator added and another one dropped.
+
+    When
+    - Fetching indicators three times with delta_mode and skip_unmodified_feeds.
+
+    Then
+    - Ensure the indicators of the unmodified feed are not expired.
+    - Ensure the third fetch sends only the added indicator, and the dropped one with an expiration.
+    """
+    mocker.patch.object(demisto, 'integrationContext', {})
+    with open('test_data/asn_ranges.txt') as asn_ranges_txt:
+        asn_ranges = asn_ranges_txt.read()
+    modified = asn_ranges.replace('AS612 ;', '; AS612 ;') + '\nAS1 ; US | SOME ORG\n'
+    requests_mock.get(SPAMHAUS_URL, [
+        {'content': asn_ranges.encode('utf8'), 'headers': {'ETag': '"v1"'}},
+        {'status_code': 304},
+        {'content': modified.encode('utf8')}
+    ])
+
+    assert run_fetch(mocker, delta_mode=True) == 466
+    assert run_fetch(mocker, delta_mode=True) == 0
+    assert run_fetch(mocker, delta_mode=True) == 2
+    created, expired = [call[0][0] for call in demisto.createIndicators.call_args_list]
+    assert [i['value'] for i in created] == ['AS1']
+    assert [i['value'] for i in expired] == ['AS612']
+    assert expired[0]['expiration']
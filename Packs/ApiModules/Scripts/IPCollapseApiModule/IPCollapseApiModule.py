@@ -0,0 +1,225 @@
+''' IMPORTS '''
+
+import socket
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Set, Tuple
+
+''' CONSTANTS '''
+
+# the address family and the number of bits of each IP version
+IP_VERSIONS = {
+    4: (socket.AF_INET, 32),
+    6: (socket.AF_INET6, 128)
+}
+# above this number of added and removed addresses, the ranges are rebuilt instead of updated one address at a time
+MAX_INCREMENTAL_UPDATES = 1000
+
+''' HELPER FUNCTIONS '''
+
+
+def ip_to_int(ip) -> Tuple[int, int]:
+    """Encodes an IP address as an integer
+
+    Args:
+        ip: an IP address string, or an IP address object (netaddr.IPAddress or ipaddress).
+
+    Returns:
+        tuple. the IP version and the integer of the address.
+    """
+    if not isinstance(ip, str):
+        return ip.version, int(ip)
+    for version, (family, _) in IP_VERSIONS.items():
+        try:
+            return version, int.from_bytes(socket.inet_pton(family, ip), 'big')
+        except OSError:
+            continue
+    raise ValueError(f'{ip} is not a valid IP address')
+
+
+def int_to_ip(version: int, value: int) -> str:
+    """Decodes an integer to an IP address string
+
+    Args:
+        version: the IP version.
+        value: the integer of the address.
+
+    Returns:
+        str. the IP address.
+    """
+    family, bits = IP_VERSIONS[version]
+    return socket.inet_ntop(family, value.to_bytes(bits // 8, 'big'))
+
+
+def range_to_cidrs(start: int, end: int, bits: int) -> List[Tuple[int, int]]:
+    """Splits a range of addresses to the fewest CIDRs which cover it
+
+    Args:
+        start: the integer of the first address of the range.
+        end: the integer of the last address of the range.
+        bits: the number of bits of the addresses.
+
+    Returns:
+        list. (network address, prefix length) tuples, in ascending order.
+    """
+    cidrs = []
+    while start <= end:
+        # the largest block which is aligned to the start, and does not go past the end
+        size = start & -start if start else 1 << bits
+        while size > end - start + 1:
+            size >>= 1
+        cidrs.append((start, bits - size.bit_length() + 1))
+        start += size
+    return cidrs
+
+
+''' MAIN CLASS '''
+
+
+class IPCollapser:
+    """Keeps the collapsed ranges of a set of IPv4 and IPv6 addresses, as sorted lists of the first and last
+    address (encoded as integers) of each range, and updates them incrementally when addresses are added or removed.
+
+    Args:
+        ips: the initial IP addresses, strings or IP address objects.
+    """
+
+    def __init__(self, ips: Iterable = ()):
+        self._members: Dict[int, Set[int]] = {version: set() for version in IP_VERSIONS}
+        self._starts: Dict[int, List[int]] = {version: [] for version in IP_VERSIONS}
+        self._ends: Dict[int, List[int]] = {version: [] for version in IP_VERSIONS}
+        self.sync(ips)
+
+    def __len__(self):
+        return sum(len(members) for members in self._members.values())
+
+    def _rebuild(self, version: int):
+        starts: List[int] = []
+        ends: List[int] = []
+        for value in sorted(self._members[version]):
+            if ends and value == ends[-1] + 1:
+                ends[-1] = value
+            else:
+                starts.append(value)
+                ends.append(value)
+        self._starts[version] = starts
+        self._ends[version] = ends
+
+    def _insert(self, version: int, value: int):
+        starts, ends = self._starts[version], self._ends[version]
+        # the address is not a member, so it is after the end of the range before this index
+        i = bisect_right(starts, value)
+        joins_previous = i > 0 and ends[i - 1] == value - 1
+        joins_next = i < len(starts) and starts[i] == value + 1
+        if joins_previous and joins_next:
+            ends[i - 1] = ends[i]
+            del starts[i]
+            del ends[i]
+        elif joins_previous:
+            ends[i - 1] = value
+        elif joins_next:
+            starts[i] = value
+        else:
+            starts.insert(i, value)
+            ends.insert(i, value)
+
+    def _delete(self, version: int, value: int):
+        starts, ends = self._starts[version], self._ends[version]
+        # the address is a member, so it is in the range at this index
+        i = bisect_right(starts, value) - 1
+        start, end = starts[i], ends[i]
+        if start == end:
+            del starts[i]
+            del ends[i]
+        elif value == start:
+            starts[i] = value + 1
+        elif value == end:
+            ends[i] = value - 1
+        else:
+            ends[i] = value - 1
+            starts.insert(i + 1, value + 1)
+            ends.insert(i + 1, end)
+
+    def add(self, ip):
+        """Adds an IP address
+
+        Args:
+            ip: an IP address string, or an IP address object.
+        """
+        version, value = ip_to_int(ip)
+        if value not in self._members[version]:
+            self._members[version].add(value)
+            self._insert(version, value)
+
+    def remove(self, ip):
+        """Removes an IP address, if it was added
+
+        Args:
+            ip: an IP address string, or an IP address object.
+        """
+        version, value = ip_to_int(ip)
+        if value in self._members[version]:
+            self._members[version].discard(value)
+            self._delete(version, value)
+
+    def sync(self, ips: Iterable):
+        """Updates the collapser to hold exactly the given IP addresses. Only the difference from the current
+        addresses is applied, unless most of the addresses changed.
+
+        Args:
+            ips: the IP addresses, strings or IP address objects.
+        """
+        new_members: Dict[int, Set[int]] = {version: set() for version in IP_VERSIONS}
+        for ip in ips:
+            version, value = ip_to_int(ip)
+            new_members[version].add(value)
+
+        for version, members in new_members.items():
+            added = members - self._members[version]
+            removed = self._members[version] - members
+            if len(added) + len(removed) > MAX_INCREMENTAL_UPDATES:
+                self._members[version] = members
+                self._rebuild(version)
+                continue
+            self._members[version] = members
+            for value in removed:
+                self._delete(version, value)
+            for value in added:
+                self._insert(version, value)
+
+    def to_ranges(self, version: int = None) -> List[str]:
+        """Gets the collapsed ranges, in ascending order
+
+        Args:
+            version: the IP version of the ranges. Default: IPv4 and then IPv6.
+
+        Returns:
+            list. 'first-last' ranges, or the address of single address ranges.
+        """
+        ranges = []
+        for ip_version in ([version] if version else IP_VERSIONS):
+            for start, end in zip(self._starts[ip_version], self._ends[ip_version]):
+                if start == end:
+                    ranges.append(int_to_ip(ip_version, start))
+                else:
+                    ranges.append(f'{int_to_ip(ip_version, start)}-{int_to_ip(ip_version, end)}')
+        return ranges
+
+    def to_cidrs(self, version: int = None) -> List[str]:
+        """Gets the fewest CIDRs which cover the addresses, in ascending order
+
+        Args:
+            version: the IP version of the CIDRs. Default: IPv4 and then IPv6.
+
+        Returns:
+            list. 'network/prefix' CIDRs, or the address of single address CIDRs.
+        """
+        cidrs = []
+        for ip_version in ([version] if version else IP_VERSIONS):
+            bits = IP_VERSIONS[ip_version][1]
+            for start, end in zip(self._starts[ip_version], self._ends[ip_version]):
+                for network, prefix in range_to_cidrs(start, end, bits):
+                    if prefix == bits:
+                        cidrs.append(int_to_ip(ip_version, network))
+                    else:
+                        cidrs.append(f'{int_to_ip(ip_version, network)}/{prefix}')
+        return cidrs
@@ -0,0 +1,142 @@
+import random
+
+import pytest
+from netaddr import IPAddress, IPSet, cidr_merge
+
+from IPCollapseApiModule import IPCollapser, range_to_cidrs
+
+
+def random_ips(count, version=4, seed=0):
+    """Random addresses in a small network, so many of them are adjacent."""
+    rand = random.Random(seed)
+    base = int(IPAddress('10.20.0.0' if version == 4 else '2001:db8::'))
+    return {str(IPAddress(base + rand.randrange(4 * count), version)) for _ in range(count)}
+
+
+def netaddr_ranges(ips):
+    ranges = []
+    for ip_range in IPSet(ips).iter_ipranges():
+        first, last = str(IPAddress(ip_range.first, ip_range.version)), str(IPAddress(ip_range.last, ip_range.version))
+        ranges.append(first if first == last else f'{first}-{last}')
+    return ranges
+
+
+def netaddr_cidrs(ips):
+    return [str(cidr.ip) if cidr.size == 1 else str(cidr) for cidr in cidr_merge(ips)]
+
+
+def legacy_ips_to_ranges(ips):
+    """The grouping of the EDL integration before the collapser, with the ranges output."""
+    ips_range_groups = []
+    ips = sorted(ips)
+    if len(ips) > 0:
+        ips_range_groups.append([ips[0]])
+    for ip in ips[1:]:
+        appended = False
+        for group in ips_range_groups:
+            if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
+                group.append(ip)
+                appended = True
+        if not appended:
+            ips_range_groups.append([ip])
+    return [str(group[0]) if len(group) == 1 else f'{group[0]}-{group[-1]}' for group in ips_range_groups]
+
+
+@pytest.mark.parametrize('version', [4, 6])
+def test_collapse_large_random_set(version):
+    """
+    Given
+    - 10,000 random IP addresses, many of which are adjacent.
+
+    When
+    - Collapsing them to ranges and to CIDRs.
+
+    Then
+    - Ensure the ranges and the CIDRs are the same as the ones netaddr collapses the addresses to.
+    """
+    ips = random_ips(10000, version)
+    collapser = IPCollapser(ips)
+    assert len(collapser) == len(ips)
+    assert collapser.to_ranges() == netaddr_ranges(ips)
+    assert collapser.to_cidrs() == netaddr_cidrs(ips)
+
+
+def test_collapse_to_ranges_like_legacy_grouping():
+    """
+    Given
+    - 500 random IPv4 addresses.
+
+    When
+    - Collapsing them to ranges.
+
+    Then
+    - Ensure the ranges are the same as the ones of the grouping of the EDL integration before the collapser.
+    """
+    ips = [IPAddress(ip) for ip in random_ips(500)]
+    assert IPCollapser(ips).to_ranges() == legacy_ips_to_ranges(ips)
+
+
+def test_incremental_updates():
+    """
+    Given
+    - A collapser of 10,000 random IPv4 and IPv6 addresses.
+
+    When
+    - Adding and removing addresses one at a time, and syncing to a set with a few and with many changes.
+
+    Then
+    - Ensure the ranges and the CIDRs are the same as the ones of a collapser built from the new set.
+    """
+    rand = random.Random(1)
+    ips = random_ips(5000, 4) | random_ips(5000, 6)
+    collapser = IPCollapser(ips)
+    candidates = sorted(random_ips(5000, 4, seed=2) | random_ips(5000, 6, seed=2))
+
+    for ip in rand.sample(candidates, 300):
+        if ip in ips:
+            ips.remove(ip)
+            collapser.remove(ip)
+        else:
+            ips.add(ip)
+            collapser.add(ip)
+    assert collapser.to_cidrs() == IPCollapser(ips).to_cidrs()
+
+    for changes in (500, 3000):
+        ips ^= set(rand.sample(candidates, changes))
+        collapser.sync(ips)
+        expected = IPCollapser(ips)
+        assert collapser.to_ranges() == expected.to_ranges()
+        assert collapser.to_cidrs() == expected.to_cidrs()
+        assert collapser.to_ranges(4) + collapser.to_ranges(6) == netaddr_ranges(ips)
+
+
+def test_range_to_cidrs():
+    """
+    Given
+    - Ranges which are not aligned to a CIDR, and the whole IPv4 space.
+
+    When
+    - Splitting them to CIDRs.
+
+    Then
+    - Ensure the fewest CIDRs which cover exactly the range are returned.
+    """
+    assert range_to_cidrs(int(IPAddress('1.1.1.1')), int(IPAddress('1.1.1.7')), 32) == [
+        (int(IPAddress('1.1.1.1')), 32), (int(IPAddress('1.1.1.2')), 31), (int(IPAddress('1.1.1.4')), 30)
+    ]
+    assert range_to_cidrs(0, 2 ** 32 - 1, 32) == [(0, 0)]
+
+
+def test_invalid_ip():
+    """
+    Given
+    - A string which is not an IP address.
+
+    When
+    - Adding it to a collapser.
+
+    Then
+    - Ensure a ValueError is raised.
+    """
+    with pytest.raises(ValueError, match='not a valid IP address'):
+        IPCollapser(['1.1.1.1', '1.1.1'])
@@ -14,7 +14,8 @@ class Client:
                  feed_name_to_config: Dict[str, dict] = None, source_name: str = 'JSON',
                  extractor: str = '', indicator: str = 'indicator',
                  insecure: bool = False, cert_file: str = None, key_file: str = None, headers: dict = None,
-                 tlp_color: Optional[str] = None, **_):
+                 tlp_color: Optional[str] = None, max_concurrent_downloads: int = 5, delta_mode: bool = False,
+                 **kwargs):
         """
         Implements class for miners of JSON feeds over http/https.
         :param url: URL of the feed.
@@ -32,6 +33,10 @@ class Client:
         Example: headers = {'user-agent': 'my-app/0.0.1'} or Authorization: Bearer
         (curl -H "Authorization: Bearer " "https://api-url.com/api/v1/iocs?first_seen_since=2016-1-1")
         :param tlp_color: Traffic Light Protocol color.
+        :param max_concurrent_downloads: The maximal number of feeds to download at once. Default: 5
+        :param delta_mode: if *True* only new and changed indicators are sent by a fetch, and indicators which
+         disappeared from the feed are sent with an expiration. See `FeedIndicatorsDelta`.
+         Ignored with the sudden death expiration policy. Default: *False*
 
          Example:
             Example feed config:
@@ -74,29 +79,62 @@ class Client:
 
         self.cert = (cert_file, key_file) if cert_file and key_file else None
         self.tlp_color = tlp_color
+        self.max_concurrent_downloads = max_concurrent_downloads
+        # with the sudden death expiration policy, indicators which are not sent in a fetch are expired
+        self.delta_mode = delta_mode and kwargs.get('feedExpirationPolicy') != 'suddenDeath'
+        # the errors of the feeds which failed in the last download, by feed name
+        self.failed_feeds: Dict[str, str] = {}
 
     def build_iterator(self, **kwargs) -> List:
-        results = []
-        for feed_name, feed in self.feed_name_to_config.items():
-            r = requests.get(
-                url=feed.get('url', self.url),
-                verify=self.verify,
-                auth=self.auth,
-                cert=self.cert,
-                headers=self.headers,
-                **kwargs
-            )
+        results = list(self.iter_feeds(**kwargs))
+        self.raise_for_failed_feeds()
+        return results
+
+    def raise_for_failed_feeds(self):
+        if self.failed_feeds:
+            raise DemistoException('Failed to fetch the feeds: ' + ', '.join(
+                f'{feed_name} ({error})' for feed_name, error in self.failed_feeds.items()))
 
+    def iter_feeds(self, **kwargs):
+        """
+        Downloads and parses the feeds concurrently over a single pooled session, and yields the result of each feed
+        as soon as it is ready.
+        A feed which failed is skipped, and its error is saved in `failed_feeds`.
+        :return: Generator of {feed name: extracted items} dicts, in the order the feeds were downloaded.
+        """
+        def download_feed(session, feed_name_and_feed):
+            _, feed = feed_name_and_feed
             try:
+                r = session.get(
+                    url=feed.get('url', self.url),
+                    verify=self.verify,
+                    auth=self.auth,
+                    cert=self.cert,
+                    headers=self.headers,
+                    **kwargs
+                )
                 r.raise_for_status()
-                data = r.json()
+                try:
+                    data = r.json()
+                except ValueError as VE:
+                    return None, f'Could not parse returned data to Json. \n\nError massage: {VE}'
                 result = jmespath.search(expression=feed.get('extractor'), data=data)
-                results.append({feed_name: result})
+                if result is None:
+                    return None, f'The extractor {feed.get("extractor")} did not match the returned data'
+                return result, None
 
-            except ValueError as VE:
-                raise ValueError(f'Could not parse returned data to Json. \n\nError massage: {VE}')
+            except Exception as e:
+                return None, str(e)
 
-        return results
+        self.failed_feeds = {}
+        feeds = list(self.feed_name_to_config.items())
+        for (feed_name, _), (result, error) in iter_feeds(feeds, download_feed,
+                                                          max_workers=self.max_concurrent_downloads):
+            if error:
+                demisto.error(f'{self.source_name} - Failed to fetch the feed {feed_name}: {error}')
+                self.failed_feeds[feed_name] = error
+                continue
+            yield {feed_name: result}
 
 
 def test_module(client, params) -> str:
@@ -113,7 +151,7 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
     :param feedTags: the indicator tags
     """
     indicators = []
-    for result in client.build_iterator(**kwargs):
+    for result in client.iter_feeds(**kwargs):
         for service_name, items in result.items():
             feed_config = client.feed_name_to_config.get(service_name, {})
             indicator_field = feed_config.get('indicator') if feed_config.get('indicator') else 'indicator'
@@ -226,14 +264,27 @@ def feed_main(params, feed_name, prefix):
         elif command == 'fetch-indicators':
             indicators = fetch_indicators_command(client, params.get('indicator_type'), feedTags,
                                                   params.get('auto_detect_type'))
+            delta = FeedIndicatorsDelta(
+                expiration_policy=params.get('feedExpirationPolicy'),
+                expiration_interval=params.get('feedExpirationInterval'),
+            ) if client.delta_mode else None
+            if delta:
+                indicators = delta.filter(indicators)
             for b in batch(indicators, batch_size=2000):
                 demisto.createIndicators(b)
+            # the indicators of a failed feed were not seen, but did not disappear from it
+            if delta and not client.failed_feeds:
+                for b in batch(delta.expired_indicators(), batch_size=2000):
+                    demisto.createIndicators(b)
+                delta.save()
+            client.raise_for_failed_feeds()
 
         elif command == f'{prefix}get-indicators':
             # dummy command for testing
             limit = int(demisto.args().get('limit', 10))
             auto_detect = params.get('auto_detect_type')
             indicators = fetch_indicators_command(client, indicator_type, feedTags, auto_detect)[:limit]
+            client.raise_for_failed_feeds()
             hr = tableToMarkdown('Indicators', indicators, headers=['value', 'type', 'rawJSON'])
             return_outputs(hr, {}, indicators)
 
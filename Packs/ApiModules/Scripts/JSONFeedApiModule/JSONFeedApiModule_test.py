@@ -1,4 +1,4 @@
-from JSONFeedApiModule import Client, fetch_indicators_command, jmespath
+from JSONFeedApiModule import Client, fetch_indicators_command, feed_main, jmespath
 from CommonServerPython import *
 import requests_mock
 
@@ -121,3 +121,127 @@ def test_list_of_indicators_with_no_json_object():
         assert indicators[0].get('value') == '1.1.1.1'
         assert indicators[0].get('type') == 'IP'
         assert indicators[1].get('rawJSON') == {'indicator': '2.2.2.2'}
+
+
+def test_feeds_are_downloaded_concurrently():
+    """
+    Given
+    - A local mock server which counts the requests it is answering at the same time.
+    - A growing number of feed URLs on it.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure all of the feeds are downloaded at the same time, as each request is answered only once all of the
+      requests arrived.
+    - Ensure a serial fetch (a single concurrent download) never has two open requests.
+    """
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {'open': 0, 'max_open': 0, 'barrier': None}
+    state_lock = threading.Lock()
+
+    class CountingFeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with state_lock:
+                state['open'] += 1
+                state['max_open'] = max(state['max_open'], state['open'])
+            try:
+                if state['barrier']:
+                    # a serial fetch would never let the other requests arrive, so the wait would time out
+                    state['barrier'].wait()
+                body = FLAT_LIST_OF_INDICATORS.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with state_lock:
+                    state['open'] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingFeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    def fetch(feeds_count, max_concurrent_downloads, barrier_parties=None):
+        state['max_open'] = 0
+        state['barrier'] = threading.Barrier(barrier_parties, timeout=10) if barrier_parties else None
+        feed_name_to_config = {
+            'feed{}'.format(i): {'url': '{}/feed{}'.format(url, i), 'extractor': 'hooks', 'indicator': None}
+            for i in range(feeds_count)
+        }
+        client = Client(url=url, feed_name_to_config=feed_name_to_config,
+                        max_concurrent_downloads=max_concurrent_downloads)
+        indicators = fetch_indicators_command(client=client, indicator_type='IP', feedTags=[], auto_detect=False)
+        assert not client.failed_feeds
+        assert len(indicators) == 3 * feeds_count
+        return state['max_open']
+
+    try:
+        for feeds_count in (2, 5):
+            assert fetch(feeds_count, 5, barrier_parties=feeds_count) == feeds_count
+        assert fetch(5, 1) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_delta_mode_is_ignored_with_sudden_death_expiration():
+    """
+    Given
+    - delta_mode, with the indicator type and the sudden death expiration policies.
+
+    When
+    - Creating the client.
+
+    Then
+    - Ensure delta mode is used only with the indicator type policy, as with sudden death unsent indicators are expired.
+    """
+    assert Client(url='https://api.url', delta_mode=True, feedExpirationPolicy='indicatorType').delta_mode
+    assert not Client(url='https://api.url', delta_mode=True, feedExpirationPolicy='suddenDeath').delta_mode
+
+
+def test_delta_is_not_saved_when_a_feed_failed(mocker):
+    """
+    Given
+    - delta_mode, with two feeds, one of which fails to download.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure the indicators of the other feed are created.
+    - Ensure no indicator is expired and the delta is not saved, as the failed feed indicators were not seen.
+    - Ensure the failed feed is reported.
+    """
+    params = {
+        'url': 'https://api.url',
+        'delta_mode': True,
+        'feedExpirationPolicy': 'indicatorType',
+        'indicator_type': 'IP',
+        'feed_name_to_config': {
+            'good': {'url': 'https://api.url/good', 'extractor': 'hooks', 'indicator': None},
+            'bad': {'url': 'https://api.url/bad', 'extractor': 'hooks', 'indicator': None},
+        },
+    }
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    expired_indicators = mocker.patch.object(FeedIndicatorsDelta, 'expired_indicators', return_value=[])
+    save = mocker.patch.object(FeedIndicatorsDelta, 'save')
+    return_error = mocker.patch('JSONFeedApiModule.return_error')
+
+    with requests_mock.Mocker() as m:
+        m.get('https://api.url/good', content=FLAT_LIST_OF_INDICATORS.encode())
+        m.get('https://api.url/bad', status_code=500)
+        feed_main(params, 'JSON Feed', 'json')
+
+    assert sum(len(call[0][0]) for call in create_indicators.call_args_list) == 3
+    assert not expired_indicators.called
+    assert not save.called
+    assert 'bad' in return_error.call_args[0][0]
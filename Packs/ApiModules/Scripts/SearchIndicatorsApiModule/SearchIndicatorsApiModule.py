@@ -0,0 +1,257 @@
+import demistomock as demisto
+
+''' IMPORTS '''
+import threading
+import time
+from collections import OrderedDict
+from queue import Empty, Full, Queue
+from typing import Any, Iterator, List, Optional, Tuple
+
+''' CONSTANTS '''
+
+DEFAULT_PAGE_SIZE = 200
+MIN_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 2000
+# a page which is returned in less than half of this time is followed by a larger page, and a slower page by a smaller one
+TARGET_PAGE_TIME = 2.0
+# the number of seconds a snapshot of a query is read from memory before the query is searched again
+SNAPSHOT_MAX_AGE = 60
+# the maximal number of snapshots kept in memory, the oldest snapshots are dropped first
+MAX_SNAPSHOTS = 16
+# the maximal number of indicators kept in a snapshot, indicators beyond it are searched again by each reader
+MAX_SNAPSHOT_SIZE = 100000
+# the interval in seconds in which the prefetch thread checks whether the stream was closed
+PREFETCH_POLL_INTERVAL = 1
+
+''' MAIN CLASSES '''
+
+
+class IndicatorsSearcher:
+    """Streams the results of a demisto.searchIndicators query page by page, without holding all of them in memory.
+
+    When the server returns a searchAfter value, the next pages are searched after it, and the page size is adapted
+    to the time it takes the server to return a page. Otherwise, the pages are searched by number with a fixed size.
+
+    Args:
+        query: the indicators query.
+        page_size: the size of the first page.
+        max_page_size: the maximal size of a page.
+        prefetch: whether to search the next page on a background thread while the current page is consumed.
+            The consumer must not call demisto server functions while the stream is open.
+        target_page_time: the number of seconds it should take the server to return a page.
+        search_args: additional demisto.searchIndicators arguments, e.g. fromDate or toDate.
+    """
+
+    def __init__(self, query: str = '', page_size: int = DEFAULT_PAGE_SIZE, max_page_size: int = MAX_PAGE_SIZE,
+                 prefetch: bool = False, target_page_time: float = TARGET_PAGE_TIME, **search_args):
+        self.query = query
+        self.page_size = page_size
+        self.max_page_size = max(max_page_size, page_size)
+        self.prefetch = prefetch
+        self.target_page_time = target_page_time
+        self.search_args = search_args
+        self.pages_fetched = 0
+
+    def _search(self, page: int, size: int, search_after: Any) -> Tuple[List[dict], Any, float]:
+        start = time.monotonic()
+        if search_after:
+            res = demisto.searchIndicators(query=self.query, size=size, searchAfter=search_after, **self.search_args)
+        else:
+            res = demisto.searchIndicators(query=self.query, page=page, size=size, **self.search_args)
+        took = time.monotonic() - start
+        self.pages_fetched += 1
+        res = res or {}
+        # In case the result from searchIndicators includes the key `iocs` but it's value is None
+        return res.get('iocs') or [], res.get('searchAfter'), took
+
+    def _next_page_size(self, size: int, took: float) -> int:
+        if took < self.target_page_time / 2:
+            return min(size * 2, self.max_page_size)
+        if took > self.target_page_time:
+            return max(size // 2, MIN_PAGE_SIZE)
+        return size
+
+    def _search_pages(self, offset: int) -> Iterator[List[dict]]:
+        size = self.page_size
+        page, skip = divmod(offset, size)
+        search_after = None
+        while True:
+            iocs, next_search_after, took = self._search(page, size, search_after)
+            is_last_page = len(iocs) < size
+            if iocs[skip:]:
+                yield iocs[skip:]
+            if is_last_page:
+                return
+            skip = 0
+            page += 1
+            if next_search_after:
+                # the page size can change only between pages which are searched after the previous page
+                search_after = next_search_after
+                size = self._next_page_size(size, took)
+
+    def _prefetch_pages(self, pages: Iterator[List[dict]]) -> Iterator[List[dict]]:
+        queue: Queue = Queue(maxsize=1)
+        closed = threading.Event()
+
+        def put(item):
+            while not closed.is_set():
+                try:
+                    queue.put(item, timeout=PREFETCH_POLL_INTERVAL)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for page in pages:
+                    if not put((page, None)):
+                        return
+                put((None, None))
+            except Exception as e:
+                put((None, e))
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                page, error = queue.get()
+                if error:
+                    raise error
+                if page is None:
+                    return
+                yield page
+        finally:
+            closed.set()
+            try:
+                queue.get_nowait()
+            except Empty:
+                pass
+
+    def pages(self, offset: int = 0) -> Iterator[List[dict]]:
+        """Streams the indicators page by page
+
+        Args:
+            offset: the number of indicators to skip.
+
+        Returns:
+            generator. the non-empty pages of indicators.
+        """
+        pages = self._search_pages(offset)
+        if self.prefetch:
+            pages = self._prefetch_pages(pages)
+        return pages
+
+    def iter_indicators(self, offset: int = 0, limit: Optional[int] = None) -> Iterator[dict]:
+        """Streams the indicators one by one
+
+        Args:
+            offset: the number of indicators to skip.
+            limit: the maximal number of indicators to stream. Default: all of them.
+
+        Returns:
+            generator. the indicators.
+        """
+        if limit is not None and limit <= 0:
+            return
+        count = 0
+        for page in self.pages(offset):
+            for ioc in page:
+                yield ioc
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.iter_indicators()
+
+
+class IndicatorsSnapshot:
+    """The results of an indicators query, which several readers (e.g. several export formats) read from memory
+    instead of searching the query again. Pages are searched only when a reader needs indicators which were not
+    searched yet. Only the first max_size indicators are kept, so a large query does not take up the memory.
+
+    Args:
+        searcher: the searcher of the query.
+        max_age: the number of seconds after which the snapshot expires.
+        max_size: the maximal number of indicators kept in the snapshot.
+    """
+
+    def __init__(self, searcher: IndicatorsSearcher, max_age: float = SNAPSHOT_MAX_AGE,
+                 max_size: int = MAX_SNAPSHOT_SIZE):
+        self.searcher = searcher
+        self.max_age = max_age
+        self.max_size = max_size
+        self.created = time.monotonic()
+        self._iocs: List[dict] = []
+        self._pages: Optional[Iterator[List[dict]]] = None
+        self._complete = False
+        self._truncated = False
+        self._lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.created > self.max_age
+
+    def get(self, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Gets indicators of the query
+
+        Args:
+            offset: the number of indicators to skip.
+            limit: the maximal number of indicators to get. Default: all of them.
+
+        Returns:
+            list. the indicators, in the order the query returned them.
+        """
+        end = offset + limit if limit is not None else None
+        with self._lock:
+            if self._pages is None and not self._truncated:
+                self._pages = self.searcher.pages()
+            while self._pages is not None and not self._complete and (end is None or len(self._iocs) < end):
+                page = next(self._pages, None)
+                if page is None:
+                    self._complete = True
+                elif len(self._iocs) + len(page) > self.max_size:
+                    self._iocs.extend(page[:self.max_size - len(self._iocs)])
+                    self._truncated = True
+                    self._pages.close()  # type: ignore[attr-defined]
+                    self._pages = None
+                else:
+                    self._iocs.extend(page)
+            if self._complete or (end is not None and end <= len(self._iocs)):
+                return self._iocs[offset:end]
+        # the indicators beyond the snapshot are searched again, and are not kept
+        return list(self.searcher.iter_indicators(offset, limit))
+
+
+''' HELPER FUNCTIONS '''
+
+# the snapshots by query, from the oldest to the newest. the snapshots are searched outside of the lock
+_SNAPSHOTS: OrderedDict = OrderedDict()
+_SNAPSHOTS_LOCK = threading.Lock()
+
+
+def get_indicators_snapshot(query: str, max_age: float = SNAPSHOT_MAX_AGE, refresh: bool = False,
+                            **searcher_args) -> IndicatorsSnapshot:
+    """Gets the snapshot of an indicators query, and creates it if it does not exist or expired.
+    Expired snapshots are dropped, and the oldest snapshots are dropped when more than MAX_SNAPSHOTS are kept.
+
+    Args:
+        query: the indicators query.
+        max_age: the number of seconds after which a new snapshot is created.
+        refresh: whether to create a new snapshot even if the snapshot of the query did not expire.
+        searcher_args: additional IndicatorsSearcher arguments.
+
+    Returns:
+        IndicatorsSnapshot. the snapshot of the query.
+    """
+    key = (query, max_age, tuple(sorted(searcher_args.items())))
+    with _SNAPSHOTS_LOCK:
+        for expired_key in [key for key, snapshot in _SNAPSHOTS.items() if snapshot.expired]:
+            del _SNAPSHOTS[expired_key]
+        if refresh or key not in _SNAPSHOTS:
+            _SNAPSHOTS.pop(key, None)
+            _SNAPSHOTS[key] = IndicatorsSnapshot(IndicatorsSearcher(query, **searcher_args), max_age)
+            while len(_SNAPSHOTS) > MAX_SNAPSHOTS:
+                _SNAPSHOTS.popitem(last=False)
+        return _SNAPSHOTS[key]
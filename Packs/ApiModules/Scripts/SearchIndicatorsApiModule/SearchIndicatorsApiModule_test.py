@@ -0,0 +1,184 @@
+import pytest
+
+import demistomock as demisto
+from SearchIndicatorsApiModule import *
+
+INDICATORS = [{'value': f'1.1.{i // 256}.{i % 256}', 'indicator_type': 'IP'} for i in range(1000)]
+
+
+def search_indicators_mock(indicators, search_after=True):
+    """A demisto.searchIndicators mock, which returns a searchAfter value unless search_after is False"""
+    calls = []
+
+    def search_indicators(query='', page=0, size=100, searchAfter=None, **_):
+        calls.append({'page': page, 'size': size, 'searchAfter': searchAfter})
+        start = searchAfter[0] if searchAfter else page * size
+        iocs = indicators[start:start + size]
+        res = {'iocs': iocs, 'total': len(indicators)}
+        if search_after and iocs:
+            res['searchAfter'] = [start + len(iocs)]
+        return res
+
+    return search_indicators, calls
+
+
+@pytest.mark.parametrize('search_after, prefetch', [(True, False), (False, False), (True, True)])
+def test_iter_indicators(mocker, search_after, prefetch):
+    """
+    Given
+    - A server which returns a searchAfter value, and a server which does not.
+
+    When
+    - Streaming the indicators of a query, with and without an offset and a limit.
+
+    Then
+    - Ensure the indicators are streamed in order, from the offset and up to the limit.
+    """
+    search_indicators, _ = search_indicators_mock(INDICATORS, search_after)
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    searcher = IndicatorsSearcher(page_size=30, prefetch=prefetch)
+    assert list(searcher) == INDICATORS
+    assert list(searcher.iter_indicators(offset=45)) == INDICATORS[45:]
+    assert list(searcher.iter_indicators(offset=45, limit=100)) == INDICATORS[45:145]
+    assert list(searcher.iter_indicators(offset=2000)) == []
+
+
+def test_adaptive_page_size(mocker):
+    """
+    Given
+    - A server which returns a searchAfter value.
+
+    When
+    - The server returns the pages fast, and then slowly.
+
+    Then
+    - Ensure the page size grows up to the maximal page size, and shrinks when the pages are slow.
+    """
+    search_indicators, calls = search_indicators_mock(INDICATORS)
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    assert len(list(IndicatorsSearcher(page_size=50, max_page_size=200))) == len(INDICATORS)
+    assert [call['size'] for call in calls] == [50, 100, 200, 200, 200, 200, 200]
+    assert calls[0]['page'] == 0 and calls[0]['searchAfter'] is None
+    assert calls[1]['searchAfter'] == [50]
+
+    calls.clear()
+    searcher = IndicatorsSearcher(page_size=400, target_page_time=0)
+    assert len(list(searcher)) == len(INDICATORS)
+    assert [call['size'] for call in calls] == [400, 200, 100, 50, 50, 50, 50, 50, 50, 50]
+    assert searcher.pages_fetched == len(calls)
+
+
+def test_fixed_page_size_without_search_after(mocker):
+    """
+    Given
+    - A server which does not return a searchAfter value.
+
+    When
+    - Streaming the indicators of a query.
+
+    Then
+    - Ensure the pages are searched by number with the same size.
+    """
+    search_indicators, calls = search_indicators_mock(INDICATORS, search_after=False)
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    assert list(IndicatorsSearcher(page_size=300).iter_indicators(offset=350)) == INDICATORS[350:]
+    assert calls == [{'page': page, 'size': 300, 'searchAfter': None} for page in (1, 2, 3)]
+
+
+def test_prefetch_error(mocker):
+    """
+    Given
+    - A server which fails on the second page.
+
+    When
+    - Streaming the indicators of a query with prefetch.
+
+    Then
+    - Ensure the error is raised to the consumer of the stream.
+    """
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=[{'iocs': INDICATORS[:10]}, ValueError('boom')])
+    stream = IndicatorsSearcher(page_size=10, prefetch=True).iter_indicators()
+    assert [next(stream) for _ in range(10)] == INDICATORS[:10]
+    with pytest.raises(ValueError, match='boom'):
+        next(stream)
+
+
+def test_indicators_snapshot(mocker):
+    """
+    Given
+    - A snapshot of a query.
+
+    When
+    - Reading parts of the indicators several times, and after the snapshot expired.
+
+    Then
+    - Ensure pages are searched only for indicators which were not read before, and again after the snapshot expired.
+    """
+    search_indicators, calls = search_indicators_mock(INDICATORS)
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    snapshot = get_indicators_snapshot('type:IP', page_size=100, max_page_size=100)
+    assert snapshot.get(0, 150) == INDICATORS[:150]
+    assert len(calls) == 2
+    assert get_indicators_snapshot('type:IP', page_size=100, max_page_size=100) is snapshot
+    assert snapshot.get(50, 50) == INDICATORS[50:100]
+    assert len(calls) == 2
+    assert snapshot.get(100) == INDICATORS[100:]
+    # the last page is full, so an empty page is searched after it
+    assert len(calls) == 11
+
+    assert get_indicators_snapshot('type:URL', page_size=100, max_page_size=100) is not snapshot
+    snapshot.created -= SNAPSHOT_MAX_AGE + 1
+    assert get_indicators_snapshot('type:IP', page_size=100, max_page_size=100) is not snapshot
+
+
+def test_indicators_snapshot_max_size(mocker):
+    """
+    Given
+    - A snapshot which keeps up to 250 indicators of a query with 1000 indicators.
+
+    When
+    - Reading indicators within the kept indicators, and beyond them.
+
+    Then
+    - Ensure only 250 indicators are kept.
+    - Ensure the indicators within the kept indicators are read from memory.
+    - Ensure the indicators beyond the kept indicators are searched again, and are correct.
+    """
+    search_indicators, calls = search_indicators_mock(INDICATORS)
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    snapshot = IndicatorsSnapshot(IndicatorsSearcher('type:IP', page_size=100, max_page_size=100), max_size=250)
+    assert snapshot.get(0, 200) == INDICATORS[:200]
+    assert len(calls) == 2
+    assert snapshot.get(100, 200) == INDICATORS[100:300]
+    assert len(snapshot._iocs) == 250
+    searched = len(calls)
+    assert snapshot.get(0, 250) == INDICATORS[:250]
+    assert len(calls) == searched
+    assert snapshot.get(200) == INDICATORS[200:]
+    assert len(snapshot._iocs) == 250
+
+
+def test_indicators_snapshot_refresh_and_eviction(mocker):
+    """
+    Given
+    - Snapshots of several queries.
+
+    When
+    - Forcing a refresh of a query, and getting the snapshots of more queries than are kept.
+
+    Then
+    - Ensure a forced refresh creates a new snapshot of the query, which is then reused.
+    - Ensure the oldest snapshots are dropped first.
+    """
+    import SearchIndicatorsApiModule
+    mocker.patch.object(SearchIndicatorsApiModule, '_SNAPSHOTS', OrderedDict())
+    snapshot = get_indicators_snapshot('type:IP')
+    refreshed = get_indicators_snapshot('type:IP', refresh=True)
+    assert refreshed is not snapshot
+    assert get_indicators_snapshot('type:IP') is refreshed
+
+    for i in range(MAX_SNAPSHOTS):
+        get_indicators_snapshot(f'value:{i}')
+    assert len(SearchIndicatorsApiModule._SNAPSHOTS) == MAX_SNAPSHOTS
+    assert get_indicators_snapshot('type:IP') is not refreshed
+    assert get_indicators_snapshot(f'value:{MAX_SNAPSHOTS - 1}') is get_indicators_snapshot(f'value:{MAX_SNAPSHOTS - 1}')
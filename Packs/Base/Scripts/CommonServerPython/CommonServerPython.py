@@ -6,17 +6,24 @@ Note that adding code to CommonServerUserPython can override functions in Common
 from __future__ import print_function
 
 import base64
+import hashlib
+import io
+import itertools
 import json
 import logging
 import os
 import re
 import socket
 import sys
+import tempfile
+import threading
 import time
 import traceback
+import zlib
 from random import randint
 import xml.etree.cElementTree as ET
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from email.utils import parsedate_tz, mktime_tz
 from datetime import datetime, timedelta
 from abc import abstractmethod
 
@@ -34,6 +41,13 @@ except Exception:
         # for more info see https://cosmicpercolator.com/2016/01/13/exception-leaks-in-python-2-and-3/
         sys.exc_clear()
 
+try:
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+except Exception:
+    # the futures backport might be missing in python 2 docker images, run_concurrently falls back to a serial run
+    if sys.version_info[0] < 3:
+        sys.exc_clear()
+
 CONTENT_RELEASE_VERSION = '0.0.0'
 CONTENT_BRANCH_NAME = 'master'
 IS_PY3 = sys.version_info[0] == 3
@@ -277,66 +291,129 @@ class FeedIndicatorType(object):
             return None
 
 
-def auto_detect_indicator_type(indicator_value):
+class IndicatorTypeDetector(object):
     """
-      Infer the type of the indicator.
-
-      :type indicator_value: ``str``
-      :param indicator_value: The indicator whose type we want to check. (required)
+    Infers the types of indicators, with the same results as trying the indicator patterns one after the
+    other. Each indicator is matched only against the patterns which its first character and length allow,
+    and the public suffix list is loaded once for all the indicators, so a detector should be created once
+    and reused for all the indicators of a feed. The public suffix list is loaded only when a value is not
+    matched by any pattern, and if it can not be loaded no value is detected as a domain.
 
-      :return: The type of the indicator.
-      :rtype: ``str``
+    :return: No data returned
+    :rtype: ``None``
     """
-    try:
-        import tldextract
-    except Exception:
-        raise Exception("Missing tldextract module, In order to use the auto detect function please use a docker"
-                        " image with it installed such as: demisto/jmespath")
 
-    if re.match(ipv4cidrRegex, indicator_value):
-        return FeedIndicatorType.CIDR
+    DIGITS = '0123456789'
+    HEX_DIGITS = '0123456789abcdefABCDEF'
 
-    if re.match(ipv6cidrRegex, indicator_value):
-        return FeedIndicatorType.IPv6CIDR
+    def __init__(self):
+        try:
+            import tldextract
+        except Exception:
+            raise Exception("Missing tldextract module, In order to use the auto detect function please use a docker"
+                            " image with it installed such as: demisto/jmespath")
+
+        self._tldextract = tldextract
+        self._extract = None
+        self._extract_created = False
+
+        # the patterns in the order they are tried, with the first characters, the substrings and the minimal length
+        # of every value the pattern matches (None where any first character is possible)
+        patterns = [
+            (ipv4cidrRegex, FeedIndicatorType.CIDR, self.DIGITS, ('/',), 0),
+            (ipv6cidrRegex, FeedIndicatorType.IPv6CIDR, self.HEX_DIGITS + ':', ('/', ':'), 0),
+            (ipv4Regex, FeedIndicatorType.IP, self.DIGITS, ('.',), 0),
+            (ipv6Regex, FeedIndicatorType.IPv6, self.HEX_DIGITS + ':', (':',), 0),
+            (sha256Regex, FeedIndicatorType.File, self.HEX_DIGITS, (), 64),
+            (urlRegex, FeedIndicatorType.URL, 'fhw', (), 0),
+            (md5Regex, FeedIndicatorType.File, self.HEX_DIGITS, (), 32),
+            (sha1Regex, FeedIndicatorType.File, self.HEX_DIGITS, (), 40),
+            (emailRegex, FeedIndicatorType.Email, None, ('@',), 0),
+            (cveRegex, FeedIndicatorType.CVE, 'cC', ('-',), 0),
+            (sha512Regex, FeedIndicatorType.File, self.HEX_DIGITS, (), 128),
+        ]
+        all_first_characters = set(''.join(pattern[2] for pattern in patterns if pattern[2]))
+
+        # the patterns to try for the values which start with each character, and for the other values
+        self._patterns_by_first_character = dict((first_character, []) for first_character in all_first_characters)
+        self._default_patterns = []
+        for pattern, indicator_type, first_characters, substrings, min_length in patterns:
+            matcher = (re.compile(pattern), indicator_type, substrings, min_length)
+            if first_characters is None:
+                self._default_patterns.append(matcher)
+            for first_character in all_first_characters:
+                if first_characters is None or first_character in first_characters:
+                    self._patterns_by_first_character[first_character].append(matcher)
+
+    def detect(self, indicator_value):
+        """
+          Infer the type of the indicator.
 
-    if re.match(ipv4Regex, indicator_value):
-        return FeedIndicatorType.IP
+          :type indicator_value: ``str``
+          :param indicator_value: The indicator whose type we want to check. (required)
 
-    if re.match(ipv6Regex, indicator_value):
-        return FeedIndicatorType.IPv6
+          :return: The type of the indicator.
+          :rtype: ``str``
+        """
+        value_length = len(indicator_value)
+        for pattern, indicator_type, substrings, min_length in self._patterns_by_first_character.get(
+                indicator_value[:1], self._default_patterns):
+            if value_length < min_length or not all(substring in indicator_value for substring in substrings):
+                continue
+            if pattern.match(indicator_value):
+                return indicator_type
 
-    if re.match(sha256Regex, indicator_value):
-        return FeedIndicatorType.File
+        try:
+            extract = self._get_extract()
+            if extract and extract(indicator_value).suffix:
+                if '*' in indicator_value:
+                    return FeedIndicatorType.DomainGlob
+                return FeedIndicatorType.Domain
 
-    if re.match(urlRegex, indicator_value):
-        return FeedIndicatorType.URL
+        except Exception:
+            pass
 
-    if re.match(md5Regex, indicator_value):
-        return FeedIndicatorType.File
+        return None
 
-    if re.match(sha1Regex, indicator_value):
-        return FeedIndicatorType.File
+    def _get_extract(self):
+        if not self._extract_created:
+            try:
+                self._extract = self._tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)
+            except Exception:
+                self._extract = None
+            self._extract_created = True
+        return self._extract
 
-    if re.match(emailRegex, indicator_value):
-        return FeedIndicatorType.Email
+    def detect_batch(self, indicator_values):
+        """
+          Infer the types of several indicators.
 
-    if re.match(cveRegex, indicator_value):
-        return FeedIndicatorType.CVE
+          :type indicator_values: ``list``
+          :param indicator_values: The indicators whose types we want to check. (required)
 
-    if re.match(sha512Regex, indicator_value):
-        return FeedIndicatorType.File
+          :return: The type of each indicator (or None if it could not be inferred), in the order of the indicators.
+          :rtype: ``list``
+        """
+        return [self.detect(indicator_value) for indicator_value in indicator_values]
 
-    try:
-        no_cache_extract = tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)
-        if no_cache_extract(indicator_value).suffix:
-            if '*' in indicator_value:
-                return FeedIndicatorType.DomainGlob
-            return FeedIndicatorType.Domain
 
-    except Exception:
-        pass
+_indicator_type_detector = None
+
+
+def auto_detect_indicator_type(indicator_value):
+    """
+      Infer the type of the indicator.
+
+      :type indicator_value: ``str``
+      :param indicator_value: The indicator whose type we want to check. (required)
 
-    return None
+      :return: The type of the indicator.
+      :rtype: ``str``
+    """
+    global _indicator_type_detector
+    if _indicator_type_detector is None:
+        _indicator_type_detector = IndicatorTypeDetector()
+    return _indicator_type_detector.detect(indicator_value)
 
 
 def handle_proxy(proxy_param_name='proxy', checkbox_default_value=False, handle_insecure=True,
@@ -984,19 +1061,32 @@ class IntegrationLogger(object):
       use LOG(<message>) to add a record to the logger (message can be any object with __str__)
       use LOG.print_log(verbose=True/False) to display all records in War-Room (if verbose) and server log.
       use add_replace_strs to add sensitive strings that should be replaced before going to the log.
+      while buffering, the oldest records are dropped once the records are longer than max_buffer_size
+      characters in total.
 
-      :type message: ``str``
-      :param message: The message to be logged
+      :type max_buffer_size: ``int``
+      :param max_buffer_size: The maximal total length of the buffered records. Default is the
+        COMMON_SERVER_LOG_BUFFER_SIZE os env, or 10M characters.
 
       :return: No data returned
       :rtype: ``None``
     """
 
-    def __init__(self):
-        self.messages = []  # type: list
+    DEFAULT_MAX_BUFFER_SIZE = 10 * 1024 * 1024
+
+    def __init__(self, max_buffer_size=None):
+        self.messages = deque()  # type: deque
         self.write_buf = []  # type: list
         self.replace_strs = []  # type: list
         self.buffering = True
+        if not max_buffer_size:
+            max_buffer_size = int(os.getenv('COMMON_SERVER_LOG_BUFFER_SIZE') or self.DEFAULT_MAX_BUFFER_SIZE)
+        self.max_buffer_size = max_buffer_size
+        self.buffer_size = 0
+        self.dropped_messages = 0
+        # all the replace strings in one pattern, which is compiled again only when replace strings are added
+        self._replace_regex = None
+        self._replace_regex_strs_count = 0
         # if for some reason you don't want to auto add credentials.password to replace strings
         # set the os env COMMON_SERVER_NO_AUTO_REPLACE_STRS. Either in CommonServerUserPython, or docker env
         if (not os.getenv('COMMON_SERVER_NO_AUTO_REPLACE_STRS') and hasattr(demisto, 'getParam')):
@@ -1015,7 +1105,8 @@ class IntegrationLogger(object):
                     if p in k_lower:
                         self.add_replace_strs(v, b64_encode(v))
 
-    def encode(self, message):
+    @staticmethod
+    def _to_str(message):
         try:
             res = str(message)
         except UnicodeEncodeError as exception:
@@ -1028,14 +1119,34 @@ class IntegrationLogger(object):
                 res = message.encode('utf-8', 'replace')  # type: ignore
             else:
                 res = "Failed encoding message with error: {}".format(exception)
-        for s in self.replace_strs:
-            res = res.replace(s, '<XX_REPLACED>')
         return res
 
+    def _get_replace_regex(self):
+        if self._replace_regex_strs_count != len(self.replace_strs):
+            # the longest strings first, so a string is replaced entirely and not only a replace string it starts with
+            replace_strs = sorted(set(s for s in self.replace_strs if s), key=len, reverse=True)
+            self._replace_regex = re.compile('|'.join(re.escape(s) for s in replace_strs)) if replace_strs else None
+            self._replace_regex_strs_count = len(self.replace_strs)
+        return self._replace_regex
+
+    def encode(self, message):
+        res = self._to_str(message)
+        replace_regex = self._get_replace_regex()
+        if replace_regex:
+            res = replace_regex.sub('<XX_REPLACED>', res)
+        return res
+
+    def _add_message(self, text):
+        self.messages.append(text)
+        self.buffer_size += len(text)
+        while self.buffer_size > self.max_buffer_size and len(self.messages) > 1:
+            self.buffer_size -= len(self.messages.popleft())
+            self.dropped_messages += 1
+
     def __call__(self, message):
         text = self.encode(message)
         if self.buffering:
-            self.messages.append(text)
+            self._add_message(text)
         else:
             demisto.info(text)
 
@@ -1047,9 +1158,10 @@ class IntegrationLogger(object):
         to_add = []
         for a in args:
             if a:
-                a = self.encode(a)
-                to_add.append(stringEscape(a))
-                to_add.append(stringUnEscape(a))
+                a = self._to_str(a)
+                for s in (stringEscape(a), stringUnEscape(a)):
+                    if s and s not in self.replace_strs and s not in to_add:
+                        to_add.append(s)
         self.replace_strs.extend(to_add)
 
     def set_buffering(self, state):
@@ -1063,13 +1175,18 @@ class IntegrationLogger(object):
 
     def print_log(self, verbose=False):
         if self.write_buf:
-            self.messages.append("".join(self.write_buf))
+            self._add_message("".join(self.write_buf))
         if self.messages:
-            text = 'Full Integration Log:\n' + '\n'.join(self.messages)
+            text = 'Full Integration Log:\n'
+            if self.dropped_messages:
+                text += '({} older records were dropped)\n'.format(self.dropped_messages)
+            text += '\n'.join(self.messages)
             if verbose:
                 demisto.log(text)
             demisto.info(text)
-            self.messages = []
+            self.messages.clear()
+            self.buffer_size = 0
+            self.dropped_messages = 0
 
     def write(self, msg):
         # same as __call__ but allows IntegrationLogger to act as a File like object.
@@ -1084,7 +1201,7 @@ class IntegrationLogger(object):
         if has_newline:
             text = "".join(self.write_buf)
             if self.buffering:
-                self.messages.append(text)
+                self._add_message(text)
             else:
                 demisto.info(text)
             self.write_buf = []
@@ -1146,6 +1263,10 @@ def logger(func):
     return func_wrapper
 
 
+_CELL_ENCODER = json.JSONEncoder(ensure_ascii=False)
+_PRETTY_CELL_ENCODER = json.JSONEncoder(ensure_ascii=False, indent=4)
+
+
 def formatCell(data, is_pretty=True):
     """
        Convert a given object to md while decending multiple levels
@@ -1196,7 +1317,8 @@ def flattenCell(data, is_pretty=True):
 
         return ',\n'.join(string_list)
     else:
-        return json.dumps(data, indent=indent, ensure_ascii=False)
+        # same as json.dumps(data, indent=indent, ensure_ascii=False), without creating an encoder per cell
+        return (_PRETTY_CELL_ENCODER if indent else _CELL_ENCODER).encode(data)
 
 
 def FormatIso8601(t):
@@ -1312,7 +1434,12 @@ def appendContext(key, data, dedup=False):
         demisto.setContext(key, data)
 
 
-def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=False, metadata=None):
+def _escape_table_cell(st):
+    """Same as ``stringEscapeMD(st, True, True)``, used for every cell of ``tableToMarkdown``"""
+    return st.replace('\r\n', '<br>').replace('\r', '<br>').replace('\n', '<br>').replace('|', '\\|')
+
+
+def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=False, metadata=None, max_rows=None):
     """
        Converts a demisto table in JSON form to a Markdown table
 
@@ -1335,6 +1462,10 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
        :type metadata: ``str``
        :param metadata: Metadata about the table contents
 
+       :type max_rows: ``int``
+       :keyword max_rows: The maximal number of rows to render. Larger tables are truncated,
+            and a note of the number of rows shown is added below the table. Default is all of the rows
+
        :return: A string representation of the markdown table
        :rtype: ``str``
     """
@@ -1361,7 +1492,7 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
         # should be only one header
         if headers and len(headers) > 0:
             header = headers[0]
-            t = map(lambda item: dict((h, item) for h in [header]), t)
+            t = [{header: item} for item in t]
         else:
             raise Exception("Missing headers param for tableToMarkdown. Example: headers=['Some Header']")
 
@@ -1371,41 +1502,62 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
         headers.sort()
 
     if removeNull:
-        headers_aux = headers[:]
-        for header in headers_aux:
-            if all(obj.get(header) in ('', None, [], {}) for obj in t):
-                headers.remove(header)
-
-    if t and len(headers) > 0:
-        newHeaders = []
-        if headerTransform is None:  # noqa
-            def headerTransform(s): return stringEscapeMD(s, True, True)  # noqa
-        for header in headers:
-            newHeaders.append(headerTransform(header))
-        mdResult += '|'
-        if len(newHeaders) == 1:
-            mdResult += newHeaders[0]
-        else:
-            mdResult += '|'.join(newHeaders)
-        mdResult += '|\n'
-        sep = '---'
-        mdResult += '|' + '|'.join([sep] * len(headers)) + '|\n'
-        for entry in t:
-            vals = [stringEscapeMD((formatCell(entry.get(h, ''), False) if entry.get(h) is not None else ''),
-                                   True, True) for h in headers]
-            # this pipe is optional
-            mdResult += '| '
-            try:
-                mdResult += ' | '.join(vals)
-            except UnicodeDecodeError:
-                vals = [str(v) for v in vals]
-                mdResult += ' | '.join(vals)
-            mdResult += ' |\n'
+        # find the empty columns in a single pass over the rows
+        empty_headers = set(headers)
+        for obj in t:
+            empty_headers = set(header for header in empty_headers if obj.get(header) in ('', None, [], {}))
+            if not empty_headers:
+                break
+        headers = [header for header in headers if header not in empty_headers]
+
+    if not headers:
+        return mdResult + '**No entries.**\n'
 
+    if headerTransform is None:  # noqa
+        newHeaders = [_escape_table_cell(header) for header in headers]
     else:
-        mdResult += '**No entries.**\n'
+        newHeaders = [headerTransform(header) for header in headers]
+    mdResult += '|' + '|'.join(newHeaders) + '|\n'
+    mdResult += '|' + '|'.join(['---'] * len(headers)) + '|\n'
+
+    total_rows = len(t)
+    if max_rows is not None and total_rows > max_rows:
+        t = t[:max_rows]
+
+    rows = []
+    for entry in t:
+        vals = []
+        for h in headers:
+            value = entry.get(h)
+            if value is None:
+                vals.append('')
+            elif isinstance(value, STRING_TYPES):
+                vals.append(_escape_table_cell(value))
+            elif type(value) is int:
+                # the JSON of an int is its str, and it has nothing to escape
+                vals.append(str(value))
+            else:
+                vals.append(_escape_table_cell(formatCell(value, False)))
+        # this pipe is optional
+        try:
+            rows.append('| ' + ' | '.join(vals) + ' |\n')
+        except UnicodeDecodeError:
+            vals = [str(v) for v in vals]
+            rows.append('| ' + ' | '.join(vals) + ' |\n')
 
-    return mdResult
+    if len(t) < total_rows:
+        rows.append('\n**Showing {} out of {} rows.**\n'.format(len(t), total_rows))
+
+    try:
+        return mdResult + ''.join(rows)
+    except UnicodeDecodeError:
+        # python 2 - non ascii byte strings can't be joined with unicode rows, so add the rows one by one
+        for row in rows:
+            try:
+                mdResult += row
+            except UnicodeDecodeError:
+                mdResult += str(row)
+        return mdResult
 
 
 tblToMd = tableToMarkdown
@@ -1805,6 +1957,115 @@ def xml2json(xmlstring, options={}, strip_ns=1, strip=1):
     return elem2json(elem, options, strip_ns=strip_ns, strip=strip)
 
 
+def _elem_to_dict(root, strip_ns=1, strip=1):
+    """Convert an Element into a dictionary, the same as json.loads(elem2json(root)).
+    Unlike elem_to_internal, the tree is walked with an explicit stack, so deep documents do not hit the recursion
+    limit, and plain dicts are built instead of OrderedDicts."""
+
+    def to_value(elem, d):
+        text = elem.text
+        tail = elem.tail
+        if strip:
+            # ignore leading and trailing whitespace
+            if text:
+                text = text.strip()
+            if tail:
+                tail = tail.strip()
+        if tail:
+            d['#tail'] = tail
+        if d:
+            # use #text element if other attributes exist
+            if text:
+                d['#text'] = text
+            return d
+        # text is the value if no attributes
+        return text or None
+
+    def add_value(d, tag, value):
+        if tag not in d:
+            d[tag] = value
+        elif isinstance(d[tag], list):
+            d[tag].append(value)
+        else:
+            d[tag] = [d[tag], value]
+
+    # every stack item is an element, the dictionary of its attributes and subelements, and its next subelements
+    stack = [(root, {'@' + key: value for key, value in root.attrib.items()}, iter(root))]
+    while stack:
+        elem, d, subelems = stack[-1]
+        for subelem in subelems:
+            attributes = {'@' + key: value for key, value in subelem.attrib.items()} if subelem.attrib else {}
+            if len(subelem):
+                # continue with the subelements of the subelement, and then with the next subelements
+                stack.append((subelem, attributes, iter(subelem)))
+                break
+            add_value(d, strip_tag(subelem.tag) if strip_ns else subelem.tag, to_value(subelem, attributes))
+        else:
+            stack.pop()
+            tag = strip_tag(elem.tag) if strip_ns else elem.tag
+            if not stack:
+                return {tag: to_value(elem, d)}
+            add_value(stack[-1][1], tag, to_value(elem, d))
+
+
+def xml2dict(xmlstring, strip_ns=1, strip=1):
+    """
+       Convert an XML string into a dictionary.
+       The result is the same as json.loads(xml2json(xmlstring)), without serializing it to JSON and parsing it back.
+
+       :type xmlstring: ``str``
+       :param xmlstring: The string to be converted (required)
+
+       :type strip_ns: ``int``
+       :param strip_ns: Whether to strip the namespaces from the tags
+
+       :type strip: ``int``
+       :param strip: Whether to strip leading and trailing whitespace from the texts
+
+       :return: The converted dictionary
+       :rtype: ``dict``
+    """
+    return _elem_to_dict(ET.fromstring(xmlstring), strip_ns=strip_ns, strip=strip)
+
+
+def iter_xml2dict(xmlstring, tag, strip_ns=1, strip=1):
+    """
+       Stream the elements with a given tag out of an XML string, each converted into a dictionary as in xml2dict.
+       Every element is released once it is converted, so a large list of repeated elements (e.g. the log entries
+       of a PAN-OS query) is not held in memory as a whole. The text after an element (#tail) is not included.
+
+       :type xmlstring: ``str``
+       :param xmlstring: The string to be converted (required)
+
+       :type tag: ``str``
+       :param tag: The tag of the elements to stream (required)
+
+       :type strip_ns: ``int``
+       :param strip_ns: Whether to strip the namespaces from the tags
+
+       :type strip: ``int``
+       :param strip: Whether to strip leading and trailing whitespace from the texts
+
+       :return: A generator of the converted elements, without their tag
+       :rtype: ``generator``
+    """
+    source = io.BytesIO(xmlstring) if isinstance(xmlstring, bytes) else io.BytesIO(xmlstring.encode('utf-8'))
+    depth = 0
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        elem_tag = strip_tag(elem.tag) if strip_ns else elem.tag
+        if elem_tag != tag:
+            continue
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        # an element nested in another element with the same tag is converted with its parent
+        if depth == 0:
+            elem.tail = None
+            yield _elem_to_dict(elem, strip_ns=strip_ns, strip=strip)[elem_tag]
+            elem.clear()
+
+
 def json2xml(json_data, factory=ET.Element):
     """Convert a JSON string into an XML string.
     Whatever Element implementation we could import will be used by
@@ -3772,8 +4033,280 @@ H || val.SSDeep && val.SSDeep == obj.SSDeep)': {'Malicious': {'Vendor': 'Vendor'
                                .format(indicator_type, INDICATOR_TYPE_TO_CONTEXT_KEY.keys()))
 
 
+class RateLimiter(object):
+    """Token bucket which limits the rate of the requests of a client, and adapts the rate to the
+    Retry-After and rate limit headers of the responses. Can be shared by several threads.
+
+    :type rate: ``float``
+    :param rate: The maximal number of requests per second.
+
+    :type burst: ``int``
+    :param burst: The maximal number of requests to send at once after being idle. Default is the rate.
+
+    :type context_key: ``str``
+    :param context_key:
+        The integration context key to keep the state of the limiter in, so it holds across command runs.
+        If not given, the state is kept only in memory.
+        The state is saved only by the thread which created the limiter. After sending requests from other
+        threads, call ``save`` from it.
+
+    :type throttled_retries: ``int``
+    :param throttled_retries: How many times to retry a request which was rejected with 429 (Too Many Requests).
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    # the rate limit headers of the vendors, as (remaining requests header, reset header)
+    RATE_LIMIT_HEADERS = (
+        ('X-RateLimit-Remaining', 'X-RateLimit-Reset'),
+        ('X-Rate-Limit-Remaining', 'X-Rate-Limit-Reset'),
+        ('RateLimit-Remaining', 'RateLimit-Reset'),
+    )
+    SAVE_INTERVAL = 1
+
+    def __init__(self, rate, burst=None, context_key=None, throttled_retries=3):
+        if rate <= 0:
+            raise ValueError('The rate of a RateLimiter must be positive, got {}'.format(rate))
+        self.max_rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.context_key = context_key
+        self.throttled_retries = throttled_retries
+        self._lock = threading.Lock()
+        self.rate = self.max_rate
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.paused_until = 0.0
+        self._last_saved = 0.0
+        # the integration context is not safe to use from worker threads
+        self._saving_thread = threading.current_thread()
+        if context_key:
+            state = get_integration_context().get(context_key) or {}
+            self.rate = min(state.get('rate', self.rate), self.max_rate)
+            self.tokens = min(state.get('tokens', self.tokens), self.burst)
+            self.updated = state.get('updated', self.updated)
+            self.paused_until = state.get('paused_until', self.paused_until)
+
+    def _refill(self, now):
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def _get_state_to_save(self, now, force=False):
+        # called with the lock held, and the state is saved after it is released
+        if not self.context_key or threading.current_thread() is not self._saving_thread:
+            return None
+        if not force and now - self._last_saved < self.SAVE_INTERVAL:
+            return None
+        self._last_saved = now
+        return {
+            'rate': self.rate,
+            'tokens': self.tokens,
+            'updated': self.updated,
+            'paused_until': self.paused_until
+        }
+
+    def _save_state(self, state):
+        if state:
+            integration_context = get_integration_context()
+            integration_context[self.context_key] = state
+            set_integration_context(integration_context)
+
+    def save(self):
+        """
+        Saves the state of the limiter to the integration context. Does nothing if called from another thread
+        than the one which created the limiter.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        with self._lock:
+            state = self._get_state_to_save(time.time(), force=True)
+        self._save_state(state)
+
+    def acquire(self):
+        """
+        Waits until a request can be sent.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        state = self._get_state_to_save(now)
+                        break
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+        self._save_state(state)
+
+    @staticmethod
+    def _parse_retry_after(value, now):
+        try:
+            return now + float(value)
+        except (TypeError, ValueError):
+            date = parsedate_tz(value or '')
+            return mktime_tz(date) if date else None
+
+    def update(self, status_code, headers):
+        """
+        Adapts the rate to a response. Pauses the requests after 429 (Too Many Requests) or when the
+        rate limit headers show no requests are left, until the time in the Retry-After or reset headers.
+
+        :type status_code: ``int``
+        :param status_code: The status code of the response.
+
+        :type headers: ``dict``
+        :param headers: The headers of the response (case insensitive).
+
+        :return: Whether the request was rejected with 429 (Too Many Requests).
+        :rtype: ``bool``
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            throttled = status_code == 429
+            resume_at = self._parse_retry_after(headers.get('Retry-After'), now)
+            for remaining_header, reset_header in self.RATE_LIMIT_HEADERS:
+                remaining, reset = headers.get(remaining_header), headers.get(reset_header)
+                if remaining is None or reset is None:
+                    continue
+                try:
+                    remaining, reset = float(remaining), float(reset)
+                except ValueError:
+                    continue
+                # no more than the remaining requests are sent, and none are sent after the last one until the reset.
+                # the reset is an epoch time or the number of seconds until the reset
+                self.tokens = min(self.tokens, remaining)
+                if remaining < 1:
+                    resume_at = max(resume_at or 0, reset if reset > 1000000000 else now + reset)
+                break
+            if throttled:
+                # the limit of the server is lower than ours, halve the rate and increase it back slowly
+                self.rate = max(self.rate / 2, self.max_rate / 16)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+            if throttled and not resume_at:
+                resume_at = now + 1 / self.rate
+            if resume_at and resume_at > now:
+                self.paused_until = max(self.paused_until, resume_at)
+                self.tokens = 0
+            state = self._get_state_to_save(now, force=throttled or bool(resume_at))
+        self._save_state(state)
+        return throttled
+
+
 # Will add only if 'requests' module imported
 if 'requests' in sys.modules:
+    class MeteredHTTPAdapter(HTTPAdapter):
+        """HTTPAdapter which counts the requests it sends and the connections it opens,
+        and measures the time spent on opening connections (TCP connect and TLS handshake).
+
+        Takes the same arguments as ``requests.adapters.HTTPAdapter``.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+
+        def __init__(self, *args, **kwargs):
+            self._reset_metrics()
+            self._request_retries = threading.local()
+            super(MeteredHTTPAdapter, self).__init__(*args, **kwargs)
+
+        def __setstate__(self, state):
+            self._reset_metrics()
+            self._request_retries = threading.local()
+            super(MeteredHTTPAdapter, self).__setstate__(state)
+
+        @property
+        def max_retries(self):
+            """
+            The retries of the request sent by the current thread, or the default retries of the adapter.
+            """
+            retry = getattr(self._request_retries, 'retry', None)
+            return self._max_retries if retry is None else retry
+
+        @max_retries.setter
+        def max_retries(self, retry):
+            self._max_retries = retry
+
+        def set_request_retries(self, retry):
+            """
+            Sets the retries of the requests sent by the current thread, without changing the retries of the
+            requests which other threads send over the adapter at the same time.
+
+            :type retry: ``Retry``
+            :param retry: The retries of the requests. None restores the default retries of the adapter.
+
+            :return: No data returned
+            :rtype: ``None``
+            """
+            self._request_retries.retry = retry
+
+        def _reset_metrics(self):
+            self._metrics_lock = threading.Lock()
+            self.metrics = {
+                'requests': 0,
+                'new_connections': 0,
+                'connect_time': 0.0,
+                'request_time': 0.0
+            }
+
+        def add_metrics(self, **metrics):
+            """
+            Adds to the counters of the adapter, safely from several threads.
+
+            :type metrics: ``dict``
+            :param metrics: The amounts to add to each counter.
+
+            :return: No data returned
+            :rtype: ``None``
+            """
+            with self._metrics_lock:
+                for key, value in metrics.items():
+                    self.metrics[key] += value
+
+        def _metered_pool_classes(self, pool_classes_by_scheme):
+            adapter = self
+            metered_classes = {}
+            for scheme, pool_class in pool_classes_by_scheme.items():
+                connection_class = pool_class.ConnectionCls
+
+                def connect(connection, connect_func=connection_class.connect):
+                    start = time.time()
+                    try:
+                        return connect_func(connection)
+                    finally:
+                        adapter.add_metrics(new_connections=1, connect_time=time.time() - start)
+
+                metered_connection_class = type(str('Metered' + connection_class.__name__), (connection_class,),
+                                                {'connect': connect})
+                metered_classes[scheme] = type(str('Metered' + pool_class.__name__), (pool_class,),
+                                               {'ConnectionCls': metered_connection_class})
+            return metered_classes
+
+        def init_poolmanager(self, *args, **kwargs):
+            super(MeteredHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = self._metered_pool_classes(
+                self.poolmanager.pool_classes_by_scheme)
+
+        def proxy_manager_for(self, proxy, **proxy_kwargs):
+            is_new_manager = proxy not in self.proxy_manager
+            manager = super(MeteredHTTPAdapter, self).proxy_manager_for(proxy, **proxy_kwargs)
+            if is_new_manager:
+                manager.pool_classes_by_scheme = self._metered_pool_classes(manager.pool_classes_by_scheme)
+            return manager
+
+        def send(self, request, *args, **kwargs):
+            self.add_metrics(requests=1)
+            return super(MeteredHTTPAdapter, self).send(request, *args, **kwargs)
+
     class BaseClient(object):
         """Client to use in integrations with powerful _http_request
         :type base_url: ``str``
@@ -3800,12 +4333,32 @@ if 'requests' in sys.modules:
             The request authorization, for example: (username, password).
             Can be None.
 
+        :type pool_connections: ``int``
+        :param pool_connections: The number of hosts to keep connection pools for.
+
+        :type pool_maxsize: ``int``
+        :param pool_maxsize:
+            The maximal number of connections to keep open to a host.
+            Should be at least the number of requests sent to the host at once.
+
+        :type pool_block: ``bool``
+        :param pool_block:
+            Whether to wait for a free connection when all of the connections to a host are in use,
+            instead of opening a connection which is not kept in the pool.
+
+        :type rate_limiter: ``RateLimiter``
+        :param rate_limiter:
+            Limits the rate of the requests of the client, and retries requests which were rejected
+            with 429 (Too Many Requests) after the time the server asked to wait. Can be None.
+
         :return: No data returned
         :rtype: ``None``
         """
 
-        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None):
+        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None,
+                     pool_connections=10, pool_maxsize=10, pool_block=False, rate_limiter=None):
             self._base_url = base_url
+            self._rate_limiter = rate_limiter
             self._verify = verify
             self._ok_codes = ok_codes
             self._headers = headers
@@ -3813,6 +4366,26 @@ if 'requests' in sys.modules:
             self._session = requests.Session()
             if not proxy:
                 self._session.trust_env = False
+            # a single adapter is mounted once, so its connections are reused by all of the requests of the client
+            self._adapter = MeteredHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                               pool_block=pool_block)
+            self._session.mount('http://', self._adapter)
+            self._session.mount('https://', self._adapter)
+
+        def get_connection_metrics(self):
+            """
+            Gets the counters of the requests sent by the client.
+
+            :return:
+                The number of requests sent, the number of connections which were opened and reused,
+                the time spent on opening connections (TCP connect and TLS handshake),
+                and the rest of the time spent on requests (sending them and receiving the responses).
+            :rtype: ``dict``
+            """
+            metrics = dict(self._adapter.metrics)
+            metrics['reused_connections'] = max(metrics['requests'] - metrics['new_connections'], 0)
+            metrics['transfer_time'] = max(metrics.pop('request_time') - metrics['connect_time'], 0.0)
+            return metrics
 
         def _implement_retry(self, retries=0,
                              status_list_to_retry=None,
@@ -3821,7 +4394,9 @@ if 'requests' in sys.modules:
                              raise_on_status=False):
             """
             Implements the retry mechanism.
-            In the default case where retries = 0 the request will fail on the first time
+            In the default case where retries = 0 the request will fail on the first time.
+            The retries are returned to be set for a single request, as the adapter is shared by all of the requests
+            of the client, which may be sent from several threads at once.
 
             :type retries: ``int``
             :param retries: How many retries should be made in case of a failure. when set to '0'- will fail on the first time
@@ -3855,9 +4430,12 @@ if 'requests' in sys.modules:
                 whether we should raise an exception, or return a response,
                 if status falls in ``status_forcelist`` range and retries have
                 been exhausted.
+
+            :return: The retries of the request, or None if urllib3 is not available.
+            :rtype: ``Retry``
             """
             try:
-                retry = Retry(
+                return Retry(
                     total=retries,
                     read=retries,
                     connect=retries,
@@ -3868,11 +4446,8 @@ if 'requests' in sys.modules:
                     raise_on_status=raise_on_status,
                     raise_on_redirect=raise_on_redirect
                 )
-                adapter = HTTPAdapter(max_retries=retry)
-                self._session.mount('http://', adapter)
-                self._session.mount('https://', adapter)
             except NameError:
-                pass
+                return None
 
         def _http_request(self, method, url_suffix='', full_url=None, headers=None, auth=None, json_data=None,
                           params=None, data=None, files=None, timeout=10, resp_type='json', ok_codes=None,
@@ -3975,21 +4550,40 @@ if 'requests' in sys.modules:
                 address = full_url if full_url else urljoin(self._base_url, url_suffix)
                 headers = headers if headers else self._headers
                 auth = auth if auth else self._auth
-                self._implement_retry(retries, status_list_to_retry, backoff_factor, raise_on_redirect, raise_on_status)
+                retry = self._implement_retry(retries, status_list_to_retry, backoff_factor, raise_on_redirect,
+                                              raise_on_status)
                 # Execute
-                res = self._session.request(
-                    method,
-                    address,
-                    verify=self._verify,
-                    params=params,
-                    data=data,
-                    json=json_data,
-                    files=files,
-                    headers=headers,
-                    auth=auth,
-                    timeout=timeout,
-                    **kwargs
-                )
+                throttled_attempts = 0
+                while True:
+                    if self._rate_limiter:
+                        self._rate_limiter.acquire()
+                    start = time.time()
+                    # the retries are set for this request only, as mounting a new adapter would drop the open
+                    # connections, and setting them on the adapter would change them for the other threads
+                    self._adapter.set_request_retries(retry)
+                    try:
+                        res = self._session.request(
+                            method,
+                            address,
+                            verify=self._verify,
+                            params=params,
+                            data=data,
+                            json=json_data,
+                            files=files,
+                            headers=headers,
+                            auth=auth,
+                            timeout=timeout,
+                            **kwargs
+                        )
+                    finally:
+                        self._adapter.set_request_retries(None)
+                        self._adapter.add_metrics(request_time=time.time() - start)
+                    if not self._rate_limiter or not self._rate_limiter.update(res.status_code, res.headers) \
+                            or throttled_attempts >= self._rate_limiter.throttled_retries:
+                        break
+                    # the limiter waits the time the server asked for before the retry
+                    res.close()
+                    throttled_attempts += 1
                 # Handle error responses gracefully
                 if not self._is_status_code_valid(res, ok_codes):
                     if error_handler:
@@ -4053,6 +4647,41 @@ if 'requests' in sys.modules:
                 err_msg = 'Max Retries Error- Request attempts with {} retries failed. \n{}'.format(retries, reason)
                 raise DemistoException(err_msg, exception)
 
+        def _concurrent_http_requests(self, requests_kwargs, max_workers=10):
+            """Sends several independent requests at once, on a bounded pool of threads.
+            The number of requests in flight is also bounded by the connection pool size of the client,
+            so the open connections are reused.
+
+            :type requests_kwargs: ``list``
+            :param requests_kwargs:
+                The arguments of each request, as dicts of the arguments of ``_http_request``,
+                for example: [{'method': 'GET', 'url_suffix': '/ip/1.1.1.1'}, {'method': 'GET', 'url_suffix': '/ip/8.8.8.8'}]
+
+            :type max_workers: ``int``
+            :param max_workers: The maximal number of requests to send at once.
+
+            :return:
+                A (result, error) tuple for each request, in the order of ``requests_kwargs``.
+                The result is the return value of ``_http_request``, and the error is the exception it raised, or None.
+            :rtype: ``list``
+            """
+            requests_kwargs = list(requests_kwargs)
+
+            def send(index):
+                try:
+                    return self._http_request(**requests_kwargs[index]), None
+                except Exception as e:
+                    return None, e
+
+            results = [None] * len(requests_kwargs)  # type: list
+            max_workers = min(max_workers, self._adapter._pool_maxsize)
+            for index, result in run_concurrently(send, range(len(requests_kwargs)), max_workers=max_workers):
+                results[index] = result
+            if self._rate_limiter:
+                # the worker threads do not save the state of the limiter
+                self._rate_limiter.save()
+            return results
+
         def _is_status_code_valid(self, response, ok_codes=None):
             """If the status code is OK, return 'True'.
 
@@ -4086,6 +4715,15 @@ def batch(iterable, batch_size=1):
     :rtype: ``list``
     :return:: Iterable slices of given
     """
+    if not hasattr(iterable, '__getitem__'):
+        # generators can't be sliced, so consume them lazily without materializing the whole iterable
+        iterator = iter(iterable)
+        current_batch = list(itertools.islice(iterator, batch_size))
+        while current_batch:
+            yield current_batch
+            current_batch = list(itertools.islice(iterator, batch_size))
+        return
+
     current_batch = iterable[:batch_size]
     not_batched = iterable[batch_size:]
     while current_batch:
@@ -4094,6 +4732,129 @@ def batch(iterable, batch_size=1):
         not_batched = not_batched[batch_size:]
 
 
+def run_concurrently(func, items, max_workers=10):
+    """Calls a function on each of the items on a bounded pool of threads, and yields each item with its result
+    as soon as its call is done, so the results can be handled while the other calls are still running.
+
+    :type func: ``callable``
+    :param func: The function to call, receives a single item.
+
+    :type items: ``list``
+    :param items: The items to call the function on.
+
+    :type max_workers: ``int``
+    :param max_workers: The maximal number of calls to run at once.
+
+    :rtype: ``tuple``
+    :return:: Iterable (item, result) tuples, in the order the calls were completed.
+        If a call raised an exception, it is raised when its result is yielded.
+    """
+    items = list(items)
+    if len(items) < 2 or max_workers < 2 or 'ThreadPoolExecutor' not in globals():
+        for item in items:
+            yield item, func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        future_to_item = {executor.submit(func, item): item for item in items}
+        try:
+            for future in as_completed(future_to_item):
+                yield future_to_item[future], future.result()
+        finally:
+            # don't start calls which are still pending if we stopped early
+            for future in future_to_item:
+                future.cancel()
+
+
+def iter_feeds(items, fetch, max_workers=5):
+    """Fetches feeds concurrently over a single pooled session, and yields each item with the result of its fetch
+    as soon as it is done, so a feed can be parsed while the other feeds are still downloading.
+    The session is closed once all of the results were consumed.
+
+    The fetch function runs on worker threads, so it should not call demisto functions (e.g. demisto.debug).
+    Return what should be logged or saved as a part of the result, and handle it in the consuming thread.
+
+    :type items: ``list``
+    :param items: The items to fetch, e.g. the feed URLs.
+
+    :type fetch: ``callable``
+    :param fetch: Receives the session and a single item, and returns its result.
+
+    :type max_workers: ``int``
+    :param max_workers: The maximal number of fetches to run at once.
+
+    :rtype: ``tuple``
+    :return:: Iterable (item, result) tuples, in the order the fetches were completed.
+        If a fetch raised an exception, it is raised when its result is yielded.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(max_workers, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    try:
+        for item, result in run_concurrently(lambda item: fetch(session, item), items, max_workers=max_workers):
+            yield item, result
+    finally:
+        session.close()
+
+
+# larger feed downloads are spooled to disk while they are hashed
+FEED_SPOOL_MAX_MEMORY = 10 * 1024 * 1024
+
+
+def conditional_request_headers(headers, validators):
+    """Adds the conditional request headers of the validators saved for a feed URL (its ETag and Last-Modified
+    headers) to the request headers, so the server answers 304 if the feed was not modified.
+
+    :type headers: ``dict``
+    :param headers: The request headers.
+
+    :type validators: ``dict``
+    :param validators: The validators saved for the URL, with the etag and last_modified keys.
+
+    :rtype: ``dict``
+    :return:: The request headers.
+    """
+    conditional_headers = {}
+    if validators.get('etag'):
+        conditional_headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        conditional_headers['If-Modified-Since'] = validators['last_modified']
+    if not conditional_headers:
+        return headers
+    return dict(headers or {}, **conditional_headers)
+
+
+def spool_response(response, max_memory=FEED_SPOOL_MAX_MEMORY):
+    """Downloads the body of a streamed response to a temporary file while hashing it, so the digest of a feed
+    can be compared to the one of the last fetch before it is parsed.
+
+    :type response: ``requests.Response``
+    :param response: The streamed response.
+
+    :type max_memory: ``int``
+    :param max_memory: The body is kept in memory up to this size, and in a temporary file beyond it.
+
+    :rtype: ``tuple``
+    :return:: A response reading its body from the temporary file, and the SHA-256 digest of the body.
+    """
+    digest = hashlib.sha256()
+    body = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        digest.update(chunk)
+        body.write(chunk)
+    body.seek(0)
+    response.close()
+
+    spooled_response = requests.Response()
+    spooled_response.status_code = response.status_code
+    spooled_response.headers = response.headers
+    spooled_response.url = response.url
+    spooled_response.encoding = response.encoding
+    spooled_response.raw = body
+    return spooled_response, digest.hexdigest()
+
+
 def dict_safe_get(dict_object, keys, default_return_value=None, return_type=None, raise_return_type=True):
     """Recursive safe get query (for nested dicts and lists), If keys found return value otherwise return None or default value.
     Example:
@@ -4346,6 +5107,173 @@ def update_integration_context(context, object_keys=None, sync=True):
     return integration_context, version
 
 
+def get_feed_full_sync_seconds(expiration_policy=None, expiration_interval=None, full_sync_hours=24):
+    """
+    Gets the period in which a feed should send all of its indicators at least once, even if they did not change,
+    so they are not expired by the expiration policy of the server.
+
+    :type expiration_policy: ``str``
+    :param expiration_policy: The expiration policy of the feed (the feedExpirationPolicy parameter).
+
+    :type expiration_interval: ``int``
+    :param expiration_interval: The expiration interval of the feed in minutes (the feedExpirationInterval
+        parameter). With the interval expiration policy, the period is half of the interval if it is shorter
+        than full_sync_hours.
+
+    :type full_sync_hours: ``int``
+    :param full_sync_hours: The period in hours.
+
+    :return: The period in seconds.
+    :rtype: ``int``
+    """
+    full_sync_seconds = full_sync_hours * 3600
+    if expiration_policy == 'interval' and expiration_interval:
+        full_sync_seconds = min(full_sync_seconds, int(expiration_interval) * 60 // 2)
+    return full_sync_seconds
+
+
+class FeedIndicatorsDelta(object):
+    """
+    Sends only the delta of a feed fetch, instead of all of its indicators.
+    A compact fingerprint of each indicator sent by the previous fetch is kept in the integration context
+    (or in a local file), so only new and changed indicators are sent, and the indicators which disappeared
+    from the feed are sent with an expiration of the fetch time.
+
+    :type context_key: ``str``
+    :param context_key: The integration context key to keep the fingerprints in.
+
+    :type file_path: ``str``
+    :param file_path: A local file to keep the fingerprints in, instead of the integration context.
+
+    :type key_fields: ``list``
+    :param key_fields: The indicator fields which changes are tracked (besides its value and type).
+        If not given, all the fields and the raw JSON of the indicator are tracked.
+
+    :type full_sync_hours: ``int``
+    :param full_sync_hours: All of the indicators are sent once in this number of hours,
+        so unchanged indicators are not expired by the expiration policy of the server.
+        With the indicator type expiration policy, it should be shorter than the expiration of the indicator types.
+
+    :type expiration_policy: ``str``
+    :param expiration_policy: The expiration policy of the feed (the feedExpirationPolicy parameter).
+
+    :type expiration_interval: ``int``
+    :param expiration_interval: The expiration interval of the feed in minutes (the feedExpirationInterval
+        parameter). With the interval expiration policy, all of the indicators are sent at least twice in an
+        interval, even if it is shorter than full_sync_hours.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    def __init__(self, context_key='feed_indicators_delta', file_path=None, key_fields=None, full_sync_hours=24,
+                 expiration_policy=None, expiration_interval=None):
+        self.context_key = context_key
+        self.file_path = file_path
+        self.key_fields = key_fields
+        state = self._load_state()
+        self.previous = state.get('fingerprints', {})  # type: dict
+        self.current = {}  # type: dict
+        self.fetch_time = time.time()
+        self.full_sync_seconds = get_feed_full_sync_seconds(expiration_policy, expiration_interval, full_sync_hours)
+        self.last_full_sync = state.get('last_full_sync', 0)
+        self.is_full_sync = self.fetch_time - self.last_full_sync >= self.full_sync_seconds
+        if self.is_full_sync:
+            self.last_full_sync = self.fetch_time
+
+    def _load_state(self):
+        if self.file_path:
+            if not os.path.exists(self.file_path):
+                return {}
+            with open(self.file_path, 'r') as f:
+                state = json.load(f)
+        else:
+            state = get_integration_context().get(self.context_key) or {}
+        if state.get('fingerprints'):
+            state['fingerprints'] = json.loads(zlib.decompress(base64.b64decode(state['fingerprints'])).decode('utf-8'))
+        return state
+
+    def fingerprint(self, indicator):
+        """
+        Gets a short digest of the tracked fields of an indicator.
+
+        :type indicator: ``dict``
+        :param indicator: The indicator, as sent to ``demisto.createIndicators``.
+
+        :rtype: ``str``
+        :return: The fingerprint of the indicator.
+        """
+        if self.key_fields is None:
+            tracked = [indicator.get('fields'), indicator.get('rawJSON')]
+        else:
+            fields = indicator.get('fields') or {}
+            tracked = [fields.get(field) for field in self.key_fields]
+        serialized = json.dumps(tracked, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(serialized).hexdigest()[:16]
+
+    def filter(self, indicators):
+        """
+        Yields only the indicators which are new or changed since the previous fetch,
+        or all of them if a full sync is due. Can be passed to ``batch`` as is.
+
+        :type indicators: ``list``
+        :param indicators: The fetched indicators, a list or a generator.
+
+        :rtype: ``dict``
+        :return:: Iterable of the indicators to send.
+        """
+        for indicator in indicators:
+            key = u'{}\t{}'.format(indicator.get('type'), indicator.get('value'))
+            fingerprint = self.fingerprint(indicator)
+            self.current[key] = fingerprint
+            if self.is_full_sync or self.previous.get(key) != fingerprint:
+                yield indicator
+
+    def expired_indicators(self):
+        """
+        Yields the indicators which were sent by the previous fetch, but were not passed to ``filter`` in this one.
+        Should be called only after all of the fetched indicators were filtered.
+
+        :rtype: ``dict``
+        :return:: Iterable of the indicators to send, with an expiration of the fetch time.
+        """
+        expiration = datetime.utcfromtimestamp(self.fetch_time).strftime('%Y-%m-%dT%H:%M:%SZ')
+        for key in self.previous:
+            if key not in self.current:
+                indicator_type, value = key.split(u'\t', 1)
+                yield {
+                    'value': value,
+                    'type': indicator_type,
+                    'expiration': expiration
+                }
+
+    def save(self, keep_unseen=False):
+        """
+        Saves the fingerprints of this fetch, to be compared with by the next one.
+        Should be called only after the indicators were created.
+
+        :type keep_unseen: ``bool``
+        :param keep_unseen: Whether to keep the fingerprints of indicators which were not seen in this fetch,
+            e.g. when only a part of the feed was fetched, and ``expired_indicators`` was not sent.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        fingerprints = dict(self.previous) if keep_unseen else {}
+        fingerprints.update(self.current)
+        state = {
+            'fingerprints': base64.b64encode(zlib.compress(json.dumps(fingerprints).encode('utf-8'))).decode('ascii'),
+            'last_full_sync': self.last_full_sync
+        }
+        if self.file_path:
+            with open(self.file_path, 'w') as f:
+                json.dump(state, f)
+        else:
+            integration_context = get_integration_context()
+            integration_context[self.context_key] = state
+            set_integration_context(integration_context)
+
+
 class DemistoException(Exception):
     def __init__(self, message, exception=None, res=None, *args):
         self.res = res
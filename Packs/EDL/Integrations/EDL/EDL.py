@@ -5,11 +5,11 @@ from CommonServerUserPython import *
 import re
 from base64 import b64decode
 from multiprocessing import Process
+import gevent
 from gevent.pywsgi import WSGIServer
 from tempfile import NamedTemporaryFile
 from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
-from typing import Callable, List, Any, Dict, cast, Tuple
+from typing import Callable, Any, Dict, cast, Tuple
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 
 
@@ -21,10 +21,13 @@ class Handler:
 
 ''' GLOBAL VARIABLES '''
 INTEGRATION_NAME: str = 'EDL'
-PAGE_SIZE: int = 200
 DEMISTO_LOGGER: Handler = Handler()
 APP: Flask = Flask('demisto-edl')
 EDL_VALUES_KEY: str = 'dmst_edl_values'
+# the rendered (encoded, compressed and hashed) response of each distinct request
+RENDERED_RESPONSES: Any = None
+# refreshes the IoCs in the background, when the server serves stale IoCs while they are refreshed
+CACHE_REFRESHER: Any = None
 EDL_LIMIT_ERR_MSG: str = 'Please provide a valid integer for EDL Size'
 EDL_OFFSET_ERR_MSG: str = 'Please provide a valid integer for Starting Index'
 EDL_COLLAPSE_ERR_MSG: str = 'The Collapse parameter can only get the following: 0 - Dont Collapse, ' \
@@ -113,18 +116,20 @@ def get_params_port(params: dict = demisto.params()) -> int:
     return port
 
 
-def refresh_edl_context(request_args: RequestArguments) -> str:
+def refresh_edl_context(request_args: RequestArguments, force_refresh: bool = False) -> str:
     """
     Refresh the cache values and format using an indicator_query to call demisto.searchIndicators
 
     Parameters:
         request_args: Request arguments
+        force_refresh: Whether to search the query again, even if it was searched recently
 
     Returns: List(IoCs in output format)
     """
     now = datetime.now()
     # poll indicators into edl from demisto
-    iocs = find_indicators_to_limit(request_args.query, request_args.limit, request_args.offset)
+    iocs = find_indicators_to_limit(request_args.query, request_args.limit, request_args.offset,
+                                    refresh=force_refresh)
     out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, request_args)
 
     while actual_indicator_amount < request_args.limit:
@@ -151,170 +156,66 @@ def refresh_edl_context(request_args: RequestArguments) -> str:
     return out_dict[EDL_VALUES_KEY]
 
 
-def find_indicators_to_limit(indicator_query: str, limit: int, offset: int = 0) -> list:
+def find_indicators_to_limit(indicator_query: str, limit: int, offset: int = 0, refresh: bool = False) -> list:
     """
-    Finds indicators using demisto.searchIndicators
+    Finds indicators using demisto.searchIndicators.
+    The query results are kept in a snapshot, so polling the same query again reads them from memory.
 
     Parameters:
         indicator_query (str): Query that determines which indicators to include in
             the EDL (Cortex XSOAR indicator query syntax)
         limit (int): The maximum number of indicators to include in the EDL
         offset (int): The starting index from which to fetch incidents
+        refresh (bool): Whether to search the query again instead of reading its snapshot
 
     Returns:
         list: The IoCs list up until the amount set by 'limit'
     """
-    if offset:
-        next_page = int(offset / PAGE_SIZE)
+    return get_indicators_snapshot(indicator_query, refresh=refresh).get(offset, limit)
 
-        # set the offset from the starting page
-        offset_in_page = offset - (PAGE_SIZE * next_page)
 
-    else:
-        next_page = 0
-        offset_in_page = 0
-
-    # the second returned variable is the next page - it is implemented for a future use of repolling
-    iocs, _ = find_indicators_to_limit_loop(indicator_query, limit, next_page=next_page)
-
-    # if offset in page is bigger than the amount of results returned return empty list
-    if len(iocs) <= offset_in_page:
-        return []
-
-    return iocs[offset_in_page:limit + offset_in_page]
-
-
-def find_indicators_to_limit_loop(indicator_query: str, limit: int, total_fetched: int = 0,
-                                  next_page: int = 0, last_found_len: int = PAGE_SIZE):
-    """
-    Finds indicators using while loop with demisto.searchIndicators, and returns result and last page
-
-    Parameters:
-        indicator_query (str): Query that determines which indicators to include in
-            the EDL (Cortex XSOAR indicator query syntax)
-        limit (int): The maximum number of indicators to include in the EDL
-        total_fetched (int): The amount of indicators already fetched
-        next_page (int): The page we are up to in the loop
-        last_found_len (int): The amount of indicators found in the last fetch
-
-    Returns:
-        (tuple): The iocs and the last page
-    """
-    iocs: List[dict] = []
-    if not last_found_len:
-        last_found_len = total_fetched
-    while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        # In case the result from searchIndicators includes the key `iocs` but it's value is None
-        fetched_iocs = fetched_iocs or []
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs, next_page
-
-
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of CIDRs.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
-        else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
-
-
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges.
+def ips_to_ranges(ips: list, collapse_ips, collapser: Any = None):
+    """Collapse IPs to Ranges or CIDRs.
+    A collapser of an earlier call is updated only with the IPs which were added or removed since.
 
     Args:
-        ip_range_groups (list): a list of lists containing connected IPs
+        ips (list): a list of IPv4 and IPv6 strings.
+        collapse_ips (str): Whether to collapse to Ranges or CIDRs.
+        collapser (IPCollapser): the collapser of an earlier call. Default: a new collapser.
 
     Returns:
-        list. a list of Ranges.
+        list. a list to Ranges or CIDRs, IPv4 and then IPv6.
     """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
+    if collapser is None:
+        collapser = IPCollapser()
+    collapser.sync(ips)
 
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
+    if collapse_ips == COLLAPSE_TO_RANGES:
+        return collapser.to_ranges()
 
-    return ip_ranges
+    else:
+        return collapser.to_cidrs()
 
 
-def ips_to_ranges(ips: list, collapse_ips):
-    """Collapse IPs to Ranges or CIDRs.
+def collapse_request_ips(ips: list, request_args: RequestArguments) -> list:
+    """Collapse the IPs of a request to Ranges or CIDRs, with the collapser kept for the request, so rendering the
+    request again only applies the IPs which changed since. Each request has its own collapser, and when it is in use
+    by another thread (e.g. by the background refresh), the IPs are collapsed by a new collapser instead of waiting.
 
     Args:
-        ips (list): a list of IP strings.
-        collapse_ips (str): Whether to collapse to Ranges or CIDRs.
+        ips (list): a list of IPv4 and IPv6 strings.
+        request_args (RequestArguments): the request arguments.
 
     Returns:
-        list. a list to Ranges or CIDRs.
+        list. a list to Ranges or CIDRs, IPv4 and then IPv6.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
-
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
-
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
-
-            if not appended:
-                ips_range_groups.append([ip])
-
-    if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
-
-    else:
-        return ip_groups_to_cidrs(ips_range_groups)
+    collapser, lock = get_rendered_responses_cache().get_state(request_args, IPCollapser)
+    if not lock.acquire(blocking=False):
+        return ips_to_ranges(ips, request_args.collapse_ips)
+    try:
+        return ips_to_ranges(ips, request_args.collapse_ips, collapser)
+    finally:
+        lock.release()
 
 
 def create_values_for_returned_dict(iocs: list, request_args: RequestArguments) -> Tuple[dict, int]:
@@ -322,8 +223,7 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
     Create a dictionary for output values
     """
     formatted_indicators = []
-    ipv4_formatted_indicators = []
-    ipv6_formatted_indicators = []
+    ip_formatted_indicators = []
     for ioc in iocs:
         indicator = ioc.get('value')
         if not indicator:
@@ -351,26 +251,21 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
                 continue
         # for PAN-OS *.domain.com does not match domain.com
         # we should provide both
-        # this could generate more than num entries according to PAGE_SIZE
+        # this could generate more than num entries according to the limit
         if indicator.startswith('*.'):
             formatted_indicators.append(indicator.lstrip('*.'))
 
         if request_args.collapse_ips != DONT_COLLAPSE and ioc_type == 'IP':
-            ipv4_formatted_indicators.append(IPAddress(indicator))
+            ip_formatted_indicators.append(indicator)
 
         elif request_args.collapse_ips != DONT_COLLAPSE and ioc_type == 'IPv6':
-            ipv6_formatted_indicators.append(IPAddress(indicator))
+            ip_formatted_indicators.append(indicator)
 
         else:
             formatted_indicators.append(indicator)
 
-    if len(ipv4_formatted_indicators) > 0:
-        ipv4_formatted_indicators = ips_to_ranges(ipv4_formatted_indicators, request_args.collapse_ips)
-        formatted_indicators.extend(ipv4_formatted_indicators)
-
-    if len(ipv6_formatted_indicators) > 0:
-        ipv6_formatted_indicators = ips_to_ranges(ipv6_formatted_indicators, request_args.collapse_ips)
-        formatted_indicators.extend(ipv6_formatted_indicators)
+    if len(ip_formatted_indicators) > 0:
+        formatted_indicators.extend(collapse_request_ips(ip_formatted_indicators, request_args))
     return {EDL_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
@@ -496,14 +391,103 @@ def route_edl_values() -> Response:
             return Response(err_msg, status=401)
 
     request_args = get_request_args(request.args, params)
+    rendered_response = get_rendered_response(params, request_args)
+    return rendered_response.to_response(request.headers)
+
+
+def get_rendered_response(params: dict, request_args: RequestArguments):
+    """
+    Gets the rendered response of a request, and renders it only if the IoCs it was rendered from were refreshed
+    since, or are due for a refresh.
+
+    Args:
+        params: Integration configuration parameters
+        request_args: the request arguments
+
+    Returns:
+        RenderedResponse. the rendered response
+    """
+    rendered_responses = get_rendered_responses_cache()
 
+    if CACHE_REFRESHER:
+        # the IoCs are refreshed in the background, so a kept response is served at once even if it is stale. a request
+        # which was never rendered is rendered by itself, without waiting for the refresh of the other requests
+        return rendered_responses.get(request_args) or render_response(params, request_args)
+
+    if params.get('on_demand'):
+        integration_context = demisto.getIntegrationContext()
+        rendered_response = rendered_responses.get(request_args, last_run=integration_context.get('last_run'))
+    else:
+        cache_time, _ = parse_date_range(params.get('cache_refresh_rate'), to_timestamp=True)
+        rendered_response = rendered_responses.get(request_args, refreshed_after=cache_time)
+    return rendered_response or render_response(params, request_args)
+
+
+def render_response(params: dict, request_args: RequestArguments):
+    """
+    Renders the response of a request, refreshing the IoCs if they are due for a refresh.
+
+    Args:
+        params: Integration configuration parameters
+        request_args: the request arguments
+
+    Returns:
+        RenderedResponse. the rendered response
+    """
     values = get_edl_ioc_values(
         on_demand=params.get('on_demand'),
         request_args=request_args,
         integration_context=demisto.getIntegrationContext(),
         cache_refresh_rate=params.get('cache_refresh_rate'),
     )
-    return Response(values, status=200, mimetype='text/plain')
+    last_run = demisto.getIntegrationContext().get('last_run')
+    return get_rendered_responses_cache().put(request_args, values, 'text/plain', last_run=last_run)
+
+
+def get_rendered_responses_cache():
+    """
+    Returns:
+        RenderedResponseCache. the rendered responses of the server
+    """
+    global RENDERED_RESPONSES
+    if RENDERED_RESPONSES is None:
+        RENDERED_RESPONSES = RenderedResponseCache()
+    return RENDERED_RESPONSES
+
+
+def refresh_rendered_responses(params: dict):
+    """
+    Refreshes the IoCs of each request whose response is kept (or of the default request, before any request was
+    made) independently, and renders the responses again.
+
+    Args:
+        params: Integration configuration parameters
+    """
+    rendered_responses = get_rendered_responses_cache()
+    for request_args in rendered_responses.requests() or [get_request_args({}, params)]:
+        # the refresh runs on the gevent hub, so the waiting requests are answered between the queries
+        gevent.sleep(0)
+        try:
+            values = refresh_edl_context(request_args)
+        except Exception as e:
+            # the responses of the other requests are still refreshed
+            demisto.error(f'Failed refreshing the IoCs of the query {request_args.query}: {e}')
+            continue
+        last_run = demisto.getIntegrationContext().get('last_run')
+        rendered_responses.put(request_args, values, 'text/plain', last_run=last_run)
+
+
+def start_cache_refresher(params: dict):
+    """
+    Starts refreshing the IoCs in the background on the refresh rate.
+
+    Args:
+        params: Integration configuration parameters
+    """
+    global CACHE_REFRESHER
+    cache_time, now = parse_date_range(params.get('cache_refresh_rate'), to_timestamp=True)
+    CACHE_REFRESHER = CacheRefresher(lambda: refresh_rendered_responses(params), interval=(now - cache_time) / 1000)
+    CACHE_REFRESHER.start()
 
 
 def get_request_args(request_args: dict, params: dict) -> RequestArguments:
@@ -617,6 +601,9 @@ def run_long_running(params, is_test=False):
             demisto.debug('Starting HTTP Server')
 
         server = WSGIServer(('0.0.0.0', port), APP, **ssl_args, log=DEMISTO_LOGGER)
+        if params.get('background_refresh') and not params.get('on_demand') and not is_test:
+            start_cache_refresher(params)
+
         if is_test:
             server_process = Process(target=server.serve_forever)
             server_process.start()
@@ -654,7 +641,7 @@ def update_edl_command(args, params):
     drop_invalids = args.get('drop_invalids', '').lower() == 'true'
     offset = try_parse_integer(args.get('offset', 0), EDL_OFFSET_ERR_MSG)
     request_args = RequestArguments(query, limit, offset, url_port_stripping, drop_invalids, collapse_ips)
-    indicators = refresh_edl_context(request_args)
+    indicators = refresh_edl_context(request_args, force_refresh=True)
     hr = tableToMarkdown('EDL was updated successfully with the following values', indicators,
                          ['Indicators']) if print_indicators == 'true' else 'EDL was updated successfully'
     return hr, {}, indicators
@@ -692,5 +679,9 @@ def main():
         return_error(err_msg)
 
 
+from IPCollapseApiModule import *  # noqa: E402
+from SearchIndicatorsApiModule import *  # noqa: E402
+from ExportServerApiModule import *  # noqa: E402
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
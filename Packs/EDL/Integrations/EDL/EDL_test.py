@@ -67,6 +67,112 @@ class TestHelperFunctions:
             for ioc_row in ioc_list:
                 assert ioc_row in iocs_text_dict
 
+    @pytest.mark.get_rendered_response
+    def test_get_rendered_response(self, mocker):
+        """Test the response is rendered only when the cache is refreshed"""
+        import EDL as edl
+        integration_context = {'last_run': 1578383898000}
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value=integration_context)
+        mocker.patch.object(edl, 'RENDERED_RESPONSES', None)
+        get_values = mocker.patch.object(edl, 'get_edl_ioc_values', return_value='1.1.1.1\n2.2.2.2')
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1578383897000, 1578383957000))
+        params = {'cache_refresh_rate': '1 minute'}
+        request_args = edl.RequestArguments(query='type:IP', limit=50, offset=0)
+        rendered_response = edl.get_rendered_response(params, request_args)
+        assert rendered_response.body == b'1.1.1.1\n2.2.2.2'
+        assert edl.get_rendered_response(params, request_args) is rendered_response
+        assert get_values.call_count == 1
+
+        # the cache is due for a refresh
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1578383898000, 1578383958000))
+        assert edl.get_rendered_response(params, request_args) is not rendered_response
+        assert get_values.call_count == 2
+
+        # on demand, the response is rendered again only after the cache was updated
+        params = {'on_demand': True}
+        rendered_response = edl.get_rendered_response(params, request_args)
+        assert edl.get_rendered_response(params, request_args) is rendered_response
+        integration_context['last_run'] = 1578383899000
+        assert edl.get_rendered_response(params, request_args) is not rendered_response
+        assert get_values.call_count == 3
+
+    @pytest.mark.get_rendered_response
+    def test_get_rendered_response_background_refresh(self, mocker):
+        """Test the last rendered response is served while the IoCs are refreshed in the background"""
+        import EDL as edl
+        integration_context = {'last_run': 1578383898000}
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value=integration_context)
+        mocker.patch.object(demisto, 'debug')
+        mocker.patch.object(edl, 'RENDERED_RESPONSES', None)
+        mocker.patch.object(edl, 'CACHE_REFRESHER', edl.CacheRefresher(lambda: None, interval=60))
+        get_values = mocker.patch.object(edl, 'get_edl_ioc_values', return_value='1.1.1.1')
+        refresh = mocker.patch.object(edl, 'refresh_edl_context', return_value='2.2.2.2')
+        params = {'cache_refresh_rate': '1 minute'}
+        request_args = edl.RequestArguments(query='type:IP', limit=50, offset=0)
+
+        # a request which was never rendered is rendered at once
+        assert edl.get_rendered_response(params, request_args).body == b'1.1.1.1'
+        # a stale response is served without a refresh
+        mocker.patch.object(edl, 'parse_date_range', return_value=(1578383899000, 1578383959000))
+        assert edl.get_rendered_response(params, request_args).body == b'1.1.1.1'
+        assert get_values.call_count == 1
+
+        # the background refresh renders the response again
+        edl.refresh_rendered_responses(params)
+        refresh.assert_called_once_with(request_args)
+        assert edl.get_rendered_response(params, request_args).body == b'2.2.2.2'
+
+    @pytest.mark.get_rendered_response
+    def test_get_rendered_response_during_background_refresh(self, mocker):
+        """Test a request which was never rendered does not wait for a running background refresh"""
+        import gevent
+        from gevent.event import Event
+        import EDL as edl
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={'last_run': 1578383898000})
+        mocker.patch.object(edl, 'RENDERED_RESPONSES', None)
+        refresh_started, refresh_done = Event(), Event()
+
+        def slow_refresh():
+            refresh_started.set()
+            refresh_done.wait(10)
+
+        mocker.patch.object(edl, 'CACHE_REFRESHER', edl.CacheRefresher(slow_refresh, interval=60))
+        mocker.patch.object(edl, 'get_edl_ioc_values', return_value='1.1.1.1')
+        refresh_greenlet = gevent.spawn(edl.CACHE_REFRESHER.refresh)
+        try:
+            refresh_started.wait(10)
+            request_greenlet = gevent.spawn(
+                edl.get_rendered_response,
+                {'cache_refresh_rate': '1 minute'}, edl.RequestArguments(query='type:IP', limit=50, offset=0))
+            request_greenlet.join(5)
+            assert request_greenlet.successful()
+            assert edl.get_rendered_responses_cache().requests()
+        finally:
+            refresh_done.set()
+            refresh_greenlet.join()
+
+    @pytest.mark.get_rendered_response
+    def test_refresh_rendered_responses_independently(self, mocker):
+        """Test a request whose IoCs fail to refresh does not stop the refresh of the other requests"""
+        import EDL as edl
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={'last_run': 1578383898000})
+        mocker.patch.object(demisto, 'error')
+        mocker.patch.object(edl, 'RENDERED_RESPONSES', None)
+        failing_request = edl.RequestArguments(query='type:URL', limit=50, offset=0)
+        request_args = edl.RequestArguments(query='type:IP', limit=50, offset=0)
+        edl.get_rendered_responses_cache().put(failing_request, 'a.com', 'text/plain')
+        edl.get_rendered_responses_cache().put(request_args, '1.1.1.1', 'text/plain')
+
+        def refresh(args):
+            if args.query == 'type:URL':
+                raise ValueError('search failed')
+            return '2.2.2.2'
+
+        mocker.patch.object(edl, 'refresh_edl_context', side_effect=refresh)
+        edl.refresh_rendered_responses({})
+        assert edl.get_rendered_responses_cache().get(request_args).body == b'2.2.2.2'
+        assert edl.get_rendered_responses_cache().get(failing_request).body == b'a.com'
+
     @pytest.mark.list_to_str
     def test_list_to_str_1(self):
         """Test invalid"""
@@ -144,8 +250,8 @@ class TestHelperFunctions:
         with open('EDL_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
             limit = 30
-            mocker.patch.object(edl, 'find_indicators_to_limit_loop', return_value=(iocs_json, 1))
-            edl_vals = edl.find_indicators_to_limit(indicator_query='', limit=limit)
+            mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            edl_vals = edl.find_indicators_to_limit(indicator_query='limit', limit=limit)
             assert len(edl_vals) == limit
 
     @pytest.mark.find_indicators_to_limit
@@ -156,35 +262,28 @@ class TestHelperFunctions:
             iocs_json = json.loads(iocs_json_f.read())
             limit = 30
             offset = 1
-            mocker.patch.object(edl, 'find_indicators_to_limit_loop', return_value=(iocs_json, 1))
-            edl_vals = edl.find_indicators_to_limit(indicator_query='', limit=limit, offset=offset)
+            mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            edl_vals = edl.find_indicators_to_limit(indicator_query='limit and offset', limit=limit, offset=offset)
             assert len(edl_vals) == limit
             # check that the first value is the second on the list
             assert edl_vals[0].get('value') == '212.115.110.19'
 
-    @pytest.mark.find_indicators_to_limit_loop
-    def test_find_indicators_to_limit_loop_1(self, mocker):
-        """Test find indicators stops when reached last page"""
-        import EDL as edl
-        with open('EDL_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
-            iocs_dict = {'iocs': json.loads(iocs_json_f.read())}
-            limit = 50
-            mocker.patch.object(demisto, 'searchIndicators', return_value=iocs_dict)
-            edl_vals, nxt_pg = edl.find_indicators_to_limit_loop(indicator_query='', limit=limit)
-            assert nxt_pg == 1  # assert entered into loop
-
-    @pytest.mark.find_indicators_to_limit_loop
-    def test_find_indicators_to_limit_loop_2(self, mocker):
-        """Test find indicators stops when reached limit"""
+    @pytest.mark.find_indicators_to_limit
+    def test_find_indicators_to_limit_repoll(self, mocker):
+        """Test polling the same query again reads the indicators from memory"""
         import EDL as edl
         with open('EDL_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
-            iocs_dict = {'iocs': json.loads(iocs_json_f.read())}
-            limit = 30
-            mocker.patch.object(demisto, 'searchIndicators', return_value=iocs_dict)
-            edl.PAGE_SIZE = IOC_RES_LEN
-            edl_vals, nxt_pg = edl.find_indicators_to_limit_loop(indicator_query='', limit=limit,
-                                                                 last_found_len=IOC_RES_LEN)
-            assert nxt_pg == 1  # assert entered into loop
+            iocs_json = json.loads(iocs_json_f.read())
+            search_indicators = mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            edl.find_indicators_to_limit(indicator_query='repoll', limit=30, offset=0)
+            edl_vals = edl.find_indicators_to_limit(indicator_query='repoll', limit=30, offset=30)
+            assert edl_vals == iocs_json[30:]
+            assert search_indicators.call_count == 1
+
+            # a forced refresh searches the query again
+            edl_vals = edl.find_indicators_to_limit(indicator_query='repoll', limit=30, offset=0, refresh=True)
+            assert edl_vals == iocs_json[:30]
+            assert search_indicators.call_count == 2
 
     @pytest.mark.validate_basic_authentication
     def test_create_values_for_returned_dict(self):
@@ -272,3 +371,43 @@ class TestHelperFunctions:
         assert "1.1.1.3" not in ip_range_list
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
+
+    @pytest.mark.ips_to_cidrs
+    def test_ips_to_ranges_cidr_ipv6(self):
+        from EDL import ips_to_ranges, COLLAPSE_TO_CIDR
+        ip_list = ["1.1.1.1", "1.1.1.2", "1.1.1.3", "1.1.1.4", "1.1.1.5", "1.1.1.6", "1.1.1.7",
+                   "2001:db8::1", "2001:db8::2", "2001:db8::3"]
+
+        ip_range_list = ips_to_ranges(ip_list, COLLAPSE_TO_CIDR)
+        assert ip_range_list == ["1.1.1.1", "1.1.1.2/31", "1.1.1.4/30", "2001:db8::1", "2001:db8::2/127"]
+
+        ip_range_list = ips_to_ranges(ip_list[1:], COLLAPSE_TO_CIDR)
+        assert ip_range_list == ["1.1.1.2/31", "1.1.1.4/30", "2001:db8::1", "2001:db8::2/127"]
+
+    @pytest.mark.ips_to_cidrs
+    def test_collapse_request_ips(self, mocker):
+        """Test each request collapses its IPs with its own collapser, which is kept between its renders"""
+        import EDL as module
+        mocker.patch.object(module, 'RENDERED_RESPONSES', None)
+        first_request = module.RequestArguments(query='type:IP', collapse_ips=module.COLLAPSE_TO_CIDR)
+        second_request = module.RequestArguments(query='type:IPv6', collapse_ips=module.COLLAPSE_TO_CIDR)
+        first_iocs = [{'value': '1.1.1.1', 'indicator_type': 'IP'}, {'value': '1.1.1.2', 'indicator_type': 'IP'}]
+        second_iocs = [{'value': '2001:db8::1', 'indicator_type': 'IPv6'}]
+
+        for _ in range(2):
+            returned_dict, _ = module.create_values_for_returned_dict(first_iocs, first_request)
+            assert returned_dict[module.EDL_VALUES_KEY] == '1.1.1.1\n1.1.1.2'
+            returned_dict, _ = module.create_values_for_returned_dict(second_iocs, second_request)
+            assert returned_dict[module.EDL_VALUES_KEY] == '2001:db8::1'
+
+        rendered_responses = module.get_rendered_responses_cache()
+        first_collapser, _ = rendered_responses.get_state(first_request, module.IPCollapser)
+        second_collapser, _ = rendered_responses.get_state(second_request, module.IPCollapser)
+        assert first_collapser is not second_collapser
+        assert len(first_collapser) == 2
+
+        # a collapser in use by another thread is not waited for
+        _, lock = rendered_responses.get_state(first_request, module.IPCollapser)
+        with lock:
+            assert module.collapse_request_ips(['1.1.1.3'], first_request) == ['1.1.1.3']
+        assert len(first_collapser) == 2
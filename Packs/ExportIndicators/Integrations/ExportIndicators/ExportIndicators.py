@@ -7,12 +7,12 @@ import json
 import traceback
 from base64 import b64decode
 from multiprocessing import Process
+import gevent
 from gevent.pywsgi import WSGIServer
 from tempfile import NamedTemporaryFile
 from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
-from typing import Callable, List, Any, cast, Dict, Tuple
+from typing import Callable, Any, cast, Dict, Tuple
 
 
 class Handler:
@@ -23,11 +23,14 @@ class Handler:
 
 ''' GLOBAL VARIABLES '''
 INTEGRATION_NAME: str = 'Export Indicators Service'
-PAGE_SIZE: int = 200
 DEMISTO_LOGGER: Handler = Handler()
 APP: Flask = Flask('demisto-export_iocs')
 CTX_VALUES_KEY: str = 'dmst_export_iocs_values'
 CTX_MIMETYPE_KEY: str = 'dmst_export_iocs_mimetype'
+# the rendered (encoded, compressed and hashed) response of each distinct request
+RENDERED_RESPONSES: Any = None
+# refreshes the IoCs in the background, when the server serves stale IoCs while they are refreshed
+CACHE_REFRESHER: Any = None
 
 FORMAT_CSV: str = 'csv'
 FORMAT_TEXT: str = 'text'
@@ -91,7 +94,7 @@ class RequestArguments:
         self.strip_port = strip_port
         self.drop_invalids = drop_invalids
         self.category_default = category_default
-        self.category_attribute = []  # type:List
+        self.category_attribute = []  # type: list
         self.collapse_ips = collapse_ips
         self.csv_text = csv_text
 
@@ -169,14 +172,15 @@ def get_params_port(params: dict = demisto.params()) -> int:
     return port
 
 
-def refresh_outbound_context(request_args: RequestArguments) -> str:
+def refresh_outbound_context(request_args: RequestArguments, force_refresh: bool = False) -> str:
     """
     Refresh the cache values and format using an indicator_query to call demisto.searchIndicators
     Returns: List(IoCs in output format)
     """
     now = datetime.now()
     # poll indicators into list from demisto
-    iocs = find_indicators_with_limit(request_args.query, request_args.limit, request_args.offset)
+    iocs = find_indicators_with_limit(request_args.query, request_args.limit, request_args.offset,
+                                      refresh=force_refresh)
     out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, request_args)
 
     # if in CSV format - the "indicator" header
@@ -240,158 +244,61 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
     return out_dict[CTX_VALUES_KEY]
 
 
-def find_indicators_with_limit(indicator_query: str, limit: int, offset: int) -> list:
+def find_indicators_with_limit(indicator_query: str, limit: int, offset: int, refresh: bool = False) -> list:
     """
     Finds indicators using demisto.searchIndicators
+    The query results are kept in a snapshot, so polling the same query again (e.g. in another format) reads them
+    from memory, unless refresh is set.
     """
-    # calculate the starting page (each page holds 200 entries)
-    if offset:
-        next_page = int(offset / PAGE_SIZE)
+    return get_indicators_snapshot(indicator_query, refresh=refresh).get(offset, limit)
 
-        # set the offset from the starting page
-        offset_in_page = offset - (PAGE_SIZE * next_page)
 
-    else:
-        next_page = 0
-        offset_in_page = 0
-
-    iocs, _ = find_indicators_with_limit_loop(indicator_query, limit, next_page=next_page)
-
-    # if offset in page is bigger than the amount of results returned return empty list
-    if len(iocs) <= offset_in_page:
-        return []
-
-    return iocs[offset_in_page:limit + offset_in_page]
-
-
-def find_indicators_with_limit_loop(indicator_query: str, limit: int, total_fetched: int = 0, next_page: int = 0,
-                                    last_found_len: int = PAGE_SIZE):
-    """
-    Finds indicators using while loop with demisto.searchIndicators, and returns result and last page
-    """
-    iocs: List[dict] = []
-    if not last_found_len:
-        last_found_len = total_fetched
-    while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs, next_page
-
-
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
-
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
-
-    Returns:
-        list. a list of CIDRs.
-    """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
-        else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
-
-
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges
+def ips_to_ranges(ips: list, collapse_ips, collapser: Any = None):
+    """Collapse IPs to Ranges or CIDRs.
+    A collapser of an earlier call is updated only with the IPs which were added or removed since.
 
     Args:
-        ip_range_groups (list): a list of lists containing connected IPs
+        ips (list): a list of IPv4 and IPv6 strings.
+        collapse_ips (str): Whether to collapse to Ranges or CIDRs.
+        collapser (IPCollapser): the collapser of an earlier call. Default: a new collapser.
 
     Returns:
-        list. a list of Ranges.
+        list. a list to Ranges or CIDRs, IPv4 and then IPv6.
     """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
+    if collapser is None:
+        collapser = IPCollapser()
+    collapser.sync(ips)
 
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
+    if collapse_ips == COLLAPSE_TO_RANGES:
+        return collapser.to_ranges()
 
-    return ip_ranges
+    else:
+        return collapser.to_cidrs()
 
 
-def ips_to_ranges(ips: list, collapse_ips):
-    """Collapse IPs to Ranges or CIDRs.
+def collapse_request_ips(ips: list, request_args: RequestArguments) -> list:
+    """Collapse the IPs of a request to Ranges or CIDRs, with the collapser kept for the request, so rendering the
+    request again only applies the IPs which changed since. Each request has its own collapser, and when it is in use
+    by another thread (e.g. by the background refresh), the IPs are collapsed by a new collapser instead of waiting.
 
     Args:
-        ips (list): a list of IP strings.
-        collapse_ips (str): Whether to collapse to Ranges or CIDRs.
+        ips (list): a list of IPv4 and IPv6 strings.
+        request_args (RequestArguments): the request arguments.
 
     Returns:
-        list. a list to Ranges or CIDRs.
+        list. a list to Ranges or CIDRs, IPv4 and then IPv6.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
-
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
-
-            if len(ips_range_groups) == 0:
-                ips_range_groups.append([ip])
-                continue
-
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
-
-            if not appended:
-                ips_range_groups.append([ip])
-
-    for group in ips_range_groups:
-        sorted(group)
-
-    if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
-
-    else:
-        return ip_groups_to_cidrs(ips_range_groups)
+    collapser, lock = get_rendered_responses_cache().get_state(request_args, IPCollapser)
+    if not lock.acquire(blocking=False):
+        return ips_to_ranges(ips, request_args.collapse_ips)
+    try:
+        return ips_to_ranges(ips, request_args.collapse_ips, collapser)
+    finally:
+        lock.release()
 
 
 def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
-    formatted_indicators = []  # type:List
+    formatted_indicators = []  # type: list
     for indicator_data in iocs:
         # only format URLs and Domains
         indicator = indicator_data.get('value')
@@ -437,7 +344,7 @@ def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
 
 
 def create_json_out_format(iocs: list):
-    formatted_indicators = []  # type:List
+    formatted_indicators = []  # type: list
     for indicator_data in iocs:
         json_format_indicator = json_format_single_indicator(indicator_data)
         formatted_indicators.append(json_format_indicator)
@@ -498,7 +405,7 @@ def create_proxysg_out_format(iocs: list, category_attribute: list, category_def
 
 
 def create_mwg_out_format(iocs: list, mwg_type: str) -> dict:
-    formatted_indicators = []  # type:List
+    formatted_indicators = []  # type: list
     for indicator in iocs:
         value = "\"" + indicator.get('value') + "\""
         sources = indicator.get('sourceBrands')
@@ -542,8 +449,7 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
         return {CTX_VALUES_KEY: json.dumps(iocs_list)}, len(iocs)
 
     else:
-        ipv4_formatted_indicators = []
-        ipv6_formatted_indicators = []
+        ip_formatted_indicators = []
         formatted_indicators = []
         if request_args.out_format == FORMAT_XSOAR_CSV and len(iocs) > 0:  # add csv keys as first item
             headers = list(iocs[0].keys())
@@ -558,10 +464,10 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
             if value:
                 if request_args.out_format in [FORMAT_TEXT, FORMAT_CSV]:
                     if type == 'IP' and request_args.collapse_ips != DONT_COLLAPSE:
-                        ipv4_formatted_indicators.append(IPAddress(value))
+                        ip_formatted_indicators.append(value)
 
                     elif type == 'IPv6' and request_args.collapse_ips != DONT_COLLAPSE:
-                        ipv6_formatted_indicators.append(IPAddress(value))
+                        ip_formatted_indicators.append(value)
 
                     else:
                         formatted_indicators.append(value)
@@ -578,13 +484,8 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
                     values = list(ioc.values())
                     formatted_indicators.append(list_to_str(values, map_func=lambda val: f'"{val}"'))
 
-        if len(ipv4_formatted_indicators) > 0:
-            ipv4_formatted_indicators = ips_to_ranges(ipv4_formatted_indicators, request_args.collapse_ips)
-            formatted_indicators.extend(ipv4_formatted_indicators)
-
-        if len(ipv6_formatted_indicators) > 0:
-            ipv6_formatted_indicators = ips_to_ranges(ipv6_formatted_indicators, request_args.collapse_ips)
-            formatted_indicators.extend(ipv6_formatted_indicators)
+        if len(ip_formatted_indicators) > 0:
+            formatted_indicators.extend(collapse_request_ips(ip_formatted_indicators, request_args))
 
     return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
@@ -683,18 +584,21 @@ def validate_basic_authentication(headers: dict, username: str, password: str) -
 ''' ROUTE FUNCTIONS '''
 
 
-def get_request_args(params):
-    limit = try_parse_integer(request.args.get('n', params.get('list_size', 10000)), CTX_LIMIT_ERR_MSG)
-    offset = try_parse_integer(request.args.get('s', 0), CTX_OFFSET_ERR_MSG)
-    out_format = request.args.get('v', params.get('format', 'text'))
-    query = request.args.get('q', params.get('indicators_query'))
-    mwg_type = request.args.get('t', params.get('mwg_type', "string"))
-    strip_port = request.args.get('sp', params.get('strip_port', False))
-    drop_invalids = request.args.get('di', params.get('drop_invalids', False))
-    category_default = request.args.get('cd', params.get('category_default', 'bc_category'))
-    category_attribute = request.args.get('ca', params.get('category_attribute', ''))
-    collapse_ips = request.args.get('tr', params.get('collapse_ips', DONT_COLLAPSE))
-    csv_text = request.args.get('tx', params.get('csv_text', False))
+def get_request_args(request_args: dict, params: dict) -> RequestArguments:
+    """
+    Processing a flask request arguments and generates a RequestArguments instance from it.
+    """
+    limit = try_parse_integer(request_args.get('n', params.get('list_size', 10000)), CTX_LIMIT_ERR_MSG)
+    offset = try_parse_integer(request_args.get('s', 0), CTX_OFFSET_ERR_MSG)
+    out_format = request_args.get('v', params.get('format', 'text'))
+    query = request_args.get('q', params.get('indicators_query'))
+    mwg_type = request_args.get('t', params.get('mwg_type', "string"))
+    strip_port = request_args.get('sp', params.get('strip_port', False))
+    drop_invalids = request_args.get('di', params.get('drop_invalids', False))
+    category_default = request_args.get('cd', params.get('category_default', 'bc_category'))
+    category_attribute = request_args.get('ca', params.get('category_attribute', ''))
+    collapse_ips = request_args.get('tr', params.get('collapse_ips', DONT_COLLAPSE))
+    csv_text = request_args.get('tx', params.get('csv_text', False))
 
     # handle flags
     if strip_port is not None and strip_port == '':
@@ -774,27 +678,100 @@ def route_list_values() -> Response:
                 demisto.debug(err_msg)
                 return Response(err_msg, status=401)
 
-        request_args = get_request_args(params)
+        request_args = get_request_args(request.args, params)
+        rendered_response = get_rendered_response(params, request_args)
+        return rendered_response.to_response(request.headers)
 
-        values = get_outbound_ioc_values(
-            on_demand=params.get('on_demand'),
-            last_update_data=demisto.getIntegrationContext(),
-            cache_refresh_rate=params.get('cache_refresh_rate'),
-            request_args=request_args
-        )
+    except Exception:
+        return Response(traceback.format_exc(), status=400, mimetype='text/plain')
 
-        if not demisto.getIntegrationContext() and params.get('on_demand'):
-            values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
-                     'export process'
 
-        elif not values:
-            values = "No Results Found For the Query"
+def get_rendered_response(params: dict, request_args: RequestArguments):
+    """
+    Gets the rendered response of a request, and renders it only if the IoCs it was rendered from were refreshed
+    since, or are due for a refresh.
+    """
+    rendered_responses = get_rendered_responses_cache()
 
-        mimetype = get_outbound_mimetype()
-        return Response(values, status=200, mimetype=mimetype)
+    if CACHE_REFRESHER:
+        # the IoCs are refreshed in the background, so a kept response is served at once even if it is stale. a request
+        # which was never rendered is rendered by itself, without waiting for the refresh of the other requests
+        return rendered_responses.get(request_args) or render_response(params, request_args)
+
+    if params.get('on_demand'):
+        rendered_response = rendered_responses.get(request_args,
+                                                   last_run=demisto.getIntegrationContext().get('last_run'))
+    else:
+        cache_time, _ = parse_date_range(params.get('cache_refresh_rate'), to_timestamp=True)
+        rendered_response = rendered_responses.get(request_args, refreshed_after=cache_time)
+    return rendered_response or render_response(params, request_args)
+
+
+def render_response(params: dict, request_args: RequestArguments):
+    """
+    Renders the response of a request, refreshing the IoCs if they are due for a refresh
+    """
+    values = get_outbound_ioc_values(
+        on_demand=params.get('on_demand'),
+        last_update_data=demisto.getIntegrationContext(),
+        cache_refresh_rate=params.get('cache_refresh_rate'),
+        request_args=request_args
+    )
+    return put_rendered_response(params, request_args, values)
+
+
+def put_rendered_response(params: dict, request_args: RequestArguments, values: str):
+    """
+    Renders the response of a request from its values, and keeps it
+    """
+    integration_context = demisto.getIntegrationContext()
+    if not integration_context and params.get('on_demand'):
+        values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
+                 'export process'
+
+    elif not values:
+        values = "No Results Found For the Query"
+
+    mimetype = get_outbound_mimetype()
+    return get_rendered_responses_cache().put(request_args, values, mimetype,
+                                              last_run=integration_context.get('last_run'))
 
-    except Exception:
-        return Response(traceback.format_exc(), status=400, mimetype='text/plain')
+
+def get_rendered_responses_cache():
+    """
+    Returns the rendered responses of the server
+    """
+    global RENDERED_RESPONSES
+    if RENDERED_RESPONSES is None:
+        RENDERED_RESPONSES = RenderedResponseCache()
+    return RENDERED_RESPONSES
+
+
+def refresh_rendered_responses(params: dict):
+    """
+    Refreshes the IoCs of each request whose response is kept (or of the default request, before any request was
+    made) independently, and renders the responses again
+    """
+    for request_args in get_rendered_responses_cache().requests() or [get_request_args({}, params)]:
+        # the refresh runs on the gevent hub, so the waiting requests are answered between the queries
+        gevent.sleep(0)
+        try:
+            values = refresh_outbound_context(request_args)
+        except Exception as e:
+            # the responses of the other requests are still refreshed
+            demisto.error(f'Failed refreshing the IoCs of the query {request_args.query}: {e}')
+            continue
+        put_rendered_response(params, request_args, values)
+
+
+def start_cache_refresher(params: dict):
+    """
+    Starts refreshing the IoCs in the background on the refresh rate
+    """
+    global CACHE_REFRESHER
+    cache_time, now = parse_date_range(params.get('cache_refresh_rate'), to_timestamp=True)
+    CACHE_REFRESHER = CacheRefresher(lambda: refresh_rendered_responses(params), interval=(now - cache_time) / 1000)
+    CACHE_REFRESHER.start()
 
 
 ''' COMMAND FUNCTIONS '''
@@ -868,6 +845,9 @@ def run_long_running(params, is_test=False):
             demisto.debug('Starting HTTP Server')
 
         server = WSGIServer(('', port), APP, **ssl_args, log=DEMISTO_LOGGER)
+        if params.get('background_refresh') and not params.get('on_demand') and not is_test:
+            start_cache_refresher(params)
+
         if is_test:
             server_process = Process(target=server.serve_forever)
             server_process.start()
@@ -918,7 +898,7 @@ def update_outbound_command(args, params):
     request_args = RequestArguments(query, out_format, limit, offset, mwg_type, strip_port, drop_invalids,
                                     category_default, category_attribute, collapse_ips, csv_text)
 
-    indicators = refresh_outbound_context(request_args)
+    indicators = refresh_outbound_context(request_args, force_refresh=True)
     if indicators:
         hr = tableToMarkdown('List was updated successfully with the following values', indicators,
                              ['Indicators']) if print_indicators == 'true' else 'List was updated successfully'
@@ -961,5 +941,9 @@ def main():
         return_error(err_msg)
 
 
+from IPCollapseApiModule import *  # noqa: E402
+from SearchIndicatorsApiModule import *  # noqa: E402
+from ExportServerApiModule import *  # noqa: E402
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
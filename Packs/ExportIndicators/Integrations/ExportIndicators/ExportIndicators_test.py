@@ -136,6 +136,112 @@ class TestHelperFunctions:
             for ioc_row in ioc_list:
                 assert ioc_row in iocs_text_dict
 
+    @pytest.mark.get_rendered_response
+    def test_get_rendered_response(self, mocker):
+        """Test the response is rendered only when the cache is refreshed"""
+        import ExportIndicators as ei
+        integration_context = {'last_run': 1578383898000}
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value=integration_context)
+        mocker.patch.object(ei, 'RENDERED_RESPONSES', None)
+        get_values = mocker.patch.object(ei, 'get_outbound_ioc_values', return_value='1.1.1.1\n2.2.2.2')
+        mocker.patch.object(ei, 'parse_date_range', return_value=(1578383897000, 1578383957000))
+        params = {'cache_refresh_rate': '1 minute'}
+        request_args = ei.RequestArguments(query='type:IP', limit=50, offset=0)
+        rendered_response = ei.get_rendered_response(params, request_args)
+        assert rendered_response.body == b'1.1.1.1\n2.2.2.2'
+        assert ei.get_rendered_response(params, request_args) is rendered_response
+        assert get_values.call_count == 1
+
+        # the cache is due for a refresh
+        mocker.patch.object(ei, 'parse_date_range', return_value=(1578383898000, 1578383958000))
+        assert ei.get_rendered_response(params, request_args) is not rendered_response
+        assert get_values.call_count == 2
+
+        # on demand, the response is rendered again only after the cache was updated
+        params = {'on_demand': True}
+        rendered_response = ei.get_rendered_response(params, request_args)
+        assert ei.get_rendered_response(params, request_args) is rendered_response
+        integration_context['last_run'] = 1578383899000
+        assert ei.get_rendered_response(params, request_args) is not rendered_response
+        assert get_values.call_count == 3
+
+    @pytest.mark.get_rendered_response
+    def test_get_rendered_response_background_refresh(self, mocker):
+        """Test the last rendered response is served while the IoCs are refreshed in the background"""
+        import ExportIndicators as ei
+        integration_context = {'last_run': 1578383898000}
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value=integration_context)
+        mocker.patch.object(demisto, 'debug')
+        mocker.patch.object(ei, 'RENDERED_RESPONSES', None)
+        mocker.patch.object(ei, 'CACHE_REFRESHER', ei.CacheRefresher(lambda: None, interval=60))
+        get_values = mocker.patch.object(ei, 'get_outbound_ioc_values', return_value='1.1.1.1')
+        refresh = mocker.patch.object(ei, 'refresh_outbound_context', return_value='2.2.2.2')
+        params = {'cache_refresh_rate': '1 minute'}
+        request_args = ei.RequestArguments(query='type:IP', limit=50, offset=0)
+
+        # a request which was never rendered is rendered at once
+        assert ei.get_rendered_response(params, request_args).body == b'1.1.1.1'
+        # a stale response is served without a refresh
+        mocker.patch.object(ei, 'parse_date_range', return_value=(1578383899000, 1578383959000))
+        assert ei.get_rendered_response(params, request_args).body == b'1.1.1.1'
+        assert get_values.call_count == 1
+
+        # the background refresh renders the response again
+        ei.refresh_rendered_responses(params)
+        refresh.assert_called_once_with(request_args)
+        assert ei.get_rendered_response(params, request_args).body == b'2.2.2.2'
+
+    @pytest.mark.get_rendered_response
+    def test_get_rendered_response_during_background_refresh(self, mocker):
+        """Test a request which was never rendered does not wait for a running background refresh"""
+        import gevent
+        from gevent.event import Event
+        import ExportIndicators as ei
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={'last_run': 1578383898000})
+        mocker.patch.object(ei, 'RENDERED_RESPONSES', None)
+        refresh_started, refresh_done = Event(), Event()
+
+        def slow_refresh():
+            refresh_started.set()
+            refresh_done.wait(10)
+
+        mocker.patch.object(ei, 'CACHE_REFRESHER', ei.CacheRefresher(slow_refresh, interval=60))
+        mocker.patch.object(ei, 'get_outbound_ioc_values', return_value='1.1.1.1')
+        refresh_greenlet = gevent.spawn(ei.CACHE_REFRESHER.refresh)
+        try:
+            refresh_started.wait(10)
+            request_greenlet = gevent.spawn(
+                ei.get_rendered_response,
+                {'cache_refresh_rate': '1 minute'}, ei.RequestArguments(query='type:IP', limit=50, offset=0))
+            request_greenlet.join(5)
+            assert request_greenlet.successful()
+            assert ei.get_rendered_responses_cache().requests()
+        finally:
+            refresh_done.set()
+            refresh_greenlet.join()
+
+    @pytest.mark.get_rendered_response
+    def test_refresh_rendered_responses_independently(self, mocker):
+        """Test a request whose IoCs fail to refresh does not stop the refresh of the other requests"""
+        import ExportIndicators as ei
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={'last_run': 1578383898000})
+        mocker.patch.object(demisto, 'error')
+        mocker.patch.object(ei, 'RENDERED_RESPONSES', None)
+        failing_request = ei.RequestArguments(query='type:URL', limit=50, offset=0)
+        request_args = ei.RequestArguments(query='type:IP', limit=50, offset=0)
+        ei.get_rendered_responses_cache().put(failing_request, 'a.com', 'text/plain')
+        ei.get_rendered_responses_cache().put(request_args, '1.1.1.1', 'text/plain')
+
+        def refresh(args):
+            if args.query == 'type:URL':
+                raise ValueError('search failed')
+            return '2.2.2.2'
+
+        mocker.patch.object(ei, 'refresh_outbound_context', side_effect=refresh)
+        ei.refresh_rendered_responses({})
+        assert ei.get_rendered_responses_cache().get(request_args).body == b'2.2.2.2'
+        assert ei.get_rendered_responses_cache().get(failing_request).body == b'a.com'
+
     @pytest.mark.list_to_str
     def test_list_to_str_1(self):
         """Test invalid"""
@@ -291,8 +397,8 @@ class TestHelperFunctions:
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
             limit = 30
-            mocker.patch.object(ei, 'find_indicators_with_limit_loop', return_value=(iocs_json, 1))
-            ei_vals = ei.find_indicators_with_limit(indicator_query='', limit=limit, offset=0)
+            mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            ei_vals = ei.find_indicators_with_limit(indicator_query='limit', limit=limit, offset=0)
             assert len(ei_vals) == limit
 
     @pytest.mark.find_indicators_with_limit
@@ -303,35 +409,23 @@ class TestHelperFunctions:
             iocs_json = json.loads(iocs_json_f.read())
             limit = 30
             offset = 1
-            mocker.patch.object(ei, 'find_indicators_with_limit_loop', return_value=(iocs_json, 1))
-            ei_vals = ei.find_indicators_with_limit(indicator_query='', limit=limit, offset=offset)
+            mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            ei_vals = ei.find_indicators_with_limit(indicator_query='limit and offset', limit=limit, offset=offset)
             assert len(ei_vals) == limit
             # check that the first value is the second on the list
             assert ei_vals[0].get('value') == '212.115.110.19'
 
-    @pytest.mark.find_indicators_with_limit_loop
-    def test_find_indicators_with_limit_loop_1(self, mocker):
-        """Test find indicators stops when reached last page"""
-        import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
-            iocs_dict = {'iocs': json.loads(iocs_json_f.read())}
-            limit = 50
-            mocker.patch.object(demisto, 'searchIndicators', return_value=iocs_dict)
-            ei_vals, nxt_pg = ei.find_indicators_with_limit_loop(indicator_query='', limit=limit)
-            assert nxt_pg == 1  # assert entered into loop
-
-    @pytest.mark.find_indicators_with_limit_loop
-    def test_find_indicators_with_limit_loop_2(self, mocker):
-        """Test find indicators stops when reached limit"""
+    @pytest.mark.find_indicators_with_limit
+    def test_find_indicators_with_limit_repoll(self, mocker):
+        """Test polling the same query again reads the indicators from memory"""
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
-            iocs_dict = {'iocs': json.loads(iocs_json_f.read())}
-            limit = 30
-            mocker.patch.object(demisto, 'searchIndicators', return_value=iocs_dict)
-            ei.PAGE_SIZE = IOC_RES_LEN
-            ei_vals, nxt_pg = ei.find_indicators_with_limit_loop(indicator_query='', limit=limit,
-                                                                 last_found_len=IOC_RES_LEN)
-            assert nxt_pg == 1  # assert entered into loop
+            iocs_json = json.loads(iocs_json_f.read())
+            search_indicators = mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': iocs_json})
+            ei.find_indicators_with_limit(indicator_query='repoll', limit=30, offset=0)
+            ei_vals = ei.find_indicators_with_limit(indicator_query='repoll', limit=30, offset=30)
+            assert ei_vals == iocs_json[30:]
+            assert search_indicators.call_count == 1
 
     @pytest.mark.create_values_for_returned_dict
     def test_create_values_for_returned_dict_1(self):
@@ -567,6 +661,46 @@ class TestHelperFunctions:
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
 
+    @pytest.mark.ips_to_cidrs
+    def test_ips_to_ranges_cidr_ipv6(self):
+        from ExportIndicators import ips_to_ranges, COLLAPSE_TO_CIDR
+        ip_list = ["1.1.1.1", "1.1.1.2", "1.1.1.3", "1.1.1.4", "1.1.1.5", "1.1.1.6", "1.1.1.7",
+                   "2001:db8::1", "2001:db8::2", "2001:db8::3"]
+
+        ip_range_list = ips_to_ranges(ip_list, COLLAPSE_TO_CIDR)
+        assert ip_range_list == ["1.1.1.1", "1.1.1.2/31", "1.1.1.4/30", "2001:db8::1", "2001:db8::2/127"]
+
+        ip_range_list = ips_to_ranges(ip_list[1:], COLLAPSE_TO_CIDR)
+        assert ip_range_list == ["1.1.1.2/31", "1.1.1.4/30", "2001:db8::1", "2001:db8::2/127"]
+
+    @pytest.mark.ips_to_cidrs
+    def test_collapse_request_ips(self, mocker):
+        """Test each request collapses its IPs with its own collapser, which is kept between its renders"""
+        import ExportIndicators as module
+        mocker.patch.object(module, 'RENDERED_RESPONSES', None)
+        first_request = module.RequestArguments(query='type:IP', out_format='text', collapse_ips=module.COLLAPSE_TO_CIDR)
+        second_request = module.RequestArguments(query='type:IPv6', out_format='text', collapse_ips=module.COLLAPSE_TO_CIDR)
+        first_iocs = [{'value': '1.1.1.1', 'indicator_type': 'IP'}, {'value': '1.1.1.2', 'indicator_type': 'IP'}]
+        second_iocs = [{'value': '2001:db8::1', 'indicator_type': 'IPv6'}]
+
+        for _ in range(2):
+            returned_dict, _ = module.create_values_for_returned_dict(first_iocs, first_request)
+            assert returned_dict[module.CTX_VALUES_KEY] == '1.1.1.1\n1.1.1.2'
+            returned_dict, _ = module.create_values_for_returned_dict(second_iocs, second_request)
+            assert returned_dict[module.CTX_VALUES_KEY] == '2001:db8::1'
+
+        rendered_responses = module.get_rendered_responses_cache()
+        first_collapser, _ = rendered_responses.get_state(first_request, module.IPCollapser)
+        second_collapser, _ = rendered_responses.get_state(second_request, module.IPCollapser)
+        assert first_collapser is not second_collapser
+        assert len(first_collapser) == 2
+
+        # a collapser in use by another thread is not waited for
+        _, lock = rendered_responses.get_state(first_request, module.IPCollapser)
+        with lock:
+            assert module.collapse_request_ips(['1.1.1.3'], first_request) == ['1.1.1.3']
+        assert len(first_collapser) == 2
+
     def test_empty_integartion_context_mimtype(self, mocker):
         from ExportIndicators import get_outbound_mimetype
         mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple, Union
 import uuid
 import json
+import time
 import requests
 
 # disable insecure warnings
@@ -26,6 +27,21 @@ XPATH_OBJECTS = ''
 
 XPATH_RULEBASE = ''
 
+# a persistent session, so the connection to the server is kept alive between requests
+SESSION = requests.Session()
+
+# User-ID API updates are sent in messages of up to this many entries and characters, several messages at once
+USER_ID_MAX_ENTRIES = 1000
+USER_ID_MAX_MESSAGE_SIZE = 512 * 1024
+USER_ID_MAX_WORKERS = 4
+
+# logs queries which are retrieved as a file are run in pages of up to the maximal number of logs of a query, up to
+# LOGS_MAX_PAGES pages, whose jobs must all finish in LOGS_JOB_TIMEOUT seconds
+LOGS_PAGE_SIZE = 5000
+LOGS_MAX_PAGES = 10
+LOGS_JOB_POLLING_INTERVAL = 5
+LOGS_JOB_TIMEOUT = 300
+
 # Security rule arguments for output handling
 SECURITY_RULE_ARGS = {
     'rulename': 'Name',
@@ -83,11 +99,12 @@ class PAN_OS_Not_Found(Exception):
 
 
 def http_request(uri: str, method: str, headers: dict = {},
-                 body: dict = {}, params: dict = {}, files: dict = None, is_pcap: bool = False) -> Any:
+                 body: dict = {}, params: dict = {}, files: dict = None, is_pcap: bool = False,
+                 is_raw: bool = False) -> Any:
     """
-    Makes an API call with the given arguments
+    Makes an API call with the given arguments. The response is returned as is if is_pcap or is_raw is set.
     """
-    result = requests.request(
+    result = SESSION.request(
         method,
         uri,
         headers=headers,
@@ -101,11 +118,11 @@ def http_request(uri: str, method: str, headers: dict = {},
         raise Exception(
             'Request Failed. with status: ' + str(result.status_code) + '. Reason is: ' + str(result.reason))
 
-    # if pcap download
-    if is_pcap:
+    # if pcap download, or the response is parsed by the caller
+    if is_pcap or is_raw:
         return result
 
-    json_result = json.loads(xml2json(result.text))
+    json_result = xml2dict(result.text)
 
     # handle raw response that doe not contain the response key, e.g xonfiguration export
     if 'response' not in json_result or '@code' not in json_result['response']:
@@ -3079,7 +3096,7 @@ def panorama_list_pcaps_command(args: dict):
         raise Exception('can not provide dlp-pcap without password')
 
     result = http_request(URL, 'GET', params=params, is_pcap=True)
-    json_result = json.loads(xml2json(result.text))['response']
+    json_result = xml2dict(result.text)['response']
     if json_result['@status'] != 'success':
         raise Exception('Request to get list of Pcaps Failed.\nStatus code: ' + str(
             json_result['response']['@code']) + '\nWith message: ' + str(json_result['response']['msg']['line']))
@@ -3608,29 +3625,126 @@ def panorama_refresh_edl_command(args: dict):
     })
 
 
-''' IP Tags '''
+''' User-ID '''
 
 
-@logger
-def panorama_register_ip_tag(tag: str, ips: List, persistent: str):
-    entry: str = ''
-    for ip in ips:
-        entry += f'<entry ip=\"{ip}\" persistent=\"{persistent}\"><tag><member>{tag}</member></tag></entry>'
+def split_user_id_entries(entries: List[Tuple[str, str]], max_entries: int = USER_ID_MAX_ENTRIES,
+                          max_size: int = USER_ID_MAX_MESSAGE_SIZE) -> List[List[Tuple[str, str]]]:
+    """
+    Splits User-ID API entries into chunks of up to max_entries entries and max_size characters
+    """
+    chunks: List[List[Tuple[str, str]]] = []
+    chunk: List[Tuple[str, str]] = []
+    chunk_size = 0
+    for value, entry in entries:
+        if chunk and (len(chunk) >= max_entries or chunk_size + len(entry) > max_size):
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+        chunk.append((value, entry))
+        chunk_size += len(entry)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def send_user_id_message(payload_type: str, value_attribute: str, chunk: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    Sends a User-ID API update message
 
+    Args:
+        payload_type: the payload type, e.g. register or unregister-user.
+        value_attribute: the attribute which identifies an entry, e.g. ip or user.
+        chunk: the value and XML entry of each entry to send.
+
+    Returns:
+        the error message of each value which the server ignored, e.g. an IP which is already registered to the tag.
+    """
+    entries = ''.join(entry for _, entry in chunk)
     params = {
         'type': 'user-id',
-        'cmd': '<uid-message><version>2.0</version><type>update</type><payload><register>' + entry
-               + '</register></payload></uid-message>',
+        'cmd': f'<uid-message><version>2.0</version><type>update</type><payload><{payload_type}>{entries}'
+               f'</{payload_type}></payload></uid-message>',
         'key': API_KEY
     }
+    result = SESSION.post(URL, data=params, verify=USE_SSL)
+    if result.status_code < 200 or result.status_code >= 300:
+        raise Exception(
+            'Request Failed. with status: ' + str(result.status_code) + '. Reason is: ' + str(result.reason))
 
-    result = http_request(
-        URL,
-        'POST',
-        body=params,
-    )
+    json_result = xml2dict(result.text)
+    if json_result['response']['@status'] == 'success':
+        return {}
+    # the server reports the entries which it ignored, and updates the other entries
+    line = dict_safe_get(json_result, ['response', 'msg', 'line'])
+    ignored_entries = dict_safe_get(line, ['uid-response', 'payload', payload_type, 'entry'])
+    if not ignored_entries:
+        raise Exception('Request Failed.\n' + str(line or json_result['response']))
+    if not isinstance(ignored_entries, list):
+        ignored_entries = [ignored_entries]
+    return {entry.get(f'@{value_attribute}'): entry.get('@message', '') for entry in ignored_entries}
 
-    return result
+
+def send_user_id_update(payload_type: str, value_attribute: str, entries: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """
+    Sends a User-ID API update in chunks, several chunks at once, so large updates are not rejected by the server
+
+    Args:
+        payload_type: the payload type, e.g. register or unregister-user.
+        value_attribute: the attribute which identifies an entry, e.g. ip or user.
+        entries: the value and XML entry of each entry to send.
+
+    Returns:
+        a summary of the update - the number of sent and failed messages, and the error of each value which
+        was not updated.
+    """
+    chunks = split_user_id_entries(entries, USER_ID_MAX_ENTRIES, USER_ID_MAX_MESSAGE_SIZE)
+    failed: Dict[str, str] = {}
+    failed_messages = 0
+
+    def send_chunk(chunk_index: int) -> Union[Dict[str, str], Exception]:
+        try:
+            return send_user_id_message(payload_type, value_attribute, chunks[chunk_index])
+        except Exception as e:
+            return e
+
+    for done, (chunk_index, result) in enumerate(
+            run_concurrently(send_chunk, range(len(chunks)), max_workers=USER_ID_MAX_WORKERS), 1):
+        if isinstance(result, Exception):
+            failed_messages += 1
+            failed.update((value, str(result)) for value, _ in chunks[chunk_index])
+        else:
+            failed.update(result)
+        demisto.debug(f'Sent {done} of {len(chunks)} user-id {payload_type} messages')
+
+    return {
+        'Messages': len(chunks),
+        'FailedMessages': failed_messages,
+        'Failed': failed
+    }
+
+
+def user_id_update_to_human_readable(summary: Dict[str, Any], success_message: str, title: str,
+                                     value_header: str) -> str:
+    """
+    Creates the human readable of a User-ID API update, and raises an exception if none of its messages were sent
+    """
+    if summary['Messages'] and summary['FailedMessages'] == summary['Messages']:
+        raise Exception(next(iter(summary['Failed'].values())))
+    if not summary['Failed']:
+        return success_message
+    return tableToMarkdown(title, [{value_header: value, 'Error': error} for value, error in summary['Failed'].items()],
+                           headers=[value_header, 'Error'])
+
+
+''' IP Tags '''
+
+
+@logger
+def panorama_register_ip_tag(tag: str, ips: List, persistent: str):
+    entries = [(ip, f'<entry ip="{ip}" persistent="{persistent}"><tag><member>{tag}</member></tag></entry>')
+               for ip in ips]
+    return send_user_id_update('register', 'ip', entries)
 
 
 def panorama_register_ip_tag_command(args: dict):
@@ -3644,6 +3758,10 @@ def panorama_register_ip_tag_command(args: dict):
     persistent = '1' if persistent == 'true' else '0'
 
     result = panorama_register_ip_tag(tag, ips, str(persistent))
+    human_readable = user_id_update_to_human_readable(
+        result, 'Registered ip-tag successfully',
+        f'Registered {len(ips) - len(result["Failed"])} of {len(ips)} IPs to the tag {tag}.'
+        f' The following IPs were not registered', 'IP')
 
     registered_ip: Dict[str, str] = {}
     # update context only if IPs are persistent
@@ -3651,6 +3769,7 @@ def panorama_register_ip_tag_command(args: dict):
         # get existing IPs for this tag
         context_ips = demisto.dt(demisto.context(), 'Panorama.DynamicTags(val.Tag ==\"' + tag + '\").IPs')
 
+        ips = [ip for ip in ips if ip not in result['Failed']]
         if context_ips:
             all_ips = ips + context_ips
         else:
@@ -3665,8 +3784,8 @@ def panorama_register_ip_tag_command(args: dict):
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Registered ip-tag successfully',
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': human_readable,
         'EntryContext': {
             "Panorama.DynamicTags(val.Tag == obj.Tag)": registered_ip
         }
@@ -3675,23 +3794,8 @@ def panorama_register_ip_tag_command(args: dict):
 
 @logger
 def panorama_unregister_ip_tag(tag: str, ips: list):
-    entry = ''
-    for ip in ips:
-        entry += '<entry ip=\"' + ip + '\"><tag><member>' + tag + '</member></tag></entry>'
-
-    params = {
-        'type': 'user-id',
-        'cmd': '<uid-message><version>2.0</version><type>update</type><payload><unregister>' + entry
-               + '</unregister></payload></uid-message>',
-        'key': API_KEY
-    }
-    result = http_request(
-        URL,
-        'POST',
-        body=params,
-    )
-
-    return result
+    entries = [(ip, f'<entry ip="{ip}"><tag><member>{tag}</member></tag></entry>') for ip in ips]
+    return send_user_id_update('unregister', 'ip', entries)
 
 
 def panorama_unregister_ip_tag_command(args: dict):
@@ -3707,8 +3811,11 @@ def panorama_unregister_ip_tag_command(args: dict):
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Unregistered ip-tag successfully'
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': user_id_update_to_human_readable(
+            result, 'Unregistered ip-tag successfully',
+            f'Unregistered {len(ips) - len(result["Failed"])} of {len(ips)} IPs from the tag {tag}.'
+            f' The following IPs were not unregistered', 'IP')
     })
 
 
@@ -3717,24 +3824,8 @@ def panorama_unregister_ip_tag_command(args: dict):
 
 @logger
 def panorama_register_user_tag(tag: str, users: List):
-    entry: str = ''
-    for user in users:
-        entry += f'<entry user=\"{user}\"><tag><member>{tag}</member></tag></entry>'
-
-    params = {
-        'type': 'user-id',
-        'cmd': f'<uid-message><version>2.0</version><type>update</type><payload><register-user>{entry}'
-               f'</register-user></payload></uid-message>',
-        'key': API_KEY
-    }
-
-    result = http_request(
-        URL,
-        'POST',
-        body=params,
-    )
-
-    return result
+    entries = [(user, f'<entry user="{user}"><tag><member>{tag}</member></tag></entry>') for user in users]
+    return send_user_id_update('register-user', 'user', entries)
 
 
 def panorama_register_user_tag_command(args: dict):
@@ -3748,10 +3839,15 @@ def panorama_register_user_tag_command(args: dict):
     users = argToList(args['Users'])
 
     result = panorama_register_user_tag(tag, users)
+    human_readable = user_id_update_to_human_readable(
+        result, 'Registered user-tag successfully',
+        f'Registered {len(users) - len(result["Failed"])} of {len(users)} users to the tag {tag}.'
+        f' The following users were not registered', 'User')
 
     # get existing Users for this tag
     context_users = demisto.dt(demisto.context(), 'Panorama.DynamicTags(val.Tag ==\"' + tag + '\").Users')
 
+    users = [user for user in users if user not in result['Failed']]
     if context_users:
         all_users = users + context_users
     else:
@@ -3766,8 +3862,8 @@ def panorama_register_user_tag_command(args: dict):
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Registered user-tag successfully',
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': human_readable,
         'EntryContext': {
             "Panorama.DynamicTags(val.Tag == obj.Tag)": registered_user
         }
@@ -3776,23 +3872,8 @@ def panorama_register_user_tag_command(args: dict):
 
 @logger
 def panorama_unregister_user_tag(tag: str, users: list):
-    entry = ''
-    for user in users:
-        entry += f'<entry user=\"{user}\"><tag><member>{tag}</member></tag></entry>'
-
-    params = {
-        'type': 'user-id',
-        'cmd': f'<uid-message><version>2.0</version><type>update</type><payload><unregister-user>{entry}'
-               f'</unregister-user></payload></uid-message>',
-        'key': API_KEY
-    }
-    result = http_request(
-        URL,
-        'POST',
-        body=params,
-    )
-
-    return result
+    entries = [(user, f'<entry user="{user}"><tag><member>{tag}</member></tag></entry>') for user in users]
+    return send_user_id_update('unregister-user', 'user', entries)
 
 
 def panorama_unregister_user_tag_command(args: dict):
@@ -3811,8 +3892,11 @@ def panorama_unregister_user_tag_command(args: dict):
         'Type': entryTypes['note'],
         'ContentsFormat': formats['json'],
         'Contents': result,
-        'ReadableContentsFormat': formats['text'],
-        'HumanReadable': 'Unregistered user-tag successfully'
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': user_id_update_to_human_readable(
+            result, 'Unregistered user-tag successfully',
+            f'Unregistered {len(users) - len(result["Failed"])} of {len(users)} users from the tag {tag}.'
+            f' The following users were not unregistered', 'User')
     })
 
 
@@ -4143,32 +4227,50 @@ def build_logs_query(address_src: Optional[str], address_dst: Optional[str], ip_
     return query
 
 
+def get_logs_query(log_type: str, query: str, address_src: str, address_dst: str, ip_: str, zone_src: str,
+                   zone_dst: str, time_generated: str, action: str, port_dst: str, rule: str, url: str,
+                   filedigest: str) -> str:
+    """
+    Gets the query of a logs query, which is either the free query or the query of the fixed search parameters
+    """
+    if filedigest and log_type != 'wildfire':
+        raise Exception('The filedigest argument is only relevant to wildfire log type.')
+    if url and log_type == 'traffic':
+        raise Exception('The url argument is not relevant to traffic log type.')
+
+    if query:
+        return query
+
+    if ip_ and (address_src or address_dst):
+        raise Exception(
+            'The ip argument cannot be used with the address-source or the address-destination arguments.')
+    return build_logs_query(address_src, address_dst, ip_,
+                            zone_src, zone_dst, time_generated, action,
+                            port_dst, rule, url, filedigest)
+
+
 @logger
 def panorama_query_logs(log_type: str, number_of_logs: str, query: str, address_src: str, address_dst: str, ip_: str,
                         zone_src: str, zone_dst: str, time_generated: str, action: str,
-                        port_dst: str, rule: str, url: str, filedigest: str):
+                        port_dst: str, rule: str, url: str, filedigest: str, skip: Optional[str] = None):
+    return panorama_run_logs_query(log_type, number_of_logs,
+                                   get_logs_query(log_type, query, address_src, address_dst, ip_, zone_src, zone_dst,
+                                                  time_generated, action, port_dst, rule, url, filedigest), skip)
+
+
+@logger
+def panorama_run_logs_query(log_type: str, number_of_logs: Optional[str], query: str, skip: Optional[str] = None):
     params = {
         'type': 'log',
         'log-type': log_type,
-        'key': API_KEY
+        'key': API_KEY,
+        'query': query
     }
 
-    if filedigest and log_type != 'wildfire':
-        raise Exception('The filedigest argument is only relevant to wildfire log type.')
-    if url and log_type == 'traffic':
-        raise Exception('The url argument is not relevant to traffic log type.')
-
-    if query:
-        params['query'] = query
-    else:
-        if ip_ and (address_src or address_dst):
-            raise Exception(
-                'The ip argument cannot be used with the address-source or the address-destination arguments.')
-        params['query'] = build_logs_query(address_src, address_dst, ip_,
-                                           zone_src, zone_dst, time_generated, action,
-                                           port_dst, rule, url, filedigest)
     if number_of_logs:
         params['nlogs'] = number_of_logs
+    if skip:
+        params['skip'] = skip
 
     result = http_request(
         URL,
@@ -4179,6 +4281,148 @@ def panorama_query_logs(log_type: str, number_of_logs: str, query: str, address_
     return result
 
 
+def get_query_logs_job_id(result: dict) -> str:
+    """
+    Gets the job ID of a logs query from its response
+    """
+    if result['response']['@status'] == 'error':
+        if 'msg' in result['response'] and 'line' in result['response']['msg']:
+            message = '. Reason is: ' + result['response']['msg']['line']
+            raise Exception('Query logs failed' + message)
+        else:
+            raise Exception('Query logs failed.')
+
+    if 'response' not in result or 'result' not in result['response'] or 'job' not in result['response']['result']:
+        raise Exception('Missing JobID in response.')
+
+    return result['response']['result']['job']
+
+
+@logger
+def panorama_get_logs_job(job_id: str) -> Tuple[dict, str]:
+    """
+    Gets the job of a logs query, without converting the logs it returned
+
+    Returns:
+        the job, and the raw response, whose logs can be streamed with write_logs.
+    """
+    params = {
+        'action': 'get',
+        'type': 'log',
+        'job-id': job_id,
+        'key': API_KEY
+    }
+    response_text = http_request(URL, 'GET', params=params, is_raw=True).text
+
+    # the job precedes the logs in the response, so only the start of the response is converted
+    job = next(iter_xml2dict(response_text, 'job'), None)
+    if not isinstance(job, dict) or 'status' not in job:
+        result = xml2dict(response_text)
+        if dict_safe_get(result, ['response', '@status']) == 'error':
+            message = dict_safe_get(result, ['response', 'msg', 'line'])
+            raise Exception('Query logs failed' + (f'. Reason is: {message}' if message else '.'))
+        raise Exception('Missing JobID status in response.')
+
+    return job, response_text
+
+
+def wait_for_logs_job(job_id: str, deadline: float) -> str:
+    """
+    Waits for a logs query to finish, until the deadline (in seconds since the epoch)
+
+    Returns:
+        the raw response of the finished query, whose logs can be streamed with write_logs.
+    """
+    while True:
+        job, response_text = panorama_get_logs_job(job_id)
+        if job['status'] == 'FIN':
+            return response_text
+        if time.time() >= deadline:
+            raise Exception(f'The logs query {job_id} did not finish in {LOGS_JOB_TIMEOUT} seconds. Retrieve less '
+                            f'logs, or query the logs without retrieve_as_file and poll panorama-check-logs-status.')
+        time.sleep(LOGS_JOB_POLLING_INTERVAL)
+
+
+def write_logs(response_text: str, logs_file) -> Tuple[int, Optional[str]]:
+    """
+    Streams the logs of a finished logs query into a JSON lines file, one prettified log at a time
+
+    Returns:
+        the number of written logs, and the latest time a written log was generated at.
+    """
+    count = 0
+    latest_time_generated = None
+    for log in iter_xml2dict(response_text, 'entry'):
+        logs_file.write(json.dumps(prettify_log(log)) + '\n')
+        count += 1
+        # the times are formatted as YYYY/MM/DD HH:MM:SS, so they are ordered as strings
+        time_generated = log.get('time_generated')
+        if time_generated and (not latest_time_generated or time_generated > latest_time_generated):
+            latest_time_generated = time_generated
+    return count, latest_time_generated
+
+
+def create_file_result(file_name: str) -> Tuple[str, dict]:
+    """
+    Creates a file entry as fileResult does, for a file which is written by the caller instead of kept in memory
+
+    Returns:
+        the path to write the file to, and the file entry.
+    """
+    file_id = demisto.uniqueFile()
+    file_path = demisto.investigation()['id'] + '_' + file_id
+    return file_path, {'Contents': '', 'ContentsFormat': formats['text'], 'Type': entryTypes['file'],
+                       'File': file_name, 'FileID': file_id}
+
+
+def panorama_query_logs_to_file(log_type: str, number_of_logs: int, skip: int, query_args: tuple):
+    """
+    Retrieves the logs of a query into a JSON lines file, by running the query in pages of up to LOGS_PAGE_SIZE logs.
+    The pages after the first are limited to the logs generated until the latest log of the first page, so logs which
+    are generated while the pages are retrieved do not shift the pages.
+    """
+    max_logs = LOGS_PAGE_SIZE * LOGS_MAX_PAGES
+    if number_of_logs > max_logs:
+        raise Exception(f'Up to {max_logs} logs can be retrieved as a file. Use the skip argument to retrieve the '
+                        f'next logs with another command.')
+
+    query = get_logs_query(log_type, *query_args)
+    deadline = time.time() + LOGS_JOB_TIMEOUT
+    file_path, file_entry = create_file_result(f'{log_type}_logs.jsonl')
+    jobs_output = []
+    count = 0
+    with open(file_path, 'w') as logs_file:
+        while count < number_of_logs:
+            page_size = min(LOGS_PAGE_SIZE, number_of_logs - count)
+            job_id = get_query_logs_job_id(panorama_run_logs_query(log_type, str(page_size), query,
+                                                                   skip=str(skip + count)))
+            page_count, latest_time_generated = write_logs(wait_for_logs_job(job_id, deadline), logs_file)
+            if not count and latest_time_generated:
+                time_bound = f"(time_generated leq '{latest_time_generated}')"
+                query = f'({query}) and {time_bound}' if query else time_bound
+            count += page_count
+            jobs_output.append({'JobID': job_id, 'Status': 'Completed', 'LogType': log_type})
+            demisto.debug(f'Retrieved {count} {log_type} logs')
+            if page_count < page_size:
+                break
+
+    summary = {
+        'JobIDs': [job['JobID'] for job in jobs_output],
+        'LogType': log_type,
+        'LogsCount': count,
+        'FileName': file_entry['File']
+    }
+    return_results([file_entry, {
+        'Type': entryTypes['note'],
+        'ContentsFormat': formats['json'],
+        'Contents': summary,
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': tableToMarkdown(f'Query {log_type} Logs:', summary,
+                                         ['JobIDs', 'LogType', 'LogsCount', 'FileName'], removeNull=True),
+        'EntryContext': {"Panorama.Monitor(val.JobID == obj.JobID)": jobs_output}
+    }])
+
+
 def panorama_query_logs_command(args: dict):
     """
     Query logs
@@ -4197,6 +4441,7 @@ def panorama_query_logs_command(args: dict):
     rule = args.get('rule')
     filedigest = args.get('filedigest')
     url = args.get('url')
+    skip = args.get('skip')
     if url and url[-1] != '/':
         url += '/'
 
@@ -4204,22 +4449,18 @@ def panorama_query_logs_command(args: dict):
                   or time_generated or action or port_dst or rule or url or filedigest):
         raise Exception('Use the free query argument or the fixed search parameters arguments to build your query.')
 
+    if argToBoolean(args.get('retrieve_as_file', 'false')):
+        panorama_query_logs_to_file(log_type, int(number_of_logs or 100), int(skip or 0),
+                                    (query, address_src, address_dst, ip_, zone_src, zone_dst, time_generated, action,
+                                     port_dst, rule, url, filedigest))
+        return
+
     result = panorama_query_logs(log_type, number_of_logs, query, address_src, address_dst, ip_,
                                  zone_src, zone_dst, time_generated, action,
-                                 port_dst, rule, url, filedigest)
-
-    if result['response']['@status'] == 'error':
-        if 'msg' in result['response'] and 'line' in result['response']['msg']:
-            message = '. Reason is: ' + result['response']['msg']['line']
-            raise Exception('Query logs failed' + message)
-        else:
-            raise Exception('Query logs failed.')
-
-    if 'response' not in result or 'result' not in result['response'] or 'job' not in result['response']['result']:
-        raise Exception('Missing JobID in response.')
+                                 port_dst, rule, url, filedigest, skip)
 
     query_logs_output = {
-        'JobID': result['response']['result']['job'],
+        'JobID': get_query_logs_job_id(result),
         'Status': 'Pending',
         'LogType': log_type,
         'Message': result['response']['result']['msg']['line']
@@ -4241,30 +4482,20 @@ def panorama_check_logs_status_command(job_id: str):
     """
     job_ids = argToList(job_id)
     for job_id in job_ids:
-        result = panorama_get_traffic_logs(job_id)
-
-        if result['response']['@status'] == 'error':
-            if 'msg' in result['response'] and 'line' in result['response']['msg']:
-                message = '. Reason is: ' + result['response']['msg']['line']
-                raise Exception('Query logs failed' + message)
-            else:
-                raise Exception('Query logs failed.')
+        # the logs of a finished query are not needed, so only its job is converted
+        job, _ = panorama_get_logs_job(job_id)
 
         query_logs_status_output = {
             'JobID': job_id,
             'Status': 'Pending'
         }
-
-        if 'response' not in result or 'result' not in result['response'] or 'job' not in result['response']['result'] \
-                or 'status' not in result['response']['result']['job']:
-            raise Exception('Missing JobID status in response.')
-        if result['response']['result']['job']['status'] == 'FIN':
+        if job['status'] == 'FIN':
             query_logs_status_output['Status'] = 'Completed'
 
         return_results({
             'Type': entryTypes['note'],
             'ContentsFormat': formats['json'],
-            'Contents': result,
+            'Contents': {'response': {'@status': 'success', 'result': {'job': job}}},
             'ReadableContentsFormat': formats['markdown'],
             'HumanReadable': tableToMarkdown('Query Logs status:', query_logs_status_output, ['JobID', 'Status'],
                                              removeNull=True),
@@ -4369,17 +4600,54 @@ def prettify_logs(logs: Union[list, dict]):
     return pretty_logs_arr
 
 
+def panorama_get_logs_to_file(job_id: str, log_type: Optional[str]):
+    """
+    Retrieves the logs of a query into a JSON lines file, and returns only a summary of them
+    """
+    job, response_text = panorama_get_logs_job(job_id)
+    query_logs_output: Dict[str, Any] = {
+        'JobID': job_id,
+        'Status': 'Pending'
+    }
+    entries: List[dict] = []
+    if job['status'] == 'FIN':
+        query_logs_output['Status'] = 'Completed'
+        file_path, file_entry = create_file_result(f'{log_type or "panorama"}_logs_{job_id}.jsonl')
+        with open(file_path, 'w') as logs_file:
+            query_logs_output['LogsCount'], _ = write_logs(response_text, logs_file)
+        query_logs_output['FileName'] = file_entry['File']
+        entries.append(file_entry)
+
+    entries.append({
+        'Type': entryTypes['note'],
+        'ContentsFormat': formats['json'],
+        'Contents': query_logs_output,
+        'ReadableContentsFormat': formats['markdown'],
+        'HumanReadable': tableToMarkdown(f'Query {log_type} Logs:' if log_type else 'Query Logs:', query_logs_output,
+                                         ['JobID', 'Status', 'LogsCount', 'FileName'], removeNull=True),
+        'EntryContext': {"Panorama.Monitor(val.JobID == obj.JobID)": {'JobID': job_id,
+                                                                      'Status': query_logs_output['Status']}}
+    })
+    return_results(entries)
+
+
 def panorama_get_logs_command(args: dict):
     ignore_auto_extract = args.get('ignore_auto_extract') == 'true'
+    as_file = argToBoolean(args.get('as_file', 'false'))
     job_ids = argToList(args.get('job_id'))
     for job_id in job_ids:
-        result = panorama_get_traffic_logs(job_id)
         log_type_dt = demisto.dt(demisto.context(), f'Panorama.Monitor(val.JobID === "{job_id}").LogType')
         if isinstance(log_type_dt, list):
             log_type = log_type_dt[0]
         else:
             log_type = log_type_dt
 
+        if as_file:
+            panorama_get_logs_to_file(job_id, log_type)
+            continue
+
+        result = panorama_get_traffic_logs(job_id)
+
         if result['response']['@status'] == 'error':
             if 'msg' in result['response'] and 'line' in result['response']['msg']:
                 message = '. Reason is: ' + result['response']['msg']['line']
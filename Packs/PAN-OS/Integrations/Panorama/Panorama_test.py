@@ -250,3 +250,188 @@ def test_validate_search_time():
     with pytest.raises(Exception):
         assert validate_search_time('219/12/26 00:00:00')
         assert validate_search_time('219/10/35')
+
+
+def test_split_user_id_entries():
+    from Panorama import split_user_id_entries
+    entries = [(str(i), 'x' * 10) for i in range(25)]
+    assert [len(chunk) for chunk in split_user_id_entries(entries, max_entries=10, max_size=1000)] == [10, 10, 5]
+    assert [len(chunk) for chunk in split_user_id_entries(entries, max_entries=10, max_size=45)] == [4] * 6 + [1]
+    assert split_user_id_entries([('1', 'x' * 100)], max_entries=10, max_size=45) == [[('1', 'x' * 100)]]
+    assert split_user_id_entries([], max_entries=10, max_size=45) == []
+
+
+def test_panorama_register_ip_tag_in_chunks(mocker, requests_mock):
+    """
+    Given
+    - 25 IPs to register, which are sent in messages of up to 10 IPs.
+    - A server which ignores one of the IPs as already registered, and fails the last message.
+
+    When
+    - Registering the IPs to a tag.
+
+    Then
+    - Ensure every IP is sent once, in 3 messages.
+    - Ensure the ignored IP and the IPs of the failed message are reported, and the other IPs are added to the context.
+    """
+    import Panorama
+    from Panorama import panorama_register_ip_tag_command
+    Panorama.URL = 'https://1.1.1.1:443/api/'
+    mocker.patch.object(Panorama, 'USER_ID_MAX_ENTRIES', 10)
+    mocker.patch.object(demisto, 'context', return_value={})
+    mocker.patch.object(demisto, 'dt', return_value=None)
+    results = mocker.patch.object(Panorama, 'return_results')
+    ips = [f'10.0.0.{i}' for i in range(25)]
+
+    def uid_response(request, context):
+        if '10.0.0.20' in request.text:
+            context.status_code = 500
+            return 'error'
+        if '10.0.0.3%22' in request.text:
+            return '<response status="error"><msg><line><uid-response><version>2.0</version><payload><register>' \
+                   '<entry ip="10.0.0.3" message="tag foo already exists, ignore"/></register></payload>' \
+                   '</uid-response></line></msg></response>'
+        return '<response status="success"><result><uid-response><version>2.0</version><payload><register/>' \
+               '</payload></uid-response></result></response>'
+
+    requests_mock.post(Panorama.URL, text=uid_response)
+    panorama_register_ip_tag_command({'tag': 'foo', 'IPs': ','.join(ips)})
+
+    assert requests_mock.call_count == 3
+    entry = results.call_args[0][0]
+    assert entry['Contents']['Messages'] == 3
+    assert entry['Contents']['FailedMessages'] == 1
+    assert set(entry['Contents']['Failed']) == {'10.0.0.3', *ips[20:]}
+    assert entry['Contents']['Failed']['10.0.0.3'] == 'tag foo already exists, ignore'
+    assert 'Registered 19 of 25 IPs to the tag foo' in entry['HumanReadable']
+    registered_ips = entry['EntryContext']['Panorama.DynamicTags(val.Tag == obj.Tag)']['IPs']
+    assert registered_ips == [ip for ip in ips[:20] if ip != '10.0.0.3']
+
+
+def test_panorama_unregister_ip_tag_fails(mocker, requests_mock):
+    import Panorama
+    from Panorama import panorama_unregister_ip_tag_command
+    Panorama.URL = 'https://1.1.1.1:443/api/'
+    requests_mock.post(Panorama.URL, status_code=403, reason='Forbidden')
+    with pytest.raises(Exception, match='Forbidden'):
+        panorama_unregister_ip_tag_command({'tag': 'foo', 'IPs': '1.1.1.1,2.2.2.2'})
+
+
+def logs_query_mock(total_logs, queries=None):
+    """A PAN-OS logs API mock, whose queries return total_logs traffic logs, newest first, and are finished on the
+    second check. The queries are appended to the given list."""
+    checks = {}
+
+    def logs_api(request, context):
+        params = request.qs
+        if 'action' not in params:
+            if queries is not None:
+                queries.append(request.query)
+            job_id = f'{params["skip"][0]}-{params["nlogs"][0]}'
+            return f'<response status="success"><result><msg><line>query job enqueued with jobid {job_id}</line></msg>' \
+                   f'<job>{job_id}</job></result></response>'
+        job_id = params['job-id'][0]
+        checks[job_id] = checks.get(job_id, 0) + 1
+        if checks[job_id] == 1:
+            return '<response status="success"><result><job><id>1</id><status>ACT</status></job></result></response>'
+        skip, nlogs = (int(value) for value in job_id.split('-'))
+        entries = ''.join(f'<entry logid="{i}"><src>10.0.0.{i % 256}</src><app>ssl</app>'
+                          f'<time_generated>2020/01/01 00:{59 - i // 60:02d}:{59 - i % 60:02d}</time_generated></entry>'
+                          for i in range(skip, min(skip + nlogs, total_logs)))
+        return f'<response status="success"><result><job><id>1</id><status>FIN</status></job><log>' \
+               f'<logs count="{min(nlogs, max(total_logs - skip, 0))}" progress="100">{entries}</logs></log>' \
+               f'</result></response>'
+
+    return logs_api
+
+
+@pytest.mark.parametrize('number_of_logs, expected_pages', [('25', ['0-10', '10-10', '20-5']),
+                                                            ('40', ['0-10', '10-10', '20-10'])])
+def test_panorama_query_logs_to_file(mocker, requests_mock, tmp_path, number_of_logs, expected_pages):
+    """
+    Given
+    - A query which matches 28 traffic logs, and pages of up to 10 logs.
+
+    When
+    - Retrieving up to 25 and up to 40 logs as a file.
+
+    Then
+    - Ensure the query is run page after page with skip and nlogs, until the number of logs or a partial page.
+    - Ensure the pages after the first are limited to the logs generated until the latest log of the first page.
+    - Ensure the prettified logs are written to a JSON lines file, and only a summary is returned.
+    """
+    import json
+    import urllib.parse
+    import Panorama
+    from Panorama import panorama_query_logs_command
+    Panorama.URL = 'https://1.1.1.1:443/api/'
+    mocker.patch.object(Panorama, 'LOGS_PAGE_SIZE', 10)
+    mocker.patch.object(Panorama, 'LOGS_JOB_POLLING_INTERVAL', 0)
+    mocker.patch.object(demisto, 'uniqueFile', return_value='logs')
+    mocker.patch.object(demisto, 'investigation', return_value={'id': str(tmp_path / '1')})
+    results = mocker.patch.object(Panorama, 'return_results')
+    queries = []
+    requests_mock.get(Panorama.URL, text=logs_query_mock(28, queries))
+
+    panorama_query_logs_command({'log-type': 'traffic', 'query': '(app eq ssl)', 'number_of_logs': number_of_logs,
+                                 'retrieve_as_file': 'true'})
+
+    file_entry, summary_entry = results.call_args[0][0]
+    assert file_entry['File'] == 'traffic_logs.jsonl'
+    with open(tmp_path / '1_logs') as logs_file:
+        logs = [json.loads(line) for line in logs_file]
+    assert len(logs) == summary_entry['Contents']['LogsCount'] == min(int(number_of_logs), 28)
+    assert logs[0] == {'SourceAddress': '10.0.0.0', 'Application': 'ssl', 'TimeGenerated': '2020/01/01 00:59:59'}
+    assert summary_entry['Contents']['JobIDs'] == expected_pages
+    query_params = [urllib.parse.parse_qs(query)['query'][0] for query in queries]
+    assert query_params == ['(app eq ssl)'] + \
+        ["((app eq ssl)) and (time_generated leq '2020/01/01 00:59:59')"] * (len(expected_pages) - 1)
+    assert 'Logs' not in summary_entry['EntryContext']['Panorama.Monitor(val.JobID == obj.JobID)'][0]
+
+
+def test_panorama_query_logs_to_file_limits(mocker, requests_mock, tmp_path):
+    """
+    Given
+    - Pages of up to 10 logs, up to 2 pages, and queries which never finish.
+
+    When
+    - Retrieving more logs than 2 pages as a file, and retrieving 2 pages as a file.
+
+    Then
+    - Ensure more logs than the pages hold are not queried.
+    - Ensure the retrieval fails once the jobs of all the pages did not finish in the timeout.
+    """
+    import Panorama
+    from Panorama import panorama_query_logs_command
+    Panorama.URL = 'https://1.1.1.1:443/api/'
+    mocker.patch.object(Panorama, 'LOGS_PAGE_SIZE', 10)
+    mocker.patch.object(Panorama, 'LOGS_MAX_PAGES', 2)
+    mocker.patch.object(Panorama, 'LOGS_JOB_POLLING_INTERVAL', 0)
+    mocker.patch.object(Panorama, 'LOGS_JOB_TIMEOUT', 0)
+    mocker.patch.object(demisto, 'uniqueFile', return_value='logs')
+    mocker.patch.object(demisto, 'investigation', return_value={'id': str(tmp_path / '1')})
+    logs_api = logs_query_mock(5)
+    requests_mock.get(Panorama.URL, text=lambda request, context: logs_api(request, context).replace('FIN', 'ACT'))
+
+    with pytest.raises(Exception, match='Up to 20 logs'):
+        panorama_query_logs_command({'log-type': 'traffic', 'number_of_logs': '21', 'retrieve_as_file': 'true'})
+    assert not requests_mock.called
+    with pytest.raises(Exception, match='did not finish in 0 seconds'):
+        panorama_query_logs_command({'log-type': 'traffic', 'number_of_logs': '20', 'retrieve_as_file': 'true'})
+
+
+def test_panorama_check_logs_status(mocker, requests_mock):
+    import Panorama
+    from Panorama import panorama_check_logs_status_command
+    Panorama.URL = 'https://1.1.1.1:443/api/'
+    results = mocker.patch.object(Panorama, 'return_results')
+    requests_mock.get(Panorama.URL, text=logs_query_mock(5))
+
+    panorama_check_logs_status_command('0-5')
+    assert results.call_args[0][0]['EntryContext']['Panorama.Monitor(val.JobID == obj.JobID)']['Status'] == 'Pending'
+    panorama_check_logs_status_command('0-5')
+    assert results.call_args[0][0]['EntryContext']['Panorama.Monitor(val.JobID == obj.JobID)']['Status'] == 'Completed'
+
+    requests_mock.get(Panorama.URL, text='<response status="error"><msg><line>job 7 not found</line></msg></response>')
+    with pytest.raises(Exception, match='job 7 not found'):
+        panorama_check_logs_status_command('7')
@@ -5,7 +5,8 @@ from gevent.pywsgi import WSGIServer
 from urllib.parse import urlparse, ParseResult
 from tempfile import NamedTemporaryFile
 from base64 import b64decode
-from typing import Callable, List, Generator
+from typing import Callable, List, Generator, Iterator, Optional, Union
+from collections import OrderedDict
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 from multiprocessing import Process
 
@@ -17,8 +18,10 @@ from libtaxii.messages_11 import (
     CollectionInformation,
     CollectionInformationResponse,
     PollRequest,
+    PollFulfillmentRequest,
     PollingServiceInstance,
     ServiceInstance,
+    StatusMessage,
     ContentBlock,
     generate_message_id,
     get_message_from_xml)
@@ -26,10 +29,12 @@ from libtaxii.constants import (
     MSG_COLLECTION_INFORMATION_REQUEST,
     MSG_DISCOVERY_REQUEST,
     MSG_POLL_REQUEST,
+    MSG_POLL_FULFILLMENT_REQUEST,
     SVC_DISCOVERY,
     SVC_COLLECTION_MANAGEMENT,
     SVC_POLL,
-    CB_STIX_XML_11
+    CB_STIX_XML_11,
+    ST_NOT_FOUND
 )
 from cybox.core import Observable
 
@@ -54,10 +59,15 @@ import pytz
 
 ''' GLOBAL VARIABLES '''
 INTEGRATION_NAME: str = 'TAXII Server'
-PAGE_SIZE = 200
 APP: Flask = Flask('demisto-taxii')
 NAMESPACE_URI = 'https://www.paloaltonetworks.com/cortex'
 NAMESPACE = 'cortex'
+# the number of seconds the time frame of a result set is kept for poll fulfillment requests of its next parts
+RESULT_SET_TTL = 3600
+# the maximal number of indicators whose content block is kept
+MAX_CONTENT_BLOCKS = 50000
+# the serialized content block of each indicator, by the indicator ID
+CONTENT_BLOCKS: OrderedDict = OrderedDict()
 
 
 ''' Log Handler '''
@@ -80,7 +90,7 @@ class Handler:
 
 class TAXIIServer:
     def __init__(self, host: str, port: int, collections: dict, certificate: str, private_key: str,
-                 http_server: bool, credentials: dict):
+                 http_server: bool, credentials: dict, result_part_size: Optional[int] = None):
         """
         Class for a TAXII Server configuration.
         Args:
@@ -91,6 +101,8 @@ class TAXIIServer:
             private_key: The private key for SSL.
             http_server: Whether to use HTTP server (not SSL).
             credentials: The user credentials.
+            result_part_size: The maximal number of content blocks in a poll response, larger results are split to
+                result parts. Default: all of the content blocks are returned in a single response.
         """
         self.host = host
         self.port = port
@@ -98,6 +110,9 @@ class TAXIIServer:
         self.certificate = certificate
         self.private_key = private_key
         self.http_server = http_server
+        self.result_part_size = result_part_size
+        # the time frames of the poll results which have more parts, by the result ID
+        self.result_sets: dict = {}
         self.auth = None
         if credentials:
             self.auth = (credentials.get('identifier', ''), credentials.get('password', ''))
@@ -189,28 +204,89 @@ class TAXIIServer:
 
         return collection_info_response
 
-    def get_poll_response(self, taxii_message: PollRequest) -> Response:
+    def get_poll_response(self, taxii_message: Union[PollRequest, PollFulfillmentRequest]) -> Response:
         """
-        Handle poll request.
+        Handle poll request and poll fulfillment request.
         Args:
-            taxii_message: The poll request message.
+            taxii_message: The poll request message, or the poll fulfillment request message of a result part.
 
         Returns:
             The poll response.
         """
-        if taxii_message.message_type != MSG_POLL_REQUEST:
-            raise ValueError('Invalid message, invalid Message Type')
-
         taxii_feeds = list(self.collections.keys())
         collection_name = taxii_message.collection_name
-        exclusive_begin_time = taxii_message.exclusive_begin_timestamp_label
-        inclusive_end_time = taxii_message.inclusive_end_timestamp_label
+        result_id = None
+        result_part_number = 1
+
+        if taxii_message.message_type == MSG_POLL_REQUEST:
+            exclusive_begin_time = taxii_message.exclusive_begin_timestamp_label
+            inclusive_end_time = taxii_message.inclusive_end_timestamp_label
+        elif taxii_message.message_type == MSG_POLL_FULFILLMENT_REQUEST:
+            result_set = self.get_result_set(taxii_message.result_id, collection_name)
+            if not result_set:
+                status_message = StatusMessage(generate_message_id(), taxii_message.message_id,
+                                               status_type=ST_NOT_FOUND,
+                                               message=f'The result ID {taxii_message.result_id} is unknown, '
+                                                       f'or its result expired. Poll the collection again.')
+                return taxii_make_response(status_message)
+            result_id = taxii_message.result_id
+            result_part_number = taxii_message.result_part_number
+            exclusive_begin_time = result_set['exclusive_begin_time']
+            inclusive_end_time = result_set['inclusive_end_time']
+        else:
+            raise ValueError('Invalid message, invalid Message Type')
 
         return self.stream_stix_data_feed(taxii_feeds, taxii_message.message_id, collection_name,
-                                          exclusive_begin_time, inclusive_end_time)
+                                          exclusive_begin_time, inclusive_end_time,
+                                          result_id=result_id, result_part_number=result_part_number)
+
+    def get_result_set(self, result_id: str, collection_name: str) -> Optional[dict]:
+        """
+        Get the time frame of a poll result which has more parts.
+        Args:
+            result_id: The result ID of the poll response.
+            collection_name: The collection name of the poll response.
+
+        Returns:
+            The result set, with the time frame of the poll, or None if the result ID is unknown or expired.
+        """
+        result_set = self.result_sets.get(result_id)
+        if not result_set or result_set['collection_name'] != collection_name \
+                or time.time() - result_set['created'] > RESULT_SET_TTL:
+            return None
+
+        return result_set
+
+    def add_result_set(self, collection_name: str, exclusive_begin_time: Optional[datetime],
+                       inclusive_end_time: datetime) -> str:
+        """
+        Keep the time frame of a poll result which has more parts, and drop the expired result sets.
+        Args:
+            collection_name: The collection name of the poll.
+            exclusive_begin_time: The query exclusive begin time.
+            inclusive_end_time: The query inclusive end time.
+
+        Returns:
+            The result ID of the poll result.
+        """
+        now = time.time()
+        for expired_result_id in [result_id for result_id, result_set in self.result_sets.items()
+                                  if now - result_set['created'] > RESULT_SET_TTL]:
+            del self.result_sets[expired_result_id]
+
+        result_id = str(uuid.uuid4())
+        self.result_sets[result_id] = {
+            'collection_name': collection_name,
+            'exclusive_begin_time': exclusive_begin_time,
+            'inclusive_end_time': inclusive_end_time,
+            'created': now
+        }
+
+        return result_id
 
     def stream_stix_data_feed(self, taxii_feeds: list, message_id: str, collection_name: str,
-                              exclusive_begin_time: datetime, inclusive_end_time: datetime) -> Response:
+                              exclusive_begin_time: datetime, inclusive_end_time: datetime,
+                              result_id: str = None, result_part_number: int = 1) -> Response:
         """
         Get the indicator query results in STIX data feed format.
         Args:
@@ -219,6 +295,8 @@ class TAXIIServer:
             collection_name: The collection name to get the indicator query from.
             exclusive_begin_time: The query exclusive begin time.
             inclusive_end_time: The query inclusive end time.
+            result_id: The result ID of a poll result which has more parts.
+            result_part_number: The number of the result part to get.
 
         Returns:
             Stream of STIX indicator data feed.
@@ -226,9 +304,30 @@ class TAXIIServer:
         if collection_name not in taxii_feeds:
             raise ValueError('Invalid message, unknown feed')
 
+        if result_part_number < 1:
+            raise ValueError('Invalid message, invalid result part number')
+
         if not inclusive_end_time:
             inclusive_end_time = datetime.utcnow().replace(tzinfo=pytz.utc)
 
+        indicator_query = self.collections[str(collection_name)]
+        indicators: Iterator[dict]
+        more = False
+        if self.result_part_size:
+            # one indicator more than the part is searched, so the response header can tell whether there are more
+            offset = (result_part_number - 1) * self.result_part_size
+            part = list(find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time,
+                                                      offset=offset, limit=self.result_part_size + 1))
+            more = len(part) > self.result_part_size
+            indicators = iter(part[:self.result_part_size])
+        else:
+            indicators = find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time)
+
+        if more and not result_id:
+            result_id = self.add_result_set(collection_name, exclusive_begin_time, inclusive_end_time)
+
+        result_id_attribute = f' result_id="{result_id}"' if result_id else ''
+
         def yield_response() -> Generator:
             """
 
@@ -241,7 +340,8 @@ class TAXIIServer:
                        'xmlns:tdq="http://taxii.mitre.org/query/taxii_default_query-1"' \
                        f' message_id="{generate_message_id()}"' \
                        f' in_response_to="{message_id}"' \
-                       f' collection_name="{collection_name}" more="false" result_part_number="1"> ' \
+                       f' collection_name="{collection_name}" more="{str(more).lower()}"{result_id_attribute}' \
+                       f' result_part_number="{result_part_number}"> ' \
                        f'<taxii_11:Inclusive_End_Timestamp>{inclusive_end_time.isoformat()}' \
                        '</taxii_11:Inclusive_End_Timestamp>'
 
@@ -251,19 +351,10 @@ class TAXIIServer:
 
             yield response
 
-            # yield the content blocks
-            indicator_query = self.collections[str(collection_name)]
-
-            for indicator in find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time):
+            # yield the content blocks of the result part
+            for indicator in indicators:
                 try:
-                    stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
-                    content_block = ContentBlock(
-                        content_binding=CB_STIX_XML_11,
-                        content=stix_xml_indicator
-                    )
-
-                    content_xml = content_block.to_xml().decode('utf-8')
-                    yield f'{content_xml}\n'
+                    yield f'{get_content_block(indicator)}\n'
                 except Exception as e:
                     handle_long_running_error(f'Failed parsing indicator to STIX: {e}')
 
@@ -595,6 +686,54 @@ def get_stix_indicator(indicator: dict) -> stix.core.STIXPackage:
 ''' HELPER FUNCTIONS '''
 
 
+def create_content_block(indicator: dict) -> str:
+    """
+    Serialize an indicator to a STIX content block.
+    Args:
+        indicator: The Demisto indicator.
+
+    Returns:
+        The XML of the content block.
+    """
+    stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
+    content_block = ContentBlock(
+        content_binding=CB_STIX_XML_11,
+        content=stix_xml_indicator
+    )
+
+    return content_block.to_xml().decode('utf-8')
+
+
+def get_content_block(indicator: dict) -> str:
+    """
+    Get the STIX content block of an indicator. The content block is serialized only if the indicator was modified
+    since it was last serialized, and the least recently polled content blocks are dropped when more than
+    MAX_CONTENT_BLOCKS are kept.
+    Args:
+        indicator: The Demisto indicator.
+
+    Returns:
+        The XML of the content block.
+    """
+    indicator_id = indicator.get('id')
+    modified = indicator.get('modified')
+    if not indicator_id or not modified:
+        return create_content_block(indicator)
+
+    cached = CONTENT_BLOCKS.get(indicator_id)
+    if cached and cached[0] == modified:
+        CONTENT_BLOCKS.move_to_end(indicator_id)
+        return cached[1]
+
+    content_xml = create_content_block(indicator)
+    CONTENT_BLOCKS[indicator_id] = (modified, content_xml)
+    CONTENT_BLOCKS.move_to_end(indicator_id)
+    while len(CONTENT_BLOCKS) > MAX_CONTENT_BLOCKS:
+        CONTENT_BLOCKS.popitem(last=False)
+
+    return content_xml
+
+
 def get_calling_context():
     return demisto.callingContext.get('context', {})  # type: ignore[attr-defined]
 
@@ -719,16 +858,19 @@ def get_collections(params: dict = demisto.params()) -> dict:
     return collections
 
 
-def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime) -> list:
+def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime,
+                                  offset: int = 0, limit: int = None) -> Iterator[dict]:
     """
     Find indicators according to a query and begin time/end time.
     Args:
         indicator_query: The indicator query.
         begin_time: The exclusive begin time.
         end_time: The inclusive end time.
+        offset: The number of indicators to skip.
+        limit: The maximal number of indicators to find. Default: all of them.
 
     Returns:
-        Indicator query results from Demisto.
+        A stream of the indicator query results from Demisto.
     """
 
     if indicator_query:
@@ -746,29 +888,7 @@ def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, en
         indicator_query += f'sourcetimestamp:<="{tz_end_time}"'
     demisto.info(f'Querying indicators by: {indicator_query}')
 
-    return find_indicators_loop(indicator_query)
-
-
-def find_indicators_loop(indicator_query: str):
-    """
-    Find indicators in a loop according to a query.
-    Args:
-        indicator_query: The indicator query.
-
-    Returns:
-        Indicator query results from Demisto.
-    """
-    iocs: List[dict] = []
-    total_fetched = 0
-    next_page = 0
-    last_found_len = PAGE_SIZE
-    while last_found_len == PAGE_SIZE:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
-    return iocs
+    return IndicatorsSearcher(indicator_query).iter_indicators(offset=offset, limit=limit)
 
 
 def taxii_make_response(taxii_message: TAXIIMessage):
@@ -922,6 +1042,14 @@ def main():
     certificate: str = params.get('certificate', '')
     private_key: str = params.get('key', '')
     credentials: dict = params.get('credentials', None)
+    result_part_size = None
+    if params.get('result_part_size'):
+        try:
+            result_part_size = int(params['result_part_size'])
+        except ValueError:
+            raise ValueError('The poll result part size must be a number.')
+        if result_part_size < 1:
+            raise ValueError('The poll result part size must be a positive number.')
     http_server = True
     if (certificate and not private_key) or (private_key and not certificate):
         raise ValueError('When using HTTPS connection, both certificate and private key must be provided.')
@@ -936,7 +1064,7 @@ def main():
         host_name = get_https_hostname(host_name)
 
     SERVER = TAXIIServer(f'{scheme}://{host_name}', port, collections,
-                         certificate, private_key, http_server, credentials)
+                         certificate, private_key, http_server, credentials, result_part_size)
 
     demisto.debug(f'Command being called is {command}')
     commands = {
@@ -954,5 +1082,7 @@ def main():
         return_error(err_msg)
 
 
+from SearchIndicatorsApiModule import *  # noqa: E402
+
 if __name__ in ['__main__', '__builtin__', 'builtins']:
     main()
@@ -386,13 +386,8 @@ def test_find_indicators_by_time_frame(mocker):
     import pytz
     from TAXIIServer import find_indicators_by_time_frame
 
-    def find_indicators(indicator_query):
-        if indicator_query == INDICATOR_QUERY:
-            return 'yep'
-        return 'nope'
-
     # Set
-    mocker.patch('TAXIIServer.find_indicators_loop', side_effect=find_indicators)
+    search_indicators = mocker.patch.object(demisto, 'searchIndicators', return_value=json.loads(IP_INDICATORS))
     mocker.patch.object(demisto, 'info')
 
     begin_date = datetime.datetime(2020, 2, 10, 11, 32, 32, 644224, tzinfo=pytz.utc)
@@ -402,19 +397,8 @@ def test_find_indicators_by_time_frame(mocker):
     result = find_indicators_by_time_frame('type:IP and sourceBrands:"Bambenek Consulting Feed"', begin_date, end_date)
 
     # Assert
-    assert result == 'yep'
-
-
-def test_find_indicators_loop(mocker):
-    from TAXIIServer import find_indicators_loop
-
-    # Set
-    mocker.patch.object(demisto, 'searchIndicators', return_value=json.loads(IP_INDICATORS))
-
-    # Arrange
-    indicators = find_indicators_loop('q')
-
-    # Assert
+    indicators = list(result)
+    assert search_indicators.call_args[1]['query'] == INDICATOR_QUERY
     assert len(indicators) == 1
     assert indicators[0]['value'] == '52.218.100.20'
 
@@ -435,3 +419,94 @@ def test_validate_indicators(indicator):
 
     # Assert
     assert sdv.validate_xml(tree)
+
+
+def test_get_content_block(mocker):
+    import TAXIIServer
+    from TAXIIServer import get_content_block
+
+    # Set
+    mocker.patch.object(TAXIIServer, 'CONTENT_BLOCKS', TAXIIServer.OrderedDict())
+    create_content_block = mocker.patch('TAXIIServer.create_content_block', side_effect=lambda ioc: ioc['value'])
+    indicator = json.loads(IP_INDICATORS)['iocs'][0]
+    modified_indicator = dict(indicator, value='1.1.1.1', modified='2020-02-21T10:00:00.000000+02:00')
+
+    # Arrange
+    content_blocks = [get_content_block(indicator), get_content_block(indicator), get_content_block(modified_indicator)]
+
+    # Assert
+    assert content_blocks == ['52.218.100.20', '52.218.100.20', '1.1.1.1']
+    assert create_content_block.call_count == 2
+    assert len(TAXIIServer.CONTENT_BLOCKS) == 1
+
+
+def test_poll_result_parts(mocker):
+    import re
+    import TAXIIServer as taxii_server_module
+    from libtaxii.constants import ST_NOT_FOUND
+    from libtaxii.messages_11 import PollFulfillmentRequest, get_message_from_xml
+    from TAXIIServer import TAXIIServer, APP
+
+    # Set
+    mocker.patch.object(taxii_server_module, 'CONTENT_BLOCKS', taxii_server_module.OrderedDict())
+    indicator = json.loads(IP_INDICATORS)['iocs'][0]
+    indicators = [dict(indicator, id=str(i), value=f'1.1.1.{i}') for i in range(5)]
+
+    def search_indicators(query='', page=0, size=200, **_):
+        return {'iocs': indicators[page * size:(page + 1) * size]}
+
+    mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    mocker.patch.object(demisto, 'info')
+    taxii_server = TAXIIServer('http://localhost', 1111, {'IP': 'type:IP'}, '', '', True, {}, result_part_size=2)
+
+    def poll(result_id=None, result_part_number=1):
+        with APP.test_request_context():
+            response = taxii_server.stream_stix_data_feed(['IP'], '1', 'IP', None, None, result_id=result_id,
+                                                          result_part_number=result_part_number)
+            return response.get_data(as_text=True)
+
+    # Arrange
+    first_part = poll()
+    result_id = re.search('result_id="([^"]+)"', first_part).group(1)
+    fulfillment_request = PollFulfillmentRequest('2', collection_name='IP', result_id=result_id, result_part_number=3)
+    with APP.test_request_context():
+        last_part = taxii_server.get_poll_response(fulfillment_request).get_data(as_text=True)
+
+    # Assert
+    assert 'more="true"' in first_part and 'result_part_number="1"' in first_part
+    assert len(re.findall('<taxii_11:Content_Block[ >]', first_part)) == 2
+    assert 'more="false"' in last_part and 'result_part_number="3"' in last_part
+    assert len(re.findall('<taxii_11:Content_Block[ >]', last_part)) == 1
+    assert '1.1.1.4' in last_part
+    # a single search of one indicator more than the part is made for each part
+    assert demisto.searchIndicators.call_count == 2
+
+    # an unknown or expired result ID gets a status message
+    for unknown_result_id in ('nope', result_id):
+        with APP.test_request_context():
+            response = taxii_server.get_poll_response(PollFulfillmentRequest('3', collection_name='IP',
+                                                                             result_id=unknown_result_id,
+                                                                             result_part_number=2))
+        status_message = get_message_from_xml(response.get_data())
+        assert status_message.status_type == ST_NOT_FOUND
+        assert status_message.in_response_to == '3'
+        taxii_server.result_sets[result_id]['created'] -= taxii_server_module.RESULT_SET_TTL + 1
+
+
+def test_poll_without_result_parts(mocker):
+    from TAXIIServer import TAXIIServer, APP
+
+    # Set
+    indicator = json.loads(IP_INDICATORS)['iocs'][0]
+    indicators = [dict(indicator, id=str(i), value=f'1.1.1.{i}') for i in range(5)]
+    mocker.patch.object(demisto, 'searchIndicators', return_value={'iocs': indicators})
+    mocker.patch.object(demisto, 'info')
+    taxii_server = TAXIIServer('http://localhost', 1111, {'IP': 'type:IP'}, '', '', True, {})
+
+    # Arrange
+    with APP.test_request_context():
+        response = taxii_server.stream_stix_data_feed(['IP'], '1', 'IP', None, None).get_data(as_text=True)
+
+    # Assert
+    assert 'more="false"' in response and 'result_id' not in response
+    assert response.count('<taxii_11:Content_Block') == 5
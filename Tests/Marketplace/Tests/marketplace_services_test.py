@@ -357,10 +357,10 @@ class TestChangelogCreation:
     """
 
     @pytest.fixture(scope="class")
-    def dummy_pack(self):
-        """ dummy pack fixture
+    def dummy_pack(self, tmp_path_factory):
+        """ dummy pack fixture, whose changelog.json is written to a temporary folder
         """
-        dummy_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+        dummy_path = str(tmp_path_factory.mktemp("TestPack"))
         sample_pack = Pack(pack_name="TestPack", pack_path=dummy_path)
         sample_pack.description = 'Sample description'
         sample_pack.current_version = '1.0.0'
@@ -1220,3 +1220,246 @@ class TestReleaseNotes:
         task_stat, pack_stat = dummy_pack.is_failed_to_upload(failed_packs_dict)
         assert task_stat == task_status
         assert pack_stat == status
+
+
+class TestDetectModified:
+    """ Test class for detecting the modified files of packs with a shared diff index.
+    """
+
+    @staticmethod
+    def dummy_content_repo(mocker, modified_paths):
+        content_repo = mocker.MagicMock()
+        modified_files = [mocker.MagicMock(a_path=path) for path in modified_paths]
+        content_repo.commit.return_value.diff.return_value.iter_change_type.return_value = modified_files
+        return content_repo
+
+    def test_get_modified_files_diffs_once(self, mocker):
+        """
+           Given:
+               - A diff with modified files of 2 packs, and a modified file which is not in a pack.
+           When:
+               - Getting the modified files of the packs expected between the same commits, and between other commits.
+           Then:
+               - Ensure the modified files of each pack are returned.
+               - Ensure the commits are diffed once per pair of commits.
+               - Ensure the index of a pair of commits is dropped once no expected pack is left for it.
+       """
+        from Tests.Marketplace.marketplace_services import ModifiedFilesIndex
+
+        content_repo = self.dummy_content_repo(mocker, ['Packs/Pack1/pack_metadata.json',
+                                                        'Packs/Pack1/Integrations/Integration1/Integration1.py',
+                                                        'Packs/Pack2/README.md', 'Tests/conf.json'])
+        modified_files_index = ModifiedFilesIndex(content_repo)
+        for pack_name in ('Pack1', 'Pack2', 'Pack3'):
+            modified_files_index.expect(pack_name, 'current', 'previous')
+        modified_files_index.expect('Pack4', 'current', 'older')
+
+        assert modified_files_index.get_modified_files('Pack1', 'current', 'previous') == [
+            'Packs/Pack1/pack_metadata.json', 'Packs/Pack1/Integrations/Integration1/Integration1.py']
+        assert modified_files_index.get_modified_files('Pack2', 'current', 'previous') == ['Packs/Pack2/README.md']
+        assert content_repo.commit.return_value.diff.call_count == 1
+
+        modified_files_index.discard('Pack3')
+        assert modified_files_index._modified_files_by_pack == {}
+
+        modified_files_index.get_modified_files('Pack4', 'current', 'older')
+        assert content_repo.commit.return_value.diff.call_count == 2
+        assert modified_files_index._modified_files_by_pack == {}
+
+    @pytest.mark.parametrize('pack_name, was_modified', [('Pack1', True), ('Pack2', False)])
+    def test_detect_modified(self, mocker, pack_name, was_modified):
+        """
+           Given:
+               - A pack which exists in the index, and a diff with modified files of Pack1.
+           When:
+               - Detecting whether the pack was modified.
+           Then:
+               - Ensure only Pack1 is detected as modified.
+               - Ensure the commit of the pack in the index is diffed with the current commit.
+       """
+        from Tests.Marketplace.marketplace_services import ModifiedFilesIndex
+
+        content_repo = self.dummy_content_repo(mocker, ['Packs/Pack1/pack_metadata.json'])
+        modified_files_index = ModifiedFilesIndex(content_repo)
+        mocker.patch('os.path.exists', return_value=True)
+        mocker.patch('builtins.open', mock_open(read_data='{"commit": "index_commit"}'))
+        mocker.patch('logging.info')
+        dummy_pack = Pack(pack_name, 'dummy_path')
+
+        task_status, pack_was_modified = dummy_pack.detect_modified(content_repo, 'index_path', 'current', 'previous',
+                                                                    modified_files_index)
+
+        assert task_status
+        assert pack_was_modified == was_modified
+        content_repo.commit.assert_any_call('index_commit')
+
+
+class TestPackArtifactsCache:
+    """ Test class for the content addressed cache of signed pack zips.
+    """
+
+    class FakeBucket:
+        def __init__(self):
+            self.blobs = {}
+
+        def blob(self, name):
+            bucket = self
+
+            class FakeBlob:
+                def exists(self):
+                    return name in bucket.blobs
+
+                def download_as_string(self):
+                    return bucket.blobs[name]
+
+                def upload_from_string(self, data):
+                    bucket.blobs[name] = data
+
+            return FakeBlob()
+
+    @staticmethod
+    def create_pack(pack_path, readme='readme'):
+        os.makedirs(os.path.join(pack_path, 'Integrations'), exist_ok=True)
+        with open(os.path.join(pack_path, 'README.md'), 'w') as readme_file:
+            readme_file.write(readme)
+        with open(os.path.join(pack_path, 'Integrations', 'integration.yml'), 'w') as integration_file:
+            integration_file.write('name: integration')
+        return Pack(os.path.basename(pack_path), pack_path)
+
+    def test_get_artifacts_cache_key(self, tmp_path):
+        """
+           Given:
+               - Two packs with the same files, and a pack with a modified file.
+           When:
+               - Getting the artifacts cache key of the packs, with and without a signing key.
+           Then:
+               - Ensure the same files and signing key get the same cache key.
+               - Ensure a modified file or another signing key get another cache key.
+       """
+        pack = self.create_pack(str(tmp_path / 'first' / 'TestPack'))
+        same_pack = self.create_pack(str(tmp_path / 'second' / 'TestPack'))
+        modified_pack = self.create_pack(str(tmp_path / 'third' / 'TestPack'), readme='modified readme')
+
+        task_status, cache_key = pack.get_artifacts_cache_key()
+
+        assert task_status
+        assert cache_key.startswith('TestPack-')
+        assert same_pack.get_artifacts_cache_key() == (True, cache_key)
+        assert modified_pack.get_artifacts_cache_key()[1] != cache_key
+        assert pack.get_artifacts_cache_key('signing key')[1] != cache_key
+
+    def test_get_artifacts_cache_key_of_other_build(self, tmp_path):
+        """
+           Given:
+               - A pack whose metadata and changelog were written by a build.
+           When:
+               - Getting the artifacts cache key of the pack after another build, with another build number, wrote
+                 them.
+           Then:
+               - Ensure the pack gets the same cache key, so the zip of its source files is reused.
+       """
+        pack_path = str(tmp_path / 'TestPack')
+        pack = self.create_pack(pack_path)
+
+        def write_build_files(build_number):
+            with open(os.path.join(pack_path, Pack.METADATA), 'w') as metadata_file:
+                json.dump({'versionInfo': build_number, 'commit': f'commit{build_number}'}, metadata_file)
+            with open(os.path.join(pack_path, Pack.CHANGELOG_JSON), 'w') as changelog_file:
+                json.dump({'1.0.0': {'displayName': f'1.0.0 - {build_number}'}}, changelog_file)
+
+        write_build_files('1')
+        _, cache_key = pack.get_artifacts_cache_key('signing key')
+        write_build_files('2')
+
+        assert pack.get_artifacts_cache_key('signing key') == (True, cache_key)
+
+    def test_complete_zip_pack(self, mocker, tmp_path):
+        """
+           Given:
+               - A zip of the pack source files, and a pack which was signed and has files written by the build.
+           When:
+               - Completing the zip.
+           Then:
+               - Ensure the zip holds the source files once, and the build files and signature with their content.
+       """
+        from zipfile import ZipFile
+
+        mocker.patch('Tests.Marketplace.marketplace_services.logging.success', create=True)
+        pack_path = str(tmp_path / 'TestPack')
+        pack = self.create_pack(pack_path)
+        with open(os.path.join(pack_path, Pack.METADATA), 'w') as metadata_file:
+            metadata_file.write('build metadata')
+        task_status, zip_pack_path = pack.zip_pack(source_files_only=True)
+        with open(os.path.join(pack_path, 'signature.sig'), 'w') as signature_file:
+            signature_file.write('signature')
+
+        assert task_status
+        assert pack.complete_zip_pack(zip_pack_path)
+        with ZipFile(zip_pack_path) as pack_zip:
+            assert sorted(pack_zip.namelist()) == sorted([os.path.join('Integrations', 'integration.yml'),
+                                                          'README.md', Pack.METADATA, 'signature.sig'])
+            assert pack_zip.read(Pack.METADATA) == b'build metadata'
+            assert pack_zip.read('signature.sig') == b'signature'
+
+    def test_get_and_put(self, tmp_path):
+        """
+           Given:
+               - An empty artifacts cache backed by a bucket.
+           When:
+               - Getting a pack zip, keeping it, and getting it again from the cache and from another cache of the
+                 same bucket.
+           Then:
+               - Ensure the zip is found only after it was kept, with its content.
+               - Ensure the hits, misses and saved time are counted.
+       """
+        from Tests.Marketplace.marketplace_services import PackArtifactsCache
+
+        bucket = self.FakeBucket()
+        artifacts_cache = PackArtifactsCache(str(tmp_path / 'cache'), bucket)
+        zip_pack_path = str(tmp_path / 'TestPack.zip')
+        with open(zip_pack_path, 'wb') as zip_file:
+            zip_file.write(b'zip content')
+
+        assert not artifacts_cache.get('TestPack-key', str(tmp_path / 'miss.zip'))
+        artifacts_cache.put('TestPack-key', zip_pack_path, 2.5)
+        assert artifacts_cache.get('TestPack-key', str(tmp_path / 'hit.zip'))
+        with open(str(tmp_path / 'hit.zip'), 'rb') as zip_file:
+            assert zip_file.read() == b'zip content'
+        assert (artifacts_cache.hits, artifacts_cache.misses, artifacts_cache.saved_seconds) == (1, 1, 2.5)
+
+        other_build_cache = PackArtifactsCache(str(tmp_path / 'other_cache'), bucket)
+        assert other_build_cache.get('TestPack-key', str(tmp_path / 'bucket_hit.zip'))
+        assert other_build_cache.saved_seconds == 2.5
+
+
+class TestSignPack:
+    """ Test class for signing packs, which may be signed in parallel.
+    """
+
+    def test_sign_pack_with_own_keyfile(self, mocker):
+        """
+           Given:
+               - Two packs and a signing key.
+           When:
+               - Signing the packs.
+           Then:
+               - Ensure each pack is signed with its own key file, which holds the key while the pack is signed.
+               - Ensure the key files are removed after signing.
+       """
+        keyfiles = []
+
+        def sign_directory(command, **kwargs):
+            keyfile_path = command.split()[2]
+            with open(keyfile_path) as keyfile:
+                assert keyfile.read() == 'signing key'
+            keyfiles.append(keyfile_path)
+            return mocker.MagicMock(communicate=mocker.MagicMock(return_value=(b'', b'')))
+
+        mocker.patch('subprocess.Popen', side_effect=sign_directory)
+        mocker.patch('logging.info')
+
+        assert Pack('Pack1', 'Packs/Pack1').sign_pack('signing key')
+        assert Pack('Pack2', 'Packs/Pack2').sign_pack('signing key')
+
+        assert len(set(keyfiles)) == 2
+        assert not any(os.path.exists(keyfile_path) for keyfile_path in keyfiles)
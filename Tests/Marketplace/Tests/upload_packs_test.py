@@ -495,3 +495,176 @@ class TestCleanPacks:
 
         assert not skipped_cleanup
         shutil.rmtree.assert_called_once_with(os.path.join(index_folder_path, invalid_pack))
+
+
+class TestPacksUploadPipeline:
+    @staticmethod
+    def mock_pack_stages(mocker, failed_pack_name=None, zip_pack=None, format_metadata=None):
+        """Mocks the upload stages of a pack, so they succeed unless the pack is the failed one, which fails zipping"""
+        from Tests.Marketplace.marketplace_services import Pack
+
+        def collect_content_items(pack):
+            pack._sever_min_version = '6.0.0'
+            return True, {}
+
+        def zip_failed_pack(pack, **kwargs):
+            return pack.name != failed_pack_name, f'{pack.path}.zip'
+
+        mocker.patch.object(Pack, 'load_user_metadata', return_value=(True, {}))
+        mocker.patch.object(Pack, 'collect_content_items', autospec=True, side_effect=collect_content_items)
+        mocker.patch.object(Pack, 'upload_integration_images', return_value=(True, []))
+        mocker.patch.object(Pack, 'upload_author_image', return_value=(True, ''))
+        mocker.patch.object(Pack, 'format_metadata', autospec=True, side_effect=format_metadata or (lambda pack, **kwargs: True))
+        mocker.patch.object(Pack, 'prepare_release_notes', return_value=(True, False))
+        mocker.patch.object(Pack, 'remove_unwanted_files', return_value=True)
+        mocker.patch.object(Pack, 'sign_pack', return_value=True)
+        mocker.patch.object(Pack, 'zip_pack', autospec=True,
+                            side_effect=zip_pack or zip_failed_pack)
+        mocker.patch.object(Pack, 'detect_modified', return_value=(True, False))
+        mocker.patch.object(Pack, 'upload_to_storage', return_value=(True, False, ''))
+        mocker.patch.object(Pack, 'check_if_exists_in_index', return_value=(True, False))
+        mocker.patch.object(Pack, 'prepare_for_index_upload', return_value=True)
+        mocker.patch.object(Pack, 'cleanup')
+        mocker.patch.object(Pack, 'latest_version', '1.0.0')
+
+    @pytest.mark.parametrize('max_workers', [1, 4])
+    def test_run_pipeline(self, mocker, max_workers):
+        """
+        Scenario: Upload packs one after another and in parallel
+
+        Given
+        - 8 packs, one of which fails zipping
+
+        When
+        - Running the upload pipeline
+
+        Then
+        - Ensure each pack gets the status of its own stages
+        - Ensure the pack state changed by a stage in a worker process is applied to the pack
+        - Ensure the index folder is never updated by two packs at once
+        - Ensure the time of each stage is summarized
+        """
+        import threading
+        import time
+        from Tests.Marketplace.upload_packs import PacksUploadPipeline
+        from Tests.Marketplace.marketplace_services import Pack, PackStatus
+
+        self.mock_pack_stages(mocker, failed_pack_name='Pack3')
+        index_updates = {'running': 0, 'max_running': 0}
+        index_updates_lock = threading.Lock()
+
+        def update_index_folder(**kwargs):
+            with index_updates_lock:
+                index_updates['running'] += 1
+                index_updates['max_running'] = max(index_updates['max_running'], index_updates['running'])
+            time.sleep(0.01)
+            with index_updates_lock:
+                index_updates['running'] -= 1
+            return True
+
+        mocker.patch('Tests.Marketplace.upload_packs.update_index_folder', side_effect=update_index_folder)
+        # the mocked stages exist only in this process, so the worker processes are forked from it
+        mocker.patch.object(PacksUploadPipeline, 'PROCESS_START_METHOD', 'fork')
+        packs_list = [Pack(f'Pack{i}', f'/tmp/Pack{i}') for i in range(8)]
+        pipeline = PacksUploadPipeline(storage_bucket=None, content_repo=None, index_folder_path='index',
+                                       current_commit_hash='current', previous_commit_hash='previous',
+                                       build_number='1', packs_dependencies_mapping={}, packs_statistic_df=None,
+                                       signature_key='', remove_test_playbooks=True, override_all_packs=False,
+                                       max_workers=max_workers, max_processes=2)
+
+        pipeline.run(packs_list)
+
+        assert [pack.status for pack in packs_list] == \
+            [PackStatus.SUCCESS.name] * 3 + [PackStatus.FAILED_ZIPPING_PACK_ARTIFACTS.name] + \
+            [PackStatus.SUCCESS.name] * 4
+        assert all(pack.server_min_version == '6.0.0' for pack in packs_list)
+        assert index_updates['max_running'] == 1
+        timing_summary = pipeline.timer.build_summary_table().get_string()
+        assert 'Zip pack' in timing_summary and 'Update index folder' in timing_summary
+
+    def test_run_cpu_task_in_spawned_process(self, tmp_path):
+        """
+        Scenario: Run a CPU bound stage of a pack in a worker process of the pipeline
+
+        Given
+        - A pack with a source file
+
+        When
+        - Running a pack task in a process which is started with the start method of the pipeline
+
+        Then
+        - Ensure the task is run in the worker process, with the same result as in the main process
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from Tests.Marketplace.upload_packs import PacksUploadPipeline
+        from Tests.Marketplace.marketplace_services import Pack
+
+        (tmp_path / 'README.md').write_text('Pack1')
+        pack = Pack('Pack1', str(tmp_path))
+        pipeline = PacksUploadPipeline(storage_bucket=None, content_repo=None, index_folder_path='index',
+                                       current_commit_hash='current', previous_commit_hash='previous',
+                                       build_number='1', packs_dependencies_mapping={}, packs_statistic_df=None,
+                                       signature_key='', remove_test_playbooks=True, override_all_packs=False,
+                                       max_workers=2, max_processes=1)
+        mp_context = multiprocessing.get_context(PacksUploadPipeline.PROCESS_START_METHOD)
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as process_pool:
+            pipeline._process_pool = process_pool
+            assert pipeline._run_cpu_task(pack, 'get_artifacts_cache_key', 'key') == \
+                pack.get_artifacts_cache_key('key')
+
+    def test_run_pipeline_with_artifacts_cache(self, mocker, tmp_path):
+        """
+        Scenario: Upload packs twice with an artifacts cache, in builds with different build numbers
+
+        Given
+        - 2 packs, one of which is modified between the uploads
+
+        When
+        - Running the upload pipeline with the same artifacts cache
+
+        Then
+        - Ensure only the source files of the modified pack are zipped again
+        - Ensure both packs are signed in each build
+        - Ensure the zip of the reused pack holds the metadata of the second build
+        """
+        import os
+        from zipfile import ZipFile
+        from Tests.Marketplace.upload_packs import PacksUploadPipeline
+        from Tests.Marketplace.marketplace_services import Pack, PackStatus, PackArtifactsCache
+
+        def format_metadata(pack, build_number, **kwargs):
+            (tmp_path / pack.name / Pack.METADATA).write_text(build_number)
+            return True
+
+        self.mock_pack_stages(mocker, zip_pack=Pack.zip_pack, format_metadata=format_metadata)
+        mocker.patch('Tests.Marketplace.marketplace_services.logging.success', create=True)
+        mocker.patch('Tests.Marketplace.upload_packs.update_index_folder', return_value=True)
+        artifacts_cache = PackArtifactsCache(str(tmp_path / 'cache'))
+        packs_list = []
+        for pack_name in ('Pack1', 'Pack2'):
+            os.makedirs(tmp_path / pack_name)
+            (tmp_path / pack_name / 'README.md').write_text(pack_name)
+            packs_list.append(Pack(pack_name, str(tmp_path / pack_name)))
+
+        def run_pipeline(build_number):
+            PacksUploadPipeline(storage_bucket=None, content_repo=None, index_folder_path='index',
+                                current_commit_hash='current', previous_commit_hash='previous',
+                                build_number=build_number, packs_dependencies_mapping={}, packs_statistic_df=None,
+                                signature_key='', remove_test_playbooks=True, override_all_packs=False,
+                                artifacts_cache=artifacts_cache).run(packs_list)
+
+        run_pipeline('1')
+        os.remove(tmp_path / 'Pack1.zip')
+        (tmp_path / 'Pack2' / 'README.md').write_text('modified')
+        Pack.zip_pack.reset_mock()
+        Pack.sign_pack.reset_mock()
+        run_pipeline('2')
+
+        assert [call[0][0].name for call in Pack.zip_pack.call_args_list] == ['Pack2']
+        assert Pack.sign_pack.call_count == 2
+        with ZipFile(tmp_path / 'Pack1.zip') as pack_zip:
+            assert sorted(pack_zip.namelist()) == ['README.md', Pack.METADATA]
+            assert pack_zip.read(Pack.METADATA) == b'2'
+        assert all(pack.status == PackStatus.SUCCESS.name for pack in packs_list)
+        assert (artifacts_cache.hits, artifacts_cache.misses) == (1, 3)
@@ -3,17 +3,21 @@ import os
 import stat
 import subprocess
 import fnmatch
+import hashlib
 import re
 import shutil
+import tempfile
 import yaml
 import google.auth
 from google.cloud import storage
 from google.cloud import bigquery
 import enum
+import threading
 import base64
 import urllib.parse
 import logging
 import warnings
+from collections import defaultdict
 from distutils.util import strtobool
 from distutils.version import LooseVersion
 from datetime import datetime
@@ -50,6 +54,7 @@ class GCPConfig(object):
     CORE_PACK_FILE_NAME = "corepacks.json"  # core packs file name
     DOWNLOADS_TABLE = "oproxy-dev.shared_views.top_packs"  # packs downloads statistics table
     BIG_QUERY_MAX_RESULTS = 2000  # big query max row results
+    ARTIFACTS_CACHE_BASE_PATH = "content/artifacts_cache"  # base path for cached pack source zips in gcs
 
     with open(os.path.join(os.path.dirname(__file__), 'core_packs_list.json'), 'r') as core_packs_list_file:
         CORE_PACKS_LIST = json.load(core_packs_list_file)
@@ -131,6 +136,194 @@ class PackStatus(enum.Enum):
     FAILED_SEARCHING_PACK_IN_INDEX = "Failed in searching pack folder in index"
 
 
+class ModifiedFilesIndex(object):
+    """ Indexes the modified files of a diff by their pack name, so the modified files of all the packs which are
+    diffed with the same commits are detected with a single diff.
+
+    The packs are diffed with the commit saved in their index metadata, so there is one diff per distinct pair of
+    commits, which is one diff per pack at worst. To bound the memory, the packs which will be diffed are registered
+    with `expect`, and the index of a pair of commits is dropped once the last pack registered for it got its modified
+    files or was discarded. The diff of a pair of commits no pack was registered for is not kept.
+
+    Args:
+        content_repo (git.repo.base.Repo): content repo object.
+
+    """
+
+    def __init__(self, content_repo):
+        self._content_repo = content_repo
+        self._modified_files_by_pack = {}  # the modified files of each pack, by the diffed pair of commits
+        self._pending_packs = defaultdict(set)  # the packs which were not diffed yet, by the pair of commits
+
+    def _index_diff(self, current_commit_hash, previous_commit_hash):
+        current_commit = self._content_repo.commit(current_commit_hash)
+        previous_commit = self._content_repo.commit(previous_commit_hash)
+        modified_files_by_pack = defaultdict(list)
+
+        for modified_file in current_commit.diff(previous_commit).iter_change_type('M'):
+            if modified_file.a_path.startswith(PACKS_FOLDER):
+                modified_file_path_parts = os.path.normpath(modified_file.a_path).split(os.sep)
+
+                if len(modified_file_path_parts) > 1 and modified_file_path_parts[1]:
+                    modified_files_by_pack[modified_file_path_parts[1]].append(modified_file.a_path)
+
+        return modified_files_by_pack
+
+    def _release(self, pack_name, commits):
+        pending_packs = self._pending_packs.get(commits)
+        if pending_packs is None:
+            return
+
+        pending_packs.discard(pack_name)
+        if not pending_packs:
+            del self._pending_packs[commits]
+            self._modified_files_by_pack.pop(commits, None)
+
+    def expect(self, pack_name, current_commit_hash, previous_commit_hash):
+        """ Registers a pack which will be diffed between two commits, so the index of the diff is kept until the pack
+        gets its modified files.
+
+        Args:
+            pack_name (str): the pack folder name.
+            current_commit_hash (str): last commit hash of head.
+            previous_commit_hash (str): the previous commit to diff with.
+
+        """
+        self._pending_packs[(current_commit_hash, previous_commit_hash)].add(pack_name)
+
+    def discard(self, pack_name):
+        """ Unregisters a pack which will not be diffed, and drops the indexes no other pack is registered for.
+
+        Args:
+            pack_name (str): the pack folder name.
+
+        """
+        for commits in list(self._pending_packs):
+            self._release(pack_name, commits)
+
+    def get_modified_files(self, pack_name, current_commit_hash, previous_commit_hash):
+        """ Returns the modified files of a pack between two commits.
+
+        Args:
+            pack_name (str): the pack folder name.
+            current_commit_hash (str): last commit hash of head.
+            previous_commit_hash (str): the previous commit to diff with.
+
+        Returns:
+            list: the paths of the modified files of the pack, relative to the content repo.
+        """
+        commits = (current_commit_hash, previous_commit_hash)
+        modified_files_by_pack = self._modified_files_by_pack.get(commits)
+        if modified_files_by_pack is None:
+            modified_files_by_pack = self._index_diff(current_commit_hash, previous_commit_hash)
+            if commits in self._pending_packs:
+                self._modified_files_by_pack[commits] = modified_files_by_pack
+
+        self._release(pack_name, commits)
+        return modified_files_by_pack.get(pack_name, [])
+
+
+class PackArtifactsCache(object):
+    """ Content addressed cache of pack source zips. A zip of the pack source files is kept by the cache key of the
+    source files, so a pack whose source files did not change since it was last zipped reuses the zip instead of being
+    zipped again. The files the build writes to the pack (see `Pack.BUILD_FILES`) and the signature change in every
+    build, so they are not cached, and are added to the reused zip after the pack is signed. The cache is kept in a
+    local directory, which can be backed by a storage bucket in order to be shared between builds.
+
+    Args:
+        cache_path (str): full path to the local cache directory.
+        storage_bucket (google.cloud.storage.bucket.Bucket): google cloud storage bucket which backs the local cache.
+
+    """
+    VERSION = "2"  # the version of the cache key, which is changed when the way packs are zipped or signed changes
+
+    def __init__(self, cache_path, storage_bucket=None):
+        self._cache_path = cache_path
+        self._storage_bucket = storage_bucket
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        os.makedirs(cache_path, exist_ok=True)
+
+    def _download(self, file_name):
+        if not self._storage_bucket:
+            return False
+
+        blob = self._storage_bucket.blob(os.path.join(GCPConfig.ARTIFACTS_CACHE_BASE_PATH, file_name))
+        if not blob.exists():
+            return False
+
+        self._replace(file_name, blob.download_as_string())
+        return True
+
+    def _replace(self, file_name, data):
+        # the file is replaced at once, so a pack which is processed in parallel never reads it half written
+        temp_descriptor, temp_path = tempfile.mkstemp(dir=self._cache_path)
+        with os.fdopen(temp_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, os.path.join(self._cache_path, file_name))
+
+    def get(self, cache_key, zip_pack_path):
+        """ Copies the cached zip of pack source files to the pack zip path.
+
+        Args:
+            cache_key (str): the cache key of the pack source files.
+            zip_pack_path (str): full path to copy the pack zip to.
+
+        Returns:
+            bool: whether the zip was found in the cache.
+        """
+        cached_zip_path = os.path.join(self._cache_path, f"{cache_key}.zip")
+        cached_info_path = os.path.join(self._cache_path, f"{cache_key}.json")
+
+        try:
+            if not os.path.exists(cached_zip_path) and not (self._download(f"{cache_key}.json")
+                                                            and self._download(f"{cache_key}.zip")):
+                with self._lock:
+                    self.misses += 1
+                return False
+
+            shutil.copyfile(cached_zip_path, zip_pack_path)
+            saved_seconds = 0.0
+            if os.path.exists(cached_info_path):
+                with open(cached_info_path, 'r') as cached_info_file:
+                    saved_seconds = json.load(cached_info_file).get('seconds', 0.0)
+        except Exception:
+            logging.exception(f"Failed in getting {cache_key} pack zip from the artifacts cache")
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += saved_seconds
+        return True
+
+    def put(self, cache_key, zip_pack_path, seconds):
+        """ Keeps the zip of pack source files.
+
+        Args:
+            cache_key (str): the cache key of the pack source files.
+            zip_pack_path (str): full path to the zip of the pack source files.
+            seconds (float): the time it took to zip the pack, which is saved when the zip is reused.
+
+        """
+        try:
+            with open(zip_pack_path, 'rb') as pack_zip:
+                cached_files = {f"{cache_key}.zip": pack_zip.read(),
+                                f"{cache_key}.json": json.dumps({'seconds': seconds}).encode()}
+
+            for file_name, data in cached_files.items():
+                self._replace(file_name, data)
+
+                if self._storage_bucket:
+                    blob = self._storage_bucket.blob(os.path.join(GCPConfig.ARTIFACTS_CACHE_BASE_PATH, file_name))
+                    blob.upload_from_string(data)
+        except Exception:
+            logging.exception(f"Failed in keeping {cache_key} pack zip in the artifacts cache")
+
+
 class Pack(object):
     """ Class that manipulates and manages the upload of pack's artifact and metadata to cloud storage.
 
@@ -147,6 +340,7 @@ class Pack(object):
         EXCLUDE_DIRECTORIES (list): list of directories to excluded before uploading pack zip to storage.
         AUTHOR_IMAGE_NAME (str): author image file name.
         RELEASE_NOTES (str): release notes folder name.
+        BUILD_FILES (list): the files the build writes to the pack root folder, which are not part of its source files.
 
     """
     PACK_INITIAL_VERSION = "1.0.0"
@@ -157,6 +351,7 @@ class Pack(object):
     AUTHOR_IMAGE_NAME = "Author_image.png"
     EXCLUDE_DIRECTORIES = [PackFolders.TEST_PLAYBOOKS.value]
     RELEASE_NOTES = "ReleaseNotes"
+    BUILD_FILES = [METADATA, CHANGELOG_JSON]
 
     def __init__(self, pack_name, pack_path):
         self._pack_name = pack_name
@@ -694,12 +889,15 @@ class Pack(object):
             bool: whether the operation succeeded.
         """
         task_status = False
+        keyfile_path = None
 
         try:
             if signature_string:
-                with open("keyfile", "wb") as keyfile:
+                # packs may be signed in parallel, so each signer writes the key to its own file
+                keyfile_descriptor, keyfile_path = tempfile.mkstemp(prefix=f'{self._pack_name}_', suffix='.keyfile')
+                with os.fdopen(keyfile_descriptor, "wb") as keyfile:
                     keyfile.write(signature_string.encode())
-                arg = f'./signDirectory {self._pack_path} keyfile base64'
+                arg = f'./signDirectory {self._pack_path} {keyfile_path} base64'
                 signing_process = subprocess.Popen(arg, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
                 output, err = signing_process.communicate()
 
@@ -714,6 +912,8 @@ class Pack(object):
         except Exception:
             logging.exception(f"Failed to sign pack for {self._pack_name}")
         finally:
+            if keyfile_path and os.path.exists(keyfile_path):
+                os.remove(keyfile_path)
             return task_status
 
     def encrypt_pack(self, zip_pack_path, pack_name, encryption_key, extract_destination_path):
@@ -731,9 +931,53 @@ class Pack(object):
         except subprocess.CalledProcessError as error:
             print(f"Error while trying to encrypt pack. {error}")
 
-    def zip_pack(self, extract_destination_path="", pack_name="", encryption_key=""):
+    def get_artifacts_cache_key(self, signature_string=None):
+        """ Hashes the pack source files (the path and the content digest of each file), the pack name and the
+        signing key. The files the build writes to the pack (see `Pack.BUILD_FILES`) are not hashed, as they change in
+        every build.
+
+        Args:
+            signature_string (str): Base64 encoded string used to sign the pack.
+
+        Returns:
+            bool: whether the operation succeeded.
+            str: the artifacts cache key of the pack.
+        """
+        task_status = False
+        cache_key = None
+
+        try:
+            tree_hash = hashlib.sha256()
+            tree_hash.update(f"{PackArtifactsCache.VERSION}\0{self._pack_name}\0".encode())
+            tree_hash.update(hashlib.sha256((signature_string or '').encode()).digest())
+
+            for root, dirs, files in os.walk(self._pack_path, topdown=True):
+                dirs.sort()
+                for pack_file in sorted(files):
+                    if root == self._pack_path and pack_file in Pack.BUILD_FILES:
+                        continue
+                    full_file_path = os.path.join(root, pack_file)
+                    file_hash = hashlib.sha256()
+                    with open(full_file_path, 'rb') as file_content:
+                        for chunk in iter(lambda: file_content.read(1024 * 1024), b''):
+                            file_hash.update(chunk)
+                    relative_file_path = os.path.relpath(full_file_path, self._pack_path)
+                    tree_hash.update(f"{relative_file_path}\0{file_hash.hexdigest()}\n".encode())
+
+            cache_key = f"{self._pack_name}-{tree_hash.hexdigest()}"
+            task_status = True
+        except Exception:
+            logging.exception(f"Failed in hashing {self._pack_name} pack files")
+        finally:
+            return task_status, cache_key
+
+    def zip_pack(self, extract_destination_path="", pack_name="", encryption_key="", source_files_only=False):
         """ Zips pack folder.
 
+        Args:
+            source_files_only (bool): whether to zip only the pack source files, without the files the build writes to
+                the pack (see `Pack.BUILD_FILES`).
+
         Returns:
             bool: whether the operation succeeded.
             str: full path to created pack zip.
@@ -745,6 +989,8 @@ class Pack(object):
             with ZipFile(zip_pack_path, 'w', ZIP_DEFLATED) as pack_zip:
                 for root, dirs, files in os.walk(self._pack_path, topdown=True):
                     for f in files:
+                        if source_files_only and root == self._pack_path and f in Pack.BUILD_FILES:
+                            continue
                         full_file_path = os.path.join(root, f)
                         relative_file_path = os.path.relpath(full_file_path, self._pack_path)
                         pack_zip.write(filename=full_file_path, arcname=relative_file_path)
@@ -758,7 +1004,56 @@ class Pack(object):
         finally:
             return task_status, zip_pack_path
 
-    def detect_modified(self, content_repo, index_folder_path, current_commit_hash, previous_commit_hash):
+    def complete_zip_pack(self, zip_pack_path):
+        """ Adds to a zip of the pack source files the pack files which are missing from it, which are the files the
+        build wrote to the pack and the signature.
+
+        Args:
+            zip_pack_path (str): full path to the zip of the pack source files.
+
+        Returns:
+            bool: whether the operation succeeded.
+        """
+        task_status = False
+
+        try:
+            with ZipFile(zip_pack_path, 'a', ZIP_DEFLATED) as pack_zip:
+                zipped_files = set(pack_zip.namelist())
+                for root, dirs, files in os.walk(self._pack_path, topdown=True):
+                    for f in files:
+                        full_file_path = os.path.join(root, f)
+                        relative_file_path = os.path.relpath(full_file_path, self._pack_path)
+                        if relative_file_path not in zipped_files:
+                            pack_zip.write(filename=full_file_path, arcname=relative_file_path)
+
+            task_status = True
+        except Exception:
+            logging.exception(f"Failed in completing {self._pack_name} pack zip")
+        finally:
+            return task_status
+
+    def get_index_commit(self, index_folder_path, previous_commit_hash):
+        """ Returns the commit the pack was last uploaded from, as saved in the metadata downloaded from index.
+
+        Args:
+            index_folder_path (str): full path to downloaded index folder.
+            previous_commit_hash (str): the commit to return when no commit was saved in the pack metadata.
+
+        Returns:
+            str: the commit hash, or None when the pack was not found in index.
+        """
+        pack_index_metadata_path = os.path.join(index_folder_path, self._pack_name, Pack.METADATA)
+
+        if not os.path.exists(pack_index_metadata_path):
+            return None
+
+        with open(pack_index_metadata_path, 'r') as metadata_file:
+            downloaded_metadata = json.load(metadata_file)
+
+        return downloaded_metadata.get('commit', previous_commit_hash)
+
+    def detect_modified(self, content_repo, index_folder_path, current_commit_hash, previous_commit_hash,
+                        modified_files_index=None):
         """ Detects pack modified files.
 
         The diff is done between current commit and previous commit that was saved in metadata that was downloaded from
@@ -770,6 +1065,8 @@ class Pack(object):
             index_folder_path (str): full path to downloaded index folder.
             current_commit_hash (str): last commit hash of head.
             previous_commit_hash (str): the previous commit to diff with.
+            modified_files_index (ModifiedFilesIndex): the index of modified files shared by all the packs. When not
+                given, the commits are diffed for this pack alone.
 
         Returns:
             bool: whether the operation succeeded.
@@ -779,29 +1076,20 @@ class Pack(object):
         pack_was_modified = False
 
         try:
-            pack_index_metadata_path = os.path.join(index_folder_path, self._pack_name, Pack.METADATA)
+            previous_commit_hash = self.get_index_commit(index_folder_path, previous_commit_hash)
 
-            if not os.path.exists(pack_index_metadata_path):
+            if not previous_commit_hash:
                 logging.info(f"{self._pack_name} pack was not found in index, skipping detection of modified pack.")
                 task_status = True
                 return
 
-            with open(pack_index_metadata_path, 'r') as metadata_file:
-                downloaded_metadata = json.load(metadata_file)
+            if modified_files_index is None:
+                modified_files_index = ModifiedFilesIndex(content_repo)
 
-            previous_commit_hash = downloaded_metadata.get('commit', previous_commit_hash)
-            # set 2 commits by hash value in order to check the modified files of the diff
-            current_commit = content_repo.commit(current_commit_hash)
-            previous_commit = content_repo.commit(previous_commit_hash)
-
-            for modified_file in current_commit.diff(previous_commit).iter_change_type('M'):
-                if modified_file.a_path.startswith(PACKS_FOLDER):
-                    modified_file_path_parts = os.path.normpath(modified_file.a_path).split(os.sep)
-
-                    if modified_file_path_parts[1] and modified_file_path_parts[1] == self._pack_name:
-                        logging.info(f"Detected modified files in {self._pack_name} pack")
-                        task_status, pack_was_modified = True, True
-                        return
+            if modified_files_index.get_modified_files(self._pack_name, current_commit_hash, previous_commit_hash):
+                logging.info(f"Detected modified files in {self._pack_name} pack")
+                task_status, pack_was_modified = True, True
+                return
 
             task_status = True
         except Exception:
@@ -9,12 +9,19 @@ import glob
 import git
 import requests
 import logging
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from zipfile import ZipFile
 from typing import Any, Tuple, Union
 from Tests.Marketplace.marketplace_services import init_storage_client, init_bigquery_client, Pack, PackStatus, \
     GCPConfig, PACKS_FULL_PATH, IGNORED_FILES, PACKS_FOLDER, IGNORED_PATHS, Metadata, CONTENT_ROOT_PATH, \
-    get_packs_statistics_dataframe, PACKS_RESULTS_FILE
+    get_packs_statistics_dataframe, PACKS_RESULTS_FILE, ModifiedFilesIndex, \
+    PackArtifactsCache
 from demisto_sdk.commands.common.tools import run_command, str2bool
 
 from Tests.scripts.utils.log_util import install_logging
@@ -732,6 +739,12 @@ def option_handler():
     parser.add_argument('-fc', '--force_previous_commit', help='A commit to be used as the previous commit to diff with')
     parser.add_argument('-pb', '--private_bucket_name', help="Private storage bucket name", required=False)
     parser.add_argument('-c', '--circle_branch', help="CircleCi branch of current build", required=True)
+    parser.add_argument('-w', '--max_workers', type=int, default=1,
+                        help="The number of packs to process in parallel. Default: 1, one pack after another")
+    parser.add_argument('-acp', '--artifacts_cache_path',
+                        help="Full path of a folder to cache pack source zips in. Default: no cache", required=False)
+    parser.add_argument('-acb', '--artifacts_cache_bucket',
+                        help="Storage bucket name which backs the artifacts cache folder", required=False)
     # disable-secrets-detection-end
     return parser.parse_args()
 
@@ -902,6 +915,285 @@ def store_successful_and_failed_packs_in_ci_artifacts(circle_artifacts_path, suc
             f.write(json.dumps(packs_results, indent=4))
 
 
+class StageTimer:
+    """Collects the time each stage of the packs upload took, per pack."""
+
+    def __init__(self):
+        self._durations = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage_name: str):
+        """Measures the time of a stage.
+
+        Args:
+            stage_name (str): the name of the stage.
+
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            with self._lock:
+                self._durations[stage_name].append(duration)
+
+    def build_summary_table(self) -> Any:
+        """Build stage timing summary table.
+
+        Returns:
+            PrettyTable: table with the number of packs and the total, average and max time of each stage.
+
+        """
+        table = prettytable.PrettyTable()
+        table.field_names = ["Stage", "Packs", "Total Seconds", "Average Seconds", "Max Seconds"]
+
+        with self._lock:
+            for stage_name, durations in self._durations.items():
+                table.add_row([stage_name, len(durations), f"{sum(durations):.2f}",
+                               f"{sum(durations) / len(durations):.2f}", f"{max(durations):.2f}"])
+
+        return table
+
+
+def _run_pack_task(pack: Pack, task_name: str, *args, **kwargs) -> Tuple[Any, dict]:
+    """Runs a Pack task in a worker process.
+
+    Returns:
+        Any: the result of the task.
+        dict: the state of the pack after the task, so the task changes can be applied to the pack of the main process.
+
+    """
+    result = getattr(pack, task_name)(*args, **kwargs)
+    return result, vars(pack)
+
+
+class PacksUploadPipeline:
+    """Prepares and uploads packs in parallel, each pack going through the upload stages in order.
+
+    The CPU bound stages (collecting content items, signing and zipping) run in a process pool, and the rest of the
+    stages (mostly GCS I/O) run in a thread per pack. Stages which read other packs from the index folder or write to
+    it are serialized, and so are the stages which use the content repo. When an artifacts cache is given, a pack
+    whose source files did not change since they were last zipped reuses the cached zip of its source files.
+
+    Args:
+        artifacts_cache (PackArtifactsCache): the cache of pack source zips.
+        max_workers (int): the number of packs which are processed at once. 1 processes the packs one after another.
+        max_processes (int): the number of processes of the CPU bound stages. Default: the number of CPUs.
+
+    """
+    # the worker processes are started while the pack threads run, and a forked process could inherit a lock which one
+    # of the threads holds (e.g. of the logging handlers), so the workers are spawned instead
+    PROCESS_START_METHOD = 'spawn'
+
+    def __init__(self, storage_bucket: Any, content_repo: Any, index_folder_path: str, current_commit_hash: str,
+                 previous_commit_hash: str, build_number: str, packs_dependencies_mapping: dict,
+                 packs_statistic_df: Any, signature_key: str, remove_test_playbooks: bool,
+                 override_all_packs: bool, max_workers: int = 1, max_processes: int = None,
+                 artifacts_cache: PackArtifactsCache = None):
+        self.storage_bucket = storage_bucket
+        self.content_repo = content_repo
+        self.modified_files_index = ModifiedFilesIndex(content_repo)
+        self.index_folder_path = index_folder_path
+        self.current_commit_hash = current_commit_hash
+        self.previous_commit_hash = previous_commit_hash
+        self.build_number = build_number
+        self.packs_dependencies_mapping = packs_dependencies_mapping
+        self.packs_statistic_df = packs_statistic_df
+        self.signature_key = signature_key
+        self.remove_test_playbooks = remove_test_playbooks
+        self.override_all_packs = override_all_packs
+        self.max_workers = max(max_workers, 1)
+        self.max_processes = max_processes or os.cpu_count()
+        self.artifacts_cache = artifacts_cache
+        self.timer = StageTimer()
+        self._index_lock = threading.Lock()
+        self._content_repo_lock = threading.Lock()
+        self._process_pool: Union[ProcessPoolExecutor, None] = None
+
+    def _run_cpu_task(self, pack: Pack, task_name: str, *args, **kwargs) -> Any:
+        """Runs a CPU bound Pack task in the process pool, and applies the changes it made to the pack."""
+        if not self._process_pool:
+            return getattr(pack, task_name)(*args, **kwargs)
+
+        result, pack_state = self._process_pool.submit(_run_pack_task, pack, task_name, *args, **kwargs).result()
+        vars(pack).update(pack_state)
+        return result
+
+    def _fail(self, pack: Pack, status: str):
+        with self._content_repo_lock:
+            self.modified_files_index.discard(pack.name)
+        pack.status = status
+        pack.cleanup()
+
+    def process_pack(self, pack: Pack):
+        """Runs the upload stages of a pack, and sets the status of the pack.
+
+        Args:
+            pack (Pack): the pack to upload.
+
+        """
+        with self.timer.time('Load user metadata'):
+            task_status, user_metadata = pack.load_user_metadata()
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_LOADING_USER_METADATA.name)
+
+        with self.timer.time('Collect content items'):
+            task_status, pack_content_items = self._run_cpu_task(pack, 'collect_content_items')
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_COLLECT_ITEMS.name)
+
+        with self.timer.time('Upload integration images'):
+            task_status, integration_images = pack.upload_integration_images(self.storage_bucket)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_IMAGES_UPLOAD.name)
+
+        with self.timer.time('Upload author image'):
+            task_status, author_image = pack.upload_author_image(self.storage_bucket)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_AUTHOR_IMAGE_UPLOAD.name)
+
+        # the metadata of the pack dependencies is read from the index folder
+        with self.timer.time('Format metadata'), self._index_lock:
+            task_status = pack.format_metadata(user_metadata=user_metadata, pack_content_items=pack_content_items,
+                                               integration_images=integration_images, author_image=author_image,
+                                               index_folder_path=self.index_folder_path,
+                                               packs_dependencies_mapping=self.packs_dependencies_mapping,
+                                               build_number=self.build_number, commit_hash=self.current_commit_hash,
+                                               packs_statistic_df=self.packs_statistic_df)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_METADATA_PARSING.name)
+
+        with self.timer.time('Prepare release notes'):
+            task_status, not_updated_build = pack.prepare_release_notes(self.index_folder_path, self.build_number)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_RELEASE_NOTES.name)
+
+        if not_updated_build:
+            return self._fail(pack, PackStatus.PACK_IS_NOT_UPDATED_IN_RUNNING_BUILD.name)
+
+        with self.timer.time('Remove unwanted files'):
+            task_status = pack.remove_unwanted_files(self.remove_test_playbooks)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_REMOVING_PACK_SKIPPED_FOLDERS.name)
+
+        cache_key = None
+        if self.artifacts_cache:
+            # a pack whose source files could not be hashed is signed and zipped without the cache
+            with self.timer.time('Hash pack files'):
+                _, cache_key = self._run_cpu_task(pack, 'get_artifacts_cache_key', self.signature_key)
+
+        if cache_key:
+            # the source files are zipped before signing, and the signature and the files the build wrote to the
+            # pack are added to the zip after signing
+            zip_pack_path = f"{pack.path}.zip"
+            with self.timer.time('Get cached zip'):
+                found_cached_zip = self.artifacts_cache.get(cache_key, zip_pack_path)
+
+            if found_cached_zip:
+                logging.info(f"Reused the cached source zip of {pack.name} pack")
+            else:
+                zip_start = time.monotonic()
+                with self.timer.time('Zip pack'):
+                    task_status, zip_pack_path = self._run_cpu_task(pack, 'zip_pack', source_files_only=True)
+                if not task_status:
+                    return self._fail(pack, PackStatus.FAILED_ZIPPING_PACK_ARTIFACTS.name)
+
+                self.artifacts_cache.put(cache_key, zip_pack_path, time.monotonic() - zip_start)
+
+            with self.timer.time('Sign pack'):
+                task_status = self._run_cpu_task(pack, 'sign_pack', self.signature_key)
+            if not task_status:
+                return self._fail(pack, PackStatus.FAILED_SIGNING_PACKS.name)
+
+            with self.timer.time('Zip pack'):
+                task_status = self._run_cpu_task(pack, 'complete_zip_pack', zip_pack_path)
+            if not task_status:
+                return self._fail(pack, PackStatus.FAILED_ZIPPING_PACK_ARTIFACTS.name)
+        else:
+            with self.timer.time('Sign pack'):
+                task_status = self._run_cpu_task(pack, 'sign_pack', self.signature_key)
+            if not task_status:
+                return self._fail(pack, PackStatus.FAILED_SIGNING_PACKS.name)
+
+            with self.timer.time('Zip pack'):
+                task_status, zip_pack_path = self._run_cpu_task(pack, 'zip_pack')
+            if not task_status:
+                return self._fail(pack, PackStatus.FAILED_ZIPPING_PACK_ARTIFACTS.name)
+
+        with self.timer.time('Detect modified'), self._content_repo_lock:
+            task_status, pack_was_modified = pack.detect_modified(self.content_repo, self.index_folder_path,
+                                                                  self.current_commit_hash, self.previous_commit_hash,
+                                                                  self.modified_files_index)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_DETECTING_MODIFIED_FILES.name)
+
+        with self.timer.time('Upload to storage'):
+            (task_status, skipped_pack_uploading, full_pack_path) = \
+                pack.upload_to_storage(zip_pack_path, pack.latest_version,
+                                       self.storage_bucket, self.override_all_packs
+                                       or pack_was_modified)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_UPLOADING_PACK.name)
+
+        with self.timer.time('Check if exists in index'):
+            task_status, exists_in_index = pack.check_if_exists_in_index(self.index_folder_path)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_SEARCHING_PACK_IN_INDEX.name)
+
+        # in case that pack already exist at cloud storage path and in index, skipped further steps
+        if skipped_pack_uploading and exists_in_index:
+            return self._fail(pack, PackStatus.PACK_ALREADY_EXISTS.name)
+
+        with self.timer.time('Prepare for index upload'):
+            task_status = pack.prepare_for_index_upload()
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_PREPARING_INDEX_FOLDER.name)
+
+        with self.timer.time('Update index folder'), self._index_lock:
+            task_status = update_index_folder(index_folder_path=self.index_folder_path, pack_name=pack.name,
+                                              pack_path=pack.path, pack_version=pack.latest_version,
+                                              hidden_pack=pack.hidden)
+        if not task_status:
+            return self._fail(pack, PackStatus.FAILED_UPDATING_INDEX_FOLDER.name)
+
+        pack.status = PackStatus.SUCCESS.name
+
+    def run(self, packs_list: list):
+        """Processes the packs, and waits for all of them to finish.
+
+        Args:
+            packs_list (list): the packs to upload.
+
+        """
+        for pack in packs_list:
+            index_commit_hash = pack.get_index_commit(self.index_folder_path, self.previous_commit_hash)
+            if index_commit_hash:
+                self.modified_files_index.expect(pack.name, self.current_commit_hash, index_commit_hash)
+
+        if self.max_workers == 1 or len(packs_list) <= 1:
+            for pack in packs_list:
+                self.process_pack(pack)
+            return
+
+        mp_context = multiprocessing.get_context(self.PROCESS_START_METHOD)
+        with ProcessPoolExecutor(max_workers=self.max_processes, mp_context=mp_context) as process_pool:
+            self._process_pool = process_pool
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as thread_pool:
+                    list(thread_pool.map(self.process_pack, packs_list))
+            finally:
+                self._process_pool = None
+
+    def print_timing_summary(self):
+        """Prints the time each stage took."""
+        logging.info(f"Packs upload stages timing summary:\n{self.timer.build_summary_table()}")
+        if self.artifacts_cache:
+            logging.info(f"Reused the cached source zips of {self.artifacts_cache.hits} packs, and zipped the source "
+                         f"files of {self.artifacts_cache.misses} packs. The artifacts cache saved about "
+                         f"{self.artifacts_cache.saved_seconds:.2f} seconds of zipping.")
+
+
 def main():
     install_logging('Prepare Content Packs For Testing.log')
     option = option_handler()
@@ -964,115 +1256,22 @@ def main():
     # clean index and gcs from non existing or invalid packs
     clean_non_existing_packs(index_folder_path, private_packs, storage_bucket)
 
-    # starting iteration over packs
-    for pack in packs_list:
-        task_status, user_metadata = pack.load_user_metadata()
-        if not task_status:
-            pack.status = PackStatus.FAILED_LOADING_USER_METADATA.value
-            pack.cleanup()
-            continue
-
-        task_status, pack_content_items = pack.collect_content_items()
-        if not task_status:
-            pack.status = PackStatus.FAILED_COLLECT_ITEMS.name
-            pack.cleanup()
-            continue
-
-        task_status, integration_images = pack.upload_integration_images(storage_bucket)
-        if not task_status:
-            pack.status = PackStatus.FAILED_IMAGES_UPLOAD.name
-            pack.cleanup()
-            continue
-
-        task_status, author_image = pack.upload_author_image(storage_bucket)
-        if not task_status:
-            pack.status = PackStatus.FAILED_AUTHOR_IMAGE_UPLOAD.name
-            pack.cleanup()
-            continue
-
-        task_status = pack.format_metadata(user_metadata=user_metadata, pack_content_items=pack_content_items,
-                                           integration_images=integration_images, author_image=author_image,
-                                           index_folder_path=index_folder_path,
-                                           packs_dependencies_mapping=packs_dependencies_mapping,
-                                           build_number=build_number, commit_hash=current_commit_hash,
-                                           packs_statistic_df=packs_statistic_df)
-        if not task_status:
-            pack.status = PackStatus.FAILED_METADATA_PARSING.name
-            pack.cleanup()
-            continue
-
-        task_status, not_updated_build = pack.prepare_release_notes(index_folder_path, build_number)
-        if not task_status:
-            pack.status = PackStatus.FAILED_RELEASE_NOTES.name
-            pack.cleanup()
-            continue
-
-        if not_updated_build:
-            pack.status = PackStatus.PACK_IS_NOT_UPDATED_IN_RUNNING_BUILD.name
-            pack.cleanup()
-            continue
-
-        task_status = pack.remove_unwanted_files(remove_test_playbooks)
-        if not task_status:
-            pack.status = PackStatus.FAILED_REMOVING_PACK_SKIPPED_FOLDERS
-            pack.cleanup()
-            continue
-
-        task_status = pack.sign_pack(signature_key)
-        if not task_status:
-            pack.status = PackStatus.FAILED_SIGNING_PACKS.name
-            pack.cleanup()
-            continue
+    # pack source zips of previous builds, by the hash of the pack source files
+    artifacts_cache = None
+    if option.artifacts_cache_path:
+        artifacts_cache_bucket = storage_client.bucket(option.artifacts_cache_bucket) \
+            if option.artifacts_cache_bucket else None
+        artifacts_cache = PackArtifactsCache(option.artifacts_cache_path, artifacts_cache_bucket)
 
-        task_status, zip_pack_path = pack.zip_pack()
-        if not task_status:
-            pack.status = PackStatus.FAILED_ZIPPING_PACK_ARTIFACTS.name
-            pack.cleanup()
-            continue
-
-        task_status, pack_was_modified = pack.detect_modified(content_repo, index_folder_path, current_commit_hash,
-                                                              previous_commit_hash)
-        if not task_status:
-            pack.status = PackStatus.FAILED_DETECTING_MODIFIED_FILES.name
-            pack.cleanup()
-            continue
-
-        (task_status, skipped_pack_uploading, full_pack_path) = \
-            pack.upload_to_storage(zip_pack_path, pack.latest_version,
-                                   storage_bucket, override_all_packs
-                                   or pack_was_modified)
-
-        if not task_status:
-            pack.status = PackStatus.FAILED_UPLOADING_PACK.name
-            pack.cleanup()
-            continue
-
-        task_status, exists_in_index = pack.check_if_exists_in_index(index_folder_path)
-        if not task_status:
-            pack.status = PackStatus.FAILED_SEARCHING_PACK_IN_INDEX.name
-            pack.cleanup()
-            continue
-
-        # in case that pack already exist at cloud storage path and in index, skipped further steps
-        if skipped_pack_uploading and exists_in_index:
-            pack.status = PackStatus.PACK_ALREADY_EXISTS.name
-            pack.cleanup()
-            continue
-
-        task_status = pack.prepare_for_index_upload()
-        if not task_status:
-            pack.status = PackStatus.FAILED_PREPARING_INDEX_FOLDER.name
-            pack.cleanup()
-            continue
-
-        task_status = update_index_folder(index_folder_path=index_folder_path, pack_name=pack.name, pack_path=pack.path,
-                                          pack_version=pack.latest_version, hidden_pack=pack.hidden)
-        if not task_status:
-            pack.status = PackStatus.FAILED_UPDATING_INDEX_FOLDER.name
-            pack.cleanup()
-            continue
-
-        pack.status = PackStatus.SUCCESS.name
+    # starting iteration over packs
+    pipeline = PacksUploadPipeline(storage_bucket=storage_bucket, content_repo=content_repo,
+                                   index_folder_path=index_folder_path, current_commit_hash=current_commit_hash,
+                                   previous_commit_hash=previous_commit_hash, build_number=build_number,
+                                   packs_dependencies_mapping=packs_dependencies_mapping,
+                                   packs_statistic_df=packs_statistic_df, signature_key=signature_key,
+                                   remove_test_playbooks=remove_test_playbooks, override_all_packs=override_all_packs,
+                                   max_workers=option.max_workers, artifacts_cache=artifacts_cache)
+    pipeline.run(packs_list)
 
     # upload core packs json to bucket
     upload_core_packs_config(storage_bucket, build_number, index_folder_path)
@@ -1092,7 +1291,8 @@ def main():
     store_successful_and_failed_packs_in_ci_artifacts(os.path.dirname(packs_artifacts_path), successful_packs,
                                                       failed_packs)
 
-    # summary of packs status
+    # summary of the time each stage took, and of packs status
+    pipeline.print_timing_summary()
     print_packs_summary(successful_packs, skipped_packs, failed_packs, not is_bucket_upload_flow)
 
 
@@ -7,6 +7,7 @@ from time import sleep
 import datetime
 from distutils.version import LooseVersion
 from typing import Any
+from queue import Queue
 
 import urllib3
 import demisto_client.demisto_api
@@ -21,7 +22,7 @@ from demisto_sdk.commands.common.tools import print_color, print_error, print_wa
 from Tests.test_content import SettingsTester, ParallelPrintsManager, DataKeeperTester, \
     print_test_summary, update_test_msg, turn_off_telemetry, \
     create_result_files, get_all_tests, get_instances_ips_and_names, get_server_numeric_version, \
-    initialize_queue_and_executed_tests_set, get_test_records_of_given_test_names, \
+    get_test_records_of_given_test_names, \
     extract_filtered_tests, load_conf_files, set_integration_params, collect_integrations, notify_failed_test, \
     SERVER_URL
 
@@ -394,6 +395,14 @@ def update_round_set_and_sleep_if_round_completed(executed_in_current_round: set
     return executed_in_current_round
 
 
+def initialize_queue_and_executed_tests_set(tests):
+    tests_queue = Queue()
+    already_executed_test_playbooks = set()
+    for t in tests:
+        tests_queue.put(t)
+    return already_executed_test_playbooks, tests_queue
+
+
 def manage_tests(tests_settings: SettingsTester):
     """
     This function manages the execution of Demisto's tests.
@@ -9,9 +9,11 @@ import json
 import logging
 import os
 import sys
-from copy import deepcopy
+from collections import defaultdict
 from distutils.version import LooseVersion
-from typing import Dict, Tuple, Union, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Tuple, Union, Optional
 
 import demisto_sdk.commands.common.tools as tools
 from demisto_sdk.commands.common.constants import *  # noqa: E402
@@ -125,20 +127,33 @@ sys.path.append(CONTENT_DIR)
 # Global used to indicate if failed during any of the validation states
 _FAILED = False
 AMI_BUILDS = {}
-ID_SET = {}
-CONF: Union[TestConf, dict] = {}
+ID_SET_PATH = './Tests/id_set.json'
+CONF_PATH = './Tests/conf.json'
 if os.path.isfile('./Tests/ami_builds.json'):
     with open('./Tests/ami_builds.json', 'r') as ami_builds_file:
         # get versions to check if tests are runnable on those envs
         AMI_BUILDS = json.load(ami_builds_file)
 
-if os.path.isfile('./Tests/id_set.json'):
-    with open('./Tests/id_set.json', 'r') as conf_file:
-        ID_SET = json.load(conf_file)
 
-if os.path.isfile('./Tests/conf.json'):
-    with open('./Tests/conf.json', 'r') as conf_file:
-        CONF = TestConf(json.load(conf_file))
+@lru_cache(maxsize=None)
+def get_id_set():
+    """Loads the id_set on its first use, and returns the same read-only view of it to all the callers.
+    The id_set is not copied, so the callers must not modify its lists and objects.
+    """
+    id_set = {}
+    if os.path.isfile(ID_SET_PATH):
+        with open(ID_SET_PATH, 'r') as id_set_file:
+            id_set = json.load(id_set_file)
+    return MappingProxyType(id_set)
+
+
+@lru_cache(maxsize=None)
+def get_conf() -> Union[TestConf, dict]:
+    """Loads conf.json on its first use, and returns the same TestConf to all the callers"""
+    if os.path.isfile(CONF_PATH):
+        with open(CONF_PATH, 'r') as conf_file:
+            return TestConf(json.load(conf_file))
+    return {}
 
 
 def is_runnable_in_server_version(from_v, server_v, to_v):
@@ -170,6 +185,109 @@ def get_tests(file_path):
         return data_dictionary.get('tests', [])
 
 
+class IdSetIndex(object):
+    """Indexes the id_set once, so the dependencies of changed entities are found by lookups instead of scans of the
+    id_set lists. The objects of each lookup are kept in the order of the id_set, so entities are enriched in the
+    same order as a scan of the id_set would enrich them.
+    """
+
+    def __init__(self, id_set: dict) -> None:
+        self.id_set = id_set
+        # id_set list name -> id -> the objects with that id
+        self._objects_by_id: Dict[str, Dict[str, List[Tuple[int, dict]]]] = {}
+        # id_set list name -> id or name -> the objects which match it, as a scan by id and then by name matches them
+        self._matching_objects: Dict[str, Dict[str, List[Tuple[int, dict]]]] = {}
+        for set_name, obj_set in id_set.items():
+            if isinstance(obj_set, list):
+                self._index_objects(set_name, obj_set)
+
+        # the non deprecated playbooks and scripts which use each command, playbook and script
+        self.command_to_playbooks: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+        self.command_to_scripts: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+        self.playbook_to_playbooks: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+        self.script_to_playbooks: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+        self.script_to_scripts: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+
+        for position, playbook in enumerate(id_set.get('playbooks', [])):
+            playbook_data = list(playbook.values())[0]
+            if playbook_data.get('deprecated', False):
+                continue
+            for command in playbook_data.get('command_to_integration', {}):
+                self.command_to_playbooks[command].append((position, playbook_data))
+            for playbook_id in set(playbook_data.get('implementing_playbooks', [])):
+                self.playbook_to_playbooks[playbook_id].append((position, playbook_data))
+            for script_id in set(playbook_data.get('implementing_scripts', [])):
+                self.script_to_playbooks[script_id].append((position, playbook_data))
+
+        for position, script in enumerate(id_set.get('scripts', [])):
+            script_data = list(script.values())[0]
+            if script_data.get('deprecated', False):
+                continue
+            for command in set(script_data.get('depends_on', [])):
+                self.command_to_scripts[command].append((position, script_data))
+            for script_id in set(script_data.get('script_executions', [])):
+                self.script_to_scripts[script_id].append((position, script_data))
+
+    def _index_objects(self, set_name: str, obj_set: list) -> None:
+        objects_by_id: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+        matching_objects: Dict[str, List[Tuple[int, dict]]] = defaultdict(list)
+        for position, obj_wrpr in enumerate(obj_set):
+            for obj_id, obj in obj_wrpr.items():
+                objects_by_id[obj_id].append((position, obj))
+                matching_objects[obj_id].append((position, obj))
+
+            obj_keys = list(obj_wrpr.keys())
+            if obj_keys:
+                # an object is matched by name only when it is not matched by id
+                obj_name = obj_wrpr[obj_keys[0]].get('name')
+                if obj_name not in obj_wrpr:
+                    matching_objects[obj_name].append((position, obj_wrpr[obj_keys[0]]))
+
+        self._objects_by_id[set_name] = objects_by_id
+        self._matching_objects[set_name] = matching_objects
+
+    def get_object_by_id(self, set_name: str, obj_id: str) -> Optional[dict]:
+        """Gets the first object of an id_set list with the given id"""
+        objects = self._objects_by_id.get(set_name, {}).get(obj_id)
+        return objects[0][1] if objects else None
+
+    def get_matching_object(self, set_name: str, obj_id: str, server_version: str = '0') -> Optional[dict]:
+        """Gets first occurrence of object in the id_set list with matching id/name and valid from/to version"""
+        for _, obj in self._matching_objects.get(set_name, {}).get(obj_id, []):
+            # check if object is runnable
+            fromversion = obj.get('fromversion', '0.0')
+            toversion = obj.get('toversion', '99.99.99')
+            if is_runnable_in_server_version(from_v=fromversion, server_v=server_version, to_v=toversion):
+                return obj
+        return None
+
+    @staticmethod
+    def get_dependents(lookup: Dict[str, List[Tuple[int, dict]]], used_ids: Iterable[str]) -> List[dict]:
+        """Gets the objects which use any of the given commands/playbooks/scripts, in the order of the id_set
+
+        :param lookup: One of the dependents lookups of the index, e.g. command_to_playbooks.
+        :param used_ids: The commands/playbooks/scripts to get the dependents of.
+
+        :return: The dependent objects, each of them once.
+        """
+        dependents = {}
+        for used_id in used_ids:
+            for position, obj in lookup.get(used_id, []):
+                dependents[position] = obj
+        return [dependents[position] for position in sorted(dependents)]
+
+
+_ID_SET_INDEX: Optional[IdSetIndex] = None
+
+
+def get_id_set_index(id_set: dict) -> IdSetIndex:
+    """Gets the index of the id_set, and indexes it if it was not indexed yet"""
+    global _ID_SET_INDEX
+    if _ID_SET_INDEX is None or _ID_SET_INDEX.id_set is not id_set:
+        _ID_SET_INDEX = IdSetIndex(id_set)
+    return _ID_SET_INDEX
+
+
 def collect_tests_and_content_packs(
         script_ids,
         playbook_ids,
@@ -177,8 +295,8 @@ def collect_tests_and_content_packs(
         catched_scripts,
         catched_playbooks,
         tests_set,
-        id_set=deepcopy(ID_SET),
-        conf=deepcopy(CONF)
+        id_set=None,
+        conf=None
 ):
     """Collect tests for the affected script_ids,playbook_ids,integration_ids.
 
@@ -188,11 +306,13 @@ def collect_tests_and_content_packs(
     :param catched_scripts: The names of the scripts we already identified a test for.
     :param catched_playbooks: The names of the scripts we already v a test for.
     :param tests_set: The names of the tests we alredy identified.
-    :param id_set: The id_set json.
-    :param conf: The conf json.
+    :param id_set: The id_set json. Default: the id_set of the content repo.
+    :param conf: The conf json. Default: the conf.json of the content repo.
 
     :return: (test_ids, missing_ids) - All the names of possible tests, the ids we didn't match a test for.
     """
+    id_set = get_id_set() if id_set is None else id_set
+    conf = get_conf() if conf is None else conf
     caught_missing_test = False
     catched_intergrations = set([])
 
@@ -301,15 +421,13 @@ def is_integration_fetching_incidents(integration_yml_path):
 
 
 def id_set__get_test_playbook(id_set, test_playbook_id):
-    for test_playbook in id_set.get('TestPlaybooks', []):
-        if test_playbook_id in test_playbook.keys():
-            return test_playbook[test_playbook_id]
+    return get_id_set_index(id_set).get_object_by_id('TestPlaybooks', test_playbook_id)
 
 
 def id_set__get_integration_file_path(id_set, integration_id):
-    for integration in id_set.get('integrations', []):
-        if integration_id in integration.keys():
-            return integration[integration_id]['file_path']
+    integration = get_id_set_index(id_set).get_object_by_id('integrations', integration_id)
+    if integration is not None:
+        return integration['file_path']
 
 
 def check_if_fetch_incidents_is_tested(missing_ids, integration_ids, id_set, conf, tests_set):
@@ -339,7 +457,9 @@ def check_if_fetch_incidents_is_tested(missing_ids, integration_ids, id_set, con
     return missing_ids, tests_set
 
 
-def find_tests_and_content_packs_for_modified_files(modified_files, conf=deepcopy(CONF), id_set=deepcopy(ID_SET)):
+def find_tests_and_content_packs_for_modified_files(modified_files, conf=None, id_set=None):
+    conf = get_conf() if conf is None else conf
+    id_set = get_id_set() if id_set is None else id_set
     script_names = set([])
     playbook_names = set([])
     integration_ids = set([])
@@ -461,7 +581,8 @@ def get_api_module_integrations(changed_api_modules, integration_set):
     return integration_ids_to_test, integration_to_version
 
 
-def collect_changed_ids(integration_ids, playbook_names, script_names, modified_files, id_set=deepcopy(ID_SET)):
+def collect_changed_ids(integration_ids, playbook_names, script_names, modified_files, id_set=None):
+    id_set = get_id_set() if id_set is None else id_set
     tests_set = set([])
     updated_script_names = set([])
     updated_playbook_names = set([])
@@ -499,6 +620,7 @@ def collect_changed_ids(integration_ids, playbook_names, script_names, modified_
     script_set = id_set['scripts']
     playbook_set = id_set['playbooks']
     integration_set = id_set['integrations']
+    id_set_index = get_id_set_index(id_set)
 
     if changed_api_modules:
         integration_ids_to_test, integration_to_version_to_add = get_api_module_integrations(changed_api_modules,
@@ -511,18 +633,18 @@ def collect_changed_ids(integration_ids, playbook_names, script_names, modified_
                                                   integration_set, integration_ids)
 
     for script_id in script_names:
-        enrich_for_script_id(script_id, script_to_version[script_id], script_names, script_set, playbook_set,
-                             playbook_names, updated_script_names, updated_playbook_names, catched_scripts,
-                             catched_playbooks, tests_set)
+        enrich_for_script_id(script_id, script_to_version[script_id], script_names, id_set_index, playbook_names,
+                             updated_script_names, updated_playbook_names, catched_scripts, catched_playbooks,
+                             tests_set)
 
     integration_to_command, deprecated_commands_message = get_integration_commands(integration_ids, integration_set)
     for integration_id, integration_commands in integration_to_command.items():
         enrich_for_integration_id(integration_id, integration_to_version[integration_id], integration_commands,
-                                  script_set, playbook_set, playbook_names, script_names, updated_script_names,
+                                  id_set_index, playbook_names, script_names, updated_script_names,
                                   updated_playbook_names, catched_scripts, catched_playbooks, tests_set)
 
     for playbook_id in playbook_names:
-        enrich_for_playbook_id(playbook_id, playbook_to_version[playbook_id], playbook_names, script_set, playbook_set,
+        enrich_for_playbook_id(playbook_id, playbook_to_version[playbook_id], playbook_names, id_set_index,
                                updated_playbook_names, catched_playbooks, tests_set)
 
     for new_script in updated_script_names:
@@ -608,7 +730,7 @@ def exclude_deprecated_entities(script_set, script_names,
     return deprecated_messages_dict
 
 
-def enrich_for_integration_id(integration_id, given_version, integration_commands, script_set, playbook_set,
+def enrich_for_integration_id(integration_id, given_version, integration_commands, id_set_index,
                               playbook_names, script_names, updated_script_names, updated_playbook_names,
                               catched_scripts, catched_playbooks, tests_set):
     """Enrich the list of affected scripts/playbooks by your change set.
@@ -616,8 +738,7 @@ def enrich_for_integration_id(integration_id, given_version, integration_command
     :param integration_id: The name of the integration we changed.
     :param given_version: the version of the integration we changed.
     :param integration_commands: The commands of the changed integation
-    :param script_set: The set of existing scripts within Content repo.
-    :param playbook_set: The set of existing playbooks within Content repo.
+    :param id_set_index: The index of the existing entities within Content repo.
     :param playbook_names: The names of the playbooks affected by your changes.
     :param script_names: The names of the scripts affected by your changes.
     :param updated_script_names: The names of scripts we identify as affected to your change set.
@@ -626,10 +747,7 @@ def enrich_for_integration_id(integration_id, given_version, integration_command
     :param catched_playbooks: The names of playbooks we found tests for.
     :param tests_set: The names of the caught tests.
     """
-    for playbook in playbook_set:
-        playbook_data = list(playbook.values())[0]
-        if playbook_data.get('deprecated', False):
-            continue
+    for playbook_data in id_set_index.get_dependents(id_set_index.command_to_playbooks, integration_commands):
         playbook_name = playbook_data.get('name')
         playbook_fromversion = playbook_data.get('fromversion', '0.0.0')
         playbook_toversion = playbook_data.get('toversion', '99.99.99')
@@ -648,13 +766,10 @@ def enrich_for_integration_id(integration_id, given_version, integration_command
 
                         updated_playbook_names.add(playbook_name)
                         new_versions = (playbook_fromversion, playbook_toversion)
-                        enrich_for_playbook_id(playbook_name, new_versions, playbook_names, script_set, playbook_set,
+                        enrich_for_playbook_id(playbook_name, new_versions, playbook_names, id_set_index,
                                                updated_playbook_names, catched_playbooks, tests_set)
 
-    for script in script_set:
-        script_data = list(script.values())[0]
-        if script_data.get('deprecated', False):
-            continue
+    for script_data in id_set_index.get_dependents(id_set_index.command_to_scripts, integration_commands):
         script_name = script_data.get('name')
         script_file_path = script_data.get('file_path')
         script_fromversion = script_data.get('fromversion', '0.0.0')
@@ -679,17 +794,14 @@ def enrich_for_integration_id(integration_id, given_version, integration_command
 
                         updated_script_names.add(script_name)
                         new_versions = (script_fromversion, script_toversion)
-                        enrich_for_script_id(script_name, new_versions, script_names, script_set, playbook_set,
-                                             playbook_names, updated_script_names, updated_playbook_names,
-                                             catched_scripts, catched_playbooks, tests_set)
+                        enrich_for_script_id(script_name, new_versions, script_names, id_set_index, playbook_names,
+                                             updated_script_names, updated_playbook_names, catched_scripts,
+                                             catched_playbooks, tests_set)
 
 
-def enrich_for_playbook_id(given_playbook_id, given_version, playbook_names, script_set, playbook_set,
+def enrich_for_playbook_id(given_playbook_id, given_version, playbook_names, id_set_index,
                            updated_playbook_names, catched_playbooks, tests_set):
-    for playbook in playbook_set:
-        playbook_data = list(playbook.values())[0]
-        if playbook_data.get('deprecated', False):
-            continue
+    for playbook_data in id_set_index.get_dependents(id_set_index.playbook_to_playbooks, [given_playbook_id]):
         playbook_name = playbook_data.get('name')
         playbook_fromversion = playbook_data.get('fromversion', '0.0.0')
         playbook_toversion = playbook_data.get('toversion', '99.99.99')
@@ -704,16 +816,13 @@ def enrich_for_playbook_id(given_playbook_id, given_version, playbook_names, scr
 
                 updated_playbook_names.add(playbook_name)
                 new_versions = (playbook_fromversion, playbook_toversion)
-                enrich_for_playbook_id(playbook_name, new_versions, playbook_names, script_set, playbook_set,
+                enrich_for_playbook_id(playbook_name, new_versions, playbook_names, id_set_index,
                                        updated_playbook_names, catched_playbooks, tests_set)
 
 
-def enrich_for_script_id(given_script_id, given_version, script_names, script_set, playbook_set, playbook_names,
+def enrich_for_script_id(given_script_id, given_version, script_names, id_set_index, playbook_names,
                          updated_script_names, updated_playbook_names, catched_scripts, catched_playbooks, tests_set):
-    for script in script_set:
-        script_data = list(script.values())[0]
-        if script_data.get('deprecated', False):
-            continue
+    for script_data in id_set_index.get_dependents(id_set_index.script_to_scripts, [given_script_id]):
         script_name = script_data.get('name')
         script_file_path = script_data.get('file_path')
         script_fromversion = script_data.get('fromversion', '0.0.0')
@@ -732,14 +841,11 @@ def enrich_for_script_id(given_script_id, given_version, script_names, script_se
 
                 updated_script_names.add(script_name)
                 new_versions = (script_fromversion, script_toversion)
-                enrich_for_script_id(script_name, new_versions, script_names, script_set, playbook_set, playbook_names,
+                enrich_for_script_id(script_name, new_versions, script_names, id_set_index, playbook_names,
                                      updated_script_names, updated_playbook_names, catched_scripts, catched_playbooks,
                                      tests_set)
 
-    for playbook in playbook_set:
-        playbook_data = list(playbook.values())[0]
-        if playbook_data.get('deprecated', False):
-            continue
+    for playbook_data in id_set_index.get_dependents(id_set_index.script_to_playbooks, [given_script_id]):
         playbook_name = playbook_data.get('name')
         playbook_fromversion = playbook_data.get('fromversion', '0.0.0')
         playbook_toversion = playbook_data.get('toversion', '99.99.99')
@@ -752,7 +858,7 @@ def enrich_for_script_id(given_script_id, given_version, script_names, script_se
 
                 updated_playbook_names.add(playbook_name)
                 new_versions = (playbook_fromversion, playbook_toversion)
-                enrich_for_playbook_id(playbook_name, new_versions, playbook_names, script_set, playbook_set,
+                enrich_for_playbook_id(playbook_name, new_versions, playbook_names, id_set_index,
                                        updated_playbook_names, catched_playbooks, tests_set)
 
 
@@ -761,8 +867,9 @@ def update_test_set(tests, tests_set):
         tests_set.add(test)
 
 
-def get_test_conf_from_conf(test_id, server_version, conf=deepcopy(CONF)):
+def get_test_conf_from_conf(test_id, server_version, conf=None):
     """Gets first occurrence of test conf with matching playbookID value to test_id with a valid from/to version"""
+    conf = get_conf() if conf is None else conf
     test_conf_lst = conf.get_tests()
     # return None if nothing is found
     test_conf = next((test_conf for test_conf in test_conf_lst if (
@@ -774,31 +881,8 @@ def get_test_conf_from_conf(test_id, server_version, conf=deepcopy(CONF)):
     return test_conf
 
 
-def extract_matching_object_from_id_set(obj_id, obj_set, server_version='0'):
-    """Gets first occurrence of object in the object's id_set with matching id/name and valid from/to version"""
-    for obj_wrpr in obj_set:
-        # try to get object by id
-        if obj_id in obj_wrpr:
-            obj = obj_wrpr.get(obj_id)
-
-        # try to get object by name
-        else:
-            obj_keys = list(obj_wrpr.keys())
-            if not obj_keys:
-                continue
-            obj = obj_wrpr[obj_keys[0]]
-            if obj.get('name') != obj_id:
-                continue
-
-        # check if object is runnable
-        fromversion = obj.get('fromversion', '0.0')
-        toversion = obj.get('toversion', '99.99.99')
-        if is_runnable_in_server_version(from_v=fromversion, server_v=server_version, to_v=toversion):
-            return obj
-    return None
-
-
-def get_test_from_conf(branch_name, conf=deepcopy(CONF)):
+def get_test_from_conf(branch_name, conf=None):
+    conf = get_conf() if conf is None else conf
     tests = set([])
     changed = set([])
     change_string = tools.run_command("git diff origin/master...{} Tests/conf.json".format(branch_name))
@@ -857,8 +941,7 @@ def is_test_runnable(test_id, id_set, conf, server_version):
         return False
     conf_fromversion = test_conf.get('fromversion', '0.0')
     conf_toversion = test_conf.get('toversion', '99.99.99')
-    test_playbooks_set = id_set.get('TestPlaybooks', [])
-    test_playbook_obj = extract_matching_object_from_id_set(test_id, test_playbooks_set, server_version)
+    test_playbook_obj = get_id_set_index(id_set).get_matching_object('TestPlaybooks', test_id, server_version)
 
     # check whether the test is runnable in id_set
     if not test_playbook_obj:
@@ -889,16 +972,16 @@ def is_test_integrations_available(server_version, test_conf, conf, id_set):
         if not is_test_uses_active_integration(test_integration_ids, conf):
             return False
         # check if all integration from/toversion is valid with server_version
-        integrations_set = id_set.get('integrations', [])
-        if any(extract_matching_object_from_id_set(integration_id, integrations_set, server_version) is None for
-               integration_id in
-               test_integration_ids):
+        id_set_index = get_id_set_index(id_set)
+        if any(id_set_index.get_matching_object('integrations', integration_id, server_version) is None for
+               integration_id in test_integration_ids):
             return False
     return True
 
 
-def is_test_uses_active_integration(integration_ids, conf=deepcopy(CONF)):
+def is_test_uses_active_integration(integration_ids, conf=None):
     """Checks whether there's an an integration in test_integration_ids that's not skipped"""
+    conf = get_conf() if conf is None else conf
     skipped_integrations = conf.get_skipped_integrations()
     # check if all integrations are skipped
     if all(integration_id in skipped_integrations for integration_id in integration_ids):
@@ -1030,9 +1113,11 @@ def filter_tests(tests: set, id_set: json) -> set:
 
 
 def get_test_list_and_content_packs_to_install(files_string, branch_name, minimum_server_version='0',
-                                               conf=deepcopy(CONF),
-                                               id_set=deepcopy(ID_SET)):
+                                               conf=None,
+                                               id_set=None):
     """Create a test list that should run"""
+    conf = get_conf() if conf is None else conf
+    id_set = get_id_set() if id_set is None else id_set
     (modified_files_with_relevant_tests, modified_tests_list, changed_common, is_conf_json, sample_tests,
      modified_metadata_list, is_reputations_json, is_indicator_json) = get_modified_files_for_testing(files_string)
 
@@ -1199,7 +1284,7 @@ def create_test_file(is_nightly, skip_save=False, path_to_pack=''):
     """Create a file containing all the tests we need to run for the CI"""
     if is_nightly:
         packs_to_install = set(filter(should_test_content_pack, os.listdir(PACKS_DIR)))
-        tests = filter_tests(set(CONF.get_test_playbook_ids()), id_set=deepcopy(ID_SET))
+        tests = filter_tests(set(get_conf().get_test_playbook_ids()), id_set=get_id_set())
         logging.info("Nightly - collected all tests that appear in conf.json and all packs from content repo that "
                      "should be tested")
     else:
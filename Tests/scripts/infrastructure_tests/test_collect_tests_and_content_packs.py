@@ -14,7 +14,7 @@ from Tests.scripts.collect_tests_and_content_packs import (
     TestConf, create_filter_envs_file,
     get_test_list_and_content_packs_to_install, collect_content_packs_to_install,
     get_from_version_and_to_version_bounderies, PACKS_DIR, remove_ignored_tests,
-    remove_tests_for_non_supported_packs)
+    remove_tests_for_non_supported_packs, IdSetIndex)
 from Tests.scripts.utils.get_modified_files_for_testing import get_modified_files_for_testing
 
 with open('Tests/scripts/infrastructure_tests/tests_data/mock_id_set.json', 'r') as mock_id_set_f:
@@ -930,6 +930,95 @@ class TestExtractMatchingObjectFromIdSet:
             collect_tests_and_content_packs._FAILED = False
 
 
+class TestIdSetIndex:
+    ID_SET = {
+        'scripts': [
+            {'script_a': {'name': 'script_a', 'depends_on': ['command_a']}},
+            {'script_b': {'name': 'script_b', 'script_executions': ['script_a']}},
+            {'script_c': {'name': 'script_c', 'depends_on': ['command_a'], 'deprecated': True}},
+        ],
+        'playbooks': [
+            {'playbook_a': {'name': 'playbook_a', 'command_to_integration': {'command_a': '', 'command_b': ''},
+                            'implementing_scripts': ['script_a']}},
+            {'playbook_b': {'name': 'playbook_b', 'implementing_playbooks': ['playbook_a'],
+                            'command_to_integration': {'command_b': ''}}},
+        ],
+        'integrations': [
+            {'integration_a': {'name': 'integration_a', 'file_path': 'a.yml', 'fromversion': '6.0.0'}},
+            {'integration_a_id': {'name': 'integration_a', 'file_path': 'a_old.yml', 'toversion': '5.9.9'}},
+        ],
+    }
+
+    def test_dependents(self):
+        """
+        Given
+        - An id_set with scripts and playbooks which use commands, scripts and playbooks, and a deprecated script.
+
+        When
+        - Indexing the id_set.
+
+        Then
+        - ensure the dependents of each entity are the non deprecated ones, once each and in the id_set order.
+        """
+        index = IdSetIndex(self.ID_SET)
+        dependents = index.get_dependents(index.command_to_playbooks, ['command_b', 'command_a'])
+        assert [playbook['name'] for playbook in dependents] == ['playbook_a', 'playbook_b']
+        assert [script['name'] for script in index.get_dependents(index.command_to_scripts, ['command_a'])] == [
+            'script_a']
+        assert [script['name'] for script in index.get_dependents(index.script_to_scripts, ['script_a'])] == [
+            'script_b']
+        assert [pb['name'] for pb in index.get_dependents(index.script_to_playbooks, ['script_a'])] == ['playbook_a']
+        assert [pb['name'] for pb in index.get_dependents(index.playbook_to_playbooks, ['playbook_a'])] == [
+            'playbook_b']
+        assert index.get_dependents(index.command_to_scripts, ['command_c']) == []
+
+    def test_get_matching_object(self):
+        """
+        Given
+        - An id_set with an integration whose id differs from its name, and another version of it.
+
+        When
+        - Getting the integration by id or name for several server versions.
+
+        Then
+        - ensure the first integration which is runnable in the server version is returned.
+        """
+        index = IdSetIndex(self.ID_SET)
+        assert index.get_matching_object('integrations', 'integration_a', '6.0.0')['file_path'] == 'a.yml'
+        assert index.get_matching_object('integrations', 'integration_a', '5.5.0')['file_path'] == 'a_old.yml'
+        assert index.get_matching_object('integrations', 'integration_a_id', '6.0.0') is None
+        assert index.get_object_by_id('integrations', 'integration_a_id')['file_path'] == 'a_old.yml'
+        assert index.get_object_by_id('integrations', 'integration_b') is None
+
+
+def test_get_id_set_is_loaded_once(mocker, tmp_path):
+    """
+    Given
+    - An id_set file.
+
+    When
+    - Getting the id_set several times.
+
+    Then
+    - ensure the file is loaded only once, and the same read-only id_set is returned each time.
+    """
+    from Tests.scripts import collect_tests_and_content_packs
+    id_set_path = tmp_path / 'id_set.json'
+    id_set_path.write_text(json.dumps(MOCK_ID_SET))
+    mocker.patch.object(collect_tests_and_content_packs, 'ID_SET_PATH', str(id_set_path))
+    collect_tests_and_content_packs.get_id_set.cache_clear()
+    try:
+        json_load = mocker.spy(json, 'load')
+        id_set = collect_tests_and_content_packs.get_id_set()
+        assert collect_tests_and_content_packs.get_id_set() is id_set
+        assert json_load.call_count == 1
+        assert id_set['scripts'] == MOCK_ID_SET['scripts']
+        with pytest.raises(TypeError):
+            id_set['scripts'] = []
+    finally:
+        collect_tests_and_content_packs.get_id_set.cache_clear()
+
+
 def test_modified_integration_content_pack_is_collected(mocker):
     """
     Given
@@ -9,6 +9,10 @@ CIRCLE_ARTIFACTS=${CIRCLE_ARTIFACTS}
 PACK_ARTIFACTS=$CIRCLE_ARTIFACTS/content_packs.zip
 ID_SET=$CIRCLE_ARTIFACTS/id_set.json
 EXTRACT_FOLDER=$(mktemp -d)
+# the number of packs which are uploaded in parallel
+UPLOAD_PACKS_MAX_WORKERS=${UPLOAD_PACKS_MAX_WORKERS:-4}
+# the zips of the pack source files are cached in the build bucket, so unchanged packs are not zipped again
+ARTIFACTS_CACHE_PATH=$(mktemp -d)
 
 if [[ -z "$GCS_MARKET_KEY" ]]; then
     echo "GCS_MARKET_KEY not set aborting!"
@@ -48,7 +52,7 @@ if [ ! -n "${NIGHTLY}" ] && [ ! -n "${BUCKET_UPLOAD}" ]; then
       echo "Did not get content packs to update in the bucket."
     else
       echo "Updating the following content packs: $CONTENT_PACKS_TO_INSTALL ..."
-      python3 ./Tests/Marketplace/upload_packs.py -a $PACK_ARTIFACTS -d $CIRCLE_ARTIFACTS/packs_dependencies.json -e $EXTRACT_FOLDER -b $GCS_BUILD_BUCKET -s $KF -n $CIRCLE_BUILD_NUM -p $CONTENT_PACKS_TO_INSTALL -o true -sb $TARGET_PATH -k $PACK_SIGNING_KEY -rt false --id_set_path $ID_SET -bu false -c $CIRCLE_BRANCH
+      python3 ./Tests/Marketplace/upload_packs.py -a $PACK_ARTIFACTS -d $CIRCLE_ARTIFACTS/packs_dependencies.json -e $EXTRACT_FOLDER -b $GCS_BUILD_BUCKET -s $KF -n $CIRCLE_BUILD_NUM -p $CONTENT_PACKS_TO_INSTALL -o true -sb $TARGET_PATH -k $PACK_SIGNING_KEY -rt false --id_set_path $ID_SET -bu false -c $CIRCLE_BRANCH -w $UPLOAD_PACKS_MAX_WORKERS -acp $ARTIFACTS_CACHE_PATH -acb $GCS_BUILD_BUCKET
       echo "Finished updating content packs successfully."
     fi
   fi
@@ -78,7 +82,7 @@ else
       PACKS_LIST="all"
     fi
   fi
-  python3 ./Tests/Marketplace/upload_packs.py -a $PACK_ARTIFACTS -d $CIRCLE_ARTIFACTS/packs_dependencies.json -e $EXTRACT_FOLDER -b $GCS_BUILD_BUCKET -s $KF -n $CIRCLE_BUILD_NUM -p "$PACKS_LIST" -o $OVERRIDE_ALL_PACKS -sb $TARGET_PATH -k $PACK_SIGNING_KEY -rt $REMOVE_PBS --id_set_path $ID_SET -bu $BUCKET_UPLOAD_FLOW -fc "$FORCE_PREVIOUS_COMMIT" -pb "$GCS_PRIVATE_BUCKET" -c $CIRCLE_BRANCH
+  python3 ./Tests/Marketplace/upload_packs.py -a $PACK_ARTIFACTS -d $CIRCLE_ARTIFACTS/packs_dependencies.json -e $EXTRACT_FOLDER -b $GCS_BUILD_BUCKET -s $KF -n $CIRCLE_BUILD_NUM -p "$PACKS_LIST" -o $OVERRIDE_ALL_PACKS -sb $TARGET_PATH -k $PACK_SIGNING_KEY -rt $REMOVE_PBS --id_set_path $ID_SET -bu $BUCKET_UPLOAD_FLOW -fc "$FORCE_PREVIOUS_COMMIT" -pb "$GCS_PRIVATE_BUCKET" -c $CIRCLE_BRANCH -w $UPLOAD_PACKS_MAX_WORKERS -acp $ARTIFACTS_CACHE_PATH -acb $GCS_BUILD_BUCKET
   echo "Finished updating content packs successfully."
 fi
 
@@ -6,6 +6,8 @@ CONF_PATH="./Tests/conf.json"
 [ -n "${NIGHTLY}" ] && IS_NIGHTLY=true || IS_NIGHTLY=false
 [ -n "${MEM_CHECK}" ] && MEM_CHECK=true || MEM_CHECK=false
 [ -z "${NON_AMI_RUN}" ] && IS_AMI_RUN=true || IS_AMI_RUN=false
+# in nightly builds, the mock-disabled tests run in parallel on each server
+[ -n "${NIGHTLY}" ] && PARALLEL_TESTS_PER_SERVER=${PARALLEL_TESTS_PER_SERVER:-3} || PARALLEL_TESTS_PER_SERVER=1
 
 PREVIOUS_JOB_NUMBER=`cat create_instances_build_num.txt`
 
@@ -15,13 +17,17 @@ cat <<EOF > "$GOOGLE_APPLICATION_CREDENTIALS"
 $GCS_ARTIFACTS_KEY
 EOF
 
-python3 ./Tests/test_content.py -k "$DEMISTO_API_KEY" -c "$CONF_PATH" -e "$SECRET_CONF_PATH" -n $IS_NIGHTLY -t "$SLACK_TOKEN" -a "$CIRCLECI_TOKEN" -b "$CIRCLE_BUILD_NUM" -g "$CIRCLE_BRANCH" -m "$MEM_CHECK" --isAMI $IS_AMI_RUN -d "$1"
+python3 ./Tests/test_content.py -k "$DEMISTO_API_KEY" -c "$CONF_PATH" -e "$SECRET_CONF_PATH" -n $IS_NIGHTLY -t "$SLACK_TOKEN" -a "$CIRCLECI_TOKEN" -b "$CIRCLE_BUILD_NUM" -g "$CIRCLE_BRANCH" -m "$MEM_CHECK" --isAMI $IS_AMI_RUN -d "$1" -p $PARALLEL_TESTS_PER_SERVER
 
 RETVAL=$?
 rm $GOOGLE_APPLICATION_CREDENTIALS
 
+role="$(echo -e "$1" | tr -d '[:space:]')"
+if [ -f ./Tests/tests_timeline.json ]; then
+  cp ./Tests/tests_timeline.json "$CIRCLE_ARTIFACTS/tests_timeline_${role}.json"
+fi
+
 if [ $RETVAL -eq 0 ]; then
-  role="$(echo -e "$1" | tr -d '[:space:]')"
   filepath="./Tests/is_build_passed_${role}.txt"
   touch "$filepath"
 fi
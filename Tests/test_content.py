@@ -18,7 +18,7 @@ import pytz
 
 from google.cloud import storage
 from google.api_core.exceptions import PreconditionFailed
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 import urllib3
@@ -41,7 +41,7 @@ except ModuleNotFoundError:
 
 from Tests.mock_server import MITMProxy, AMIConnection
 from Tests.test_integration import Docker, check_integration, disable_all_integrations
-from Tests.test_dependencies import get_used_integrations, get_tests_allocation_for_threads
+from Tests.test_dependencies import get_used_integrations, get_average_tests_durations, TestsScheduler
 from demisto_sdk.commands.common.constants import FILTER_CONF, PB_Status
 from demisto_sdk.commands.common.tools import print_color, print_error, print_warning, \
     LOG_COLORS, str2bool
@@ -64,6 +64,8 @@ WORKFLOW_ID = os.environ.get('CIRCLE_WORKFLOW_ID')
 CIRCLE_STATUS_TOKEN = os.environ.get('CIRCLECI_STATUS_TOKEN')
 SLACK_MEM_CHANNEL_ID = 'CM55V7J8K'
 PROXY_LOG_FILE_NAME = 'proxy_metrics.csv'
+TESTS_DURATIONS_FILE_NAME = 'tests_durations.json'
+TESTS_TIMELINE_PATH = './Tests/tests_timeline.json'
 ENV_RESULTS_PATH = './env_results.json'
 
 
@@ -86,6 +88,9 @@ def options_handler():
                                                       'tests on(Valid only when using AMI)', default="NonAMI")
     parser.add_argument('-l', '--testsList', help='List of specific, comma separated'
                                                   'tests to run')
+    parser.add_argument('-p', '--parallelTestsPerServer', type=int, default=1,
+                        help='The number of mock-disabled tests which run at the same time on each server in nightly '
+                             'builds. Default: 1, one test after another')
 
     options = parser.parse_args()
     tests_settings = SettingsTester(options)
@@ -108,6 +113,7 @@ class SettingsTester:
         self.serverVersion = options.serverVersion
         self.serverNumericVersion = None
         self.specific_tests_to_run = self.parse_tests_list_arg(options.testsList)
+        self.parallel_tests_per_server = max(getattr(options, 'parallelTestsPerServer', 1), 1)
         self.is_local_run = (self.server is not None)
 
     @staticmethod
@@ -142,6 +148,12 @@ class ParallelPrintsManager:
         self.print_lock = threading.Lock()
         self.threads_last_update_times = [time.time() for i in range(number_of_threads)]
 
+    def add_thread(self):
+        with self.print_lock:
+            self.threads_print_jobs.append([])
+            self.threads_last_update_times.append(time.time())
+            return len(self.threads_print_jobs) - 1
+
     def should_update_thread_status(self, thread_index):
         current_time = time.time()
         thread_last_update = self.threads_last_update_times[thread_index]
@@ -841,8 +853,8 @@ def get_json_file(path):
         return json.loads(json_file.read())
 
 
-def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_tests_names,
-                    tests_data_keeper, prints_manager, thread_index=0, is_ami=True):
+def execute_testing(tests_settings, server_ip, tests_scheduler, tests_data_keeper, prints_manager, thread_index=0,
+                    is_ami=True):
     server = SERVER_URL.format(server_ip)
     server_numeric_version = tests_settings.serverNumericVersion
     start_message = "Executing tests with the server {} - and the server ip {}".format(server, server_ip)
@@ -894,8 +906,24 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
 
     disable_all_integrations(xsoar_client, prints_manager, thread_index=thread_index)
     prints_manager.execute_thread_prints(thread_index)
-    mockable_tests = get_test_records_of_given_test_names(tests_settings, mockable_tests_names)
-    unmockable_tests = get_test_records_of_given_test_names(tests_settings, unmockable_tests_names)
+
+    def run_scheduled_tests(is_mockable, worker_thread_index):
+        worker = f'{server_ip}/{worker_thread_index}'
+        while True:
+            t = tests_scheduler.get_next_test(worker, is_mockable)
+            if t is None:
+                return
+            try:
+                run_test_scenario(tests_scheduler, tests_settings, t, proxy, default_test_timeout,
+                                  skipped_tests_conf, nightly_integrations, skipped_integrations_conf,
+                                  skipped_integration, is_nightly, filtered_tests, skipped_tests, secret_params,
+                                  failed_playbooks, playbook_skipped_integration, unmockable_integrations,
+                                  succeed_playbooks, slack, circle_ci, build_number, server, build_name,
+                                  server_numeric_version, demisto_user, demisto_pass, demisto_api_key,
+                                  prints_manager, worker_thread_index, is_ami)
+            finally:
+                tests_scheduler.complete_test(t)
+            prints_manager.execute_thread_prints(worker_thread_index)
 
     if is_nightly and is_memory_check:
         mem_lim, err = get_docker_limit()
@@ -905,46 +933,27 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
 
     try:
         # first run the mock tests to avoid mockless side effects in container
-        if is_ami and mockable_tests:
+        if is_ami and tests_scheduler.has_pending_tests(is_mockable=True):
             proxy.configure_proxy_in_demisto(proxy=proxy.ami.docker_ip + ':' + proxy.PROXY_PORT,
                                              username=demisto_user, password=demisto_pass,
                                              server=server)
-            executed_in_current_round, mockable_tests_queue = initialize_queue_and_executed_tests_set(mockable_tests)
-            while not mockable_tests_queue.empty():
-                t = mockable_tests_queue.get()
-                executed_in_current_round = update_round_set_and_sleep_if_round_completed(executed_in_current_round,
-                                                                                          prints_manager,
-                                                                                          t,
-                                                                                          thread_index,
-                                                                                          mockable_tests_queue)
-                run_test_scenario(mockable_tests_queue, tests_settings, t, proxy, default_test_timeout,
-                                  skipped_tests_conf, nightly_integrations, skipped_integrations_conf,
-                                  skipped_integration, is_nightly, filtered_tests, skipped_tests, secret_params, failed_playbooks,
-                                  playbook_skipped_integration, unmockable_integrations, succeed_playbooks, slack,
-                                  circle_ci, build_number, server, build_name, server_numeric_version, demisto_user,
-                                  demisto_pass, demisto_api_key, prints_manager, thread_index=thread_index)
+            # the proxy records and plays back the traffic of one test at a time
+            run_scheduled_tests(True, thread_index)
             proxy.configure_proxy_in_demisto(username=demisto_user, password=demisto_pass, server=server)
 
             # reset containers after clearing the proxy server configuration
             reset_containers(server, demisto_user, demisto_pass, prints_manager, thread_index)
 
         prints_manager.add_print_job("\nRunning mock-disabled tests", print, thread_index)
-        executed_in_current_round, unmockable_tests_queue = initialize_queue_and_executed_tests_set(unmockable_tests)
-        while not unmockable_tests_queue.empty():
-            t = unmockable_tests_queue.get()
-            executed_in_current_round = update_round_set_and_sleep_if_round_completed(executed_in_current_round,
-                                                                                      prints_manager,
-                                                                                      t,
-                                                                                      thread_index,
-                                                                                      unmockable_tests_queue)
-            run_test_scenario(unmockable_tests_queue, tests_settings, t, proxy, default_test_timeout,
-                              skipped_tests_conf, nightly_integrations, skipped_integrations_conf, skipped_integration,
-                              is_nightly, filtered_tests, skipped_tests, secret_params,
-                              failed_playbooks, playbook_skipped_integration, unmockable_integrations,
-                              succeed_playbooks, slack, circle_ci, build_number, server, build_name,
-                              server_numeric_version, demisto_user, demisto_pass, demisto_api_key,
-                              prints_manager, thread_index, is_ami)
-            prints_manager.execute_thread_prints(thread_index)
+        prints_manager.execute_thread_prints(thread_index)
+        # only nightly builds run several mock-disabled tests at the same time on a server
+        parallel_tests = tests_settings.parallel_tests_per_server if is_nightly else 1
+        workers_thread_indexes = [thread_index] + [prints_manager.add_thread() for _ in range(parallel_tests - 1)]
+        with ThreadPoolExecutor(max_workers=len(workers_thread_indexes)) as executor:
+            workers = [executor.submit(run_scheduled_tests, False, worker_thread_index)
+                       for worker_thread_index in workers_thread_indexes]
+            for worker in workers:
+                worker.result()
 
     except Exception as exc:
         if exc.__class__ == ApiException:
@@ -1003,49 +1012,6 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
             prints_manager.add_print_job("Failed to save proxy metrics", print, thread_index)
 
 
-def update_round_set_and_sleep_if_round_completed(executed_in_current_round: set,
-                                                  prints_manager: ParallelPrintsManager,
-                                                  t: dict,
-                                                  thread_index: int,
-                                                  unmockable_tests_queue: Queue) -> set:
-    """
-    Checks if the string representation of the current test configuration is already in
-    the executed_in_current_round set.
-    If it is- it means we have already executed this test and the we have reached a round and there are tests that
-    were not able to be locked by this execution..
-    In that case we want to start a new round monitoring by emptying the 'executed_in_current_round' set and sleep
-    in order to let the tests be unlocked
-    Args:
-        executed_in_current_round: A set containing the string representation of all tests configuration as they appear
-        in conf.json file that were already executed in the current round
-        prints_manager: ParallelPrintsManager object
-        t: test configuration as it appears in conf.json file
-        thread_index: Currently executing thread
-        unmockable_tests_queue: The queue of remaining tests
-
-    Returns:
-        A new executed_in_current_round set which contains only the current tests configuration if a round was completed
-        else it just adds the new test to the set.
-    """
-    if str(t) in executed_in_current_round:
-        prints_manager.add_print_job(
-            'all tests in the queue were executed, sleeping for 30 seconds to let locked tests get unlocked.',
-            print,
-            thread_index)
-        executed_in_current_round = set()
-        time.sleep(30)
-    executed_in_current_round.add(str(t))
-    return executed_in_current_round
-
-
-def initialize_queue_and_executed_tests_set(tests):
-    tests_queue = Queue()
-    already_executed_test_playbooks = set()
-    for t in tests:
-        tests_queue.put(t)
-    return already_executed_test_playbooks, tests_queue
-
-
 def get_unmockable_tests(tests_settings):
     conf, _ = load_conf_files(tests_settings.conf_path, tests_settings.secret_conf_path)
     unmockable_integrations = conf['unmockable_integrations']
@@ -1072,6 +1038,61 @@ def get_all_tests(tests_settings):
     return all_tests
 
 
+def create_tests_scheduler(tests_settings, mockable_tests_names, unmockable_tests_names, tests_durations=None):
+    mockable_tests = get_test_records_of_given_test_names(tests_settings, mockable_tests_names)
+    unmockable_tests = get_test_records_of_given_test_names(tests_settings, unmockable_tests_names)
+    return TestsScheduler(mockable_tests, unmockable_tests, get_average_tests_durations(tests_durations or {}))
+
+
+def load_tests_durations(tests_settings):
+    """
+    Loads the average durations of the tests in previous nightly builds, which the tests scheduler hands out the
+    longest tests first by.
+
+    Args:
+        tests_settings (SettingsTester): An object containing all the relevant data regarding how the tests should be ran
+
+    Returns:
+        dict. The average duration and the number of runs of each test, or an empty dict if they could not be loaded.
+    """
+    if tests_settings.is_local_run:
+        return {}
+    try:
+        storage_client = storage.Client()
+        durations_blob = storage_client.bucket(BUCKET_NAME).blob(f'{LOCKS_PATH}/{TESTS_DURATIONS_FILE_NAME}')
+        if not durations_blob.exists():
+            return {}
+        return json.loads(durations_blob.download_as_string())
+    except Exception as e:
+        print_warning(f'Failed loading the durations of the tests, the tests will not be ordered by duration: {e}')
+        return {}
+
+
+def save_tests_durations(tests_durations):
+    try:
+        storage_client = storage.Client()
+        durations_blob = storage_client.bucket(BUCKET_NAME).blob(f'{LOCKS_PATH}/{TESTS_DURATIONS_FILE_NAME}')
+        durations_blob.upload_from_string(json.dumps(tests_durations))
+    except Exception as e:
+        print_warning(f'Failed saving the durations of the tests: {e}')
+
+
+def create_tests_timeline_file(tests_schedulers):
+    """
+    Writes the timeline of the tests runs of each scheduler, with the busy and idle time of every server.
+
+    Args:
+        tests_schedulers (list): The schedulers of the tests which ran.
+    """
+    timeline = [tests_scheduler.get_timeline() for tests_scheduler in tests_schedulers]
+    for scheduler_timeline in timeline:
+        for worker, worker_timeline in scheduler_timeline['workers'].items():
+            print(f'{worker} was idle for {worker_timeline["idle"]:.0f} out of '
+                  f'{scheduler_timeline["duration"]:.0f} seconds')
+    with open(TESTS_TIMELINE_PATH, 'w') as timeline_file:
+        json.dump(timeline, timeline_file, indent=4)
+
+
 def manage_tests(tests_settings):
     """
     This function manages the execution of Demisto's tests.
@@ -1087,6 +1108,7 @@ def manage_tests(tests_settings):
     number_of_instances = len(instances_ips)
     prints_manager = ParallelPrintsManager(number_of_instances)
     tests_data_keeper = DataKeeperTester()
+    tests_schedulers = []
 
     if tests_settings.server:
         # If the user supplied a server - all tests will be done on that server.
@@ -1097,39 +1119,40 @@ def manage_tests(tests_settings):
         mockable_tests = []
         print(tests_settings.specific_tests_to_run)
         unmockable_tests = tests_settings.specific_tests_to_run if tests_settings.specific_tests_to_run else all_tests
-        execute_testing(tests_settings, server_ip, mockable_tests, unmockable_tests, tests_data_keeper, prints_manager,
+        tests_scheduler = create_tests_scheduler(tests_settings, mockable_tests, unmockable_tests)
+        tests_schedulers.append(tests_scheduler)
+        execute_testing(tests_settings, server_ip, tests_scheduler, tests_data_keeper, prints_manager,
                         thread_index=0, is_ami=False)
 
     elif tests_settings.isAMI:
         # Running tests in AMI configuration.
         # This is the way we run most tests, including running Circle for PRs and nightly.
         if is_nightly:
-            # If the build is a nightly build, run tests in parallel.
-            test_allocation = get_tests_allocation_for_threads(number_of_instances, tests_settings.conf_path)
-            current_thread_index = 0
+            # If the build is a nightly build, run tests in parallel. All the servers take their next test from the
+            # same scheduler, which never runs two tests of the same integration at the same time.
+            tests_durations = load_tests_durations(tests_settings)
             all_unmockable_tests_list = get_unmockable_tests(tests_settings)
+            mockable_tests = [test for test in get_all_tests(tests_settings) if test not in all_unmockable_tests_list]
+            tests_scheduler = create_tests_scheduler(tests_settings, mockable_tests, all_unmockable_tests_list,
+                                                     tests_durations)
+            tests_schedulers.append(tests_scheduler)
+            current_thread_index = 0
             threads_array = []
 
             for ami_instance_name, ami_instance_ip in instances_ips:
                 if ami_instance_name == tests_settings.serverVersion:  # Only run tests for given AMI Role
                     current_instance = ami_instance_ip
-                    tests_allocation_for_instance = test_allocation[current_thread_index]
-
-                    unmockable_tests = [test for test in all_unmockable_tests_list
-                                        if test in tests_allocation_for_instance]
-                    mockable_tests = [test for test in tests_allocation_for_instance if test not in unmockable_tests]
                     print_color("Starting tests for {}".format(ami_instance_name), LOG_COLORS.GREEN)
                     print("Starts tests with server url - https://{}".format(ami_instance_ip))
 
                     if number_of_instances == 1:
-                        execute_testing(tests_settings, current_instance, mockable_tests, unmockable_tests,
-                                        tests_data_keeper, prints_manager, thread_index=0, is_ami=True)
+                        execute_testing(tests_settings, current_instance, tests_scheduler, tests_data_keeper,
+                                        prints_manager, thread_index=0, is_ami=True)
                     else:
                         thread_kwargs = {
                             "tests_settings": tests_settings,
                             "server_ip": current_instance,
-                            "mockable_tests_names": mockable_tests,
-                            "unmockable_tests_names": unmockable_tests,
+                            "tests_scheduler": tests_scheduler,
                             "thread_index": current_thread_index,
                             "prints_manager": prints_manager,
                             "tests_data_keeper": tests_data_keeper,
@@ -1142,6 +1165,9 @@ def manage_tests(tests_settings):
             for t in threads_array:
                 t.join()
 
+            if not tests_settings.is_local_run:
+                save_tests_durations(tests_scheduler.get_tests_durations(tests_durations))
+
         else:
             for ami_instance_name, ami_instance_ip in instances_ips:
                 if ami_instance_name == tests_settings.serverVersion:
@@ -1150,8 +1176,10 @@ def manage_tests(tests_settings):
                     all_tests = get_all_tests(tests_settings)
                     unmockable_tests = get_unmockable_tests(tests_settings)
                     mockable_tests = [test for test in all_tests if test not in unmockable_tests]
-                    execute_testing(tests_settings, ami_instance_ip, mockable_tests, unmockable_tests,
-                                    tests_data_keeper, prints_manager, thread_index=0, is_ami=True)
+                    tests_scheduler = create_tests_scheduler(tests_settings, mockable_tests, unmockable_tests)
+                    tests_schedulers.append(tests_scheduler)
+                    execute_testing(tests_settings, ami_instance_ip, tests_scheduler, tests_data_keeper,
+                                    prints_manager, thread_index=0, is_ami=True)
                     sleep(8)
 
     else:
@@ -1163,11 +1191,14 @@ def manage_tests(tests_settings):
         print("Using server version: {} (assuming latest for non-ami)".format(server_numeric_version))
         instance_ip = instances_ips[0][1]
         all_tests = get_all_tests(tests_settings)
-        execute_testing(tests_settings, instance_ip, [], all_tests,
-                        tests_data_keeper, prints_manager, thread_index=0, is_ami=False)
+        tests_scheduler = create_tests_scheduler(tests_settings, [], all_tests)
+        tests_schedulers.append(tests_scheduler)
+        execute_testing(tests_settings, instance_ip, tests_scheduler, tests_data_keeper, prints_manager,
+                        thread_index=0, is_ami=False)
 
     print_test_summary(tests_data_keeper, tests_settings.isAMI)
     create_result_files(tests_data_keeper)
+    create_tests_timeline_file(tests_schedulers)
 
     if tests_data_keeper.failed_playbooks:
         tests_failed_msg = "Some tests have failed. Not destroying instances."
@@ -1,206 +1,206 @@
-import json
-import math
+import itertools
+import threading
+import time
 
+# the duration in seconds which is assumed for tests which did not run in previous builds
+DEFAULT_TEST_DURATION = 300
+# the number of seconds after which a test whose integrations are locked by another build is retried
+DEFERRED_TEST_DELAY = 30
 
-class VertexTester:
-    def __init__(self, test_name):
-        self.neighbors = {}
-        self.test_name = test_name
 
-        self.visited = False
+def get_used_integrations(test_playbook_record):
+    tested_integrations = test_playbook_record.get("integrations", [])
+    if isinstance(tested_integrations, list):
+        return tested_integrations
+    else:
+        return [tested_integrations]
 
-    def add_neighbor(self, neighbor_test):
-        neighbor_name = neighbor_test.test_name
-        self.neighbors[neighbor_name] = neighbor_test
 
-    def get_connected_component(self, tests_in_component):
-        tests_in_component.append(self.test_name)
-        self.visited = True
-        for neighbor_name in self.neighbors:
-            neighbor_vertex = self.neighbors[neighbor_name]
-            if not neighbor_vertex.visited:
-                tests_in_component = neighbor_vertex.get_connected_component(tests_in_component)
-        return tests_in_component
+class ScheduledTest:
+    def __init__(self, test_record, is_mockable, duration):
+        self.test_record = test_record
+        self.test_name = test_record.get("playbookID")
+        self.integrations = set(get_used_integrations(test_record))
+        self.is_mockable = is_mockable
+        self.duration = duration
+        # the longest total duration of the tests of one of the integrations of the test
+        self.chain_duration = duration
+        self.not_before = 0.0
 
+    @property
+    def priority(self):
+        return self.chain_duration, self.duration
 
-class GraphTester:
-    """A graph representing the tests in Demisto and whether they use mutual integrations.
 
-    Attributes:
-        test_vertices (list): A list of vertices (of type TestVertex), each representing a test.
-        clusters (list): A list of test clusters, where the tests of each cluster need to be run sequentially.
+class TestRun(dict):
+    """The conf.json record of a test, as handed out by the tests scheduler for one run of the test. The run ID
+    identifies the run when the record is given back to the scheduler, as the same test may run more than once."""
+    __test__ = False  # required because otherwise pytest will try to run it as it has Test prefix
 
-    """
-    def __init__(self):
-        self.test_vertices = {}
-        self.clusters = []
-
-    def add_test_graph_vertices(self, tests_data):
-        for test_playbook_record in tests_data:
-            playbook_name_in_record = test_playbook_record.get("playbookID")
-            if playbook_name_in_record and playbook_name_in_record not in self.test_vertices:
-                new_test_vertex = VertexTester(playbook_name_in_record)
-                self.test_vertices[playbook_name_in_record] = new_test_vertex
-
-    def add_test_graph_neighbors(self, tests_data):
-        integration_to_tests_mapping = get_integration_to_tests_mapping(tests_data)
-        for integration_name in integration_to_tests_mapping:
-            tests_using_integration = integration_to_tests_mapping[integration_name]
-            for i in range(len(tests_using_integration)):
-                first_test_name = tests_using_integration[i]
-                first_test_vertex = self.test_vertices[first_test_name]
-
-                for j in range(i + 1, len(tests_using_integration)):
-                    second_test_name = tests_using_integration[j]
-                    second_test_vertex = self.test_vertices[second_test_name]
-
-                    first_test_vertex.add_neighbor(second_test_vertex)
-                    second_test_vertex.add_neighbor(first_test_vertex)
-
-    def get_clusters(self):
-        clusters = []
-        for test_name in self.test_vertices:
-            test_vertex = self.test_vertices[test_name]
-            if not test_vertex.visited:
-                test_connected_component = test_vertex.get_connected_component([])
-                clusters.append(test_connected_component)
-        self.clusters = clusters
-
-    def build_tests_graph_from_conf_json(self, tests_file_path, dependent_tests):
-        with open(tests_file_path, 'r') as myfile:
-            conf_json_string = myfile.read()
-
-        tests_data = json.loads(conf_json_string)["tests"]
-
-        dependent_tests_data = [test_record for test_record in tests_data
-                                if test_record.get("playbookID") in dependent_tests]
-
-        self.add_test_graph_vertices(dependent_tests_data)
-        self.add_test_graph_neighbors(dependent_tests_data)
-        self.get_clusters()
-
-
-def get_integration_to_tests_mapping(tests_data):
-    integration_to_tests_mapping = {}
-    for test_playbook_record in tests_data:
-        record_playbook_name = test_playbook_record.get("playbookID", None)
-        record_integrations = get_used_integrations(test_playbook_record)
-        for integration_name in record_integrations:
-            if integration_name in integration_to_tests_mapping:
-                if record_playbook_name not in integration_to_tests_mapping[integration_name]:
-                    integration_to_tests_mapping[integration_name].append(record_playbook_name)
-            else:
-                integration_to_tests_mapping[integration_name] = [record_playbook_name]
-    return integration_to_tests_mapping
+    def __init__(self, test_record, run_id):
+        super().__init__(test_record)
+        self.run_id = run_id
 
 
-def get_used_integrations(test_playbook_record):
-    tested_integrations = test_playbook_record.get("integrations", [])
-    if isinstance(tested_integrations, list):
-        return tested_integrations
-    else:
-        return [tested_integrations]
+class TestsScheduler:
+    """Hands out the tests of a build to the workers which run them - the servers, and the parallel slots of each
+    server - so that tests which use a mutual integration never run at the same time.
+
+    Instead of a fixed allocation of tests to servers, every worker takes the next test when it is free. The tests of
+    the integrations with the longest total duration are handed out first, as they are the ones which can not run in
+    parallel, and after them the longest tests first. The durations are the average durations of previous builds.
 
+    Attributes:
+        timeline (list): The runs of the tests, with the worker which ran each test and its start and end times.
 
-def get_dependent_and_independent_integrations(tests_file_path):
-    with open(tests_file_path, 'r') as myfile:
-        conf_json_string = myfile.read()
-
-    conf_json_obj = json.loads(conf_json_string)
-
-    integration_tests_count = {}
-    for test_record in conf_json_obj["tests"]:
-        integrations_used = get_used_integrations(test_record)
-        for integration_name in integrations_used:
-            if integration_name in integration_tests_count:
-                integration_tests_count[integration_name] += 1
-            else:
-                integration_tests_count[integration_name] = 1
-
-    dependent_integrations = [integration_name for integration_name in integration_tests_count
-                              if integration_tests_count[integration_name] > 1]
-    independent_integrations = [integration_name for integration_name in integration_tests_count
-                                if integration_tests_count[integration_name] <= 1]
-    return dependent_integrations, independent_integrations
-
-
-def get_test_dependencies(tests_file_path):
-    dependent_integrations = get_dependent_and_independent_integrations(tests_file_path)[0]
-
-    with open(tests_file_path, 'r') as myfile:
-        conf_json_string = myfile.read()
-    conf_json_obj = json.loads(conf_json_string)
-
-    dependent_tests = []
-    all_tests = []
-    for test_record in conf_json_obj["tests"]:
-        integrations_used = get_used_integrations(test_record)
-        playbook = test_record.get("playbookID", None)
-        if playbook not in all_tests:
-            all_tests.append(playbook)
-        dependent_integrations_used = [integration for integration in integrations_used
-                                       if integration in dependent_integrations]
-        if dependent_integrations_used and playbook not in dependent_tests:
-            dependent_tests.append(playbook)
-
-    independent_tests = [test for test in all_tests if test not in dependent_tests]
-    return dependent_tests, independent_tests, all_tests
-
-
-def get_dependent_integrations_clusters_data(tests_file_path, dependent_tests):
-    tests_graph = GraphTester()
-    tests_graph.build_tests_graph_from_conf_json(tests_file_path, dependent_tests)
-    return tests_graph.clusters
-
-
-def get_tests_allocation_for_threads(number_of_instances, tests_file_path):
-    dependent_tests, independent_tests, all_tests = get_test_dependencies(tests_file_path)
-    dependent_tests_clusters = get_dependent_integrations_clusters_data(tests_file_path, dependent_tests)
-    dependent_tests_clusters.sort(key=len, reverse=True)  # Sort the clusters from biggest to smallest
-    tests_allocation = []
-    number_of_tests_left = len(all_tests)
-    while number_of_tests_left > 0:
-        allocations_left = number_of_instances - len(tests_allocation)
-        desired_tests_per_allocation = math.ceil(number_of_tests_left / allocations_left)  # We prefer an equal division of tests.
-        current_allocation = []
-
-        # If we have one allocation left, add all tests to it and finish
-        if allocations_left == 1:
-            for tests_cluster in dependent_tests_clusters:
-                current_allocation.extend(tests_cluster)
-            for test_name in independent_tests:
-                current_allocation.append(test_name)
-            tests_allocation.append(current_allocation)
-            break
-
-        if len(dependent_tests_clusters) > 0:
-            # Even if the first cluster is bigger than the desired amount, we have to add it to the allocation.
-            # If we don't, it will not be added to any allocation.
-            first_cluster = dependent_tests_clusters.pop(0)
-            first_cluster_size = len(first_cluster)
-            current_allocation.extend(first_cluster)
-            number_of_tests_left -= first_cluster_size
-
-        if len(current_allocation) >= desired_tests_per_allocation:
-            tests_allocation.append(current_allocation)
-            continue
-
-        clusters_added = 0
-        for cluster in dependent_tests_clusters:
-            cluster_size = len(cluster)
-            if len(current_allocation) + cluster_size > desired_tests_per_allocation:
-                # Will fill the quota from the independent test lists.
-                break
-            current_allocation.extend(cluster)
-            number_of_tests_left -= cluster_size
-            clusters_added += 1
-
-        del dependent_tests_clusters[:clusters_added]
-
-        num_of_tests_to_add = int(desired_tests_per_allocation - len(current_allocation))
-        independent_tests_to_add = independent_tests[:num_of_tests_to_add]
-        current_allocation.extend(independent_tests_to_add)
-        del independent_tests[:num_of_tests_to_add]
-
-        tests_allocation.append(current_allocation)
-    return tests_allocation
+    """
+    __test__ = False  # required because otherwise pytest will try to run it as it has Test prefix
+
+    def __init__(self, mockable_tests, unmockable_tests, tests_durations=None,
+                 default_duration=DEFAULT_TEST_DURATION, defer_delay=DEFERRED_TEST_DELAY):
+        tests_durations = tests_durations or {}
+        self.defer_delay = defer_delay
+        self.start_time = time.time()
+        self.timeline = []
+        self._condition = threading.Condition()
+        self._locked_integrations = set()
+        self._run_ids = itertools.count()
+        self._running = {}
+        self._deferred = set()
+        self._workers_start_times = {}
+
+        tests = []
+        for tests_records, is_mockable in ((mockable_tests, True), (unmockable_tests, False)):
+            for test_record in tests_records:
+                duration = tests_durations.get(test_record.get("playbookID"), default_duration)
+                tests.append(ScheduledTest(test_record, is_mockable, duration))
+        integration_durations = {}
+        for test in tests:
+            for integration in test.integrations:
+                integration_durations[integration] = integration_durations.get(integration, 0) + test.duration
+        for test in tests:
+            test.chain_duration = max([integration_durations[integration] for integration in test.integrations],
+                                      default=test.duration)
+        self._pending = sorted(tests, key=lambda scheduled_test: scheduled_test.priority, reverse=True)
+
+    def has_pending_tests(self, is_mockable):
+        with self._condition:
+            return any(test.is_mockable == is_mockable for test in self._pending)
+
+    def get_next_test(self, worker, is_mockable):
+        """Gets the next test for a worker to run, and waits for one while all the pending tests use integrations
+        which are used by running tests.
+
+        Args:
+            worker (str): The name of the worker.
+            is_mockable (bool): Whether to get a mockable test, or a test which runs with mocking disabled.
+
+        Returns:
+            TestRun. The conf.json record of the test run, or None if there are no more pending tests of that kind.
+        """
+        with self._condition:
+            self._workers_start_times.setdefault(worker, time.time())
+            while True:
+                candidates = [test for test in self._pending if test.is_mockable == is_mockable]
+                if not candidates:
+                    return None
+                now = time.time()
+                for test in candidates:
+                    if test.not_before <= now and not test.integrations & self._locked_integrations:
+                        self._pending.remove(test)
+                        self._locked_integrations.update(test.integrations)
+                        test_run = TestRun(test.test_record, next(self._run_ids))
+                        self._running[test_run.run_id] = (test, worker, now)
+                        return test_run
+                deferred_times = [test.not_before - now for test in candidates if test.not_before > now]
+                # a running test completes or a deferred test can be retried
+                self._condition.wait(min(deferred_times) if deferred_times else None)
+
+    def put(self, test_run):
+        """Defers a running test, which could not lock its integrations because another build uses them, so it will
+        be retried after the running tests of the other integrations. This is the interface of the tests queue which
+        run_test_logic returns such tests to.
+
+        Args:
+            test_run (TestRun): The conf.json record of the test run, as got from the scheduler.
+        """
+        with self._condition:
+            self._deferred.add(test_run.run_id)
+
+    def complete_test(self, test_run):
+        """Marks a test which was got from the scheduler as done (or as deferred), so its integrations are free
+
+        Args:
+            test_run (TestRun): The conf.json record of the test run, as got from the scheduler.
+        """
+        with self._condition:
+            test, worker, start_time = self._running.pop(test_run.run_id)
+            end_time = time.time()
+            is_deferred = test_run.run_id in self._deferred
+            self._deferred.discard(test_run.run_id)
+            self._locked_integrations.difference_update(test.integrations)
+            if is_deferred:
+                test.not_before = end_time + self.defer_delay
+                self._pending.append(test)
+                self._pending.sort(key=lambda scheduled_test: scheduled_test.priority, reverse=True)
+            self.timeline.append({
+                "playbookID": test.test_name,
+                "worker": worker,
+                "start": start_time - self.start_time,
+                "end": end_time - self.start_time,
+                "status": "deferred" if is_deferred else "done"
+            })
+            self._condition.notify_all()
+
+    def get_timeline(self):
+        """Gets the timeline of the tests run, with the busy and idle time of each worker.
+
+        Returns:
+            dict. The total duration, and the tests runs and idle periods of each worker (in seconds from the start).
+        """
+        with self._condition:
+            end_time = max([test_run["end"] for test_run in self.timeline], default=0)
+            workers = {}
+            for worker, worker_start_time in self._workers_start_times.items():
+                worker_runs = sorted([test_run for test_run in self.timeline if test_run["worker"] == worker],
+                                     key=lambda test_run: test_run["start"])
+                idle_periods = []
+                last_end = worker_start_time - self.start_time
+                for test_run in worker_runs:
+                    if test_run["start"] > last_end:
+                        idle_periods.append([last_end, test_run["start"]])
+                    last_end = max(last_end, test_run["end"])
+                if end_time > last_end:
+                    idle_periods.append([last_end, end_time])
+                workers[worker] = {
+                    "busy": sum(test_run["end"] - test_run["start"] for test_run in worker_runs),
+                    "idle": sum(idle_end - idle_start for idle_start, idle_end in idle_periods),
+                    "idle_periods": idle_periods,
+                    "tests": worker_runs
+                }
+            return {"duration": end_time, "workers": workers}
+
+    def get_tests_durations(self, previous_tests_durations=None):
+        """Adds the durations of the tests which ran to the average durations of previous builds.
+
+        Args:
+            previous_tests_durations (dict): The average duration and the number of runs of each test.
+
+        Returns:
+            dict. The average duration and the number of runs of each test, including this build.
+        """
+        tests_durations = {test_name: dict(test_durations)
+                           for test_name, test_durations in (previous_tests_durations or {}).items()}
+        with self._condition:
+            for test_run in self.timeline:
+                if test_run["status"] != "done":
+                    continue
+                test_durations = tests_durations.setdefault(test_run["playbookID"], {"average": 0, "count": 0})
+                count = test_durations["count"] + 1
+                test_durations["average"] += (test_run["end"] - test_run["start"] - test_durations["average"]) / count
+                test_durations["count"] = count
+        return tests_durations
+
+
+def get_average_tests_durations(tests_durations):
+    return {test_name: test_durations["average"] for test_name, test_durations in tests_durations.items()}
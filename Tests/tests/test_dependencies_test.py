@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+
+from Tests.test_dependencies import TestsScheduler
+
+
+def test_scheduler_hands_out_busiest_integrations_first():
+    """
+    Given
+    - Tests of an integration with a long total duration, a long test without integrations and a short test.
+    When
+    - Getting the tests from the scheduler one after the other.
+    Then
+    - Ensure the tests of the busiest integration are handed out first, and then the longest tests.
+    - Ensure a test is not handed out while another test of its integration runs.
+    """
+    tests = [
+        {'playbookID': 'short', 'integrations': 'b'},
+        {'playbookID': 'long'},
+        {'playbookID': 'a1', 'integrations': ['a']},
+        {'playbookID': 'a2', 'integrations': 'a'},
+    ]
+    durations = {'short': 1, 'long': 50, 'a1': 30, 'a2': 40}
+    scheduler = TestsScheduler([], tests, durations)
+
+    first = scheduler.get_next_test('worker', is_mockable=False)
+    assert first['playbookID'] == 'a2'
+    next_tests = [scheduler.get_next_test('worker', is_mockable=False) for _ in range(2)]
+    assert [test['playbookID'] for test in next_tests] == ['long', 'short']
+    assert scheduler.get_next_test('worker', is_mockable=True) is None
+    for test in next_tests:
+        scheduler.complete_test(test)
+
+    # a1 waits for a2, which uses the same integration
+    waiting_worker_test = []
+    waiting_worker = threading.Thread(
+        target=lambda: waiting_worker_test.append(scheduler.get_next_test('other', is_mockable=False)))
+    waiting_worker.start()
+    waiting_worker.join(0.2)
+    assert waiting_worker.is_alive()
+    scheduler.complete_test(first)
+    waiting_worker.join(5)
+    assert waiting_worker_test[0]['playbookID'] == 'a1'
+
+
+def test_scheduler_never_runs_conflicting_tests_together():
+    """
+    Given
+    - 60 tests which use random integrations out of 6, mockable and mock-disabled.
+    When
+    - 4 workers run the tests in parallel.
+    Then
+    - Ensure every test runs once, and no two tests of the same integration run at the same time.
+    """
+    rand = random.Random(0)
+    tests = [{'playbookID': f'test_{i}', 'integrations': rand.sample('abcdef', rand.randint(0, 2))}
+             for i in range(60)]
+    scheduler = TestsScheduler(tests[:20], tests[20:])
+    used_integrations = []
+    ran_tests = []
+    lock = threading.Lock()
+
+    def worker(name):
+        for is_mockable in (True, False):
+            while True:
+                test = scheduler.get_next_test(name, is_mockable)
+                if test is None:
+                    break
+                with lock:
+                    assert not set(test['integrations']) & set(used_integrations)
+                    used_integrations.extend(test['integrations'])
+                    ran_tests.append(test['playbookID'])
+                time.sleep(0.001)
+                with lock:
+                    for integration in test['integrations']:
+                        used_integrations.remove(integration)
+                scheduler.complete_test(test)
+
+    workers = [threading.Thread(target=worker, args=(f'worker_{i}',)) for i in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join(30)
+    assert sorted(ran_tests) == sorted(test['playbookID'] for test in tests)
+    timeline = scheduler.get_timeline()
+    assert set(timeline['workers']) == {f'worker_{i}' for i in range(4)}
+    assert sum(len(worker_timeline['tests']) for worker_timeline in timeline['workers'].values()) == 60
+
+
+def test_scheduler_retries_deferred_tests():
+    """
+    Given
+    - A test whose integrations are locked by another build.
+    When
+    - The test is returned to the scheduler.
+    Then
+    - Ensure the test is handed out again after the deferral delay, as another run of the same record.
+    - Ensure only the completed run is added to the average durations, and the idle time is in the timeline.
+    """
+    test = {'playbookID': 'test', 'integrations': 'a'}
+    scheduler = TestsScheduler([test], [], defer_delay=0.1)
+    deferred_run = scheduler.get_next_test('worker', is_mockable=True)
+    assert deferred_run == test
+    scheduler.put(deferred_run)
+    scheduler.complete_test(deferred_run)
+    assert scheduler.has_pending_tests(is_mockable=True)
+    completed_run = scheduler.get_next_test('worker', is_mockable=True)
+    assert completed_run == test
+    assert completed_run.run_id != deferred_run.run_id
+    scheduler.complete_test(completed_run)
+    assert not scheduler.has_pending_tests(is_mockable=True)
+    assert [test_run['status'] for test_run in scheduler.timeline] == ['deferred', 'done']
+
+    tests_durations = scheduler.get_tests_durations({'test': {'average': 10, 'count': 1}})
+    assert tests_durations['test']['count'] == 2
+    assert tests_durations['test']['average'] < 10
+    assert scheduler.get_timeline()['workers']['worker']['idle'] >= 0.1